@@ -7,7 +7,7 @@ from datetime import datetime, timedelta
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
 
-from products.models import Product, Category, Brand
+from products.models import Product, Category
 from products.serializers import ProductSerializer
 from vendors.models import VendorProfile, VendorApproval
 from vendors.serializers import VendorProfileSerializer, VendorApprovalAdminSerializer
@@ -16,6 +16,9 @@ from orders.serializers import OrderSerializer
 from users.models import User
 from users.permissions import IsAdminUser
 from users.serializers import UserSerializer
+from backend.http_client import upstream_stats
+from emi.bank_catalog import catalog_metrics
+from analytics.dashboard import ADMIN_SUMMARY, get_snapshot
 from .models import SiteSettings
 from .serializers import SiteSettingsSerializer
 
@@ -27,80 +30,10 @@ class DashboardViewSet(viewsets.ViewSet):
     
     @action(detail=False, methods=['get'])
     def summary(self, request):
-        """Get summary data for the admin dashboard."""
-        # Get counts
-        total_products = Product.objects.count()
-        pending_products = Product.objects.filter(is_approved=False).count()
-        total_vendors = VendorProfile.objects.count()
-        pending_vendors = VendorProfile.objects.filter(status='pending').count()
-        total_orders = Order.objects.count()
-        total_users = User.objects.count()
-        
-        # Revenue calculations
-        completed_orders = Order.objects.filter(status='completed')
-        total_revenue = completed_orders.aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-        
-        # Recent activity
-        recent_orders = Order.objects.order_by('-created_at')[:5]
-        recent_vendors = VendorProfile.objects.order_by('-created_at')[:5]
-        recent_products = Product.objects.order_by('-created_at')[:5]
-        
-        # Get data for the last 7 days
-        last_week = datetime.now() - timedelta(days=7)
-        orders_by_day = []
-        revenue_by_day = []
-        
-        for i in range(7):
-            day = last_week + timedelta(days=i)
-            next_day = day + timedelta(days=1)
-            day_orders = Order.objects.filter(created_at__gte=day, created_at__lt=next_day)
-            day_revenue = day_orders.aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-            
-            orders_by_day.append({
-                'date': day.strftime('%Y-%m-%d'),
-                'count': day_orders.count()
-            })
-            
-            revenue_by_day.append({
-                'date': day.strftime('%Y-%m-%d'),
-                'amount': day_revenue
-            })
-        
-        # Top categories
-        top_categories = Category.objects.annotate(
-            product_count=Count('products')
-        ).order_by('-product_count')[:5]
-        
-        # Top brands
-        top_brands = Brand.objects.annotate(
-            product_count=Count('products')
-        ).order_by('-product_count')[:5]
-        
-        return Response({
-            'counts': {
-                'products': total_products,
-                'pending_products': pending_products,
-                'vendors': total_vendors,
-                'pending_vendors': pending_vendors,
-                'orders': total_orders,
-                'users': total_users,
-            },
-            'revenue': {
-                'total': total_revenue,
-                'by_day': revenue_by_day
-            },
-            'activity': {
-                'orders_by_day': orders_by_day,
-            },
-            'top_categories': [
-                {'name': cat.name, 'count': cat.product_count}
-                for cat in top_categories
-            ],
-            'top_brands': [
-                {'name': brand.name, 'count': brand.product_count}
-                for brand in top_brands
-            ]
-        })
+        """Get summary data for the admin dashboard from its snapshot; ``?fresh=1`` recomputes it."""
+        fresh = request.query_params.get('fresh') in ('1', 'true')
+        snapshot = get_snapshot(ADMIN_SUMMARY, fresh=fresh)
+        return Response({**snapshot.data, 'generated_at': snapshot.generated_at})
 
 
 class ProductApprovalViewSet(viewsets.ModelViewSet):
@@ -388,6 +321,16 @@ class SystemSettingsViewSet(viewsets.ViewSet):
         ).values('id', 'name', 'product_count', 'avg_price')
         
         return Response(categories)
+    
+    @action(detail=False, methods=['get'])
+    def upstreams(self, request):
+        """Get latency histograms and circuit states of outbound HTTP calls made by this process."""
+        return Response(upstream_stats())
+    
+    @action(detail=False, methods=['get'])
+    def emi_bank_catalog(self, request):
+        """Get the age of the EMI bank catalog and of its cached copy, with cache hit counts."""
+        return Response(catalog_metrics())
 
 
 class UserManagementViewSet(viewsets.ModelViewSet):
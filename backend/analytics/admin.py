@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import PageView, ProductView, SearchQuery, CartEvent, SalesMetric
+from .models import PageView, ProductView, SearchQuery, CartEvent, SalesMetric, RollupWatermark, DashboardSnapshot
 
 
 @admin.register(PageView)
@@ -40,3 +40,16 @@ class SalesMetricAdmin(admin.ModelAdmin):
     list_filter = ['period_type', 'period_start']
     search_fields = ['category__name', 'vendor__company_name']
     date_hierarchy = 'period_start'
+    readonly_fields = ['scope']
+
+
+@admin.register(RollupWatermark)
+class RollupWatermarkAdmin(admin.ModelAdmin):
+    list_display = ['name', 'processed_until', 'updated_at']
+
+
+@admin.register(DashboardSnapshot)
+class DashboardSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['key', 'generated_at']
+    search_fields = ['key']
+    readonly_fields = ['key', 'data', 'generated_at']
@@ -0,0 +1,231 @@
+"""
+Dashboard snapshots.
+
+The analytics dashboard (last 30 days, overall or per vendor) and the
+admin panel summary are computed here with grouped queries: names come in
+through joins and days through TruncDate, never with a query per row.
+``refresh_snapshots()`` stores each payload as a DashboardSnapshot row.
+Celery beat runs it every five minutes.
+
+The views read the stored row, which is one query however many orders
+there are. They compute and store a payload themselves when its row is
+missing, older than DASHBOARD_SNAPSHOT_MAX_AGE seconds, or ``?fresh=1``
+is given.
+
+A vendor's sales are the revenue of their own items. The overall sales
+are order totals.
+"""
+import logging
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, DecimalField, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+from products.models import Brand, Category, Product
+from vendors.models import VendorProfile
+from .models import DashboardSnapshot
+from .rollups import SALE_STATUSES
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+SALES = 'sales'
+ADMIN_SUMMARY = 'admin_summary'
+DASHBOARD_DAYS = 30
+TOP_ROWS = 10
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def get_max_age():
+    return getattr(settings, 'DASHBOARD_SNAPSHOT_MAX_AGE', 30 * 60)
+
+
+def sales_key(vendor=None):
+    return f'{SALES}:vendor:{vendor.id}' if vendor else SALES
+
+
+def _money(value):
+    return float(value or 0)
+
+
+def _name(row, prefix):
+    full_name = f"{row[prefix + 'first_name']} {row[prefix + 'last_name']}".strip()
+    return full_name or row[prefix + 'email']
+
+
+def build_sales_dashboard(start_date, end_date, vendor=None):
+    """The DashboardView payload for ``start_date``..``end_date``, for one vendor profile or overall."""
+    items = OrderItem.objects.filter(
+        order__created_at__gte=start_date,
+        order__created_at__lte=end_date,
+        order__status__in=SALE_STATUSES,
+    ).order_by()
+    revenue = Sum(F('price') * F('quantity'), output_field=MONEY)
+
+    if vendor:
+        items = items.filter(product__vendor_id=vendor.user_id)
+        totals = items.aggregate(total_sales=revenue, total_orders=Count('order', distinct=True))
+        daily = items.annotate(date=TruncDate('order__created_at')).values('date').annotate(
+            sales=revenue, orders=Count('order', distinct=True),
+        ).order_by('date')
+        customers = items.values('order__user_id', 'order__user__email', 'order__user__first_name',
+                                 'order__user__last_name').annotate(
+            orders=Count('order', distinct=True), spent=revenue,
+        )
+        prefix, customer_id = 'order__user__', 'order__user_id'
+    else:
+        orders = Order.objects.filter(
+            created_at__gte=start_date, created_at__lte=end_date, status__in=SALE_STATUSES,
+        ).order_by()
+        totals = orders.aggregate(total_sales=Sum('total'), total_orders=Count('id'))
+        daily = orders.annotate(date=TruncDate('created_at')).values('date').annotate(
+            sales=Sum('total'), orders=Count('id'),
+        ).order_by('date')
+        customers = orders.values('user_id', 'user__email', 'user__first_name', 'user__last_name').annotate(
+            orders=Count('id'), spent=Sum('total'),
+        )
+        prefix, customer_id = 'user__', 'user_id'
+
+    total_sales = _money(totals['total_sales'])
+    total_orders = totals['total_orders']
+    top_products = items.values('product_id', 'product__name').annotate(
+        sold=Sum('quantity'), revenue=revenue,
+    ).order_by('-sold', 'product_id')[:TOP_ROWS]
+    top_customers = customers.order_by('-spent', customer_id)[:TOP_ROWS]
+
+    return {
+        'sales': {
+            'total_sales': total_sales,
+            'total_orders': total_orders,
+            'average_order_value': total_sales / total_orders if total_orders else 0.0,
+            'daily_sales': [
+                {'date': row['date'].isoformat(), 'sales': _money(row['sales']), 'orders': row['orders']}
+                for row in daily
+            ],
+        },
+        'products': {
+            'total_products_sold': items.aggregate(sold=Sum('quantity'))['sold'] or 0,
+            'top_selling_products': [
+                {'id': row['product_id'], 'name': row['product__name'], 'sold': row['sold'],
+                 'revenue': _money(row['revenue'])}
+                for row in top_products
+            ],
+        },
+        'customers': {
+            'unique_customers': customers.count(),
+            'top_customers': [
+                {'id': row[customer_id], 'name': _name(row, prefix),
+                 'email': row[prefix + 'email'], 'orders': row['orders'], 'spent': _money(row['spent'])}
+                for row in top_customers
+            ],
+        },
+    }
+
+
+def build_admin_summary():
+    """The admin panel DashboardViewSet.summary payload."""
+    products = Product.objects.aggregate(total=Count('id'), pending=Count('id', filter=Q(is_approved=False)))
+    vendors = VendorProfile.objects.aggregate(total=Count('id'), pending=Count('id', filter=Q(status='pending')))
+    orders = Order.objects.order_by().aggregate(
+        count=Count('id'), revenue=Sum('total', filter=Q(status__in=SALE_STATUSES)),
+    )
+
+    today = timezone.localdate()
+    days = [today - timedelta(days=offset) for offset in range(6, -1, -1)]
+    by_day = {
+        row['date']: row
+        for row in Order.objects.filter(
+            created_at__gte=timezone.make_aware(datetime.combine(days[0], time.min)),
+        ).annotate(date=TruncDate('created_at')).values('date').annotate(
+            count=Count('id'), amount=Sum('total'),
+        ).order_by()
+    }
+
+    top_categories = Category.objects.annotate(product_count=Count('products')).order_by(
+        '-product_count', 'id').values('name', 'product_count')[:5]
+    top_brands = Brand.objects.annotate(product_count=Count('products')).order_by(
+        '-product_count', 'id').values('name', 'product_count')[:5]
+
+    return {
+        'counts': {
+            'products': products['total'],
+            'pending_products': products['pending'],
+            'vendors': vendors['total'],
+            'pending_vendors': vendors['pending'],
+            'orders': orders['count'],
+            'users': User.objects.count(),
+        },
+        'revenue': {
+            'total': _money(orders['revenue']),
+            'by_day': [
+                {'date': day.isoformat(), 'amount': _money(by_day.get(day, {}).get('amount'))}
+                for day in days
+            ],
+        },
+        'activity': {
+            'orders_by_day': [
+                {'date': day.isoformat(), 'count': by_day.get(day, {}).get('count', 0)}
+                for day in days
+            ],
+        },
+        'top_categories': [{'name': row['name'], 'count': row['product_count']} for row in top_categories],
+        'top_brands': [{'name': row['name'], 'count': row['product_count']} for row in top_brands],
+    }
+
+
+def _build(key):
+    if key == ADMIN_SUMMARY:
+        return build_admin_summary()
+    end_date = timezone.now()
+    start_date = end_date - timedelta(days=DASHBOARD_DAYS)
+    vendor = None
+    if key != SALES:
+        vendor = VendorProfile.objects.get(id=int(key.rsplit(':', 1)[1]))
+    return build_sales_dashboard(start_date, end_date, vendor)
+
+
+def store_snapshot(key):
+    """Compute and store the payload of ``key``; returns the snapshot."""
+    snapshot, _ = DashboardSnapshot.objects.update_or_create(
+        key=key, defaults={'data': _build(key), 'generated_at': timezone.now()},
+    )
+    return snapshot
+
+
+def get_snapshot(key, fresh=False):
+    """The stored snapshot of ``key``, recomputed first when asked for or too old."""
+    if not fresh:
+        snapshot = DashboardSnapshot.objects.filter(key=key).first()
+        if snapshot and snapshot.generated_at >= timezone.now() - timedelta(seconds=get_max_age()):
+            return snapshot
+    return store_snapshot(key)
+
+
+def refresh_snapshots():
+    """
+    Recompute the overall and admin snapshots, and those of every vendor
+    with sales in the window or a snapshot already. Returns the keys refreshed.
+    """
+    since = timezone.now() - timedelta(days=DASHBOARD_DAYS)
+    vendor_ids = set(VendorProfile.objects.filter(
+        user__products__orderitem__order__created_at__gte=since,
+        user__products__orderitem__order__status__in=SALE_STATUSES,
+    ).values_list('id', flat=True).distinct())
+    stored = DashboardSnapshot.objects.filter(key__startswith=f'{SALES}:vendor:').values_list('key', flat=True)
+    vendor_ids.update(int(key.rsplit(':', 1)[1]) for key in stored)
+
+    keys = [SALES, ADMIN_SUMMARY] + [f'{SALES}:vendor:{vendor_id}' for vendor_id in sorted(vendor_ids)]
+    refreshed = []
+    for key in keys:
+        try:
+            store_snapshot(key)
+            refreshed.append(key)
+        except VendorProfile.DoesNotExist:
+            DashboardSnapshot.objects.filter(key=key).delete()
+        except Exception as e:
+            logger.error(f"Error refreshing dashboard snapshot {key}: {str(e)}")
+    return refreshed
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cartevent',
+            index=models.Index(fields=['-timestamp', '-id'], name='cartevent_timestamp_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='pageview',
+            index=models.Index(fields=['-timestamp', '-id'], name='pageview_timestamp_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='productview',
+            index=models.Index(fields=['-timestamp', '-id'], name='productview_timestamp_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='searchquery',
+            index=models.Index(fields=['-timestamp', '-id'], name='searchquery_timestamp_keyset'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations, models
+
+
+def fill_scope(apps, schema_editor):
+    SalesMetric = apps.get_model('analytics', 'SalesMetric')
+    seen = set()
+    # Newest first, so older duplicates of an overall row are the ones dropped
+    for metric in SalesMetric.objects.order_by('-updated_at', '-id'):
+        if metric.category_id:
+            scope = f'category:{metric.category_id}'
+        elif metric.vendor_id:
+            scope = f'vendor:{metric.vendor_id}'
+        else:
+            scope = 'overall'
+        key = (metric.period_type, metric.period_start, scope)
+        if key in seen:
+            metric.delete()
+            continue
+        seen.add(key)
+        metric.scope = scope
+        metric.save(update_fields=['scope'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='salesmetric',
+            name='scope',
+            field=models.CharField(default='', editable=False, max_length=40),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_scope, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='salesmetric',
+            unique_together={('period_type', 'period_start', 'scope')},
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('processed_until', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
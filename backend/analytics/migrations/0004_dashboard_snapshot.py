@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_sales_metric_scope'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=60, unique=True)),
+                ('data', models.JSONField(default=dict)),
+                ('generated_at', models.DateTimeField()),
+            ],
+        ),
+    ]
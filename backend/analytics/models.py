@@ -44,6 +44,7 @@ class PageView(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['page_type', 'timestamp']),
+            models.Index(fields=['-timestamp', '-id'], name='pageview_timestamp_keyset'),
         ]
     
     def __str__(self):
@@ -73,6 +74,7 @@ class ProductView(models.Model):
         indexes = [
             models.Index(fields=['product', 'timestamp']),
             models.Index(fields=['user', 'timestamp']),
+            models.Index(fields=['-timestamp', '-id'], name='productview_timestamp_keyset'),
         ]
     
     def __str__(self):
@@ -102,6 +104,7 @@ class SearchQuery(models.Model):
         verbose_name_plural = "Search queries"
         indexes = [
             models.Index(fields=['query', 'timestamp']),
+            models.Index(fields=['-timestamp', '-id'], name='searchquery_timestamp_keyset'),
         ]
     
     def __str__(self):
@@ -136,6 +139,7 @@ class CartEvent(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['event_type', 'timestamp']),
+            models.Index(fields=['-timestamp', '-id'], name='cartevent_timestamp_keyset'),
             models.Index(fields=['product', 'event_type']),
         ]
     
@@ -175,16 +179,29 @@ class SalesMetric(models.Model):
     new_customers = models.PositiveIntegerField(default=0)
     returning_customers = models.PositiveIntegerField(default=0)
     
+    # 'overall', 'category:<id>' or 'vendor:<id>'; unlike the nullable foreign keys it can key an upsert
+    scope = models.CharField(max_length=40, editable=False)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        unique_together = ('period_type', 'period_start', 'category', 'vendor')
+        unique_together = ('period_type', 'period_start', 'scope')
         indexes = [
             models.Index(fields=['period_type', 'period_start']),
         ]
     
+    def save(self, *args, **kwargs):
+        if not self.scope:
+            if self.category_id:
+                self.scope = f'category:{self.category_id}'
+            elif self.vendor_id:
+                self.scope = f'vendor:{self.vendor_id}'
+            else:
+                self.scope = 'overall'
+        super().save(*args, **kwargs)
+    
     def __str__(self):
         base = f"{self.get_period_type_display()} metrics for {self.period_start}"
         if self.category:
@@ -192,3 +209,26 @@ class SalesMetric(models.Model):
         elif self.vendor:
             return f"{base} - Vendor: {self.vendor.company_name}"
         return base
+
+
+class RollupWatermark(models.Model):
+    """How far an incremental rollup has processed its source rows (see analytics/rollups.py)."""
+    
+    name = models.CharField(max_length=50, unique=True)
+    processed_until = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} up to {self.processed_until}"
+
+
+class DashboardSnapshot(models.Model):
+    """Pre-computed dashboard payload, refreshed in the background (see analytics/dashboard.py)."""
+    
+    # 'sales', 'sales:vendor:<vendor profile id>' or 'admin_summary'
+    key = models.CharField(max_length=60, unique=True)
+    data = models.JSONField(default=dict)
+    generated_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.key} dashboard at {self.generated_at}"
@@ -0,0 +1,188 @@
+"""
+Incremental sales metric rollups.
+
+SalesMetric rows hold daily, weekly, monthly and yearly totals, overall
+and per category and vendor. They are computed in the database:
+``OrderItem`` joined to its order and product and grouped by truncated
+order date and dimension. Nothing is loaded into Python but the grouped
+rows, which are upserted with ``bulk_create(update_conflicts=True)`` on
+(period_type, period_start, scope).
+
+``roll_up_sales_metrics()`` is incremental. A watermark records when the
+last run started. The next run looks only at orders changed since then,
+through their ``updated_at``, and recomputes just the periods those orders
+fall in. Rows of those periods that no longer have sales are removed.
+Deleted orders are not noticed until their period is rebuilt, for example
+with ``rebuild_sales_metrics``.
+
+A customer is new in a period when their first ever sale falls in it,
+and returning otherwise.
+"""
+import logging
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    Count, DateField, DecimalField, F, Min, OuterRef, Q, Subquery, Sum,
+)
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+from .models import RollupWatermark, SalesMetric
+
+logger = logging.getLogger(__name__)
+
+WATERMARK = 'sales_metrics'
+# Orders committed late with an earlier updated_at are still picked up; recomputing a period twice is harmless
+WATERMARK_OVERLAP = timedelta(minutes=1)
+SALE_STATUSES = ('completed', 'delivered')
+PERIOD_KINDS = {'daily': 'day', 'weekly': 'week', 'monthly': 'month', 'yearly': 'year'}
+DIMENSIONS = {
+    'overall': None,
+    'category': 'product__category_id',
+    'vendor': 'product__vendor__vendor_profile__id',
+}
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+CENTS = Decimal('0.01')
+
+
+def period_bounds(period_type, day):
+    """First and last day of the ``period_type`` period holding ``day``."""
+    if period_type == 'daily':
+        return day, day
+    if period_type == 'weekly':
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=6)
+    if period_type == 'monthly':
+        start = day.replace(day=1)
+        following = (start + timedelta(days=32)).replace(day=1)
+        return start, following - timedelta(days=1)
+    return date(day.year, 1, 1), date(day.year, 12, 31)
+
+
+def _aware(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _period_items(period_type, starts):
+    """Sold items of the periods starting on ``starts``, annotated with their period."""
+    kind = PERIOD_KINDS[period_type]
+    first_sale = Order.objects.filter(
+        user=OuterRef('order__user'), status__in=SALE_STATUSES,
+    ).order_by().values('user').annotate(first=Min('created_at')).values('first')
+    range_end = period_bounds(period_type, max(starts))[1] + timedelta(days=1)
+    return OrderItem.objects.filter(
+        order__status__in=SALE_STATUSES,
+        order__created_at__gte=_aware(min(starts)),
+        order__created_at__lt=_aware(range_end),
+    ).annotate(
+        period=Trunc('order__created_at', kind, output_field=DateField()),
+        customer_since=Trunc(Subquery(first_sale), kind, output_field=DateField()),
+    ).filter(period__in=starts).order_by()
+
+
+def _metric_rows(period_type, starts, now):
+    """SalesMetric instances for every dimension of the given periods."""
+    items = _period_items(period_type, starts)
+    rows = []
+    for dimension, field in DIMENSIONS.items():
+        group = ['period'] + ([field] if field else [])
+        grouped = items
+        if field:
+            grouped = grouped.filter(**{f'{field}__isnull': False})
+
+        # Heaviest product per group: the first row of each group in this order
+        top_products = {}
+        for row in grouped.values(*group, 'product_id').annotate(sold=Sum('quantity')).order_by(
+                *group, '-sold', 'product_id'):
+            top_products.setdefault(tuple(row[name] for name in group), row['product_id'])
+
+        totals = grouped.values(*group).annotate(
+            total_sales=Sum(F('price') * F('quantity'), output_field=MONEY),
+            total_orders=Count('order_id', distinct=True),
+            total_products_sold=Sum('quantity'),
+            customers=Count('order__user_id', distinct=True),
+            new_customers=Count('order__user_id', distinct=True, filter=Q(customer_since=F('period'))),
+        )
+        for row in totals:
+            key = tuple(row[name] for name in group)
+            dimension_id = row[field] if field else None
+            rows.append(SalesMetric(
+                period_type=period_type,
+                period_start=row['period'],
+                period_end=period_bounds(period_type, row['period'])[1],
+                category_id=dimension_id if dimension == 'category' else None,
+                vendor_id=dimension_id if dimension == 'vendor' else None,
+                scope=f'{dimension}:{dimension_id}' if field else dimension,
+                total_sales=row['total_sales'],
+                total_orders=row['total_orders'],
+                average_order_value=(row['total_sales'] / row['total_orders']).quantize(CENTS),
+                total_products_sold=row['total_products_sold'],
+                top_selling_product_id=top_products.get(key),
+                new_customers=row['new_customers'],
+                returning_customers=row['customers'] - row['new_customers'],
+                updated_at=now,
+            ))
+    return rows
+
+
+def roll_up_periods(period_type, days):
+    """
+    Recompute the ``period_type`` metrics of the periods holding ``days``.
+
+    Returns the number of metric rows written.
+    """
+    starts = sorted({period_bounds(period_type, day)[0] for day in days})
+    if not starts:
+        return 0
+    now = timezone.now()
+    rows = _metric_rows(period_type, starts, now)
+    with transaction.atomic():
+        SalesMetric.objects.bulk_create(
+            rows, batch_size=1000, update_conflicts=True,
+            unique_fields=['period_type', 'period_start', 'scope'],
+            update_fields=[
+                'period_end', 'category', 'vendor', 'total_sales', 'total_orders', 'average_order_value',
+                'total_products_sold', 'top_selling_product', 'new_customers', 'returning_customers',
+                'updated_at',
+            ],
+        )
+        # Dimensions of these periods that no longer have sales
+        SalesMetric.objects.filter(
+            period_type=period_type, period_start__in=starts, updated_at__lt=now,
+        ).delete()
+    return len(rows)
+
+
+def roll_up_sales_metrics(period_types=None):
+    """
+    Recompute the periods touched by orders changed since the last run.
+
+    The first run covers every order. Returns rows written per period type.
+    """
+    period_types = period_types or list(PERIOD_KINDS)
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+        started = timezone.now()
+        changed = Order.objects.order_by()
+        if watermark.processed_until:
+            changed = changed.filter(updated_at__gte=watermark.processed_until)
+        days = list(changed.dates('created_at', 'day'))
+
+        written = {period_type: roll_up_periods(period_type, days) for period_type in period_types}
+        watermark.processed_until = started - WATERMARK_OVERLAP
+        watermark.save(update_fields=['processed_until', 'updated_at'])
+    logger.info(f"Rolled up sales metrics for {len(days)} changed days: {written}")
+    return written
+
+
+def rebuild_sales_metrics(period_type, start_date, end_date):
+    """Recompute the ``period_type`` periods overlapping ``start_date``..``end_date``; returns rows written."""
+    days = []
+    day = start_date
+    while day <= end_date:
+        days.append(day)
+        day += timedelta(days=1)
+    return roll_up_periods(period_type, days)
@@ -0,0 +1,33 @@
+import logging
+
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def roll_up_sales_metrics():
+    """Recompute the sales metric periods touched since the last run (see analytics/rollups.py)."""
+    from .rollups import roll_up_sales_metrics as roll_up
+
+    written = roll_up()
+    return f"Wrote {sum(written.values())} sales metric rows"
+
+
+@shared_task
+def rebuild_sales_metrics(period_type, start_date, end_date):
+    """Recompute the sales metrics of a date range given as ISO dates."""
+    from datetime import date
+    from .rollups import rebuild_sales_metrics as rebuild
+
+    written = rebuild(period_type, date.fromisoformat(start_date), date.fromisoformat(end_date))
+    return f"Wrote {written} {period_type} sales metric rows"
+
+
+@shared_task
+def refresh_dashboard_snapshots():
+    """Recompute the stored dashboard payloads (see analytics/dashboard.py)."""
+    from .dashboard import refresh_snapshots
+
+    refreshed = refresh_snapshots()
+    return f"Refreshed {len(refreshed)} dashboard snapshots"
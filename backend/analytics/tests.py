@@ -1,3 +1,183 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from orders.models import Order, OrderItem
+from products.models import Brand, Category, Product
+from vendors.models import VendorProfile
+from .dashboard import refresh_snapshots
+from .models import DashboardSnapshot, RollupWatermark, SalesMetric
+from .rollups import roll_up_sales_metrics
+
+User = get_user_model()
+
+
+def create_order(user, day, lines, status='delivered'):
+    order = Order.objects.create(
+        user=user, status=status, payment_method='cod', shipping_address='House 1', shipping_city='Dhaka',
+        shipping_state='Dhaka', shipping_postal_code='1200', shipping_phone='01700000000',
+        subtotal=0, total=sum(product.base_price * quantity for product, quantity in lines),
+    )
+    for product, quantity in lines:
+        OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.base_price)
+    # update() skips auto_now, so the order looks untouched since it was placed
+    created_at = timezone.make_aware(datetime.combine(day, time(12)))
+    Order.objects.filter(pk=order.pk).update(created_at=created_at, updated_at=created_at)
+    return order
+
+
+@override_settings(CELERY_BROKER_URL=None)
+class SalesMetricRollupTest(TestCase):
+    """Sales metrics are grouped in SQL and only the periods of changed orders are recomputed."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create_user(email='vendor@example.com', password='pass')
+        cls.vendor_profile = VendorProfile.objects.create(
+            user=vendor, company_name='Acme', slug='acme', business_email='vendor@example.com',
+            business_phone='01700000000', business_address='Road 1', city='Dhaka', state='Dhaka',
+            postal_code='1200', country='Bangladesh',
+        )
+        other_vendor = User.objects.create_user(email='other@example.com', password='pass')
+        brand = Brand.objects.create(name='Acme', slug='acme')
+        cls.phones = Category.objects.create(name='Phones', slug='phones')
+        cls.cases = Category.objects.create(name='Cases', slug='cases')
+        cls.phone = Product.objects.create(name='Phone', slug='phone', category=cls.phones, brand=brand,
+                                           vendor=vendor, description='A phone', base_price=Decimal('100'))
+        cls.case = Product.objects.create(name='Case', slug='case', category=cls.cases, brand=brand,
+                                          vendor=other_vendor, description='A case', base_price=Decimal('50'))
+        cls.regular = User.objects.create_user(email='regular@example.com', password='pass')
+        cls.newcomer = User.objects.create_user(email='newcomer@example.com', password='pass')
+
+        create_order(cls.regular, date(2026, 2, 20), [(cls.phone, 1)])
+        create_order(cls.regular, date(2026, 3, 10), [(cls.phone, 3)])
+        cls.newcomer_order = create_order(cls.newcomer, date(2026, 3, 10), [(cls.case, 1)])
+        create_order(cls.newcomer, date(2026, 3, 10), [(cls.phone, 5)], status='cancelled')
+
+    def metric(self, period_type, period_start, scope='overall'):
+        return SalesMetric.objects.get(period_type=period_type, period_start=period_start, scope=scope)
+
+    def test_rolls_up_every_period_and_dimension(self):
+        written = roll_up_sales_metrics()
+        self.assertEqual(written['daily'], 2 + 3 + 2)
+
+        day = self.metric('daily', date(2026, 3, 10))
+        self.assertEqual((day.total_sales, day.total_orders, day.total_products_sold), (Decimal('350.00'), 2, 4))
+        self.assertEqual(day.average_order_value, Decimal('175.00'))
+        self.assertEqual(day.top_selling_product_id, self.phone.id)
+        self.assertEqual((day.new_customers, day.returning_customers), (1, 1))
+
+        phones = self.metric('daily', date(2026, 3, 10), f'category:{self.phones.id}')
+        self.assertEqual((phones.category_id, phones.total_sales), (self.phones.id, Decimal('300.00')))
+        vendor = self.metric('weekly', date(2026, 3, 9), f'vendor:{self.vendor_profile.id}')
+        self.assertEqual((vendor.vendor_id, vendor.period_end, vendor.total_sales),
+                         (self.vendor_profile.id, date(2026, 3, 15), Decimal('300.00')))
+        # The case's vendor has no profile, so it has no vendor row
+        self.assertEqual(SalesMetric.objects.filter(period_type='daily', scope__startswith='vendor:').count(), 2)
+
+        february = self.metric('monthly', date(2026, 2, 1))
+        self.assertEqual((february.period_end, february.new_customers, february.returning_customers),
+                         (date(2026, 2, 28), 1, 0))
+        year = self.metric('yearly', date(2026, 1, 1))
+        self.assertEqual((year.total_sales, year.total_orders, year.new_customers), (Decimal('450.00'), 3, 2))
+
+    def test_recomputes_only_periods_of_changed_orders(self):
+        roll_up_sales_metrics()
+        self.assertIsNotNone(RollupWatermark.objects.get(name='sales_metrics').processed_until)
+        self.assertEqual(roll_up_sales_metrics(), {'daily': 0, 'weekly': 0, 'monthly': 0, 'yearly': 0})
+
+        order = Order.objects.get(pk=self.newcomer_order.pk)
+        order.status = 'refunded'
+        order.save()
+        written = roll_up_sales_metrics()
+        self.assertEqual(written['daily'], 1 + 1 + 1)
+
+        day = self.metric('daily', date(2026, 3, 10))
+        self.assertEqual((day.total_sales, day.total_orders, day.new_customers, day.returning_customers),
+                         (Decimal('300.00'), 1, 0, 1))
+        self.assertFalse(SalesMetric.objects.filter(scope=f'category:{self.cases.id}').exists())
+        # February was not touched
+        self.assertEqual(self.metric('daily', date(2026, 2, 20)).total_sales, Decimal('100.00'))
+
+    def test_generate_endpoint_rebuilds_a_range(self):
+        admin = User.objects.create_user(email='admin@example.com', password='pass', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.post('/api/analytics/sales-metrics/generate/', {
+            'period_type': 'daily', 'start_date': '2026-03-01', 'end_date': '2026-03-31',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['metrics_generated'], 1 + 2 + 1)
+        self.assertFalse(SalesMetric.objects.filter(period_start=date(2026, 2, 20)).exists())
+
+
+class DashboardSnapshotTest(TestCase):
+    """Dashboards are served from stored snapshots, overall and per vendor."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user(email='vendor@example.com', password='pass')
+        VendorProfile.objects.create(
+            user=cls.vendor, company_name='Acme', slug='acme', business_email='vendor@example.com',
+            business_phone='01700000000', business_address='Road 1', city='Dhaka', state='Dhaka',
+            postal_code='1200', country='Bangladesh',
+        )
+        other_vendor = User.objects.create_user(email='other@example.com', password='pass')
+        brand = Brand.objects.create(name='Acme', slug='acme')
+        category = Category.objects.create(name='Phones', slug='phones')
+        cls.phone = Product.objects.create(name='Phone', slug='phone', category=category, brand=brand,
+                                           vendor=cls.vendor, description='A phone', base_price=Decimal('100'))
+        cls.case = Product.objects.create(name='Case', slug='case', category=category, brand=brand,
+                                          vendor=other_vendor, description='A case', base_price=Decimal('50'))
+        cls.customer = User.objects.create_user(email='customer@example.com', password='pass',
+                                                first_name='Rahim', last_name='Uddin')
+        cls.admin = User.objects.create_user(email='admin@example.com', password='pass', is_staff=True,
+                                             role='admin')
+        cls.recently = timezone.localdate() - timedelta(days=2)
+        create_order(cls.customer, cls.recently, [(cls.phone, 2), (cls.case, 1)])
+
+    def get(self, user, url):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_serves_stored_snapshot_until_refreshed(self):
+        data = self.get(self.admin, '/api/analytics/dashboard/')
+        self.assertEqual(data['sales']['total_sales'], 250.0)
+        self.assertEqual(data['sales']['daily_sales'], [
+            {'date': self.recently.isoformat(), 'sales': 250.0, 'orders': 1},
+        ])
+        self.assertEqual(data['products']['top_selling_products'][0],
+                         {'id': self.phone.id, 'name': 'Phone', 'sold': 2, 'revenue': 200.0})
+        self.assertEqual(data['customers']['top_customers'][0]['name'], 'Rahim Uddin')
+
+        create_order(self.customer, self.recently, [(self.case, 2)])
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        with self.assertNumQueries(1):
+            response = client.get('/api/analytics/dashboard/')
+        self.assertEqual(response.data['sales']['total_sales'], 250.0)
+
+        self.assertEqual(self.get(self.admin, '/api/analytics/dashboard/?fresh=1')['sales']['total_sales'], 350.0)
+        refresh_snapshots()
+        self.assertEqual(DashboardSnapshot.objects.get(key='admin_summary').data['revenue']['total'], 350.0)
+
+    def test_vendor_sees_own_items_only(self):
+        data = self.get(self.vendor, '/api/analytics/dashboard/')
+        self.assertEqual((data['sales']['total_sales'], data['sales']['total_orders']), (200.0, 1))
+        self.assertEqual(data['products']['total_products_sold'], 2)
+        self.assertEqual(data['customers']['top_customers'][0]['spent'], 200.0)
+
+    def test_admin_summary(self):
+        data = self.get(self.admin, '/api/admin/dashboard/summary/')
+        self.assertEqual(data['counts']['products'], 2)
+        self.assertEqual(data['counts']['pending_products'], 2)
+        self.assertEqual(len(data['activity']['orders_by_day']), 7)
+        self.assertIn({'date': self.recently.isoformat(), 'count': 1}, data['activity']['orders_by_day'])
+        self.assertEqual(data['top_categories'], [{'name': 'Phones', 'count': 2}])
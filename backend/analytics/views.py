@@ -1,5 +1,5 @@
 from django.shortcuts import render
-from django.db.models import Count, Sum, Avg, F, Q, ExpressionWrapper, DecimalField
+from django.db.models import Count, Avg, Q, ExpressionWrapper, DecimalField
 from django.db.models.functions import TruncDate, TruncWeek, TruncMonth, TruncYear
 from django.utils import timezone
 from rest_framework import viewsets, permissions, status, filters
@@ -17,15 +17,24 @@ from .serializers import (
     CartEventSerializer, SalesMetricSerializer
 )
 from .permissions import IsAdminOrVendorReadOnly
-from products.models import Product, Category
-from orders.models import Order, OrderItem
+from .rollups import PERIOD_KINDS, rebuild_sales_metrics
+from .dashboard import DASHBOARD_DAYS, build_sales_dashboard, get_snapshot, sales_key
+from backend.task_dispatch import dispatch_task
+from products.models import Product
+from products.pagination import CursorPaginationMixin
 
 
-class AnalyticsPagination(PageNumberPagination):
-    """Custom pagination for analytics data."""
+class AnalyticsPagination(CursorPaginationMixin, PageNumberPagination):
+    """Custom pagination for analytics data; ``?cursor=`` pages by (-timestamp, -id)."""
     page_size = 50
     page_size_query_param = 'page_size'
     max_page_size = 1000
+    cursor_ordering = ('-timestamp', '-id')
+
+
+class SalesMetricPagination(AnalyticsPagination):
+    """Analytics pagination for sales metrics, which have periods instead of timestamps."""
+    cursor_ordering = ('-period_start', '-id')
 
 
 class PageViewViewSet(viewsets.ModelViewSet):
@@ -384,7 +393,7 @@ class SalesMetricViewSet(viewsets.ModelViewSet):
     queryset = SalesMetric.objects.all().order_by('-period_start')
     serializer_class = SalesMetricSerializer
     permission_classes = [IsAdminOrVendorReadOnly]
-    pagination_class = AnalyticsPagination
+    pagination_class = SalesMetricPagination
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['period_start', 'total_sales']
     
@@ -447,12 +456,27 @@ class SalesMetricViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Generate metrics
+        if period_type not in PERIOD_KINDS:
+            return Response(
+                {'error': f"period_type must be one of {', '.join(PERIOD_KINDS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Recompute on a worker when a broker is configured; the SQL rollup is cheap enough inline otherwise
+        from .tasks import rebuild_sales_metrics as rebuild_task
+        if dispatch_task(rebuild_task, period_type, start_date.date().isoformat(), end_date.date().isoformat()):
+            return Response({
+                'status': 'queued',
+                'period_type': period_type,
+                'start_date': start_date,
+                'end_date': end_date
+            }, status=status.HTTP_202_ACCEPTED)
+        
         try:
-            metrics = self._generate_metrics(period_type, start_date, end_date)
+            metrics_generated = rebuild_sales_metrics(period_type, start_date.date(), end_date.date())
             return Response({
                 'status': 'success',
-                'metrics_generated': len(metrics),
+                'metrics_generated': metrics_generated,
                 'period_type': period_type,
                 'start_date': start_date,
                 'end_date': end_date
@@ -462,329 +486,33 @@ class SalesMetricViewSet(viewsets.ModelViewSet):
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-    
-    def _generate_metrics(self, period_type, start_date, end_date):
-        """Generate sales metrics for the given period."""
-        # Get all orders in the date range
-        orders = Order.objects.filter(
-            created_at__gte=start_date,
-            created_at__lte=end_date,
-            status__in=['completed', 'delivered']
-        )
-        
-        # No orders, no metrics
-        if not orders.exists():
-            return []
-        
-        # Create a DataFrame from orders
-        order_data = []
-        for order in orders:
-            for item in order.items.all():
-                order_data.append({
-                    'order_id': order.id,
-                    'user_id': order.user_id,
-                    'created_at': order.created_at,
-                    'product_id': item.product_id,
-                    'category_id': item.product.category_id if item.product else None,
-                    'vendor_id': item.product.vendor_id if item.product else None,
-                    'quantity': item.quantity,
-                    'price': float(item.price),
-                    'total': float(item.price) * item.quantity
-                })
-        
-        df = pd.DataFrame(order_data)
-        
-        # Add period column based on period_type
-        if period_type == 'daily':
-            df['period_start'] = df['created_at'].dt.date
-            df['period_end'] = df['period_start']
-        elif period_type == 'weekly':
-            df['period_start'] = df['created_at'].dt.to_period('W').dt.start_time.dt.date
-            df['period_end'] = df['created_at'].dt.to_period('W').dt.end_time.dt.date
-        elif period_type == 'monthly':
-            df['period_start'] = df['created_at'].dt.to_period('M').dt.start_time.dt.date
-            df['period_end'] = df['created_at'].dt.to_period('M').dt.end_time.dt.date
-        elif period_type == 'yearly':
-            df['period_start'] = df['created_at'].dt.to_period('Y').dt.start_time.dt.date
-            df['period_end'] = df['created_at'].dt.to_period('Y').dt.end_time.dt.date
-        
-        # Generate overall metrics
-        overall_metrics = []
-        for period_start, period_data in df.groupby('period_start'):
-            period_end = period_data['period_end'].iloc[0]
-            
-            # Calculate metrics
-            total_sales = period_data['total'].sum()
-            total_orders = period_data['order_id'].nunique()
-            avg_order_value = total_sales / total_orders if total_orders > 0 else 0
-            total_products = period_data['quantity'].sum()
-            
-            # Find top selling product
-            product_sales = period_data.groupby('product_id')['quantity'].sum()
-            top_product_id = product_sales.idxmax() if not product_sales.empty else None
-            
-            # Count customers
-            users = period_data['user_id'].unique()
-            # This is simplified - in reality you'd need to check if they ordered before this period
-            new_customers = len(users)
-            returning_customers = 0
-            
-            # Create or update metric
-            metric, created = SalesMetric.objects.update_or_create(
-                period_type=period_type,
-                period_start=period_start,
-                period_end=period_end,
-                category=None,
-                vendor=None,
-                defaults={
-                    'total_sales': total_sales,
-                    'total_orders': total_orders,
-                    'average_order_value': avg_order_value,
-                    'total_products_sold': total_products,
-                    'top_selling_product_id': top_product_id,
-                    'new_customers': new_customers,
-                    'returning_customers': returning_customers
-                }
-            )
-            overall_metrics.append(metric)
-        
-        # Generate metrics by category
-        category_metrics = []
-        for (period_start, category_id), period_cat_data in df.groupby(['period_start', 'category_id']):
-            if not category_id:
-                continue
-                
-            period_end = period_cat_data['period_end'].iloc[0]
-            
-            # Calculate metrics
-            total_sales = period_cat_data['total'].sum()
-            total_orders = period_cat_data['order_id'].nunique()
-            avg_order_value = total_sales / total_orders if total_orders > 0 else 0
-            total_products = period_cat_data['quantity'].sum()
-            
-            # Find top selling product
-            product_sales = period_cat_data.groupby('product_id')['quantity'].sum()
-            top_product_id = product_sales.idxmax() if not product_sales.empty else None
-            
-            # Create or update metric
-            try:
-                category = Category.objects.get(id=category_id)
-                metric, created = SalesMetric.objects.update_or_create(
-                    period_type=period_type,
-                    period_start=period_start,
-                    period_end=period_end,
-                    category=category,
-                    vendor=None,
-                    defaults={
-                        'total_sales': total_sales,
-                        'total_orders': total_orders,
-                        'average_order_value': avg_order_value,
-                        'total_products_sold': total_products,
-                        'top_selling_product_id': top_product_id,
-                        'new_customers': 0,  # Not tracking by category
-                        'returning_customers': 0  # Not tracking by category
-                    }
-                )
-                category_metrics.append(metric)
-            except Category.DoesNotExist:
-                continue
-        
-        # Generate metrics by vendor
-        vendor_metrics = []
-        for (period_start, vendor_id), period_vendor_data in df.groupby(['period_start', 'vendor_id']):
-            if not vendor_id:
-                continue
-                
-            period_end = period_vendor_data['period_end'].iloc[0]
-            
-            # Calculate metrics
-            total_sales = period_vendor_data['total'].sum()
-            total_orders = period_vendor_data['order_id'].nunique()
-            avg_order_value = total_sales / total_orders if total_orders > 0 else 0
-            total_products = period_vendor_data['quantity'].sum()
-            
-            # Find top selling product
-            product_sales = period_vendor_data.groupby('product_id')['quantity'].sum()
-            top_product_id = product_sales.idxmax() if not product_sales.empty else None
-            
-            # Create or update metric
-            try:
-                from vendors.models import VendorProfile
-                vendor = VendorProfile.objects.get(id=vendor_id)
-                metric, created = SalesMetric.objects.update_or_create(
-                    period_type=period_type,
-                    period_start=period_start,
-                    period_end=period_end,
-                    category=None,
-                    vendor=vendor,
-                    defaults={
-                        'total_sales': total_sales,
-                        'total_orders': total_orders,
-                        'average_order_value': avg_order_value,
-                        'total_products_sold': total_products,
-                        'top_selling_product_id': top_product_id,
-                        'new_customers': 0,  # Not tracking by vendor
-                        'returning_customers': 0  # Not tracking by vendor
-                    }
-                )
-                vendor_metrics.append(metric)
-            except Exception:
-                continue
-        
-        return overall_metrics + category_metrics + vendor_metrics
 
 
 class DashboardView(APIView):
-    """API endpoint for dashboard summary data."""
+    """API endpoint for dashboard summary data, served from snapshots (see analytics/dashboard.py)."""
     permission_classes = [IsAdminOrVendorReadOnly]
     
     def get(self, request):
-        """Get dashboard summary data."""
-        # Get date range
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=30)  # Default to last 30 days
-        
-        if request.query_params.get('start_date'):
-            start_date = datetime.fromisoformat(request.query_params.get('start_date'))
-        if request.query_params.get('end_date'):
-            end_date = datetime.fromisoformat(request.query_params.get('end_date'))
-        
+        """Get dashboard summary data; ``?fresh=1`` recomputes it first."""
         # For vendors, only show their data
-        vendor_filter = {}
+        vendor = None
         if not request.user.is_staff and hasattr(request.user, 'vendor_profile'):
             vendor = request.user.vendor_profile
-            vendor_filter = {'vendor': vendor}
-        
-        # Get sales data
-        sales_data = self._get_sales_data(start_date, end_date, vendor_filter)
-        
-        # Get product data
-        product_data = self._get_product_data(start_date, end_date, vendor_filter)
-        
-        # Get customer data
-        customer_data = self._get_customer_data(start_date, end_date, vendor_filter)
-        
-        return Response({
-            'sales': sales_data,
-            'products': product_data,
-            'customers': customer_data
-        })
-    
-    def _get_sales_data(self, start_date, end_date, vendor_filter):
-        """Get sales summary data."""
-        # Get orders in date range
-        orders = Order.objects.filter(
-            created_at__gte=start_date,
-            created_at__lte=end_date,
-            status__in=['completed', 'delivered']
-        )
-        
-        # Apply vendor filter if needed
-        if vendor_filter and 'vendor' in vendor_filter:
-            orders = orders.filter(items__product__vendor=vendor_filter['vendor'])
-        
-        # Calculate sales metrics
-        total_sales = sum(order.total_amount for order in orders)
-        total_orders = orders.count()
-        avg_order_value = total_sales / total_orders if total_orders > 0 else 0
-        
-        # Get daily sales
-        daily_sales = orders.annotate(
-            date=TruncDate('created_at')
-        ).values('date').annotate(
-            sales=Sum('total_amount'),
-            orders=Count('id')
-        ).order_by('date')
-        
-        return {
-            'total_sales': float(total_sales),
-            'total_orders': total_orders,
-            'average_order_value': float(avg_order_value),
-            'daily_sales': list(daily_sales)
-        }
-    
-    def _get_product_data(self, start_date, end_date, vendor_filter):
-        """Get product summary data."""
-        # Get order items in date range
-        order_items = OrderItem.objects.filter(
-            order__created_at__gte=start_date,
-            order__created_at__lte=end_date,
-            order__status__in=['completed', 'delivered']
-        )
-        
-        # Apply vendor filter if needed
-        if vendor_filter and 'vendor' in vendor_filter:
-            order_items = order_items.filter(product__vendor=vendor_filter['vendor'])
-        
-        # Calculate product metrics
-        total_products_sold = order_items.aggregate(Sum('quantity'))['quantity__sum'] or 0
         
-        # Get top selling products
-        top_products = order_items.values('product').annotate(
-            sold=Sum('quantity'),
-            revenue=Sum(F('price') * F('quantity'))
-        ).order_by('-sold')[:10]
-        
-        # Enrich with product data
-        top_products_enriched = []
-        for item in top_products:
-            try:
-                product = Product.objects.get(id=item['product'])
-                top_products_enriched.append({
-                    'id': product.id,
-                    'name': product.name,
-                    'sold': item['sold'],
-                    'revenue': float(item['revenue'])
-                })
-            except Product.DoesNotExist:
-                continue
-        
-        return {
-            'total_products_sold': total_products_sold,
-            'top_selling_products': top_products_enriched
-        }
-    
-    def _get_customer_data(self, start_date, end_date, vendor_filter):
-        """Get customer summary data."""
-        # Get orders in date range
-        orders = Order.objects.filter(
-            created_at__gte=start_date,
-            created_at__lte=end_date,
-            status__in=['completed', 'delivered']
-        )
-        
-        # Apply vendor filter if needed
-        if vendor_filter and 'vendor' in vendor_filter:
-            orders = orders.filter(items__product__vendor=vendor_filter['vendor'])
-        
-        # Count unique customers
-        unique_customers = orders.values('user').distinct().count()
-        
-        # Get top customers
-        top_customers = orders.values('user').annotate(
-            orders=Count('id'),
-            spent=Sum('total_amount')
-        ).order_by('-spent')[:10]
-        
-        # Enrich with user data
-        top_customers_enriched = []
-        for item in top_customers:
-            try:
-                user = User.objects.get(id=item['user'])
-                top_customers_enriched.append({
-                    'id': user.id,
-                    'name': user.get_full_name() or user.email,
-                    'email': user.email,
-                    'orders': item['orders'],
-                    'spent': float(item['spent'])
-                })
-            except User.DoesNotExist:
-                continue
-        
-        return {
-            'unique_customers': unique_customers,
-            'top_customers': top_customers_enriched
-        }
+        # A custom date range is computed on the spot; snapshots cover the last 30 days
+        if request.query_params.get('start_date') or request.query_params.get('end_date'):
+            end_date = timezone.now()
+            start_date = end_date - timedelta(days=DASHBOARD_DAYS)
+            if request.query_params.get('start_date'):
+                start_date = datetime.fromisoformat(request.query_params.get('start_date'))
+            if request.query_params.get('end_date'):
+                end_date = datetime.fromisoformat(request.query_params.get('end_date'))
+            data = build_sales_dashboard(start_date, end_date, vendor)
+            return Response({**data, 'generated_at': timezone.now()})
+        
+        fresh = request.query_params.get('fresh') in ('1', 'true')
+        snapshot = get_snapshot(sales_key(vendor), fresh=fresh)
+        return Response({**snapshot.data, 'generated_at': snapshot.generated_at})
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
@@ -0,0 +1,275 @@
+"""
+Shared client for outbound HTTP calls.
+
+``get_client(name)`` returns the process-wide client for one upstream
+(``sslcommerz``, ``sms``, ``images``, ...). Each client keeps a pooled
+``requests.Session``, so calls reuse kept-alive connections instead of
+paying a TCP and TLS handshake every time. Settings come from
+HTTP_CLIENT_DEFAULTS, overridden per upstream by HTTP_UPSTREAMS.
+
+Every call gets connect/read timeouts. Retries depend on the method:
+
+* Connection failures are retried for every method, since the request
+  never reached the upstream.
+* Read timeouts, dropped responses and 429/502/503/504 are retried only
+  for idempotent calls. GET and HEAD are idempotent by default; a POST
+  that only reads (``idempotent=True``) can be marked as such.
+
+Each upstream has a circuit breaker; ``breaker_per_host`` gives each host
+its own. After ``failure_threshold`` consecutive failures (connection
+errors, timeouts, 5xx), calls fail fast with CircuitOpenError for
+``reset_timeout`` seconds. Then a single trial call decides whether it
+closes again. CircuitOpenError is a ``requests.ConnectionError``, so
+existing error handling treats it like an unreachable host.
+
+Latency per upstream is kept in a histogram. ``upstream_stats()``
+reports it for the current process.
+"""
+import math
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from django.conf import settings
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+# Upper bounds in seconds, as in Prometheus' default buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+DEFAULTS = {
+    'timeout': (3.05, 30),
+    'retries': 2,
+    'backoff': 0.3,
+    'pool_size': 10,
+    'failure_threshold': 5,
+    'reset_timeout': 30,
+    'breaker_per_host': False,
+}
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open trial call."""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            # Open long enough, or a half-open trial that never reported back
+            if now - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.opened_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class LatencyHistogram:
+    """Counts of call latencies per bucket, with errors alongside."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, error=False):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self.counts[i] += 1
+                    break
+            self.count += 1
+            self.total += seconds
+            if error:
+                self.errors += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile, in seconds."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'count': self.count,
+                'errors': self.errors,
+                'mean_ms': round(self.total / self.count * 1000, 1) if self.count else None,
+                'p50_ms': _ms(self.quantile(0.5)),
+                'p95_ms': _ms(self.quantile(0.95)),
+                'p99_ms': _ms(self.quantile(0.99)),
+                'buckets': [
+                    {'le_ms': _ms(bound), 'count': count} for bound, count in zip(self.buckets, self.counts)
+                ],
+            }
+
+
+def _ms(seconds):
+    if seconds is None:
+        return None
+    return 'inf' if math.isinf(seconds) else round(seconds * 1000, 1)
+
+
+class HTTPClient:
+    """Pooled session, retries, circuit breakers and latency histograms for one upstream."""
+
+    def __init__(self, name, timeout=None, retries=None, backoff=None, pool_size=None,
+                 failure_threshold=None, reset_timeout=None, breaker_per_host=None):
+        self.name = name
+        self.timeout = timeout or DEFAULTS['timeout']
+        self.retries = retries if retries is not None else DEFAULTS['retries']
+        self.backoff = backoff if backoff is not None else DEFAULTS['backoff']
+        self.failure_threshold = failure_threshold or DEFAULTS['failure_threshold']
+        self.reset_timeout = reset_timeout or DEFAULTS['reset_timeout']
+        self.breaker_per_host = breaker_per_host if breaker_per_host is not None else DEFAULTS['breaker_per_host']
+        pool_size = pool_size or DEFAULTS['pool_size']
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self._histograms = {}
+
+    def _key(self, url):
+        if self.breaker_per_host:
+            return f"{self.name}:{urlparse(url).netloc.lower()}"
+        return self.name
+
+    def _breaker(self, key):
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self._histograms[key] = LatencyHistogram()
+            return self._breakers[key]
+
+    def request(self, method, url, idempotent=None, retries=None, **kwargs):
+        """
+        Send a request and return the response; raises ``requests`` exceptions as usual.
+
+        ``retries`` overrides the upstream's count for calls whose caller
+        retries on its own.
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        retries = self.retries if retries is None else retries
+        kwargs.setdefault('timeout', self.timeout)
+        key = self._key(url)
+        breaker = self._breaker(key)
+        histogram = self._histograms[key]
+
+        for attempt in range(retries + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {key}")
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                histogram.observe(time.perf_counter() - started, error=True)
+                breaker.record_failure()
+                if not (idempotent or _not_sent(e)) or attempt == retries:
+                    raise
+            else:
+                failed = response.status_code >= 500
+                histogram.observe(time.perf_counter() - started, error=failed)
+                if failed:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if not (idempotent and response.status_code in RETRY_STATUSES) or attempt == retries:
+                    return response
+                response.close()
+            # Exponential backoff with full jitter
+            time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            keys = list(self._breakers)
+        return {
+            key: {**self._histograms[key].snapshot(), 'circuit': self._breakers[key].state}
+            for key in keys
+        }
+
+
+def _not_sent(error):
+    """Whether the request failed while connecting, so the upstream never saw it."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name):
+    """Return the shared client for upstream ``name``, creating it on first use."""
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            config = {
+                **getattr(settings, 'HTTP_CLIENT_DEFAULTS', {}),
+                **getattr(settings, 'HTTP_UPSTREAMS', {}).get(name, {}),
+            }
+            client = _clients[name] = HTTPClient(name, **config)
+        return client
+
+
+def upstream_stats():
+    """Latency histograms and circuit states of every upstream called by this process."""
+    with _clients_lock:
+        clients = list(_clients.values())
+    stats = {}
+    for client in clients:
+        stats.update(client.stats())
+    return stats
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     # Third-party apps
     'rest_framework',
@@ -310,6 +311,57 @@ SSLCOMMERZ_IPN_URL = f'{BACKEND_BASE_URL}/api/payments/ipn/'
 PAYMENT_TIMEOUT = 30  # minutes
 MAX_PAYMENT_RETRY = 3
 
+# Stock reserved at checkout is returned if not paid within this many seconds (see orders/inventory.py)
+STOCK_RESERVATION_TTL = PAYMENT_TIMEOUT * 60
+
+CELERY_BEAT_SCHEDULE = {
+    'expire-stock-reservations': {
+        'task': 'orders.tasks.expire_stock_reservations',
+        'schedule': 60.0,  # Every minute
+    },
+    'dispatch-sms-outbox': {
+        'task': 'sms.tasks.dispatch_sms_outbox',
+        'schedule': 30.0,  # Retries and anything not picked up after commit
+    },
+    'refresh-emi-bank-catalog': {
+        'task': 'emi.tasks.refresh_emi_bank_catalog',
+        'schedule': 6 * 60 * 60.0,  # Every 6 hours
+    },
+    'roll-up-sales-metrics': {
+        'task': 'analytics.tasks.roll_up_sales_metrics',
+        'schedule': 15 * 60.0,  # Periods touched by orders changed since the last run
+    },
+    'refresh-dashboard-snapshots': {
+        'task': 'analytics.tasks.refresh_dashboard_snapshots',
+        'schedule': 5 * 60.0,  # Every 5 minutes
+    },
+    'reconcile-review-stats': {
+        'task': 'reviews.tasks.reconcile_review_stats',
+        'schedule': 24 * 60 * 60.0,  # Daily; signals keep the stats current in between
+    },
+    'reconcile-purchased-products': {
+        'task': 'orders.tasks.reconcile_purchased_products',
+        'schedule': 24 * 60 * 60.0,  # Daily; order saves keep the index current in between
+    },
+}
+
+# EMI bank catalog cache (see emi/bank_catalog.py)
+EMI_BANK_CACHE_TTL = 300  # Seconds a cached catalog is served as fresh
+EMI_BANK_CACHE_STALE = 24 * 60 * 60  # Seconds after that it is still served while being rebuilt
+
+# EMI reminders (see emi/reminders.py)
+EMI_REMINDER_DAYS = 3  # Days before the due date a reminder is sent
+EMI_REMINDER_CHUNK_SIZE = 500  # Installments loaded, queued and marked per transaction
+
+# Dashboard snapshots (see analytics/dashboard.py), refreshed every 5 minutes by beat
+DASHBOARD_SNAPSHOT_MAX_AGE = 30 * 60  # Seconds before a view recomputes a snapshot itself
+
+# Shipping zones are compiled per process (see shipping/zones.py)
+SHIPPING_ZONES_TTL = 300  # Seconds before a process recompiles without a version change
+
+# Per-user purchased product sets (see orders/purchases.py)
+PURCHASED_PRODUCTS_TTL = 60 * 60  # Seconds a cached set is kept; order status changes drop it sooner
+
 # SMS API Settings (SSL Wireless)
 SMS_API_URL = os.getenv('SMS_API_URL', 'https://smsplus.sslwireless.com')
 SMS_API_SID = os.getenv('SMS_API_SID', 'PHONEBAYBRAND')  # SSL Wireless SID
@@ -317,6 +369,13 @@ SMS_API_TOKEN = os.getenv('SMS_API_TOKEN', '4v32ycsy-q0f22usn-qk8aminl-g78imsro-
 SMS_BRAND_NAME = os.getenv('SMS_BRAND_NAME', 'Phone Bay')
 SMS_TEST_MODE = os.getenv('SMS_TEST_MODE', 'False').lower() == 'true'  # Set to False for live mode
 
+# Queued SMS dispatch (see sms/dispatch.py)
+SMS_DISPATCH_BATCH_SIZE = 100  # Messages per bulk API call
+SMS_DISPATCH_RATE = 50  # Messages per second
+SMS_DISPATCH_TIMEOUT = (5, 30)  # Connect and read timeouts in seconds
+SMS_DISPATCH_MAX_ATTEMPTS = 5
+SMS_DISPATCH_BACKOFF = 30  # Seconds before the first retry, doubling after that
+
 # SMS template defaults
 DEFAULT_SMS_TEMPLATES = {
     'welcome': 'Welcome to Phone Bay! Your account has been created successfully. Shop the latest mobile phones and accessories.',
@@ -326,3 +385,52 @@ DEFAULT_SMS_TEMPLATES = {
     'order_status': 'Your order #{order_id} status has been updated to: {status}. Track your order on our website.',
     'emi_reminder': 'Reminder: Your EMI payment of {amount} BDT for order #{order_id} is due on {due_date}. Please make your payment to avoid late fees.'
 }
+
+# Product image renditions (see products/renditions.py)
+IMAGE_RENDITION_DIR = 'renditions'
+IMAGE_RENDITION_WIDTHS = [300, 600]  # thumbnail_small and thumbnail_medium
+IMAGE_RENDITION_MAX_WIDTH = 2000
+IMAGE_RENDITION_MAX_AGE = 3600  # Seconds before clients revalidate a thumbnail with its ETag
+IMAGE_RENDITION_MEMORY_BYTES = 64 * 1024 * 1024  # Per-process LRU budget
+IMAGE_RENDITION_MEMORY_ITEM_BYTES = 512 * 1024
+IMAGE_RENDITION_ASYNC = os.getenv('IMAGE_RENDITION_ASYNC', 'False').lower() == 'true'
+# 'django' streams files, 'x-accel-redirect' hands them to nginx, 'x-sendfile' to Apache/lighttpd
+IMAGE_RENDITION_SERVE_MODE = os.getenv('IMAGE_RENDITION_SERVE_MODE', 'django')
+IMAGE_RENDITION_ACCEL_PREFIX = '/protected-media/'
+
+# Autocomplete prefix index (see products/autocomplete.py)
+AUTOCOMPLETE_INDEX_MAX_AGE = 300  # Seconds before a process rebuilds its index
+AUTOCOMPLETE_INDEX_CHECK_INTERVAL = 5  # Seconds between checks of the shared version
+AUTOCOMPLETE_INDEX_OVERLAY_LIMIT = 500  # Incremental updates kept before a rebuild
+AUTOCOMPLETE_POPULARITY_DAYS = 90  # Search history used for popularity weights
+
+# Homepage rail response cache (see products/rail_cache.py)
+RAIL_CACHE_TIMEOUT = 600  # Seconds a rail stays in the server-side cache
+RAIL_CACHE_MAX_AGE = 60  # Cache-Control max-age for browsers and CDNs
+RAIL_CACHE_STALE_WHILE_REVALIDATE = 300
+
+# Bulk product imports (see products/imports.py)
+IMPORT_CHUNK_SIZE = 1000  # Rows per transaction and progress update
+
+# Image downloads for bulk imports (see products/image_fetcher.py)
+IMAGE_FETCH_WORKERS = 16  # Concurrent downloads per batch
+IMAGE_FETCH_PER_HOST = 4  # Concurrent downloads from any one host
+IMAGE_FETCH_RETRIES = 3  # Retries after connection errors, timeouts, 429s and 5xx
+IMAGE_FETCH_BACKOFF = 0.5  # Seconds; doubled each retry, with full jitter
+IMAGE_FETCH_TIMEOUT = (5, 30)  # Connect and read timeouts in seconds
+IMAGE_FETCH_MAX_BYTES = 20 * 1024 * 1024
+
+# Outbound HTTP clients (see backend/http_client.py); HTTP_UPSTREAMS overrides the defaults per upstream
+HTTP_CLIENT_DEFAULTS = {
+    'timeout': (3.05, 30),  # Connect and read timeouts in seconds
+    'retries': 2,  # Idempotent calls only, apart from failed connects
+    'backoff': 0.3,  # Seconds; doubled each retry, with full jitter
+    'pool_size': 10,  # Kept-alive connections per host
+    'failure_threshold': 5,  # Consecutive failures that open the circuit
+    'reset_timeout': 30,  # Seconds before a trial call is let through
+}
+HTTP_UPSTREAMS = {
+    'sslcommerz': {'timeout': (3.05, 30)},
+    'sms': {'timeout': (3.05, 15)},
+    'images': {'pool_size': IMAGE_FETCH_WORKERS, 'timeout': IMAGE_FETCH_TIMEOUT, 'breaker_per_host': True},
+}
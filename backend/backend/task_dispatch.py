@@ -0,0 +1,31 @@
+"""
+Queue background work on Celery when a broker is configured.
+
+``dispatch_task(task, *args, fallback=fn)`` calls ``task.delay(*args)``
+when CELERY_BROKER_URL is set. Without a broker, or when queueing fails,
+it runs ``fallback(*args)`` in the current process instead, so the work
+still happens. Queueing failures are logged with their traceback.
+"""
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch_task(task, *args, fallback=None):
+    """
+    Queue ``task`` with ``args``; returns True if it was queued.
+
+    Otherwise ``fallback(*args)`` runs inline when given, and False is
+    returned so callers without a fallback can do the work themselves.
+    """
+    if getattr(settings, 'CELERY_BROKER_URL', None):
+        try:
+            task.delay(*args)
+            return True
+        except Exception:
+            logger.exception(f"Error queueing {task.name}")
+    if fallback is not None:
+        fallback(*args)
+    return False
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Build the in-memory autocomplete index in the background
+from products.autocomplete import warm_autocomplete_index  # noqa: E402
+
+warm_autocomplete_index()
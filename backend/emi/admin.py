@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import EMIPlan, EMIApplication, EMIRecord, EMIInstallment
+from .models import EMIPlan, EMIBank, EMIApplication, EMIRecord, EMIInstallment
 
 
 class EMIInstallmentInline(admin.TabularInline):
@@ -13,6 +13,15 @@ class EMIInstallmentInline(admin.TabularInline):
     ]
 
 
+@admin.register(EMIBank)
+class EMIBankAdmin(admin.ModelAdmin):
+    """Admin interface for the EMI bank catalog."""
+    list_display = ['name', 'code', 'interest_rate', 'processing_fee_percentage', 'source', 'is_active', 'refreshed_at']
+    list_filter = ['is_active', 'source']
+    search_fields = ['name', 'code']
+    readonly_fields = ['refreshed_at']
+
+
 @admin.register(EMIPlan)
 class EMIPlanAdmin(admin.ModelAdmin):
     """Admin interface for EMI plans."""
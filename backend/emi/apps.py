@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class EmiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'emi'
+
+    def ready(self):
+        """Import signals when the app is ready."""
+        import emi.signals
@@ -0,0 +1,264 @@
+"""
+Card EMI bank catalog and local EMI quotes.
+
+Banks and their rates are stored as EMIBank rows. The
+``refresh_emi_bank_catalog`` task updates them from SSLCOMMERZ every
+EMI_BANK_REFRESH_INTERVAL. When the gateway cannot be reached and the
+table is empty, it is seeded from FALLBACK_BANKS. Requests never call the
+gateway. They read the catalog through a cache, and every quote is
+computed locally from the cached rates.
+
+A cached catalog is fresh for EMI_BANK_CACHE_TTL seconds. For another
+EMI_BANK_CACHE_STALE seconds it is still served, and one request per
+window rebuilds it from the table (stale-while-revalidate). The rebuild
+runs on a Celery worker when a broker is configured, otherwise inline,
+which is one query. The TTL bounds how long a process with its own cache
+(LocMem) keeps serving rates after the table changes.
+
+``catalog_metrics()`` reports the age of the cached copy and of the
+catalog itself, with hit, stale and miss counts. Reads are counted in
+process and added to the shared counters every METRICS_FLUSH_INTERVAL
+seconds, so a catalog read costs no cache write.
+"""
+import logging
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from backend.task_dispatch import dispatch_task
+
+from .models import EMIBank
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'emi:banks:catalog'
+REVALIDATE_KEY = 'emi:banks:revalidating'
+METRIC_KEYS = ('hits', 'stale_hits', 'misses')
+# Seconds between writes of a process's hit counts to the cache
+METRICS_FLUSH_INTERVAL = 10
+
+_counts = dict.fromkeys(METRIC_KEYS, 0)
+_counts_flushed = [time.monotonic()]
+_counts_lock = threading.Lock()
+
+# Used only while SSLCOMMERZ has never been reached
+FALLBACK_BANKS = [
+    {'code': 'DBBL', 'name': 'Dutch-Bangla Bank', 'interest_rate': Decimal('12.5')},
+    {'code': 'EBLC', 'name': 'Eastern Bank', 'interest_rate': Decimal('13.0')},
+    {'code': 'BCBL', 'name': 'Bangladesh Commerce Bank', 'interest_rate': Decimal('11.5')},
+    {'code': 'BBL', 'name': 'BRAC Bank', 'interest_rate': Decimal('12.0')},
+    {'code': 'ABBL', 'name': 'AB Bank', 'interest_rate': Decimal('13.5')},
+    {'code': 'MTBL', 'name': 'Mutual Trust Bank', 'interest_rate': Decimal('12.0')},
+    {'code': 'SCB', 'name': 'Standard Chartered Bank', 'interest_rate': Decimal('11.0')},
+    {'code': 'CITI', 'name': 'Citibank', 'interest_rate': Decimal('10.5')},
+    {'code': 'EBL', 'name': 'Eastern Bank Limited', 'interest_rate': Decimal('12.5')},
+    {'code': 'HSBC', 'name': 'HSBC Bank', 'interest_rate': Decimal('11.5')},
+]
+DEFAULT_INTEREST_RATE = Decimal('12.0')
+
+
+def get_cache_ttl():
+    """Seconds a cached catalog is served without revalidation."""
+    return getattr(settings, 'EMI_BANK_CACHE_TTL', 300)
+
+
+def get_cache_stale():
+    """Seconds past the TTL a cached catalog may still be served while it is rebuilt."""
+    return getattr(settings, 'EMI_BANK_CACHE_STALE', 24 * 60 * 60)
+
+
+def _count(metric):
+    """Count a catalog read in this process; the counts reach the cache every METRICS_FLUSH_INTERVAL."""
+    with _counts_lock:
+        _counts[metric] += 1
+        due = time.monotonic() - _counts_flushed[0] >= METRICS_FLUSH_INTERVAL
+    if due:
+        flush_metrics()
+
+
+def flush_metrics():
+    """Add this process's pending counts to the shared counters in the cache."""
+    with _counts_lock:
+        pending = {metric: count for metric, count in _counts.items() if count}
+        _counts.update(dict.fromkeys(_counts, 0))
+        _counts_flushed[0] = time.monotonic()
+    for metric, count in pending.items():
+        key = f'emi:banks:metrics:{metric}'
+        try:
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                # First flush of this counter
+                if not cache.add(key, count, None):
+                    cache.incr(key, count)
+        except Exception as e:
+            logger.debug(f"Could not count EMI bank catalog {metric}: {str(e)}")
+
+
+def build_catalog():
+    """Read the active banks into the cached form."""
+    banks = list(EMIBank.objects.filter(is_active=True).order_by('name'))
+    if not banks:
+        banks = seed_fallback_banks()
+    entry = {
+        'banks': [
+            {'code': bank.code, 'name': bank.name, 'interest_rate': float(bank.interest_rate)}
+            for bank in banks
+        ],
+        'rates': {
+            bank.code: (bank.interest_rate, bank.processing_fee_percentage, bank.source) for bank in banks
+        },
+        'refreshed_at': max(bank.refreshed_at for bank in banks).timestamp() if banks else None,
+        'built_at': time.time(),
+    }
+    cache.set(CACHE_KEY, entry, get_cache_ttl() + get_cache_stale())
+    return entry
+
+
+def seed_fallback_banks():
+    """Fill an empty catalog with FALLBACK_BANKS; returns the active banks."""
+    EMIBank.objects.bulk_create(
+        [EMIBank(source='fallback', **bank) for bank in FALLBACK_BANKS], ignore_conflicts=True,
+    )
+    return list(EMIBank.objects.filter(is_active=True).order_by('name'))
+
+
+def get_catalog():
+    """Return the cached catalog, rebuilding it on a miss and revalidating it once stale."""
+    entry = cache.get(CACHE_KEY)
+    if entry is None:
+        _count('misses')
+        return build_catalog()
+    if time.time() - entry['built_at'] > get_cache_ttl():
+        _count('stale_hits')
+        if cache.add(REVALIDATE_KEY, 1, 60):
+            schedule_revalidation()
+    else:
+        _count('hits')
+    return entry
+
+
+def schedule_revalidation():
+    """Rebuild the cached catalog after commit, on a Celery worker when a broker is configured."""
+    from .tasks import rebuild_emi_bank_cache
+
+    def run():
+        try:
+            dispatch_task(rebuild_emi_bank_cache, fallback=build_catalog)
+        finally:
+            cache.delete(REVALIDATE_KEY)
+
+    transaction.on_commit(run)
+
+
+def get_available_banks():
+    """Active banks as ``{code, name, interest_rate}`` dicts."""
+    return get_catalog()['banks']
+
+
+def get_bank_rate(bank_code):
+    """(annual interest rate, processing fee %, source) of a bank, or None if it is unknown."""
+    return get_catalog()['rates'].get(bank_code)
+
+
+def refresh_bank_catalog(banks):
+    """
+    Store banks fetched from SSLCOMMERZ and rebuild the cache.
+
+    ``banks`` are dicts with code, name, interest_rate and optionally
+    processing_fee. Banks the gateway no longer lists are deactivated.
+    """
+    now = timezone.now()
+    rows = []
+    for bank in banks:
+        code = str(bank.get('code') or '').strip()
+        if not code or bank.get('interest_rate') is None:
+            continue
+        rows.append(EMIBank(
+            code=code, name=bank.get('name') or code,
+            interest_rate=Decimal(str(bank['interest_rate'])),
+            processing_fee_percentage=Decimal(str(bank.get('processing_fee') or 0)),
+            is_active=True, source='gateway', refreshed_at=now,
+        ))
+    if not rows:
+        return 0
+    with transaction.atomic():
+        EMIBank.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['code'],
+            update_fields=['name', 'interest_rate', 'processing_fee_percentage', 'is_active', 'source',
+                           'refreshed_at'],
+        )
+        EMIBank.objects.exclude(code__in=[row.code for row in rows]).update(is_active=False)
+    build_catalog()
+    return len(rows)
+
+
+def catalog_metrics():
+    """Ages in seconds of the cached copy and of the catalog, with cache counters."""
+    entry = cache.get(CACHE_KEY)
+    now = time.time()
+    refreshed_at = EMIBank.objects.filter(is_active=True, source='gateway').aggregate(
+        latest=Max('refreshed_at'),
+    )['latest']
+    metrics = {
+        'cache_age_seconds': round(now - entry['built_at'], 1) if entry else None,
+        'cache_is_stale': bool(entry) and now - entry['built_at'] > get_cache_ttl(),
+        'catalog_age_seconds': round(now - refreshed_at.timestamp(), 1) if refreshed_at else None,
+        'bank_count': len(entry['banks']) if entry else None,
+    }
+    flush_metrics()
+    for metric in METRIC_KEYS:
+        metrics[metric] = cache.get(f'emi:banks:metrics:{metric}', 0)
+    return metrics
+
+
+def calculate_card_emi(principal, annual_rate, months):
+    """Reducing-balance EMI on ``principal``; returns monthly, total and interest as Decimals."""
+    principal = Decimal(str(principal))
+    monthly_rate = Decimal(str(annual_rate or 0)) / Decimal('1200')
+    if monthly_rate > 0:
+        growth = (1 + monthly_rate) ** months
+        monthly_payment = principal * monthly_rate * growth / (growth - 1)
+    else:
+        monthly_payment = principal / Decimal(months)
+    total_payment = monthly_payment * months
+    return {
+        'monthly_payment': monthly_payment,
+        'total_payment': total_payment,
+        'total_interest': total_payment - principal,
+    }
+
+
+def quote(bank_code, amount, months, plan=None):
+    """
+    Quote card EMI on ``amount`` with a bank's catalog rate.
+
+    A plan's own rate for the bank (``sslcommerz_bank_interest_rates``)
+    takes precedence. Unknown banks fall back to the plan's rate, then to
+    DEFAULT_INTEREST_RATE.
+    """
+    amount = Decimal(str(amount))
+    catalog_rate = get_bank_rate(bank_code) if bank_code else None
+    interest_rate, fee_percentage, source = catalog_rate or (None, Decimal('0'), None)
+
+    plan_rates = (plan.sslcommerz_bank_interest_rates or {}) if plan is not None else {}
+    if bank_code in plan_rates:
+        interest_rate, source = Decimal(str(plan_rates[bank_code])), 'plan'
+    if interest_rate is None:
+        interest_rate = plan.interest_rate if plan is not None and plan.interest_rate is not None \
+            else DEFAULT_INTEREST_RATE
+        source = 'plan' if plan is not None and plan.interest_rate is not None else 'default'
+
+    details = calculate_card_emi(amount, interest_rate, int(months))
+    details.update({
+        'interest_rate': Decimal(str(interest_rate)),
+        'bank_processing_fee': amount * fee_percentage / Decimal('100'),
+        'rate_source': source,
+    })
+    return details
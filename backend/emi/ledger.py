@@ -0,0 +1,90 @@
+"""
+Set-based EMI bookkeeping.
+
+An EMI record's ``installments_paid``, ``amount_paid`` and
+``remaining_amount`` are rolled up from its installments. They are
+updated by statement, never by loading installments into Python:
+
+* ``rollup_payments(records)`` updates any number of records in one
+  UPDATE, with correlated subqueries over their paid installments.
+* ``complete_paid_records()`` marks every active record with no unpaid
+  installment as completed, in one UPDATE ... WHERE NOT EXISTS. It returns
+  the ids it completed so the caller can notify those customers.
+
+``EMIRecord.update_payment_status`` uses one aggregate query for a single
+record.
+"""
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Count, DecimalField, Exists, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import EMIInstallment, EMIRecord
+
+
+def paid_totals(installments):
+    """Aggregate (paid count, paid amount) over ``installments``."""
+    totals = installments.aggregate(
+        paid=Count('id', filter=Q(status='paid')),
+        amount=Sum('amount', filter=Q(status='paid')),
+    )
+    return totals['paid'], totals['amount'] or Decimal('0.00')
+
+
+def rollup_payments(records):
+    """Recompute paid counts and amounts of the ``records`` queryset; returns the rows updated."""
+    paid = EMIInstallment.objects.filter(emi_record=OuterRef('pk'), status='paid').order_by().values('emi_record')
+    paid_count = Subquery(paid.annotate(n=Count('id')).values('n'), output_field=IntegerField())
+    paid_amount = Subquery(paid.annotate(total=Sum('amount')).values('total'),
+                           output_field=DecimalField(max_digits=10, decimal_places=2))
+    zero = Value(Decimal('0.00'), output_field=DecimalField(max_digits=10, decimal_places=2))
+    return records.update(
+        installments_paid=Coalesce(paid_count, 0),
+        amount_paid=Coalesce(paid_amount, zero),
+        remaining_amount=F('total_payable') - Coalesce(paid_amount, zero),
+        updated_at=timezone.now(),
+    )
+
+
+def complete_paid_records(today=None):
+    """
+    Complete active records whose installments are all paid; returns their ids.
+
+    Their paid totals are rolled up in the same statement and nothing is
+    left to pay. Records without installments are left alone.
+    """
+    today = today or timezone.now().date()
+    if connection.vendor != 'postgresql':
+        records = EMIRecord.objects.filter(
+            Exists(EMIInstallment.objects.filter(emi_record=OuterRef('pk'))),
+            ~Exists(EMIInstallment.objects.filter(emi_record=OuterRef('pk')).exclude(status='paid')),
+            status='active',
+        )
+        ids = list(records.values_list('id', flat=True))
+        rollup_payments(EMIRecord.objects.filter(id__in=ids))
+        EMIRecord.objects.filter(id__in=ids).update(
+            status='completed', completed_date=today, remaining_amount=Decimal('0.00'), updated_at=timezone.now(),
+        )
+        return ids
+
+    records = connection.ops.quote_name(EMIRecord._meta.db_table)
+    installments = connection.ops.quote_name(EMIInstallment._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {records} r
+            SET status = 'completed', completed_date = %s, remaining_amount = 0, updated_at = %s,
+                installments_paid = (SELECT count(*) FROM {installments} i WHERE i.emi_record_id = r.id),
+                amount_paid = (SELECT coalesce(sum(i.amount), 0) FROM {installments} i WHERE i.emi_record_id = r.id)
+            WHERE r.status = 'active'
+              AND EXISTS (SELECT 1 FROM {installments} i WHERE i.emi_record_id = r.id)
+              AND NOT EXISTS (
+                  SELECT 1 FROM {installments} i WHERE i.emi_record_id = r.id AND i.status <> 'paid'
+              )
+            RETURNING r.id
+            """,
+            [today, timezone.now()],
+        )
+        return [row[0] for row in cursor.fetchall()]
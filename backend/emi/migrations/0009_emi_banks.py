@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:41
+
+import django.core.validators
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emi', '0008_emiplan_sslcommerz_bank_interest_rates_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EMIBank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20, unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('interest_rate', models.DecimalField(decimal_places=2, help_text='Annual interest rate in percentage', max_digits=5, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)])),
+                ('processing_fee_percentage', models.DecimalField(decimal_places=2, default=0, help_text='Bank processing fee as percentage of the price', max_digits=5, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)])),
+                ('is_active', models.BooleanField(default=True)),
+                ('source', models.CharField(choices=[('gateway', 'SSLCOMMERZ'), ('fallback', 'Built-in defaults')], default='gateway', max_length=10)),
+                ('refreshed_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When this row was last confirmed')),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -210,6 +210,40 @@ class EMIPlan(models.Model):
         }
 
 
+class EMIBank(models.Model):
+    """Bank offering card EMI through SSLCOMMERZ, with its annual rate (see emi/bank_catalog.py)."""
+    
+    SOURCE_CHOICES = (
+        ('gateway', 'SSLCOMMERZ'),
+        ('fallback', 'Built-in defaults'),
+    )
+    
+    code = models.CharField(max_length=20, unique=True)
+    name = models.CharField(max_length=100)
+    interest_rate = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        validators=[MinValueValidator(0), MaxValueValidator(100)],
+        help_text="Annual interest rate in percentage"
+    )
+    processing_fee_percentage = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        default=0,
+        validators=[MinValueValidator(0), MaxValueValidator(100)],
+        help_text="Bank processing fee as percentage of the price"
+    )
+    is_active = models.BooleanField(default=True)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='gateway')
+    refreshed_at = models.DateTimeField(default=timezone.now, help_text="When this row was last confirmed")
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return f"{self.name} ({self.code})"
+
+
 class EMIApplication(models.Model):
     """Model for EMI applications from users."""
     
@@ -379,40 +413,41 @@ class EMIRecord(models.Model):
         super().save(*args, **kwargs)
     
     def generate_installments(self):
-        """Generate installment records for this EMI."""
+        """Generate installment records for this EMI, in one insert."""
         from datetime import timedelta
-        for i in range(1, self.tenure_months + 1):
-            if isinstance(self.start_date, str):
-                from datetime import datetime
-                start_date = datetime.strptime(self.start_date, "%Y-%m-%d").date()
-            else:
-                start_date = self.start_date
-            due_date = start_date + timedelta(days=30 * i)
-            
-            EMIInstallment.objects.create(
+        if isinstance(self.start_date, str):
+            from datetime import datetime
+            start_date = datetime.strptime(self.start_date, "%Y-%m-%d").date()
+        else:
+            start_date = self.start_date
+        
+        return EMIInstallment.objects.bulk_create([
+            EMIInstallment(
                 emi_record=self,
                 installment_number=i,
                 amount=self.monthly_installment,
-                due_date=due_date,
+                due_date=start_date + timedelta(days=30 * i),
                 status='pending'
             )
+            for i in range(1, self.tenure_months + 1)
+        ])
     
     def update_payment_status(self):
-        """Update payment status based on installments."""
-        # Count paid installments
-        paid_installments = self.installments.filter(status='paid').count()
-        self.installments_paid = paid_installments
+        """Roll up paid installments in one aggregate query and save the totals."""
+        from .ledger import paid_totals
         
-        # Calculate amount paid and remaining
-        self.amount_paid = sum(inst.amount for inst in self.installments.filter(status='paid'))
+        self.installments_paid, self.amount_paid = paid_totals(self.installments.all())
         self.remaining_amount = self.total_payable - self.amount_paid
         
         # Check if all installments are paid
-        if paid_installments == self.tenure_months and self.down_payment_paid:
+        if self.installments_paid == self.tenure_months and self.down_payment_paid:
             self.status = 'completed'
             self.completed_date = timezone.now().date()
         
-        self.save()
+        self.save(update_fields=[
+            'installments_paid', 'amount_paid', 'remaining_amount', 'down_payment_paid', 'status',
+            'completed_date', 'updated_at',
+        ])
 
 
 class EMIInstallment(models.Model):
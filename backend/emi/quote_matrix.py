@@ -0,0 +1,274 @@
+"""
+EMI quote matrix.
+
+``quote_matrix(prices)`` quotes many prices against every active plan in
+one NumPy pass. Each plan contributes one line per bank it is quoted for,
+and the amortization grid of prices x lines x tenures is computed as
+arrays rather than one ``calculate_monthly_payment`` call at a time.
+
+Lines:
+
+* Plans with their own interest rate give a single line.
+* SSLCOMMERZ card EMI plans give a bank-less line, estimated without
+  interest as ``calculate_monthly_payment`` does. When ``banks`` are
+  requested, they also give a line per bank, priced from the bank catalog
+  (a plan's own rate for a bank comes first).
+
+By default every plan is quoted at its own duration. Passing ``tenures``
+quotes every plan at those tenures instead.
+
+The quotes of one price are cached under the quote version. Saving or
+deleting a plan bumps the version (see emi/signals.py). Bank lines also
+depend on the bank catalog's build time. Every quote carries an
+``eligible`` flag from the plan's price limits. ``product_quotes``
+applies a product's own plans, as the product EMI endpoint does.
+"""
+import logging
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Q
+
+from . import bank_catalog
+from .models import EMIPlan
+
+logger = logging.getLogger(__name__)
+
+VERSION_CACHE_KEY = 'emi:quotes:version'
+CACHE_TIMEOUT = 60 * 60
+CENTS = Decimal('0.01')
+
+
+def get_quote_version():
+    return cache.get(VERSION_CACHE_KEY, 0)
+
+
+def bump_quote_version():
+    """Invalidate every cached quote; returns the new version."""
+    try:
+        cache.add(VERSION_CACHE_KEY, 0, None)
+        return cache.incr(VERSION_CACHE_KEY)
+    except Exception as e:
+        logger.error(f"Error bumping EMI quote version: {str(e)}")
+        return None
+
+
+def to_price(value):
+    """Price as a Decimal in cents, or None if it cannot be quoted."""
+    try:
+        price = Decimal(str(value))
+        if not price.is_finite():
+            return None
+        price = price.quantize(CENTS)
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    return price if price > 0 else None
+
+
+def plan_lines(plans, banks=None):
+    """
+    One line per plan and bank as dicts of floats.
+
+    ``banks`` is None for no bank lines, ``'all'`` for every catalog bank,
+    or a list of bank codes.
+    """
+    catalog = bank_catalog.get_catalog()['rates'] if banks else {}
+    lines = []
+    for plan in plans:
+        base = {
+            'plan': plan,
+            'down_payment_percentage': float(plan.down_payment_percentage),
+            'processing_fee_percentage': float(plan.processing_fee_percentage),
+            'processing_fee_fixed': float(plan.processing_fee_fixed),
+            'min_price': float(plan.min_price),
+            'max_price': float(plan.max_price) if plan.max_price is not None else np.inf,
+            'bank_fee_percentage': 0.0,
+        }
+        if not (plan.is_sslcommerz_emi and plan.plan_type == 'card_emi'):
+            lines.append({**base, 'bank_code': None, 'interest_rate': float(plan.interest_rate or 0),
+                          'rate_source': 'plan'})
+            continue
+
+        # The bank sets the rate; this line is an estimate without interest
+        lines.append({**base, 'bank_code': None, 'interest_rate': 0.0, 'rate_source': 'bank'})
+        if not banks:
+            continue
+        plan_rates = plan.sslcommerz_bank_interest_rates or {}
+        codes = plan.sslcommerz_bank_list or sorted(catalog)
+        if banks != 'all':
+            codes = [code for code in codes if code in banks]
+        for code in codes:
+            interest_rate, fee_percentage, source = catalog.get(code) or (None, Decimal('0'), None)
+            if code in plan_rates:
+                interest_rate, source = plan_rates[code], 'plan'
+            if interest_rate is None:
+                continue
+            lines.append({**base, 'bank_code': code, 'interest_rate': float(interest_rate),
+                          'rate_source': source, 'bank_fee_percentage': float(fee_percentage)})
+    return lines
+
+
+def amortize(prices, lines, tenures=None):
+    """
+    Compute the quote grid of ``prices`` x ``lines`` x tenures.
+
+    Returns the tenures and a dict of arrays shaped (prices, lines,
+    tenures), plus ``offered`` (lines, tenures) and ``eligible`` (prices,
+    lines) masks.
+    """
+    def column(name):
+        return np.array([line[name] for line in lines], dtype=float)
+
+    explicit = bool(tenures)
+    if explicit:
+        tenures = sorted(set(tenures))
+    else:
+        tenures = sorted({line['plan'].duration_months for line in lines})
+    n = np.array(tenures, dtype=float)
+    p = np.array([float(price) for price in prices], dtype=float)[:, None]
+
+    rate = (column('interest_rate') / 1200)[:, None]
+    growth = (1 + rate) ** n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # EMI = P * r * (1 + r)^n / ((1 + r)^n - 1), or P / n without interest
+        factor = np.where(rate > 0, rate * growth / (growth - 1), 1 / n)
+
+    down_payment = p * column('down_payment_percentage') / 100
+    principal = p - down_payment
+    fee_percentage = column('processing_fee_percentage') + column('bank_fee_percentage')
+    processing_fee = principal * fee_percentage / 100 + column('processing_fee_fixed')
+    monthly = principal[:, :, None] * factor
+    repaid = monthly * n
+
+    if explicit:
+        offered = np.ones((len(lines), len(tenures)), dtype=bool)
+    else:
+        offered = np.array([line['plan'].duration_months for line in lines])[:, None] == n
+    return tenures, {
+        'monthly_payment': monthly,
+        'down_payment': np.broadcast_to(down_payment[:, :, None], monthly.shape),
+        'processing_fee': np.broadcast_to(processing_fee[:, :, None], monthly.shape),
+        'total_payment': repaid + (down_payment + processing_fee)[:, :, None],
+        'total_interest': repaid - principal[:, :, None],
+        'offered': offered,
+        'eligible': (p >= column('min_price')) & (p <= column('max_price')),
+    }
+
+
+def _rows(tenures, lines, grid, index):
+    """Quotes of the price at ``index``, as JSON-ready dicts."""
+    values = {
+        name: np.round(grid[name][index], 2).tolist()
+        for name in ('monthly_payment', 'down_payment', 'processing_fee', 'total_payment', 'total_interest')
+    }
+    eligible = grid['eligible'][index].tolist()
+    offered = grid['offered']
+    rows = []
+    for i, line in enumerate(lines):
+        for j, tenure in enumerate(tenures):
+            if not offered[i, j]:
+                continue
+            rows.append({
+                'plan_id': line['plan'].id,
+                'bank_code': line['bank_code'],
+                'tenure_months': tenure,
+                'interest_rate': line['interest_rate'],
+                'rate_source': line['rate_source'],
+                'is_bank_determined_interest': line['rate_source'] == 'bank',
+                'eligible': eligible[i],
+                **{name: value[i][j] for name, value in values.items()},
+            })
+    return rows
+
+
+def _cache_key(version, tenures, banks, price):
+    tenure_key = ','.join(str(t) for t in sorted(set(tenures))) if tenures else 'plan'
+    if not banks:
+        bank_key = 'none'
+    elif banks == 'all':
+        bank_key = 'all'
+    else:
+        bank_key = ','.join(sorted(banks))
+    return f'emi:quotes:{version}:{tenure_key}:{bank_key}:{price}'
+
+
+def quote_matrix(prices, tenures=None, banks=None):
+    """
+    Quote ``prices`` against every active plan; returns ``{price: quotes}``.
+
+    Prices are Decimals in cents (see ``to_price``). Cached prices cost no
+    query; the rest are computed together in one pass.
+    """
+    prices = sorted({price for price in map(to_price, prices) if price is not None})
+    if not prices:
+        return {}
+    version = str(get_quote_version())
+    if banks:
+        version += f"-{bank_catalog.get_catalog()['built_at']}"
+    keys = {price: _cache_key(version, tenures, banks, price) for price in prices}
+    cached = cache.get_many(keys.values())
+    result = {price: cached[key] for price, key in keys.items() if key in cached}
+
+    missing = [price for price in prices if price not in result]
+    if missing:
+        lines = plan_lines(EMIPlan.objects.filter(is_active=True), banks)
+        if lines:
+            tenures, grid = amortize(missing, lines, tenures)
+            computed = {price: _rows(tenures, lines, grid, index) for index, price in enumerate(missing)}
+        else:
+            computed = {price: [] for price in missing}
+        cache.set_many({keys[price]: rows for price, rows in computed.items()}, CACHE_TIMEOUT)
+        result.update(computed)
+    return result
+
+
+def product_price(product):
+    """Price EMI is quoted on: the default variation's price, else the base price."""
+    return product.effective_price if product.effective_price is not None else product.base_price
+
+
+def own_plan_ids(product):
+    """Ids of the active plans assigned to ``product``; uses prefetched ``emi_plans``."""
+    return {plan.id for plan in product.emi_plans.all() if plan.is_active}
+
+
+def product_plans(product):
+    """
+    The plans ``product`` is quoted on, as a queryset.
+
+    A product with active plans of its own is quoted on those, whatever
+    their price limits; any other product on the active plans its price
+    is eligible for.
+    """
+    own_plans = EMIPlan.objects.filter(id__in=own_plan_ids(product))
+    if own_plans.exists():
+        return own_plans
+    price = product_price(product)
+    return EMIPlan.objects.filter(is_active=True, min_price__lte=price).filter(
+        Q(max_price__isnull=True) | Q(max_price__gte=price)
+    )
+
+
+def product_quotes(products, tenures=None, banks=None):
+    """
+    Quotes per product id for products with EMI available, on the plans
+    ``product_plans`` picks. Prefetch ``emi_plans`` to avoid a query per
+    product.
+    """
+    products = [product for product in products if product.emi_available]
+    matrix = quote_matrix([product_price(product) for product in products], tenures, banks)
+    quotes = {}
+    for product in products:
+        rows = matrix.get(to_price(product_price(product)), [])
+        own_plans = own_plan_ids(product)
+        if own_plans:
+            quotes[product.id] = [row for row in rows if row['plan_id'] in own_plans]
+        else:
+            quotes[product.id] = [row for row in rows if row['eligible']]
+    return quotes
+
+
+def lowest_quote(rows):
+    """The quote with the lowest monthly payment, or None."""
+    return min(rows, key=lambda row: row['monthly_payment'], default=None)
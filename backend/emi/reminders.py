@@ -0,0 +1,131 @@
+"""
+Batched EMI payment reminders and overdue notices.
+
+``send_reminders(kind)`` walks the matching installments in id order,
+EMI_REMINDER_CHUNK_SIZE at a time, with their record, user and order
+joined in. Each chunk is rendered, handed to the SMS outbox in one insert
+(sms/dispatch.py sends it in batches after commit) and marked with one
+update, all in one transaction.
+
+Every message carries a dedupe key: one per installment for reminders,
+one per installment and day for overdue notices. A run that crashed or
+was retried therefore never texts a customer twice, even before its
+chunk was marked.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from notifications.services import SMSService as NotificationService
+from sms.services import SMSService
+from .models import EMIInstallment
+
+logger = logging.getLogger(__name__)
+
+UPCOMING, OVERDUE = 'upcoming', 'overdue'
+EVENT_TYPES = {
+    UPCOMING: 'emi_payment_reminder',
+    OVERDUE: 'emi_payment_overdue',
+}
+
+
+def get_chunk_size():
+    return getattr(settings, 'EMI_REMINDER_CHUNK_SIZE', 500)
+
+
+def get_reminder_days():
+    """Days ahead of the due date a reminder is sent."""
+    return getattr(settings, 'EMI_REMINDER_DAYS', 3)
+
+
+def due_installments(kind, today):
+    """Installments of active records that get a message of ``kind`` today."""
+    installments = EMIInstallment.objects.filter(emi_record__status='active')
+    if kind == UPCOMING:
+        installments = installments.filter(
+            status__in=['pending', 'due'],
+            due_date__gte=today,
+            due_date__lte=today + timedelta(days=get_reminder_days()),
+            reminder_sent=False,
+        )
+    else:
+        installments = installments.filter(status__in=['pending', 'due', 'overdue'], due_date__lt=today)
+    return installments.select_related('emi_record__user', 'emi_record__order').order_by('id')
+
+
+def dedupe_key(kind, installment, today):
+    if kind == UPCOMING:
+        return f"emi-reminder:{installment.id}"
+    return f"emi-overdue:{installment.id}:{today.isoformat()}"
+
+
+def render(kind, template, installment, today):
+    """The message dict for one installment, or None without a phone number."""
+    record = installment.emi_record
+    phone_number = record.user.phone or record.order.shipping_phone
+    if not phone_number:
+        return None
+    context = {
+        'order_id': record.order.id,
+        'installment_number': installment.installment_number,
+        'amount': str(installment.amount),
+        'due_date': installment.due_date.strftime('%d %B %Y'),
+    }
+    if kind == UPCOMING:
+        context['days_remaining'] = (installment.due_date - today).days
+    else:
+        context['days_overdue'] = (today - installment.due_date).days
+    return {
+        'phone_number': phone_number,
+        'message': template.render_body(context),
+        'dedupe_key': dedupe_key(kind, installment, today),
+    }
+
+
+def send_reminders(kind, today=None, chunk_size=None):
+    """
+    Queue today's messages of ``kind`` (``upcoming`` or ``overdue``).
+
+    Returns counts of messages queued, skipped as already queued, and
+    installments without a phone number.
+    """
+    today = today or timezone.now().date()
+    chunk_size = chunk_size or get_chunk_size()
+    counts = {'queued': 0, 'duplicates': 0, 'no_phone': 0}
+
+    template = NotificationService.get_event_template(EVENT_TYPES[kind])
+    if not template:
+        logger.error(f"No SMS template found for event: {EVENT_TYPES[kind]}")
+        return counts
+
+    sms = SMSService()
+    installments = due_installments(kind, today)
+    last_id = 0
+    while True:
+        chunk = list(installments.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+
+        messages = [render(kind, template, installment, today) for installment in chunk]
+        messages = [message for message in messages if message]
+        with transaction.atomic():
+            queued = sms.queue_many(messages)
+            ids = [installment.id for installment in chunk]
+            if kind == UPCOMING:
+                EMIInstallment.objects.filter(id__in=ids).update(
+                    reminder_sent=True, reminder_date=timezone.now(), updated_at=timezone.now(),
+                )
+            else:
+                EMIInstallment.objects.filter(id__in=ids).exclude(status='overdue').update(
+                    status='overdue', updated_at=timezone.now(),
+                )
+        counts['queued'] += len(queued)
+        counts['duplicates'] += len(messages) - len(queued)
+        counts['no_phone'] += len(chunk) - len(messages)
+
+    logger.info(f"EMI {kind} messages: {counts}")
+    return counts
@@ -0,0 +1,13 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import EMIPlan
+from .quote_matrix import bump_quote_version
+
+
+@receiver(post_save, sender=EMIPlan)
+@receiver(post_delete, sender=EMIPlan)
+def invalidate_quotes_on_plan_change(sender, instance, **kwargs):
+    """Cached EMI quotes are computed from every active plan; bumped after commit so nobody caches the old plans under the new version."""
+    transaction.on_commit(bump_quote_version)
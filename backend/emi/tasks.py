@@ -49,25 +49,16 @@ def update_installment_statuses():
 
 @shared_task
 def check_emi_completion():
-    """Check and mark EMI records as completed when all installments are paid."""
+    """Mark EMI records as completed when all installments are paid, in one statement."""
+    from .ledger import complete_paid_records
+
     try:
-        # Get active EMI records
-        active_records = EMIRecord.objects.filter(status='active')
+        completed_ids = complete_paid_records()
         
-        completed_count = 0
-        for emi_record in active_records:
-            # Check if all installments are paid
-            total_installments = emi_record.installments.count()
-            paid_installments = emi_record.installments.filter(status='paid').count()
-            
-            if total_installments > 0 and paid_installments == total_installments:
-                # Mark as completed
-                emi_record.status = 'completed'
-                emi_record.completed_date = date.today()
-                emi_record.remaining_amount = Decimal('0.00')
-                emi_record.save()
-                
-                # Send completion notification
+        # Send completion notifications
+        completed_records = EMIRecord.objects.filter(id__in=completed_ids).select_related('user', 'order')
+        for emi_record in completed_records.iterator(chunk_size=500):
+            try:
                 SMSService.send_event_notification(
                     event_type='emi_completed',
                     user=emi_record.user,
@@ -78,11 +69,11 @@ def check_emi_completion():
                     },
                     related_object=emi_record
                 )
-                
-                completed_count += 1
+            except Exception as e:
+                logger.error(f"Failed to send completion notice for EMI record {emi_record.id}: {str(e)}")
         
-        logger.info(f"Marked {completed_count} EMI records as completed")
-        return f"Completed {completed_count} EMI records"
+        logger.info(f"Marked {len(completed_ids)} EMI records as completed")
+        return f"Completed {len(completed_ids)} EMI records"
         
     except Exception as e:
         logger.error(f"Error in check_emi_completion task: {str(e)}")
@@ -91,83 +82,13 @@ def check_emi_completion():
 
 @shared_task
 def send_payment_reminders():
-    """Send payment reminders for upcoming and overdue EMI installments."""
+    """Queue payment reminders for upcoming and overdue EMI installments (see emi/reminders.py)."""
+    from .reminders import OVERDUE, UPCOMING, send_reminders
+
     try:
-        today = date.today()
-        
-        # Get installments due in next 3 days
-        upcoming_installments = EMIInstallment.objects.filter(
-            status='pending',
-            due_date__lte=today + timedelta(days=3),
-            due_date__gte=today,
-            reminder_sent=False,
-            emi_record__status='active'
-        )
-        
-        reminder_count = 0
-        for installment in upcoming_installments:
-            try:
-                # Send reminder SMS
-                SMSService.send_event_notification(
-                    event_type='emi_payment_reminder',
-                    user=installment.emi_record.user,
-                    context_data={
-                        'order_id': installment.emi_record.order.id,
-                        'installment_number': installment.installment_number,
-                        'amount': str(installment.amount),
-                        'due_date': installment.due_date.strftime('%d %B %Y'),
-                        'days_remaining': (installment.due_date - today).days
-                    },
-                    related_object=installment
-                )
-                
-                # Mark reminder as sent
-                installment.reminder_sent = True
-                installment.reminder_date = timezone.now()
-                installment.save()
-                
-                reminder_count += 1
-                
-            except Exception as e:
-                logger.error(f"Failed to send reminder for installment {installment.id}: {str(e)}")
-        
-        # Get overdue installments (send more urgent reminders)
-        overdue_installments = EMIInstallment.objects.filter(
-            status='pending',
-            due_date__lt=today,
-            emi_record__status='active'
-        )
-        
-        overdue_count = 0
-        for installment in overdue_installments:
-            try:
-                days_overdue = (today - installment.due_date).days
-                
-                # Send overdue reminder
-                SMSService.send_event_notification(
-                    event_type='emi_payment_overdue',
-                    user=installment.emi_record.user,
-                    context_data={
-                        'order_id': installment.emi_record.order.id,
-                        'installment_number': installment.installment_number,
-                        'amount': str(installment.amount),
-                        'due_date': installment.due_date.strftime('%d %B %Y'),
-                        'days_overdue': days_overdue
-                    },
-                    related_object=installment
-                )
-                
-                # Update installment status to overdue
-                installment.status = 'overdue'
-                installment.save()
-                
-                overdue_count += 1
-                
-            except Exception as e:
-                logger.error(f"Failed to send overdue notice for installment {installment.id}: {str(e)}")
-        
-        logger.info(f"Sent {reminder_count} payment reminders and {overdue_count} overdue notices")
-        return f"Sent {reminder_count} reminders and {overdue_count} overdue notices"
+        reminders = send_reminders(UPCOMING)
+        overdue = send_reminders(OVERDUE)
+        return f"Queued {reminders['queued']} reminders and {overdue['queued']} overdue notices"
         
     except Exception as e:
         logger.error(f"Error in send_payment_reminders task: {str(e)}")
@@ -265,4 +186,26 @@ def generate_monthly_emi_report():
         
     except Exception as e:
         logger.error(f"Error in generate_monthly_emi_report task: {str(e)}")
-        raise 
\ No newline at end of file
+        raise 
+
+@shared_task
+def refresh_emi_bank_catalog():
+    """Update the EMI bank catalog from SSLCOMMERZ; keeps the stored rates if it cannot be reached."""
+    from payments.services import SSLCommerzClient
+    from .bank_catalog import build_catalog, catalog_metrics, refresh_bank_catalog
+
+    banks = SSLCommerzClient().fetch_emi_banks()
+    updated = refresh_bank_catalog(banks) if banks else 0
+    if not updated:
+        # Still rebuild, which seeds an empty catalog with the fallback banks
+        build_catalog()
+    logger.info(f"EMI bank catalog: {updated} banks from SSLCOMMERZ, metrics {catalog_metrics()}")
+    return f"Updated {updated} EMI banks"
+
+
+@shared_task
+def rebuild_emi_bank_cache():
+    """Rebuild the cached EMI bank catalog from the database."""
+    from .bank_catalog import build_catalog
+
+    return f"Cached {len(build_catalog()['banks'])} EMI banks"
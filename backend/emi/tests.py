@@ -1,3 +1,321 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import bank_catalog, quote_matrix
+from notifications.models import NotificationTemplate
+from orders.models import Order
+from sms.models import SMSLog
+from products.models import Brand, Category, Product
+from .ledger import complete_paid_records, rollup_payments
+from .reminders import OVERDUE, UPCOMING, send_reminders
+from .models import EMIApplication, EMIBank, EMIInstallment, EMIPlan, EMIRecord
+from .tasks import check_emi_completion, refresh_emi_bank_catalog
+
+
+@override_settings(CELERY_BROKER_URL=None)
+class EMIBankCatalogTest(TestCase):
+    """EMI banks and quotes come from the stored catalog through a cache, never from the gateway."""
+
+    def setUp(self):
+        # Drop counts left over in this process by other tests
+        bank_catalog.flush_metrics()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # Any outbound call would fail the test
+        patcher = mock.patch('backend.http_client.HTTPClient.request', side_effect=AssertionError('HTTP call'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_seeds_fallback_banks_and_serves_them_from_cache(self):
+        banks = bank_catalog.get_available_banks()
+        self.assertEqual(len(banks), len(bank_catalog.FALLBACK_BANKS))
+        self.assertEqual(EMIBank.objects.filter(source='fallback').count(), len(banks))
+
+        with self.assertNumQueries(0):
+            response = APIClient().get('/api/emi/plans/available_banks/')
+        self.assertEqual(response.data['count'], len(banks))
+        self.assertIn({'code': 'DBBL', 'name': 'Dutch-Bangla Bank', 'interest_rate': 12.5}, response.data['banks'])
+        # Counted in process until the next flush
+        self.assertIsNone(cache.get('emi:banks:metrics:hits'))
+        self.assertEqual(bank_catalog.catalog_metrics()['hits'], 1)
+
+    def test_refresh_replaces_rates_and_quotes_use_them(self):
+        bank_catalog.get_catalog()
+        gateway_banks = [
+            {'code': 'DBBL', 'name': 'Dutch-Bangla Bank', 'interest_rate': '9.00', 'processing_fee': '1.0'},
+            {'code': 'BBL', 'name': 'BRAC Bank', 'interest_rate': 0},
+        ]
+        with mock.patch('payments.services.SSLCommerzClient.fetch_emi_banks', return_value=gateway_banks):
+            refresh_emi_bank_catalog()
+
+        self.assertEqual([bank['code'] for bank in bank_catalog.get_available_banks()], ['BBL', 'DBBL'])
+        self.assertFalse(EMIBank.objects.get(code='HSBC').is_active)
+
+        details = bank_catalog.quote('DBBL', Decimal('12000'), 12)
+        self.assertEqual((details['interest_rate'], details['rate_source']), (Decimal('9.00'), 'gateway'))
+        self.assertEqual(details['bank_processing_fee'], Decimal('120'))
+        self.assertEqual(round(details['monthly_payment'], 2), Decimal('1049.42'))
+        self.assertEqual(bank_catalog.quote('BBL', Decimal('1200'), 12)['monthly_payment'], Decimal('100'))
+
+        plan = EMIPlan.objects.create(
+            name='Card EMI', plan_type='card_emi', is_sslcommerz_emi=True, duration_months=12,
+            sslcommerz_bank_interest_rates={'DBBL': 6},
+        )
+        self.assertEqual(bank_catalog.quote('DBBL', Decimal('12000'), 12, plan=plan)['rate_source'], 'plan')
+
+        response = APIClient().get('/api/emi/plans/calculate_emi/', {
+            'plan_id': plan.id, 'product_price': '12000', 'bank_code': 'BBL',
+        })
+        self.assertEqual(response.data['details']['interest_rate'], 0.0)
+        self.assertEqual(response.data['details']['monthly_installment'], 1000.0)
+        self.assertTrue(response.data['details']['is_live_data'])
+
+    def test_stale_catalog_is_served_while_it_is_rebuilt(self):
+        bank_catalog.get_catalog()
+        entry = cache.get(bank_catalog.CACHE_KEY)
+        entry['built_at'] = time.time() - bank_catalog.get_cache_ttl() - 1
+        cache.set(bank_catalog.CACHE_KEY, entry)
+        EMIBank.objects.filter(code='DBBL').update(interest_rate=Decimal('8.00'))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(bank_catalog.get_bank_rate('DBBL')[0], Decimal('12.5'))
+            self.assertTrue(bank_catalog.catalog_metrics()['cache_is_stale'])
+            # One rebuild per stale window
+            bank_catalog.get_catalog()
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+
+        self.assertEqual(bank_catalog.get_bank_rate('DBBL')[0], Decimal('8.00'))
+        metrics = bank_catalog.catalog_metrics()
+        self.assertFalse(metrics['cache_is_stale'])
+        self.assertEqual((metrics['stale_hits'], metrics['misses']), (2, 1))
+
+
+@override_settings(CELERY_BROKER_URL=None)
+class EMIQuoteMatrixTest(TestCase):
+    """Prices are quoted against every plan, bank and tenure in one pass and cached per plan version."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.interest_plan = EMIPlan.objects.create(
+            name='Bank 12%', plan_type='cardless_emi', duration_months=12, interest_rate=Decimal('12'),
+            down_payment_percentage=Decimal('10'), processing_fee_percentage=Decimal('2'),
+            processing_fee_fixed=Decimal('100'),
+        )
+        self.card_plan = EMIPlan.objects.create(
+            name='Card EMI', plan_type='card_emi', is_sslcommerz_emi=True, duration_months=6,
+            sslcommerz_bank_interest_rates={'DBBL': 6},
+        )
+        self.premium_plan = EMIPlan.objects.create(
+            name='Premium', plan_type='cardless_emi', duration_months=24, interest_rate=Decimal('9'),
+            min_price=Decimal('50000'),
+        )
+
+    def test_matches_plan_calculation_and_is_cached(self):
+        with self.assertNumQueries(1):
+            rows = quote_matrix.quote_matrix(['12000', '60000'])
+        quotes = {(row['plan_id'], row['tenure_months']): row for row in rows[Decimal('12000.00')]}
+        self.assertEqual(len(quotes), 3)
+
+        expected = self.interest_plan.calculate_monthly_payment(Decimal('12000'))
+        quote = quotes[(self.interest_plan.id, 12)]
+        for field in ('monthly_payment', 'down_payment', 'processing_fee', 'total_payment', 'total_interest'):
+            self.assertAlmostEqual(quote[field], float(expected[field]), places=2)
+        self.assertEqual(quotes[(self.card_plan.id, 6)]['monthly_payment'], 2000.0)
+        self.assertFalse(quotes[(self.premium_plan.id, 24)]['eligible'])
+        self.assertTrue(all(row['eligible'] for row in rows[Decimal('60000.00')]))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(quote_matrix.quote_matrix([Decimal('12000')]), {Decimal('12000.00'): rows[Decimal('12000.00')]})
+
+        # Changing a plan invalidates every cached quote once it commits
+        with self.captureOnCommitCallbacks(execute=True):
+            EMIPlan.objects.filter(pk=self.premium_plan.pk).delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(quote_matrix.quote_matrix(['12000'])[Decimal('12000.00')]), 2)
+
+    def test_skips_prices_that_are_not_finite(self):
+        for value in ('NaN', 'Infinity', '-Infinity', 'sNaN'):
+            self.assertIsNone(quote_matrix.to_price(value))
+        response = APIClient().get('/api/emi/plans/quote_matrix/', {'prices': 'NaN,Infinity,12000'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['price'] for entry in response.data['prices']], [12000.0])
+
+    def test_tenures_and_banks(self):
+        bank_catalog.get_catalog()
+        rows = quote_matrix.quote_matrix(['12000'], tenures=[6, 12], banks=['DBBL', 'BBL'])[Decimal('12000.00')]
+        card_rows = {(row['bank_code'], row['tenure_months']): row for row in rows if row['plan_id'] == self.card_plan.id}
+        self.assertEqual(set(card_rows), {(code, tenure) for code in (None, 'DBBL', 'BBL') for tenure in (6, 12)})
+        self.assertEqual((card_rows['DBBL', 12]['interest_rate'], card_rows['DBBL', 12]['rate_source']), (6.0, 'plan'))
+        self.assertEqual(card_rows['BBL', 12]['rate_source'], 'fallback')
+        self.assertTrue(card_rows[None, 6]['is_bank_determined_interest'])
+        details = bank_catalog.quote('BBL', Decimal('12000'), 12)
+        self.assertAlmostEqual(card_rows['BBL', 12]['monthly_payment'], float(details['monthly_payment']), places=2)
+
+    def test_products_get_lowest_monthly_quote(self):
+        category = Category.objects.create(name='Phones', slug='phones')
+        brand = Brand.objects.create(name='Acme', slug='acme')
+        vendor = get_user_model().objects.create_user(email='vendor@example.com', password='pass')
+        products = [
+            Product.objects.create(name=f'Phone {i}', slug=f'phone-{i}', category=category, brand=brand,
+                                   vendor=vendor,
+                                   description='A phone', base_price=price, emi_available=available, is_approved=True)
+            for i, (price, available) in enumerate([(Decimal('12000'), True), (Decimal('60000'), True),
+                                                    (Decimal('12000'), False)])
+        ]
+        products[1].emi_plans.add(self.interest_plan)
+        # An inactive assigned plan leaves the product on the eligible active plans
+        retired_plan = EMIPlan.objects.create(
+            name='Retired', plan_type='card_emi', duration_months=3, interest_rate=Decimal('0'), is_active=False,
+        )
+        products[0].emi_plans.add(retired_plan)
+
+        response = APIClient().get('/api/emi/plans/quote_matrix/', {
+            'product_ids': ','.join(str(product.id) for product in products), 'summary': '1',
+        })
+        self.assertEqual(response.status_code, 200)
+        emi_from = {entry['product_id']: entry['emi_from'] for entry in response.data['products']}
+        self.assertEqual(set(emi_from), {products[0].id, products[1].id})
+        self.assertEqual(emi_from[products[0].id]['plan_id'], self.interest_plan.id)
+        self.assertEqual(emi_from[products[1].id]['plan_id'], self.interest_plan.id)
+
+        response = APIClient().get(f'/api/products/products/id-{products[0].id}/emi_plans/')
+        self.assertEqual([plan['id'] for plan in response.data], [self.interest_plan.id, self.card_plan.id])
+        self.assertEqual(response.data[1]['calculations'][0]['monthly_payment'], 2000.0)
+        self.assertEqual(APIClient().get('/api/emi/plans/quote_matrix/').status_code, 400)
+
+
+def create_emi_record(user, plan, number, tenure=3, amount=Decimal('1000.00'), start_date=None):
+    """An active EMI record with its order, application and installment schedule."""
+    order = Order.objects.create(
+        user=user, payment_method='emi', shipping_address='House 1', shipping_city='Dhaka',
+        shipping_state='Dhaka', shipping_postal_code='1200', shipping_phone='01700000000',
+        subtotal=amount * tenure, total=amount * tenure,
+    )
+    terms = {'emi_plan': plan, 'tenure_months': tenure, 'principal_amount': amount * tenure,
+             'monthly_installment': amount, 'total_payable': amount * tenure}
+    application = EMIApplication.objects.create(
+        user=user, order=order, product_price=amount * tenure, down_payment=0, processing_fee=0,
+        total_interest=0, employment_type='salaried', monthly_income=50000, years_employed=2,
+        nid_number=f'NID{number}', nid_front_image='front.jpg', nid_back_image='back.jpg', **terms,
+    )
+    record = EMIRecord.objects.create(user=user, order=order, application=application, down_payment_paid=True,
+                                      start_date=start_date or timezone.now().date(), **terms)
+    record.generate_installments()
+    return record
+
+
+class EMIBookkeepingTest(TestCase):
+    """Installment schedules, paid totals and completion are written by statement, not per row."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email='buyer@example.com', password='pass')
+        cls.plan = EMIPlan.objects.create(name='Cardless', plan_type='cardless_emi', duration_months=3,
+                                          interest_rate=Decimal('0'))
+
+    def create_record(self, number, **kwargs):
+        return create_emi_record(self.user, self.plan, number, **kwargs)
+
+    def test_mark_as_paid_rolls_up_in_one_aggregate(self):
+        record = self.create_record(1)
+        first, second, third = record.installments.all()
+        with self.assertNumQueries(3):
+            first.mark_as_paid(first.amount)
+        record.refresh_from_db()
+        self.assertEqual((record.installments_paid, record.amount_paid, record.remaining_amount),
+                         (1, Decimal('1000.00'), Decimal('2000.00')))
+
+        second.mark_as_paid(second.amount)
+        third.mark_as_paid(third.amount)
+        self.assertEqual(third.emi_record.status, 'completed')
+
+    def test_pay_full_marks_down_payment_and_completes(self):
+        record = self.create_record(1)
+        EMIRecord.objects.filter(pk=record.pk).update(down_payment_paid=False)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(f'/api/emi/records/{record.id}/process_down_payment/', {'pay_full': True},
+                               format='json')
+        self.assertEqual(response.status_code, 200)
+
+        record.refresh_from_db()
+        self.assertTrue(record.down_payment_paid)
+        self.assertEqual((record.status, record.installments_paid, record.remaining_amount),
+                         ('completed', 3, Decimal('0.00')))
+
+    def test_completion_job_is_set_based(self):
+        records = [self.create_record(i) for i in range(30)]
+        paid, partly_paid = records[:20], records[20:25]
+        EMIInstallment.objects.filter(emi_record__in=paid).update(status='paid', paid_amount=F('amount'))
+        EMIInstallment.objects.filter(emi_record__in=partly_paid, installment_number=1).update(status='paid')
+        self.assertEqual(rollup_payments(EMIRecord.objects.filter(id__in=[r.id for r in partly_paid])), 5)
+        partly = EMIRecord.objects.get(pk=partly_paid[0].pk)
+        self.assertEqual((partly.installments_paid, partly.amount_paid, partly.remaining_amount),
+                         (1, Decimal('1000.00'), Decimal('2000.00')))
+
+        with mock.patch('emi.tasks.SMSService.send_event_notification') as notify:
+            with self.assertNumQueries(2):
+                check_emi_completion()
+        self.assertEqual(notify.call_count, 20)
+
+        completed = EMIRecord.objects.filter(status='completed')
+        self.assertEqual(set(completed.values_list('id', flat=True)), {record.id for record in paid})
+        self.assertEqual(set(completed.values_list('installments_paid', 'amount_paid', 'remaining_amount')),
+                         {(3, Decimal('3000.00'), Decimal('0.00'))})
+        self.assertEqual(complete_paid_records(), [])
+
+
+@override_settings(CELERY_BROKER_URL=None)
+class EMIReminderTest(TestCase):
+    """Reminders are queued to the SMS outbox in chunks, and never twice for the same installment and day."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email='buyer@example.com', password='pass', phone='01711111111')
+        cls.plan = EMIPlan.objects.create(name='Cardless', plan_type='cardless_emi', duration_months=3)
+        for event_type in ('emi_payment_reminder', 'emi_payment_overdue'):
+            NotificationTemplate.objects.create(
+                name=f'{event_type} sms', type='sms',
+                body='EMI {{ installment_number }} of {{ amount }} for order #{{ order_id }} is due {{ due_date }}',
+            )
+        today = timezone.now().date()
+        # First installments due in two days, and ten days ago
+        cls.upcoming = [create_emi_record(cls.user, cls.plan, i, start_date=today - timedelta(days=28)) for i in range(5)]
+        cls.overdue = [create_emi_record(cls.user, cls.plan, 10 + i, start_date=today - timedelta(days=40))
+                       for i in range(3)]
+
+    def test_upcoming_reminders_are_chunked_and_deduplicated(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(send_reminders(UPCOMING, chunk_size=2), {'queued': 5, 'duplicates': 0, 'no_phone': 0})
+        # One outbox dispatch per chunk
+        self.assertEqual(len(callbacks), 3)
+        logs = SMSLog.objects.filter(dedupe_key__startswith='emi-reminder:')
+        self.assertEqual(logs.count(), 5)
+        self.assertEqual({log.phone_number for log in logs}, {'8801711111111'})
+        first = EMIInstallment.objects.get(emi_record=self.upcoming[0], installment_number=1)
+        self.assertIn(f'EMI 1 of 1000.00 for order #{self.upcoming[0].order.id}', logs.get(dedupe_key=f'emi-reminder:{first.id}').message)
+        self.assertTrue(first.reminder_sent)
+
+        self.assertEqual(send_reminders(UPCOMING)['queued'], 0)
+        # A run that crashed before marking its chunk queues nothing again
+        EMIInstallment.objects.update(reminder_sent=False)
+        self.assertEqual(send_reminders(UPCOMING), {'queued': 0, 'duplicates': 5, 'no_phone': 0})
+        self.assertEqual(SMSLog.objects.count(), 5)
+
+    def test_overdue_notices_once_a_day(self):
+        today = timezone.now().date()
+        self.assertEqual(send_reminders(OVERDUE, today=today)['queued'], 3)
+        self.assertEqual(send_reminders(OVERDUE, today=today)['duplicates'], 3)
+        self.assertEqual(EMIInstallment.objects.filter(status='overdue').count(), 3)
+        self.assertEqual(send_reminders(OVERDUE, today=today + timedelta(days=1))['queued'], 3)
@@ -5,7 +5,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.exceptions import PermissionDenied
-from django.db.models import Q
+from django.db.models import F, Prefetch, Q
 from django.db import transaction
 from datetime import datetime, timedelta
 from decimal import Decimal
@@ -18,6 +18,8 @@ from .serializers import (
     EMIRecordSerializer, EMIInstallmentSerializer, EMIRecordDetailSerializer
 )
 from .permissions import IsAdminOrOwnerReadOnly, EMIPermission
+from .bank_catalog import calculate_card_emi
+from .quote_matrix import lowest_quote, product_quotes, quote_matrix
 from notifications.services import SMSService
 from payments.services import SSLCommerzClient
 from products.models import Product
@@ -25,6 +27,8 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+MAX_QUOTE_ITEMS = 200
+
 
 class EMIPlanViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for EMI plans."""
@@ -66,35 +70,67 @@ class EMIPlanViewSet(viewsets.ReadOnlyModelViewSet):
     
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def available_banks(self, request):
-        """Get list of available banks for EMI from SSLCOMMERZ API"""
-        # Create SSLCOMMERZ client
-        client = SSLCommerzClient()
-        
-        # Fetch banks from SSLCOMMERZ API
-        banks = client.get_available_banks()
-        
-        # If API call fails, use fallback data
-        if not banks:
-            logger.warning("Failed to fetch banks from SSLCOMMERZ API, using fallback data")
-            banks = [
-                {"code": "DBBL", "name": "Dutch-Bangla Bank", "interest_rate": 12.5},
-                {"code": "EBLC", "name": "Eastern Bank", "interest_rate": 13.0},
-                {"code": "BCBL", "name": "Bangladesh Commerce Bank", "interest_rate": 11.5},
-                {"code": "BBL", "name": "BRAC Bank", "interest_rate": 12.0},
-                {"code": "ABBL", "name": "AB Bank", "interest_rate": 13.5},
-                {"code": "MTBL", "name": "Mutual Trust Bank", "interest_rate": 12.0},
-                {"code": "SCB", "name": "Standard Chartered Bank", "interest_rate": 11.0},
-                {"code": "CITI", "name": "Citibank", "interest_rate": 10.5},
-                {"code": "EBL", "name": "Eastern Bank Limited", "interest_rate": 12.5},
-                {"code": "HSBC", "name": "HSBC Bank", "interest_rate": 11.5}
-            ]
+        """Get list of available banks for EMI from the cached SSLCOMMERZ catalog"""
+        banks = SSLCommerzClient().get_available_banks()
         
         return Response({
             'status': 'success',
             'banks': banks,
             'count': len(banks)
         })
-    
+
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    def quote_matrix(self, request):
+        """
+        Quote prices and/or products against every active plan in one pass.
+
+        Query parameters: ``prices`` and ``product_ids`` (comma separated),
+        ``tenures`` (comma separated, default each plan's duration), ``banks``
+        (comma separated bank codes or ``all``) and ``summary`` to return
+        only the lowest monthly quote of each product.
+        """
+        def split(name):
+            return [value.strip() for value in request.query_params.get(name, '').split(',') if value.strip()]
+
+        try:
+            tenures = sorted({int(tenure) for tenure in split('tenures')})
+            product_ids = [int(product_id) for product_id in split('product_ids')]
+        except ValueError:
+            return Response({'error': 'tenures and product_ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if any(tenure < 1 or tenure > 60 for tenure in tenures):
+            return Response({'error': 'tenures must be between 1 and 60 months'}, status=status.HTTP_400_BAD_REQUEST)
+        prices = split('prices')
+        if not prices and not product_ids:
+            return Response({'error': 'prices or product_ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(prices) + len(product_ids) > MAX_QUOTE_ITEMS:
+            return Response({'error': f'At most {MAX_QUOTE_ITEMS} prices and products can be quoted at once'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        banks = split('banks')
+        banks = 'all' if banks == ['all'] else banks or None
+        summary = request.query_params.get('summary', '').lower() in ('1', 'true', 'yes')
+
+        result = {'tenures': tenures or None, 'banks': banks}
+        if prices:
+            matrix = quote_matrix(prices, tenures, banks)
+            result['prices'] = [
+                {'price': float(price), 'lowest': lowest_quote(rows), 'quotes': rows}
+                for price, rows in sorted(matrix.items())
+            ]
+        if product_ids:
+            products = Product.objects.filter(id__in=product_ids).only(
+                'id', 'base_price', 'effective_price', 'emi_available',
+            ).prefetch_related(Prefetch('emi_plans', queryset=EMIPlan.objects.only('id', 'is_active')))
+            quotes = product_quotes(products, tenures, banks)
+            result['products'] = []
+            for product_id in product_ids:
+                if product_id not in quotes:
+                    continue
+                entry = {'product_id': product_id, 'emi_from': lowest_quote(quotes[product_id])}
+                if not summary:
+                    entry['quotes'] = quotes[product_id]
+                result['products'].append(entry)
+        return Response(result)
+
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def calculate_emi(self, request):
         """Calculate EMI details for a plan"""
@@ -116,6 +152,9 @@ class EMIPlanViewSet(viewsets.ReadOnlyModelViewSet):
                     'error': 'Invalid plan_id or product_price'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
+            emi_details = None
+            bank_processing_fee = 0
+            
             # For Cardless EMI, use the specified calculation method
             if plan.plan_type == 'cardless_emi':
                 # 1. Calculate interest on the full price
@@ -144,37 +183,28 @@ class EMIPlanViewSet(viewsets.ReadOnlyModelViewSet):
                 down_payment = price * (plan.down_payment_percentage / 100)
                 financed_amount = price - down_payment
             
-                # Try getting EMI details from SSLCOMMERZ API if this is an SSLCOMMERZ EMI plan
-                emi_details = None
+                # SSLCOMMERZ EMI plans use the bank's rate from the cached catalog
                 if plan.is_sslcommerz_emi and bank_code:
                     client = SSLCommerzClient()
-                    emi_details = client.get_emi_details(bank_code, float(price), plan.duration_months)
+                    emi_details = client.get_emi_details(bank_code, financed_amount, plan.duration_months, plan=plan)
 
-                # Use API details if available, otherwise calculate using our formula
                 if emi_details:
-                    logger.info(f"Using EMI details from SSLCOMMERZ API for bank {bank_code}")
                     interest_rate = emi_details['interest_rate']
                     monthly_installment = emi_details['monthly_payment']
                     total_payment = emi_details['total_payment']
-                    total_interest = total_payment - financed_amount
-                    bank_processing_fee = emi_details.get('bank_processing_fee', 0)
+                    total_interest = emi_details['total_interest']
+                    bank_processing_fee = emi_details['bank_processing_fee']
                 else:
                     # Fallback to local calculation for Card EMI
                     interest_rate = plan.interest_rate
                     if bank_code and plan.sslcommerz_bank_interest_rates:
                         interest_rate = plan.sslcommerz_bank_interest_rates.get(bank_code, plan.interest_rate)
                     
-                    monthly_interest_rate = (interest_rate or Decimal('0.0')) / Decimal('1200.0')
-                    if monthly_interest_rate > 0:
-                        monthly_installment = financed_amount * (
-                            monthly_interest_rate * (1 + monthly_interest_rate) ** plan.duration_months
-                        ) / ((1 + monthly_interest_rate) ** plan.duration_months - 1)
-                    else:
-                        monthly_installment = financed_amount / plan.duration_months
-                    
-                    total_payment = monthly_installment * plan.duration_months
-                    total_interest = total_payment - financed_amount
-                    bank_processing_fee = 0
+                    interest_rate = interest_rate or Decimal('0.0')
+                    schedule = calculate_card_emi(financed_amount, interest_rate, plan.duration_months)
+                    monthly_installment = schedule['monthly_payment']
+                    total_payment = schedule['total_payment']
+                    total_interest = schedule['total_interest']
             
             return Response({
                 'status': 'success',
@@ -191,8 +221,8 @@ class EMIPlanViewSet(viewsets.ReadOnlyModelViewSet):
                     'total_interest': float(total_interest),
                     'total_payable': float(price + total_interest),
                     'bank_code': bank_code,
-                    'bank_processing_fee': float(bank_processing_fee if 'bank_processing_fee' in locals() else 0),
-                    'is_live_data': 'emi_details' in locals() and emi_details is not None
+                    'bank_processing_fee': float(bank_processing_fee),
+                    'is_live_data': bool(emi_details) and emi_details['rate_source'] == 'gateway'
                 }
             })
             
@@ -417,10 +447,11 @@ class EMIRecordViewSet(viewsets.ReadOnlyModelViewSet):
 
             # For sandbox we simply mark payments as done without gateway
             if pay_full:
-                # mark all pending installments paid
-                pending_installments = emi_record.installments.filter(status__in=['pending', 'due', 'overdue'])
-                for inst in pending_installments:
-                    inst.mark_as_paid(inst.amount, payment_method=payment_method, transaction_id='FULLPAY')
+                # mark all pending installments paid in one update
+                emi_record.installments.filter(status__in=['pending', 'due', 'overdue']).update(
+                    status='paid', paid_amount=F('amount'), paid_date=timezone.now().date(),
+                    payment_method=payment_method, transaction_id='FULLPAY', updated_at=timezone.now(),
+                )
                 emi_record.down_payment_paid = True
                 emi_record.status = 'completed'
                 emi_record.completed_date = datetime.now().date()
@@ -1,4 +1,3 @@
-import requests
 import logging
 from django.conf import settings
 from django.utils import timezone
@@ -7,6 +6,8 @@ from django.contrib.contenttypes.models import ContentType
 from .models import Notification, SMSProvider, NotificationTemplate, NotificationEvent
 import uuid
 from django.db.models.signals import post_migrate
+from backend.http_client import get_client
+from sms.services import SMSService as OutboxSMSService
 from django.dispatch import receiver
 
 logger = logging.getLogger(__name__)
@@ -142,7 +143,7 @@ class SMSService:
             }
             
             # Make API request
-            response = requests.post(
+            response = get_client('sms').post(
                 f"{provider.api_url}/api/v3/send-sms",
                 json=data,
                 headers={'Content-Type': 'application/json'}
@@ -171,53 +172,44 @@ class SMSService:
                 'error': str(e)
             }
     
+    @staticmethod
+    def get_event_template(event_type):
+        """Return the active SMS template of an event, or None."""
+        # Try to find from sms_events relationship first (forward relationship)
+        try:
+            event = NotificationEvent.objects.select_related('sms_template').get(event_type=event_type, is_active=True)
+            if event.sms_template:
+                return event.sms_template
+        except NotificationEvent.DoesNotExist:
+            pass
+        
+        # If no template found, try to find by name match as fallback
+        return NotificationTemplate.objects.filter(
+            name__icontains=event_type,
+            type='sms',
+            is_active=True
+        ).first()
+    
     @staticmethod
     def send_event_notification(event_type, user, context_data=None, related_object=None):
-        """Send an event-based notification."""
+        """
+        Queue an event-based SMS and return its ``pending`` SMSLog.
+
+        Messages go through the SMS outbox (sms/dispatch.py), so order, EMI
+        and other events never wait on the gateway.
+        """
         try:
-            # Get notification template for the event
-            event_templates = []
-            
-            # Try to find from sms_events relationship first (forward relationship)
-            from .models import NotificationEvent
-            try:
-                event = NotificationEvent.objects.get(event_type=event_type, is_active=True)
-                if event.sms_template:
-                    event_templates.append(event.sms_template)
-            except NotificationEvent.DoesNotExist:
-                pass
-            
-            # If no template found, try to find by name match as fallback
-            if not event_templates:
-                from .models import NotificationTemplate
-                template = NotificationTemplate.objects.filter(
-                    name__icontains=event_type,
-                    type='sms',
-                    is_active=True
-                ).first()
-                
-                if template:
-                    event_templates.append(template)
-            
-            if not event_templates:
+            template = SMSService.get_event_template(event_type)
+            if not template:
                 logger.error(f"No SMS template found for event: {event_type}")
                 return None
             
-            # Use the first template found
-            template = event_templates[0]
-            
             # Render template with context
             message = template.render_body(context_data or {})
             
-            # Send SMS
-            if hasattr(user, 'phone_number') and user.phone_number:
-                return SMSService.send_sms(
-                    recipient=user.phone_number,
-                    message=message,
-                    user=user,
-                    related_object=related_object,
-                    template=template
-                )
+            phone_number = getattr(user, 'phone_number', None) or getattr(user, 'phone', None)
+            if phone_number:
+                return OutboxSMSService().queue_sms(phone_number, message)
             else:
                 logger.warning(f"Cannot send SMS to user {user.id}: No phone number available")
                 return None
@@ -1,6 +1,7 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from django.apps import apps
 
@@ -22,8 +23,8 @@ if is_model_registered('orders', 'Order'):
     def order_notification_handler(sender, instance, created, **kwargs):
         """Send notifications for order events."""
         if created:
-            # New order created
-            NotificationService.notify_order_created(instance)
+            # New order created; sent after commit, once its items are saved
+            transaction.on_commit(lambda: NotificationService.notify_order_created(instance))
         else:
             # Check if status changed (requires previous status to be stored)
             if hasattr(instance, '_previous_status') and instance._previous_status != instance.status:
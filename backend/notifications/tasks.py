@@ -6,76 +6,27 @@ from datetime import timedelta
 
 from .models import Notification
 from .notification_service import NotificationService
-from emi.models import EMIInstallment
 from products.models import Product
-from .services import SMSService
 
 logger = logging.getLogger(__name__)
 
 
 @shared_task
 def send_emi_payment_reminders():
-    """Send reminders for upcoming EMI payments."""
-    # Get installments due in the next 3 days
-    today = timezone.now().date()
-    due_date = today + timedelta(days=3)
+    """Queue reminders for upcoming EMI payments."""
+    from emi.reminders import UPCOMING, send_reminders
     
-    upcoming_installments = EMIInstallment.objects.filter(
-        status__in=['pending', 'due'],
-        due_date__lte=due_date,
-        due_date__gte=today
-    ).select_related('emi_record__user', 'emi_record__order')
-    
-    sent_count = 0
-    for installment in upcoming_installments:
-        try:
-            # Send reminder SMS
-            SMSService.send_event_notification(
-                event_type='emi_payment_reminder',
-                user=installment.emi_record.user,
-                context_data={
-                    'order_id': installment.emi_record.order.id,
-                    'amount': str(installment.amount),
-                    'due_date': installment.due_date.strftime('%Y-%m-%d')
-                },
-                related_object=installment
-            )
-            sent_count += 1
-        except Exception as e:
-            logger.exception(f"Failed to send EMI reminder for installment {installment.id}: {str(e)}")
-    
-    return f"Sent {sent_count} EMI payment reminders"
+    counts = send_reminders(UPCOMING)
+    return f"Queued {counts['queued']} EMI payment reminders"
 
 
 @shared_task
 def send_emi_overdue_notifications():
-    """Send notifications for overdue EMI payments."""
-    # Get overdue installments
-    today = timezone.now().date()
-    
-    overdue_installments = EMIInstallment.objects.filter(
-        status='overdue',
-        due_date__lt=today
-    ).select_related('emi_record__user', 'emi_record__order')
-    
-    sent_count = 0
-    for installment in overdue_installments:
-        try:
-            # Send overdue notification SMS
-            SMSService.send_event_notification(
-                event_type='emi_payment_overdue',
-                user=installment.emi_record.user,
-                context_data={
-                    'order_id': installment.emi_record.order.id,
-                    'amount': str(installment.amount)
-                },
-                related_object=installment
-            )
-            sent_count += 1
-        except Exception as e:
-            logger.exception(f"Failed to send EMI overdue notification for installment {installment.id}: {str(e)}")
+    """Queue notifications for overdue EMI payments."""
+    from emi.reminders import OVERDUE, send_reminders
     
-    return f"Sent {sent_count} EMI overdue notifications"
+    counts = send_reminders(OVERDUE)
+    return f"Queued {counts['queued']} EMI overdue notifications"
 
 
 @shared_task
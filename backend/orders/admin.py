@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Cart, CartItem, Order, OrderItem
+from .models import Cart, CartItem, Order, OrderItem, PurchasedProduct, StockReservation
 from emi.models import EMIRecord
 
 
@@ -21,6 +21,13 @@ class OrderItemInline(admin.TabularInline):
     readonly_fields = ('product', 'quantity', 'price', 'has_emi')
 
 
+class StockReservationInline(admin.TabularInline):
+    model = StockReservation
+    extra = 0
+    readonly_fields = ('product', 'variation', 'quantity', 'status', 'expires_at', 'created_at', 'updated_at')
+    can_delete = False
+
+
 class EMIRecordInline(admin.StackedInline):
     model = EMIRecord
     extra = 0
@@ -40,7 +47,7 @@ class OrderAdmin(admin.ModelAdmin):
     list_filter = ('status', 'payment_status', 'payment_method', 'has_emi', 'created_at')
     search_fields = ('order_id', 'user__email', 'shipping_phone')
     readonly_fields = ('order_id', 'created_at', 'updated_at')
-    inlines = [OrderItemInline, EMIRecordInline]
+    inlines = [OrderItemInline, StockReservationInline, EMIRecordInline]
     fieldsets = (
         (None, {
             'fields': ('order_id', 'user', 'status', 'payment_status', 'payment_method')
@@ -58,3 +65,20 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'updated_at')
         }),
     )
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('order', 'product', 'variation', 'quantity', 'status', 'expires_at', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('order__order_id', 'product__name')
+    raw_id_fields = ('order', 'product', 'variation')
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(PurchasedProduct)
+class PurchasedProductAdmin(admin.ModelAdmin):
+    list_display = ('user', 'product', 'created_at')
+    search_fields = ('user__email', 'product__name')
+    raw_id_fields = ('user', 'product')
+    readonly_fields = ('created_at',)
@@ -0,0 +1,248 @@
+"""
+Stock reservations for checkout.
+
+Placing an order reserves its items with conditional UPDATEs,
+
+    UPDATE ... SET stock_quantity = stock_quantity - n
+    WHERE id = ... AND stock_quantity >= n
+
+so two checkouts can never both take the last unit, and nothing is read
+and written back. Lines of variations take the variation's stock, other
+lines the product's. On PostgreSQL all lines of a table are taken in one
+statement; elsewhere one UPDATE per line. Rows are always locked in the
+same order (products, then variations, by id) so concurrent multi-item
+checkouts cannot deadlock.
+
+A reservation then ends in one of three ways:
+
+* ``commit_reservations`` when the payment succeeds (or straight away for
+  cash on delivery); the stock stays taken.
+* ``release_reservations`` when the payment fails or the order is
+  cancelled; the stock is returned.
+* ``expire_stale_reservations`` (the ``expire_stock_reservations`` task)
+  for checkouts abandoned longer than STOCK_RESERVATION_TTL.
+
+Each reservation changes state with a conditional UPDATE on its status,
+so a late IPN and the sweeper racing on the same reservation return its
+stock at most once.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from products.models import Product, ProductVariation
+from .models import StockReservation
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStock(Exception):
+    """Raised when a line cannot be reserved; nothing of the order is reserved then."""
+
+    def __init__(self, product_id, variation_id, quantity):
+        self.product_id = product_id
+        self.variation_id = variation_id
+        self.quantity = quantity
+        target = f"variation {variation_id}" if variation_id else f"product {product_id}"
+        super().__init__(f"Not enough stock for {target} (requested {quantity})")
+
+
+def get_reservation_ttl():
+    """Seconds a checkout may hold stock before the sweeper returns it."""
+    return getattr(settings, 'STOCK_RESERVATION_TTL', 30 * 60)
+
+
+def _merge_lines(lines):
+    """Sum quantities per (product_id, variation_id) and sort in lock order."""
+    merged = defaultdict(int)
+    for product_id, variation_id, quantity in lines:
+        if quantity > 0:
+            merged[(product_id, variation_id)] += quantity
+    # Product rows first, then variation rows, each by id
+    return sorted(merged.items(), key=lambda item: (item[0][1] is not None, item[0][1] or item[0][0]))
+
+
+def _take(product_id, variation_id, quantity):
+    """Take ``quantity`` units if available; returns whether the row was updated."""
+    if variation_id:
+        rows = ProductVariation.objects.filter(pk=variation_id, stock_quantity__gte=quantity)
+    else:
+        rows = Product.objects.filter(pk=product_id, stock_quantity__gte=quantity)
+    return rows.update(stock_quantity=F('stock_quantity') - quantity) == 1
+
+
+def _take_all(model, wanted):
+    """
+    Take stock for ``{id: quantity}`` rows of ``model``; returns the ids that were short.
+
+    The rows are locked in id order first, then updated in the same statement.
+    """
+    if not wanted:
+        return []
+    items = sorted(wanted.items())
+    if connection.vendor != 'postgresql':
+        short = []
+        for pk, quantity in items:
+            if not model.objects.filter(pk=pk, stock_quantity__gte=quantity).update(
+                    stock_quantity=F('stock_quantity') - quantity):
+                short.append(pk)
+        return short
+
+    table = connection.ops.quote_name(model._meta.db_table)
+    values = ', '.join(['(%s::bigint, %s::integer)'] * len(items))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH wanted (id, quantity) AS (VALUES {values}),
+            locked AS MATERIALIZED (
+                SELECT t.id FROM {table} t JOIN wanted ON wanted.id = t.id ORDER BY t.id FOR UPDATE OF t
+            )
+            UPDATE {table} t SET stock_quantity = t.stock_quantity - wanted.quantity
+            FROM wanted
+            WHERE t.id = wanted.id AND t.id IN (SELECT id FROM locked) AND t.stock_quantity >= wanted.quantity
+            RETURNING t.id
+            """,
+            [value for item in items for value in item],
+        )
+        taken = {row[0] for row in cursor.fetchall()}
+    return [pk for pk, _ in items if pk not in taken]
+
+
+def _give_back(product_id, variation_id, quantity):
+    if variation_id:
+        rows = ProductVariation.objects.filter(pk=variation_id)
+    else:
+        rows = Product.objects.filter(pk=product_id)
+    rows.update(stock_quantity=F('stock_quantity') + quantity)
+
+
+def reserve_stock(order, lines, ttl=None):
+    """
+    Reserve ``lines`` of (product_id, variation_id, quantity) for ``order``.
+
+    Raises InsufficientStock if any line is short; the stock taken for
+    earlier lines is rolled back with the savepoint.
+    """
+    lines = _merge_lines(lines)
+    expires_at = timezone.now() + timedelta(seconds=ttl if ttl is not None else get_reservation_ttl())
+
+    products = {product_id: quantity for (product_id, variation_id), quantity in lines if not variation_id}
+    variations = {variation_id: quantity for (product_id, variation_id), quantity in lines if variation_id}
+
+    with transaction.atomic():
+        # Products before variations, matching the lock order everywhere else
+        short = _take_all(Product, products)
+        if short:
+            raise InsufficientStock(short[0], None, products[short[0]])
+        short = _take_all(ProductVariation, variations)
+        if short:
+            product_id = next(p for (p, v), _ in lines if v == short[0])
+            raise InsufficientStock(product_id, short[0], variations[short[0]])
+        return StockReservation.objects.bulk_create([
+            StockReservation(order=order, product_id=product_id, variation_id=variation_id,
+                             quantity=quantity, expires_at=expires_at)
+            for (product_id, variation_id), quantity in lines
+        ])
+
+
+def _transition(reservations, from_statuses, to_status):
+    """Move each reservation that is still in ``from_statuses``; returns the ones moved."""
+    moved = []
+    now = timezone.now()
+    for reservation in reservations:
+        claimed = StockReservation.objects.filter(
+            pk=reservation.pk, status__in=from_statuses,
+        ).update(status=to_status, updated_at=now)
+        if claimed:
+            reservation.status = to_status
+            moved.append(reservation)
+    return moved
+
+
+def _sorted_for_locking(reservations):
+    return sorted(reservations, key=lambda r: (r.variation_id is not None, r.variation_id or r.product_id))
+
+
+def commit_reservations(order):
+    """
+    Make the order's reservations permanent once it is paid.
+
+    A reservation that expired before the payment arrived has already
+    returned its stock; it is taken again if still available, otherwise the
+    shortfall is logged for staff to resolve.
+    """
+    with transaction.atomic():
+        reservations = _sorted_for_locking(order.stock_reservations.filter(
+            status__in=[StockReservation.STATUS_ACTIVE, StockReservation.STATUS_EXPIRED, StockReservation.STATUS_RELEASED]
+        ))
+        committed = _transition(
+            [r for r in reservations if r.status == StockReservation.STATUS_ACTIVE],
+            [StockReservation.STATUS_ACTIVE], StockReservation.STATUS_COMMITTED,
+        )
+        lapsed = [StockReservation.STATUS_EXPIRED, StockReservation.STATUS_RELEASED]
+        for reservation in reservations:
+            if reservation.status == StockReservation.STATUS_COMMITTED:
+                continue
+            # The status check also covers reservations the sweeper expired after we read them
+            with transaction.atomic():
+                if not _transition([reservation], lapsed, StockReservation.STATUS_COMMITTED):
+                    continue
+                retaken = _take(reservation.product_id, reservation.variation_id, reservation.quantity)
+                if not retaken:
+                    transaction.set_rollback(True)
+            if retaken:
+                committed.append(reservation)
+            else:
+                logger.error(f"Order {order.order_id} was paid after reservation {reservation.pk} lapsed and "
+                             f"the stock is gone: {reservation.quantity} x product {reservation.product_id} "
+                             f"variation {reservation.variation_id}")
+    return len(committed)
+
+
+def release_reservations(order, include_committed=False, status=StockReservation.STATUS_RELEASED):
+    """
+    Return the stock held for ``order``.
+
+    Active reservations are released; with ``include_committed`` (e.g. when
+    a paid order is cancelled) committed ones are too.
+    """
+    from_statuses = [StockReservation.STATUS_ACTIVE]
+    if include_committed:
+        from_statuses.append(StockReservation.STATUS_COMMITTED)
+    with transaction.atomic():
+        reservations = _sorted_for_locking(order.stock_reservations.filter(status__in=from_statuses))
+        released = _return_stock(reservations, from_statuses, status)
+    return len(released)
+
+
+def _return_stock(reservations, from_statuses, status):
+    released = _transition(reservations, from_statuses, status)
+    for reservation in released:
+        _give_back(reservation.product_id, reservation.variation_id, reservation.quantity)
+    return released
+
+
+def expire_stale_reservations(now=None, batch_size=500):
+    """Release active reservations past their expiry; returns how many were expired."""
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        with transaction.atomic():
+            batch = list(StockReservation.objects.filter(
+                status=StockReservation.STATUS_ACTIVE, expires_at__lte=now,
+            ).order_by('expires_at', 'pk')[:batch_size])
+            if not batch:
+                break
+            expired += len(_return_stock(
+                _sorted_for_locking(batch), [StockReservation.STATUS_ACTIVE], StockReservation.STATUS_EXPIRED,
+            ))
+        if len(batch) < batch_size:
+            break
+    if expired:
+        logger.info(f"Expired {expired} stale stock reservations")
+    return expired
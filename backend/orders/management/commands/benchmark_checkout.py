@@ -0,0 +1,77 @@
+import statistics
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from orders.models import Cart, CartItem
+from orders.serializers import OrderCreateSerializer
+from products.models import Brand, Category, Product
+
+User = get_user_model()
+
+ORDER_DATA = {
+    'payment_method': 'card', 'shipping_address': 'Benchmark House', 'shipping_city': 'Dhaka',
+    'shipping_state': 'Dhaka', 'shipping_postal_code': '1200', 'shipping_phone': '01700000000',
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Time checkout (OrderCreateSerializer.save) against cart size; all data is rolled back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,5,20,50,100', help='Comma-separated cart sizes')
+        parser.add_argument('--repeat', type=int, default=10, help='Checkouts per cart size')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        try:
+            # Benchmark data and orders are never committed
+            with transaction.atomic():
+                self.run(sizes, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, sizes, repeat):
+        user = User.objects.create_user(email='checkout-benchmark@example.com', password='unused')
+        category = Category.objects.create(name='Checkout Benchmark', slug='checkout-benchmark')
+        brand = Brand.objects.create(name='Checkout Benchmark', slug='checkout-benchmark')
+        products = [
+            Product.objects.create(
+                name=f'Benchmark item {i}', slug=f'checkout-benchmark-{i}', category=category, brand=brand,
+                description='Benchmark item', base_price=Decimal('100.00'), vendor=user, is_approved=True,
+                stock_quantity=max(sizes) * repeat,
+            )
+            for i in range(max(sizes))
+        ]
+        cart = Cart.objects.create(user=user)
+        context = {'request': SimpleNamespace(user=user)}
+
+        for size in sizes:
+            timings = []
+            query_counts = []
+            for _ in range(repeat):
+                CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=1)
+                                              for product in products[:size]])
+                serializer = OrderCreateSerializer(data=ORDER_DATA, context=context)
+                serializer.is_valid(raise_exception=True)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    serializer.save()
+                    timings.append((time.perf_counter() - started) * 1000)
+                query_counts.append(len(queries))
+
+            timings.sort()
+            self.stdout.write(self.style.SUCCESS(
+                f"{size:>4} lines: mean {statistics.mean(timings):.1f} ms, p50 {timings[len(timings) // 2]:.1f} ms, "
+                f"max {timings[-1]:.1f} ms, {max(query_counts)} queries"
+            ))
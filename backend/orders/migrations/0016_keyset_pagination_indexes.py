@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0015_cartitem_emi_bank_cartitem_emi_type_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-created_at', '-id'], name='order_created_keyset'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_purchased_products(apps, schema_editor):
+    from orders.purchases import rebuild_purchases
+
+    rebuild_purchases(
+        order_item_model=apps.get_model('orders', 'OrderItem'),
+        purchase_model=apps.get_model('orders', 'PurchasedProduct'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_import_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('orders', '0018_order_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchasedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purchases', to='products.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purchased_products', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'product')},
+            },
+        ),
+        migrations.RunPython(fill_purchased_products, migrations.RunPython.noop),
+    ]
@@ -60,13 +60,21 @@ class CartItem(models.Model):
     def __str__(self):
         return f"{self.quantity} x {self.product.name} in {self.cart}"
     
+    @property
+    def unit_price(self):
+        """Variation price, else the product's sale price or current price."""
+        if self.variation:
+            return self.variation.price
+        product = self.product
+        if product.sale_price:
+            return product.sale_price
+        # effective_price mirrors Product.price without querying the variations
+        return product.effective_price if product.effective_price is not None else product.price
+    
     @property
     def total_price(self):
         """Calculate total price for this item."""
-        if self.variation:
-            return self.variation.price * self.quantity
-        unit_price = self.product.sale_price if self.product.sale_price else self.product.price
-        return unit_price * self.quantity
+        return self.unit_price * self.quantity
 
 
 class Order(models.Model):
@@ -127,10 +135,24 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination order (see products.pagination)
+            models.Index(fields=['-created_at', '-id'], name='order_created_keyset'),
+            # Sales rollups find the orders changed since their last run
+            models.Index(fields=['updated_at'], name='order_updated_at'),
+        ]
     
     def __str__(self):
         return f"Order {self.order_id}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so saves can tell status transitions (see orders.purchases)
+        if 'status' in field_names:
+            instance._loaded_status = values[field_names.index('status')]
+        return instance
+    
     def save(self, *args, **kwargs):
         # Generate order ID if not set
         if not self.order_id:
@@ -169,3 +191,63 @@ class OrderItem(models.Model):
     def total_price(self):
         """Calculate total price for this item."""
         return self.price * self.quantity
+
+
+class PurchasedProduct(models.Model):
+    """
+    A product a user has received: it is on one of their delivered or
+    completed orders. Maintained by orders.purchases.
+    """
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='purchased_products')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='purchases')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ('user', 'product')
+    
+    def __str__(self):
+        return f"{self.user} bought {self.product_id}"
+
+
+class StockReservation(models.Model):
+    """
+    Stock held for an order between checkout and payment.
+
+    Stock is taken from the product or variation when the reservation is
+    made (see orders.inventory). Payment commits the reservation; failure,
+    cancellation or expiry releases it and returns the stock.
+    """
+
+    STATUS_ACTIVE = 'active'
+    STATUS_COMMITTED = 'committed'
+    STATUS_RELEASED = 'released'
+    STATUS_EXPIRED = 'expired'
+
+    STATUS_CHOICES = (
+        (STATUS_ACTIVE, 'Active'),
+        (STATUS_COMMITTED, 'Committed'),
+        (STATUS_RELEASED, 'Released'),
+        (STATUS_EXPIRED, 'Expired'),
+    )
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='stock_reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_reservations')
+    variation = models.ForeignKey('products.ProductVariation', on_delete=models.CASCADE, null=True, blank=True,
+                                  related_name='stock_reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Sweeper scan for stale holds
+            models.Index(fields=['status', 'expires_at'], name='reservation_status_expiry'),
+        ]
+
+    def __str__(self):
+        target = self.variation or self.product
+        return f"{self.quantity} x {target} for {self.order} ({self.status})"
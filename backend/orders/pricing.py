@@ -0,0 +1,163 @@
+"""
+Single-pass cart pricing.
+
+``CartPricer(cart).price()`` loads the cart's items with their products,
+variations and EMI plans in one prefetching query. It then works out line
+prices, the promo discount, EMI interest and the shipping estimate in one
+pass over them. The result is an immutable ``PricedCart``, which the cart
+view and order creation both read instead of walking ``cart.items`` again.
+
+Unit prices come from ``CartItem.unit_price``: the variation price, the
+product's sale price, or its denormalized ``effective_price``. None of
+these needs another query.
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Any, Mapping, Optional, Tuple
+
+from django.db.models import Prefetch, prefetch_related_objects
+
+from shipping.services import ShippingService
+from .models import CartItem
+
+ZERO = Decimal('0.00')
+
+
+@dataclass(frozen=True)
+class PricedLine:
+    """One cart item with its price and, for EMI items, the plan's calculation."""
+
+    item: CartItem
+    unit_price: Decimal
+    quantity: int
+    total: Decimal
+    emi: Optional[Mapping[str, Any]] = None
+    emi_interest: Decimal = ZERO
+
+    @property
+    def has_emi(self):
+        return self.emi is not None
+
+
+@dataclass(frozen=True)
+class PricedCart:
+    """
+    Priced snapshot of a cart.
+
+    ``total`` is what an order for the cart charges: subtotal, less the
+    discount, plus cardless EMI interest. ``shipping_cost`` is the estimate
+    shown with the cart.
+    """
+
+    cart: Any
+    lines: Tuple[PricedLine, ...]
+    subtotal: Decimal
+    total_items: int
+    discount_amount: Decimal
+    emi_interest: Decimal
+    shipping_cost: Decimal
+    free_shipping_threshold: Decimal
+    promo_code: Any = None
+
+    @property
+    def total(self):
+        return self.subtotal - self.discount_amount + self.emi_interest
+
+    @property
+    def has_emi(self):
+        return any(line.item.emi_selected for line in self.lines)
+
+    @property
+    def emi_lines(self):
+        return tuple(line for line in self.lines if line.has_emi)
+
+    @property
+    def remaining_for_free_shipping(self):
+        return max(self.free_shipping_threshold - self.subtotal, ZERO)
+
+    @property
+    def is_eligible_for_free_shipping(self):
+        return self.subtotal >= self.free_shipping_threshold
+
+    def stock_lines(self):
+        """(product_id, variation_id, quantity) for orders.inventory."""
+        return [(line.item.product_id, line.item.variation_id, line.quantity) for line in self.lines]
+
+    def shipping_info(self):
+        return {
+            'free_shipping_threshold': float(self.free_shipping_threshold),
+            'remaining_for_free_shipping': float(self.remaining_for_free_shipping),
+            'default_shipping_cost': float(ShippingService.get_default_shipping_cost()),
+            'is_eligible_for_free_shipping': self.is_eligible_for_free_shipping,
+        }
+
+
+class CartPricer:
+    """Price a cart from one load of its items."""
+
+    def __init__(self, cart):
+        self.cart = cart
+
+    @staticmethod
+    def items_queryset():
+        # Everything CartItem.unit_price and CartItemSerializer read
+        return CartItem.objects.select_related(
+            'product__category', 'product__brand', 'variation', 'emi_plan',
+        ).prefetch_related('product__emi_plans').order_by('id')
+
+    def load(self):
+        """Prefetch the cart's items, so ``cart.items.all()`` is served from memory afterwards."""
+        prefetch_related_objects([self.cart], Prefetch('items', queryset=self.items_queryset()))
+        return list(self.cart.items.all())
+
+    def price(self, promo_code=None, use_cart_promo=False):
+        """
+        Return a PricedCart.
+
+        ``promo_code`` is applied if given; otherwise, with ``use_cart_promo``,
+        the promo code applied to the cart is. A code that yields no discount
+        is dropped.
+        """
+        lines = []
+        subtotal = ZERO
+        total_items = 0
+        emi_interest = ZERO
+
+        for item in self.load():
+            unit_price = item.unit_price
+            total = unit_price * item.quantity
+            emi = None
+            interest = ZERO
+            if item.emi_selected and item.emi_plan:
+                emi = MappingProxyType(item.emi_plan.calculate_monthly_payment(
+                    total, item.emi_period or item.emi_plan.duration_months,
+                ))
+                # Card EMI interest is charged by the bank, not on the order
+                if item.emi_plan.plan_type == 'cardless_emi':
+                    interest = emi['total_interest']
+            lines.append(PricedLine(item=item, unit_price=unit_price, quantity=item.quantity, total=total,
+                                    emi=emi, emi_interest=interest))
+            subtotal += total
+            total_items += item.quantity
+            emi_interest += interest
+
+        if promo_code is None and use_cart_promo:
+            promo_code = self.cart.promo_code
+        discount_amount = ZERO
+        if promo_code is not None:
+            discount_amount = promo_code.calculate_discount(subtotal)
+            if discount_amount <= 0:
+                promo_code, discount_amount = None, ZERO
+
+        return PricedCart(
+            cart=self.cart,
+            lines=tuple(lines),
+            subtotal=subtotal,
+            total_items=total_items,
+            discount_amount=discount_amount,
+            emi_interest=emi_interest,
+            shipping_cost=ShippingService.calculate_shipping_cost(subtotal),
+            free_shipping_threshold=ShippingService.get_free_shipping_threshold(),
+            promo_code=promo_code,
+        )
@@ -0,0 +1,193 @@
+"""
+Purchased products index.
+
+PurchasedProduct has one row per user and product they have received,
+that is, a product on one of their delivered or completed orders. When an
+order moves into or out of those statuses, the rows of its products are
+synced after the transaction commits, once the order's items are saved.
+
+Each user's product ids are cached as one set for PURCHASED_PRODUCTS_TTL
+seconds. The set is dropped whenever the user's rows change. "Has this
+user bought this product" is then a set membership check. Can-review,
+the verified purchase flag on new reviews and "you bought this" badges
+all use ``purchased_product_ids``, which makes at most one query.
+
+Queryset ``update()`` calls on orders send no signals.
+``rebuild_purchases`` recomputes the rows from the orders, and the
+``reconcile_purchased_products`` task runs it nightly.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Order, OrderItem, PurchasedProduct
+
+logger = logging.getLogger(__name__)
+
+PURCHASED_STATUSES = ('delivered', 'completed')
+
+
+def get_ttl():
+    """Seconds a user's purchased product set stays cached."""
+    return getattr(settings, 'PURCHASED_PRODUCTS_TTL', 60 * 60)
+
+
+def cache_key(user_id):
+    return f'orders:purchased:{user_id}'
+
+
+def invalidate(user_ids):
+    cache.delete_many([cache_key(user_id) for user_id in user_ids])
+
+
+def purchased_product_ids(user_id):
+    """Ids of the products ``user_id`` has received, as a frozenset (empty for anonymous users)."""
+    if not user_id:
+        return frozenset()
+    key = cache_key(user_id)
+    product_ids = cache.get(key)
+    if product_ids is None:
+        product_ids = frozenset(PurchasedProduct.objects.filter(user_id=user_id).values_list('product_id', flat=True))
+        cache.set(key, product_ids, get_ttl())
+    return product_ids
+
+
+def has_purchased(user_id, product_id):
+    return product_id in purchased_product_ids(user_id)
+
+
+def sync_purchases(user_id, product_ids):
+    """Make the rows of ``user_id`` for ``product_ids`` match their orders."""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    bought = set(OrderItem.objects.filter(
+        order__user_id=user_id, order__status__in=PURCHASED_STATUSES, product_id__in=product_ids,
+    ).values_list('product_id', flat=True).distinct())
+
+    with transaction.atomic():
+        PurchasedProduct.objects.bulk_create(
+            [PurchasedProduct(user_id=user_id, product_id=product_id) for product_id in bought],
+            ignore_conflicts=True,
+        )
+        PurchasedProduct.objects.filter(user_id=user_id, product_id__in=product_ids - bought).delete()
+    invalidate([user_id])
+
+
+def sync_order_purchases(order_id, user_id):
+    """Sync the purchased products of an order's user for the order's products."""
+    sync_purchases(user_id, OrderItem.objects.filter(order_id=order_id).values_list('product_id', flat=True))
+
+
+def rebuild_purchases(user_ids=None, order_item_model=None, purchase_model=None):
+    """
+    Rewrite the rows that drifted from the orders; returns how many rows changed.
+
+    Only the drifted rows pass through the database connection: on
+    PostgreSQL the missing rows are added with INSERT ... SELECT ... WHERE
+    NOT EXISTS and the stale ones removed with DELETE ... WHERE NOT EXISTS. Models can be passed in so data migrations can use
+    historical models.
+    """
+    if order_item_model is None or purchase_model is None:
+        order_item_model, purchase_model = OrderItem, PurchasedProduct
+    if user_ids is not None:
+        user_ids = list(user_ids)
+
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            added, removed = _rebuild_sql(user_ids, order_item_model, purchase_model)
+        else:
+            added, removed = _rebuild_orm(user_ids, order_item_model, purchase_model)
+
+    changed_users = set(added) | set(removed)
+    invalidate(changed_users)
+    if changed_users:
+        logger.warning(f"Rebuilt {len(added) + len(removed)} purchased product rows of {len(changed_users)} users")
+    return len(added) + len(removed)
+
+
+def _rebuild_sql(user_ids, order_item_model, purchase_model):
+    """Add and remove rows in two statements; returns the user ids of the added and of the removed rows."""
+    order_model = order_item_model._meta.get_field('order').related_model
+    purchases = connection.ops.quote_name(purchase_model._meta.db_table)
+    items = connection.ops.quote_name(order_item_model._meta.db_table)
+    orders = connection.ops.quote_name(order_model._meta.db_table)
+    user_filter = 'AND {}.user_id = ANY(%s)' if user_ids is not None else ''
+    params = [list(PURCHASED_STATUSES)] + ([user_ids] if user_ids is not None else [])
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {purchases} (user_id, product_id, created_at)
+            SELECT DISTINCT o.user_id, i.product_id, %s
+            FROM {items} i JOIN {orders} o ON o.id = i.order_id
+            WHERE o.status = ANY(%s) {user_filter.format('o')} AND NOT EXISTS (
+                SELECT 1 FROM {purchases} p WHERE p.user_id = o.user_id AND p.product_id = i.product_id
+            )
+            ON CONFLICT DO NOTHING
+            RETURNING user_id
+            """,
+            [timezone.now()] + params,
+        )
+        added = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            f"""
+            DELETE FROM {purchases} p
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {items} i JOIN {orders} o ON o.id = i.order_id
+                WHERE o.user_id = p.user_id AND i.product_id = p.product_id AND o.status = ANY(%s)
+            ) {user_filter.format('p')}
+            RETURNING user_id
+            """,
+            params,
+        )
+        removed = [row[0] for row in cursor.fetchall()]
+    return added, removed
+
+
+def _rebuild_orm(user_ids, order_item_model, purchase_model):
+    """Load only the drifted pairs; returns the user ids of the added and of the removed rows."""
+    items = order_item_model.objects.filter(order__status__in=PURCHASED_STATUSES)
+    stored = purchase_model.objects.all()
+    if user_ids is not None:
+        items = items.filter(order__user_id__in=user_ids)
+        stored = stored.filter(user_id__in=user_ids)
+
+    missing = list(items.filter(~Exists(
+        purchase_model.objects.filter(user_id=OuterRef('order__user_id'), product_id=OuterRef('product_id'))
+    )).order_by().values_list('order__user_id', 'product_id').distinct())
+    extra = stored.filter(~Exists(
+        items.filter(order__user_id=OuterRef('user_id'), product_id=OuterRef('product_id'))
+    ))
+    removed = list(extra.values_list('user_id', flat=True))
+
+    purchase_model.objects.bulk_create(
+        [purchase_model(user_id=user_id, product_id=product_id) for user_id, product_id in missing],
+        batch_size=1000, ignore_conflicts=True,
+    )
+    extra.delete()
+    return [user_id for user_id, _ in missing], removed
+
+
+@receiver(post_save, sender=Order)
+def update_purchases(sender, instance, created, **kwargs):
+    """Sync the order's purchased products when it moves into or out of a purchased status."""
+    was_purchased = getattr(instance, '_loaded_status', None) in PURCHASED_STATUSES
+    instance._loaded_status = instance.status
+    if was_purchased == (instance.status in PURCHASED_STATUSES):
+        return
+    order_id, user_id = instance.pk, instance.user_id
+
+    def sync():
+        try:
+            sync_order_purchases(order_id, user_id)
+        except Exception as e:
+            logger.error(f"Error syncing purchased products of order {order_id}: {str(e)}")
+
+    transaction.on_commit(sync)
@@ -1,6 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
+from .inventory import InsufficientStock, reserve_stock, commit_reservations
+from .pricing import CartPricer
 from .models import Cart, CartItem, Order, OrderItem
 from products.models import Product, ProductVariation
 from products.serializers import ProductListSerializer, ProductVariationSerializer
@@ -9,8 +13,10 @@ from users.models import Address
 from emi.models import EMIPlan, EMIRecord, EMIInstallment
 from .serializers_minimal import OrderMinimalSerializer
 from emi.serializers import EMIPlanSerializer
+import logging
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -194,8 +200,14 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         
         return data
     
+    @transaction.atomic
     def create(self, validated_data):
-        """Create a new order from cart items."""
+        """
+        Create a new order from cart items, reserving their stock.
+        
+        Everything is written in this one transaction with a fixed number of
+        statements per table; notifications are sent once it commits.
+        """
         user = self.context['request'].user
         
         # Get user's cart
@@ -204,46 +216,22 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         except Cart.DoesNotExist:
             raise serializers.ValidationError("User has no items in cart")
         
+        # Lock the promo code so concurrent checkouts can't overrun its usage limit
+        promo_code = self.context.get('promo_code')
+        if promo_code:
+            promo_code = self._lock_promo_code(promo_code)
+        
+        # Price every line, the promo discount and EMI interest from one load of the cart
+        priced = CartPricer(cart).price(promo_code=promo_code)
+        
         # Check if cart has items
-        if cart.items.count() == 0:
+        if not priced.lines:
             raise serializers.ValidationError("Cart is empty")
         
         # Calculate order totals
-        subtotal = cart.total_price
         shipping_cost = 0  # Can be calculated based on business logic
         tax = 0  # No tax calculation
-        
-        # Apply promo code if available
-        discount_amount = 0
-        promo_code = self.context.get('promo_code')
-        
-        if promo_code:
-            discount_amount = promo_code.calculate_discount(subtotal)
-            
-            # Check if discount is valid
-            if discount_amount <= 0:
-                promo_code = None
-        
-        # Calculate EMI interest if applicable
-        emi_interest = 0
-        has_cardless_emi = False
-        
-        for cart_item in cart.items.all():
-            if cart_item.emi_selected and cart_item.emi_plan:
-                if cart_item.emi_plan.plan_type == 'cardless_emi':
-                    has_cardless_emi = True
-                    # Calculate interest for cardless EMI
-                    calculation = cart_item.emi_plan.calculate_monthly_payment(
-                        cart_item.total_price,
-                        cart_item.emi_period or cart_item.emi_plan.duration_months
-                    )
-                    emi_interest += calculation['total_interest']
-        
-        # Calculate final total with EMI interest
-        total = subtotal + shipping_cost + tax - discount_amount + emi_interest
-        
-        # Check if cart has EMI items
-        has_emi = any(item.emi_selected for item in cart.items.all())
+        promo_code = priced.promo_code
         
         # Remove has_emi from validated_data to avoid duplicate keyword argument
         validated_data.pop('has_emi', None)
@@ -253,174 +241,171 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             user=user,
             status='pending',
             payment_status='pending',
-            subtotal=subtotal,
+            subtotal=priced.subtotal,
             shipping_cost=shipping_cost,
             tax=tax,
-            discount_amount=discount_amount,
+            discount_amount=priced.discount_amount,
             promo_code=promo_code,
-            total=total,
-            has_emi=has_emi,
+            total=priced.total + shipping_cost + tax,
+            has_emi=priced.has_emi,
             **validated_data
         )
         
+        # Hold the stock until payment; fails the whole order if any item ran out
+        try:
+            reserve_stock(order, priced.stock_lines())
+        except InsufficientStock as e:
+            raise serializers.ValidationError(
+                "Some items in your cart are no longer available in the requested quantity"
+            ) from e
+        if order.payment_method == 'cod':
+            # No payment step will confirm cash on delivery orders
+            commit_reservations(order)
+        
         # Create order items from cart items
-        for cart_item in cart.items.all():
-            # Use variation price if available, otherwise use product price
-            if cart_item.variation:
-                price = cart_item.variation.price
-            else:
-                price = cart_item.product.sale_price if cart_item.product.sale_price else cart_item.product.price
-                
-            OrderItem.objects.create(
+        OrderItem.objects.bulk_create([
+            OrderItem(
                 order=order,
-                product=cart_item.product,
-                variation=cart_item.variation,
-                quantity=cart_item.quantity,
-                price=price,
-                has_emi=cart_item.emi_selected,
-                emi_plan=cart_item.emi_plan if cart_item.emi_selected else None,
-                emi_type=cart_item.emi_type if cart_item.emi_selected else None,
-                emi_bank=cart_item.emi_bank if cart_item.emi_selected else None
+                product=line.item.product,
+                variation=line.item.variation,
+                quantity=line.quantity,
+                price=line.unit_price,
+                has_emi=line.item.emi_selected,
+                emi_plan=line.item.emi_plan if line.item.emi_selected else None,
+                emi_type=line.item.emi_type if line.item.emi_selected else None,
+                emi_bank=line.item.emi_bank if line.item.emi_selected else None
             )
+            for line in priced.lines
+        ])
         
         # Record promo code usage if applied
         if promo_code:
-            from promotions.models import PromoCodeUsage
+            from promotions.models import PromoCode, PromoCodeUsage
             PromoCodeUsage.objects.create(
                 promo_code=promo_code,
                 user=user,
                 order=order,
-                discount_amount=discount_amount
+                discount_amount=priced.discount_amount
             )
             
-            # Increment usage count
-            promo_code.use()
+            # Increment usage count on the locked row
+            PromoCode.objects.filter(pk=promo_code.pk).update(usage_count=F('usage_count') + 1)
         
         # Create EMI applications for EMI items
-        self._create_emi_applications(order, cart)
+        self._create_emi_applications(order, priced)
         
         # Clear cart after order is created
-        cart.items.all().delete()
+        CartItem.objects.filter(cart=cart).delete()
         
         return order 
     
-    def _create_emi_applications(self, order, cart):
-        """Create EMI applications for EMI items in the order."""
+    def _lock_promo_code(self, promo_code):
+        """Re-read the promo code FOR UPDATE and check it is still valid."""
+        from promotions.models import PromoCode
+        promo_code = PromoCode.objects.select_for_update().get(pk=promo_code.pk)
+        if not promo_code.is_valid:
+            raise serializers.ValidationError({"promo_code": "This promo code is no longer valid"})
+        return promo_code
+    
+    def _create_emi_applications(self, order, priced):
+        """
+        Create the EMI application for the order's EMI items.
+        
+        Cardless EMI applications wait for admin review; SSLCOMMERZ card EMI
+        is approved at once, with its EMI record and installment schedule.
+        An order has a single application, so it is made for the first EMI
+        line. A failure here is logged and doesn't fail the order.
+        """
         from emi.models import EMIApplication
         
         # Get EMI application data from context if available
-        emi_application_data = self.context.get('emi_application_data')
+        emi_application_data = self.context.get('emi_application_data') or {}
         
-        # Get EMI items from cart
-        emi_items = cart.items.filter(emi_selected=True)
+        lines = [
+            line for line in priced.emi_lines
+            if line.item.emi_plan.plan_type == 'cardless_emi'
+            or (line.item.emi_plan.plan_type == 'card_emi' and line.item.emi_plan.is_sslcommerz_emi)
+        ]
+        if not lines:
+            return
+        if len(lines) > 1:
+            logger.warning(f"Order {order.id} has {len(lines)} EMI items; creating an EMI application for the first")
         
-        for cart_item in emi_items:
-            if cart_item.emi_plan:
-                try:
-                    # Calculate EMI details
-                    emi_plan = cart_item.emi_plan
-                    product_price = cart_item.total_price
-                    
-                    # Calculate EMI amounts
-                    calculation = emi_plan.calculate_monthly_payment(
-                        product_price, 
-                        cart_item.emi_period or emi_plan.duration_months
+        line = lines[0]
+        emi_plan = line.item.emi_plan
+        calculation = line.emi
+        application = EMIApplication(
+            user=order.user,
+            order=order,
+            emi_plan=emi_plan,
+            tenure_months=line.item.emi_period or emi_plan.duration_months,
+            product_price=line.total,
+            down_payment=calculation['down_payment'],
+            principal_amount=calculation['principal'],
+            processing_fee=calculation['processing_fee'],
+            monthly_installment=calculation['monthly_payment'],
+            total_payable=calculation['total_payment'],
+            total_interest=calculation['total_interest'],
+        )
+        
+        if emi_plan.plan_type == 'cardless_emi':
+            # Admin reviews cardless EMI against the applicant's documents
+            application.employment_type = 'salaried'  # Default based on provided job title
+            application.monthly_income = emi_application_data.get('monthly_salary', 0)
+            application.job_title = emi_application_data.get('job_title', '')
+            application.nid_number = ''  # Will be extracted from documents
+            application.nid_front_image = emi_application_data.get('nid_front_image')
+            application.nid_back_image = emi_application_data.get('nid_back_image')
+            application.status = 'pending'  # Always pending for cardless EMI
+            application.admin_notes = 'Pending admin review for Cardless EMI application'
+        else:
+            application.employment_type = 'not_required'  # Not required for card EMI
+            application.monthly_income = 0  # Not required for card EMI
+            application.nid_number = 'not_required'  # Not required for card EMI
+            application.status = 'approved'  # Auto-approve
+            application.approved_at = timezone.now()
+            application.admin_notes = 'Auto-approved for SSLCOMMERZ Card EMI'
+        
+        try:
+            # A savepoint, so a failure leaves the order's transaction usable
+            with transaction.atomic():
+                application.save()
+                if application.status == 'approved':
+                    emi_record = EMIRecord.objects.create(
+                        user=order.user,
+                        order=order,
+                        application=application,
+                        emi_plan=emi_plan,
+                        tenure_months=application.tenure_months,
+                        principal_amount=application.principal_amount,
+                        monthly_installment=application.monthly_installment,
+                        total_payable=application.total_payable,
+                        remaining_amount=application.total_payable,
+                        down_payment_paid=False  # Will be updated when payment is processed
                     )
-                    
-                    # For Cardless EMI, create an application that requires admin review
-                    if emi_plan.plan_type == 'cardless_emi':
-                        # Use provided EMI application data or defaults
-                        if emi_application_data:
-                            employment_type = 'salaried'  # Default based on provided job title
-                            monthly_income = emi_application_data.get('monthly_salary', 0)
-                            job_title = emi_application_data.get('job_title', '')
-                            nid_front_image = emi_application_data.get('nid_front_image')
-                            nid_back_image = emi_application_data.get('nid_back_image')
-                        else:
-                            employment_type = 'salaried'
-                            monthly_income = 0
-                            job_title = ''
-                            nid_front_image = None
-                            nid_back_image = None
-                        
-                        # Create EMI application for admin review
-                        application = EMIApplication.objects.create(
-                            user=order.user,
-                            order=order,
-                            emi_plan=emi_plan,
-                            tenure_months=cart_item.emi_period or emi_plan.duration_months,
-                            product_price=product_price,
-                            down_payment=calculation['down_payment'],
-                            principal_amount=calculation['principal'],
-                            processing_fee=calculation['processing_fee'],
-                            monthly_installment=calculation['monthly_payment'],
-                            total_payable=calculation['total_payment'],
-                            total_interest=calculation['total_interest'],
-                            employment_type=employment_type,
-                            job_title=job_title,
-                            monthly_income=monthly_income,
-                            nid_number='',  # Will be extracted from documents
-                            nid_front_image=nid_front_image,
-                            nid_back_image=nid_back_image,
-                            status='pending',  # Always pending for cardless EMI
-                            admin_notes='Pending admin review for Cardless EMI application'
-                        )
-                        
-                        # Send notification about application submission
-                        from notifications.services import SMSService
-                        SMSService.send_event_notification(
-                            event_type='emi_application_submitted',
-                            user=order.user,
-                            context_data={
-                                'order_id': order.id,
-                                'application_id': application.id
-                            },
-                            related_object=application
-                        )
-                    
-                    # For Card EMI, auto-approve and create EMI record immediately
-                    elif emi_plan.plan_type == 'card_emi' and emi_plan.is_sslcommerz_emi:
-                        # Auto-approve card EMI applications
-                        application = EMIApplication.objects.create(
-                            user=order.user,
-                            order=order,
-                            emi_plan=emi_plan,
-                            tenure_months=cart_item.emi_period or emi_plan.duration_months,
-                            product_price=product_price,
-                            down_payment=calculation['down_payment'],
-                            principal_amount=calculation['principal'],
-                            processing_fee=calculation['processing_fee'],
-                            monthly_installment=calculation['monthly_payment'],
-                            total_payable=calculation['total_payment'],
-                            total_interest=calculation['total_interest'],
-                            employment_type='not_required',  # Not required for card EMI
-                            monthly_income=0,  # Not required for card EMI
-                            nid_number='not_required',  # Not required for card EMI
-                            status='approved',  # Auto-approve
-                            approved_at=timezone.now(),
-                            admin_notes='Auto-approved for SSLCOMMERZ Card EMI'
-                        )
-                        
-                        # Create EMI record immediately
-                        from emi.models import EMIRecord
-                        emi_record = EMIRecord.objects.create(
-                            user=order.user,
-                            order=order,
-                            application=application,
-                            emi_plan=emi_plan,
-                            tenure_months=application.tenure_months,
-                            principal_amount=application.principal_amount,
-                            monthly_installment=application.monthly_installment,
-                            total_payable=application.total_payable,
-                            remaining_amount=application.total_payable,
-                            down_payment_paid=False  # Will be updated when payment is processed
-                        )
-                        
-                        # Generate installments
-                        emi_record.generate_installments()
-                        
-                except Exception as e:
-                    # Log error but don't fail order creation
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.error(f"Failed to create EMI application for order {order.id}: {str(e)}") 
\ No newline at end of file
+                    # One bulk insert for the whole schedule
+                    emi_record.generate_installments()
+        except Exception as e:
+            # Log error but don't fail order creation
+            logger.error(f"Failed to create EMI application for order {order.id}: {str(e)}")
+            return
+        
+        if application.status == 'pending':
+            # Notify about the application once the order is committed
+            transaction.on_commit(lambda: self._notify_emi_application_submitted(order, application))
+    
+    @staticmethod
+    def _notify_emi_application_submitted(order, application):
+        from notifications.services import SMSService
+        try:
+            SMSService.send_event_notification(
+                event_type='emi_application_submitted',
+                user=order.user,
+                context_data={
+                    'order_id': order.id,
+                    'application_id': application.id
+                },
+                related_object=application
+            )
+        except Exception as e:
+            logger.error(f"Error sending EMI application notification for order {order.id}: {str(e)}")
@@ -11,10 +11,13 @@ def order_post_save(sender, instance, created, **kwargs):
     """
     Signal handler for Order post_save event.
     
-    Sends SMS notifications for:
+    Queues SMS notifications for:
     - New order created
     - Order status updates
     - Payment status updates
+    
+    Messages go to the SMS outbox and are sent after commit by the
+    dispatcher (sms/dispatch.py), so saving an order never waits on the gateway.
     """
     # Check if SMS service is available
     try:
@@ -5,6 +5,7 @@ from datetime import timedelta
 from django.db.models import Count, Sum, F, Q
 
 from .models import Order
+from .inventory import expire_stale_reservations
 from notifications.notification_service import NotificationService
 
 logger = logging.getLogger(__name__)
@@ -57,6 +58,13 @@ def process_abandoned_carts():
     return f"Processed {sent_count} abandoned carts"
 
 
+@shared_task
+def expire_stock_reservations():
+    """Return the stock held by checkouts that were never paid."""
+    expired = expire_stale_reservations()
+    return f"Expired {expired} stock reservations"
+
+
 @shared_task
 def update_order_statuses():
     """Update order statuses based on time elapsed."""
@@ -117,4 +125,13 @@ def generate_orders_report():
     logger.info(f"Status Breakdown: {status_breakdown}")
     logger.info(f"Payment Method Breakdown: {payment_breakdown}")
     
-    return f"Generated orders report for {yesterday}" 
\ No newline at end of file
+    return f"Generated orders report for {yesterday}" 
+
+
+@shared_task
+def reconcile_purchased_products():
+    """Rewrite purchased product rows that drifted from the orders (see orders/purchases.py)."""
+    from .purchases import rebuild_purchases
+
+    changed = rebuild_purchases()
+    return f"Rebuilt {changed} purchased product rows"
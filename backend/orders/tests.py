@@ -1,3 +1,399 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from emi.models import EMIApplication, EMIPlan
+from products.models import Brand, Category, Product, ProductVariation
+from promotions.models import PromoCode
+from .inventory import (
+    InsufficientStock, commit_reservations, expire_stale_reservations, release_reservations, reserve_stock,
+)
+from .models import Cart, CartItem, Order, OrderItem, PurchasedProduct, StockReservation
+from .pricing import CartPricer
+from .purchases import purchased_product_ids, rebuild_purchases
+from .serializers import OrderCreateSerializer
+
+User = get_user_model()
+
+
+def create_order(user, **fields):
+    fields.setdefault('payment_method', 'card')
+    return Order.objects.create(
+        user=user, shipping_address='House 1', shipping_city='Dhaka', shipping_state='Dhaka',
+        shipping_postal_code='1200', shipping_phone='01700000000', subtotal=0, total=0, **fields,
+    )
+
+
+class StockFixtureMixin:
+
+    @classmethod
+    def create_stock(cls):
+        cls.user = User.objects.create_user(email='buyer@example.com', password='pass')
+        category = Category.objects.create(name='Phones', slug='phones')
+        brand = Brand.objects.create(name='Acme', slug='acme')
+        cls.product = Product.objects.create(
+            name='Phone', slug='phone', category=category, brand=brand, description='A phone',
+            base_price=Decimal('1000.00'), vendor=cls.user, is_approved=True, stock_quantity=5,
+        )
+        cls.case = Product.objects.create(
+            name='Case', slug='case', category=category, brand=brand, description='A case',
+            base_price=Decimal('10.00'), vendor=cls.user, is_approved=True, stock_quantity=5,
+        )
+        cls.variation = ProductVariation.objects.create(
+            product=cls.product, name='8GB', price=Decimal('1200.00'), stock_quantity=3,
+        )
+
+    def stock(self):
+        self.product.refresh_from_db()
+        self.case.refresh_from_db()
+        self.variation.refresh_from_db()
+        return self.product.stock_quantity, self.case.stock_quantity, self.variation.stock_quantity
+
+
+class StockReservationTest(StockFixtureMixin, TestCase):
+    """Checkout takes stock up front; payment keeps it, failure and expiry return it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_stock()
+
+    def test_reserve_commit_and_release(self):
+        order = create_order(self.user)
+        reserve_stock(order, [(self.product.id, None, 2), (self.product.id, self.variation.id, 1),
+                              (self.product.id, None, 1)])
+        self.assertEqual(self.stock(), (2, 5, 2))
+        self.assertEqual(order.stock_reservations.count(), 2)
+
+        self.assertEqual(commit_reservations(order), 2)
+        self.assertEqual(release_reservations(order), 0)
+        self.assertEqual(self.stock(), (2, 5, 2))
+
+        # Cancelling a paid order returns its stock, once
+        self.assertEqual(release_reservations(order, include_committed=True), 2)
+        self.assertEqual(release_reservations(order, include_committed=True), 0)
+        self.assertEqual(self.stock(), (5, 5, 3))
+
+    def test_short_line_reserves_nothing(self):
+        order = create_order(self.user)
+        with self.assertRaises(InsufficientStock):
+            reserve_stock(order, [(self.case.id, None, 2), (self.product.id, self.variation.id, 4)])
+        self.assertEqual(self.stock(), (5, 5, 3))
+        self.assertFalse(order.stock_reservations.exists())
+
+    def test_sweeper_expires_and_late_payment_retakes(self):
+        order = create_order(self.user)
+        reserve_stock(order, [(self.case.id, None, 4)], ttl=0)
+        self.assertEqual(expire_stale_reservations(now=timezone.now() + timedelta(seconds=1)), 1)
+        self.assertEqual(self.stock(), (5, 5, 3))
+        self.assertEqual(order.stock_reservations.get().status, StockReservation.STATUS_EXPIRED)
+
+        # Payment arrives after expiry: stock is taken again while it lasts
+        self.assertEqual(commit_reservations(order), 1)
+        self.assertEqual(self.stock(), (5, 1, 3))
+
+        other = create_order(self.user)
+        reserve_stock(other, [(self.case.id, None, 1)], ttl=0)
+        expire_stale_reservations(now=timezone.now() + timedelta(seconds=1))
+        reserve_stock(create_order(self.user), [(self.case.id, None, 1)])
+        self.assertEqual(commit_reservations(other), 0)
+        self.assertEqual(self.stock(), (5, 0, 3))
+
+    def test_checkout_reserves_cart_items(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, variation=self.variation, quantity=2)
+        CartItem.objects.create(cart=cart, product=self.case, quantity=5)
+        data = {
+            'payment_method': 'cod', 'shipping_address': 'House 1', 'shipping_city': 'Dhaka',
+            'shipping_state': 'Dhaka', 'shipping_postal_code': '1200', 'shipping_phone': '01700000000',
+        }
+        context = {'request': SimpleNamespace(user=self.user)}
+
+        serializer = OrderCreateSerializer(data=data, context=context)
+        serializer.is_valid(raise_exception=True)
+        order = serializer.save()
+        self.assertEqual(self.stock(), (5, 0, 1))
+        self.assertEqual(
+            set(order.stock_reservations.values_list('status', flat=True)), {StockReservation.STATUS_COMMITTED}
+        )
+
+        # The cart was cleared; a second checkout of the same items finds no stock
+        CartItem.objects.create(cart=cart, product=self.case, quantity=1)
+        serializer = OrderCreateSerializer(data=data, context=context)
+        serializer.is_valid(raise_exception=True)
+        with self.assertRaises(serializers.ValidationError):
+            serializer.save()
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class CartPricerTest(StockFixtureMixin, TestCase):
+    """Carts are priced from one load of their items, whatever their size."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_stock()
+        cls.case.sale_price = Decimal('8.00')
+        cls.case.save()
+        cls.plan = EMIPlan.objects.create(name='Cardless 12', plan_type='cardless_emi', duration_months=12,
+                                          interest_rate=Decimal('12.00'))
+        cls.promo = PromoCode.objects.create(code='TENOFF', discount_type='percentage',
+                                             discount_value=Decimal('10.00'))
+
+    def setUp(self):
+        self.cart = Cart.objects.create(user=self.user, promo_code=self.promo)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_prices_lines_promo_and_emi(self):
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        CartItem.objects.create(cart=self.cart, product=self.product, variation=self.variation, quantity=2,
+                                emi_selected=True, emi_plan=self.plan, emi_period=12)
+        CartItem.objects.create(cart=self.cart, product=self.case, quantity=3)
+
+        priced = CartPricer(self.cart).price(use_cart_promo=True)
+        self.assertEqual([line.unit_price for line in priced.lines],
+                         [Decimal('1000.00'), Decimal('1200.00'), Decimal('8.00')])
+        self.assertEqual(priced.subtotal, Decimal('3424.00'))
+        self.assertEqual(priced.total_items, 6)
+        self.assertEqual(priced.discount_amount, Decimal('342.40'))
+        interest = self.plan.calculate_monthly_payment(Decimal('2400.00'), 12)['total_interest']
+        self.assertEqual(priced.emi_interest, interest)
+        self.assertEqual(priced.total, Decimal('3424.00') - Decimal('342.40') + interest)
+        self.assertEqual(priced.shipping_cost, Decimal('120.00'))
+        self.assertEqual(priced.emi_lines, (priced.lines[1],))
+
+        # Without the cart's promo, or with a code that gives nothing, there is no discount
+        self.assertEqual(CartPricer(self.cart).price().discount_amount, 0)
+        self.promo.min_purchase_amount = Decimal('10000.00')
+        self.assertIsNone(CartPricer(self.cart).price(promo_code=self.promo).promo_code)
+
+    def my_cart_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/orders/cart/my_cart/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data
+
+    def test_query_count_does_not_grow_with_lines(self):
+        CartItem.objects.create(cart=self.cart, product=self.product, variation=self.variation, quantity=1)
+        one_line, data = self.my_cart_queries()
+        self.assertEqual(data['total_price'], '1200.00')
+
+        category, brand = self.product.category, self.product.brand
+        for i in range(19):
+            product = Product.objects.create(
+                name=f'Cable {i}', slug=f'cable-{i}', category=category, brand=brand, description='A cable',
+                base_price=Decimal('5.00'), vendor=self.user, is_approved=True, stock_quantity=5,
+            )
+            product.emi_plans.add(self.plan)
+            CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+        twenty_lines, data = self.my_cart_queries()
+        self.assertEqual(twenty_lines, one_line)
+        self.assertEqual(data['total_price'], '1390.00')
+        self.assertEqual(data['total_items'], 39)
+        self.assertEqual(data['discount_amount'], 139.0)
+        self.assertEqual(len(data['items']), 20)
+
+        cart = Cart.objects.get(pk=self.cart.pk)
+        with CaptureQueriesContext(connection) as queries:
+            CartPricer(cart).price(use_cart_promo=True)
+        # Items with their products and EMI plans, then the cart's promo code
+        self.assertEqual(len(queries), 3)
+
+
+class CheckoutMaterializationTest(StockFixtureMixin, TestCase):
+    """Checkout writes each table with a fixed number of statements and notifies after commit."""
+
+    DATA = {
+        'payment_method': 'card', 'shipping_address': 'House 1', 'shipping_city': 'Dhaka',
+        'shipping_state': 'Dhaka', 'shipping_postal_code': '1200', 'shipping_phone': '01700000000',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_stock()
+        cls.cables = [
+            Product.objects.create(
+                name=f'Cable {i}', slug=f'cable-{i}', category=cls.product.category, brand=cls.product.brand,
+                description='A cable', base_price=Decimal('5.00'), vendor=cls.user, is_approved=True,
+                stock_quantity=10,
+            )
+            for i in range(20)
+        ]
+        cls.promo = PromoCode.objects.create(code='TENOFF', discount_type='percentage',
+                                             discount_value=Decimal('10.00'), usage_limit=2)
+        cls.card_plan = EMIPlan.objects.create(name='Card 6', plan_type='card_emi', is_sslcommerz_emi=True,
+                                               duration_months=6)
+
+    def setUp(self):
+        self.cart = Cart.objects.create(user=self.user)
+
+    def checkout(self, **data):
+        serializer = OrderCreateSerializer(data={**self.DATA, **data},
+                                           context={'request': SimpleNamespace(user=self.user)})
+        serializer.is_valid(raise_exception=True)
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks() as callbacks:
+            order = serializer.save()
+        return order, len(queries), callbacks
+
+    def fill_cart(self, products):
+        CartItem.objects.bulk_create([CartItem(cart=self.cart, product=product, quantity=1) for product in products])
+
+    def test_queries_grow_only_with_stock_updates(self):
+        self.fill_cart(self.cables[:1])
+        _, one_line, _ = self.checkout(promo_code='TENOFF')
+
+        self.fill_cart(self.cables)
+        order, twenty_lines, _ = self.checkout(promo_code='TENOFF')
+        # Stock, order items and everything else are written in bulk
+        self.assertEqual(twenty_lines, one_line)
+        self.assertEqual(order.items.count(), 20)
+        self.assertEqual(order.discount_amount, Decimal('10.00'))
+        self.assertFalse(self.cart.items.exists())
+
+        # The usage limit is enforced against the locked, current count
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.usage_count, 2)
+        self.fill_cart(self.cables[:1])
+        with self.assertRaises(serializers.ValidationError):
+            self.checkout(promo_code='TENOFF')
+
+    def test_card_emi_application_and_schedule(self):
+        CartItem.objects.create(cart=self.cart, product=self.product, variation=self.variation, quantity=1,
+                                emi_selected=True, emi_plan=self.card_plan, emi_period=6)
+        CartItem.objects.create(cart=self.cart, product=self.case, quantity=1,
+                                emi_selected=True, emi_plan=self.card_plan, emi_period=6)
+        order, _, callbacks = self.checkout()
+
+        application = EMIApplication.objects.get(order=order)
+        self.assertEqual(application.status, 'approved')
+        self.assertEqual(application.product_price, Decimal('1200.00'))
+        self.assertEqual(
+            list(order.emi_record.installments.order_by('installment_number').values_list('installment_number', flat=True)),
+            list(range(1, 7)),
+        )
+        self.assertEqual(OrderItem.objects.filter(order=order, has_emi=True).count(), 2)
+        # The order notification waits for the commit
+        self.assertEqual(len(callbacks), 1)
+
+
+class PurchasedProductsTest(StockFixtureMixin, TestCase):
+    """Delivered orders feed a per-user purchased products set, cached between status changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_stock()
+
+    def setUp(self):
+        cache.clear()
+
+    def order(self, *products, status='pending'):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = create_order(self.user, status=status)
+            for product in products:
+                OrderItem.objects.create(order=order, product=product, price=product.base_price)
+        return order
+
+    def set_status(self, order, status):
+        order = Order.objects.get(pk=order.pk)
+        order.status = status
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+
+    def test_status_transitions_update_the_set(self):
+        first = self.order(self.product, self.case)
+        second = self.order(self.product)
+        self.assertEqual(purchased_product_ids(self.user.id), frozenset())
+
+        self.set_status(first, 'delivered')
+        self.set_status(second, 'delivered')
+        with self.assertNumQueries(1):
+            self.assertEqual(purchased_product_ids(self.user.id), {self.product.id, self.case.id})
+        with self.assertNumQueries(0):
+            purchased_product_ids(self.user.id)
+
+        # The phone stays bought through the second order
+        self.set_status(first, 'refunded')
+        self.assertEqual(purchased_product_ids(self.user.id), {self.product.id})
+        # Saves without a status change leave the set alone
+        with self.captureOnCommitCallbacks() as callbacks:
+            Order.objects.get(pk=second.pk).save()
+        self.assertEqual(callbacks, [])
+
+        # Orders created as delivered count once their items are saved
+        self.order(self.case, status='delivered')
+        self.assertEqual(purchased_product_ids(self.user.id), {self.product.id, self.case.id})
+
+    def test_rebuild_repairs_bulk_updates(self):
+        order = self.order(self.product, status='delivered')
+        self.assertEqual(rebuild_purchases(), 0)
+
+        # update() sends no signals
+        Order.objects.filter(pk=order.pk).update(status='cancelled')
+        self.order(self.case, status='pending')
+        Order.objects.filter(status='pending').update(status='delivered')
+        self.assertEqual(rebuild_purchases([self.user.id]), 2)
+        self.assertEqual(purchased_product_ids(self.user.id), {self.case.id})
+        self.assertEqual(PurchasedProduct.objects.count(), 1)
+
+
+class StockReservationConcurrencyTest(StockFixtureMixin, TransactionTestCase):
+    """Many checkouts racing for the same stock never oversell or deadlock."""
+
+    THREADS = 24
+
+    def setUp(self):
+        self.create_stock()
+
+    def test_no_oversell_under_contention(self):
+        orders = [create_order(self.user) for _ in range(self.THREADS)]
+        barrier = threading.Barrier(self.THREADS)
+        outcomes = []
+        errors = []
+
+        def checkout(i):
+            # Half the threads list the items in the opposite order
+            lines = [(self.product.id, None, 1), (self.case.id, None, 1), (self.product.id, self.variation.id, 1)]
+            if i % 2:
+                lines.reverse()
+            try:
+                barrier.wait()
+                for _ in range(3):
+                    try:
+                        with transaction.atomic():
+                            reserve_stock(orders[i], lines)
+                        outcomes.append('reserved')
+                        if i % 3 == 0:
+                            release_reservations(orders[i])
+                            outcomes.append('released')
+                    except InsufficientStock:
+                        outcomes.append('short')
+            except OperationalError as e:  # Deadlocks surface here
+                errors.append(e)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=60)
+
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        self.assertEqual(errors, [])
+        self.assertIn('short', outcomes)
+        held = outcomes.count('reserved') - outcomes.count('released')
+        # The variation has the least stock, so at most three checkouts can hold it
+        self.assertLessEqual(held, 3)
+        self.assertEqual(self.stock(), (5 - held, 5 - held, 3 - held))
+        self.assertEqual(StockReservation.objects.filter(status=StockReservation.STATUS_ACTIVE).count(), held * 3)
@@ -2,18 +2,21 @@ from django.shortcuts import render
 from rest_framework import viewsets, generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.pagination import PageNumberPagination
 from django.shortcuts import get_object_or_404
 from django.db.models import Q
 
+from .inventory import release_reservations
+from .pricing import CartPricer
 from .models import Cart, CartItem, Order, OrderItem
 from .serializers import (
     CartSerializer, CartItemSerializer,
     OrderSerializer, OrderCreateSerializer, OrderItemSerializer
 )
 from products.models import Product
+from products.pagination import CursorPaginationMixin
 from users.permissions import IsOwnerOrAdmin, IsUserOwnerOrAdmin
 from notifications.services import SMSService
-from shipping.services import ShippingService
 
 
 class CartViewSet(viewsets.GenericViewSet):
@@ -35,32 +38,26 @@ class CartViewSet(viewsets.GenericViewSet):
     def my_cart(self, request):
         """Get the current user's cart."""
         cart = self.get_object()
+        # Loads the items once; the serializer below reads the same prefetched items
+        priced = CartPricer(cart).price(use_cart_promo=True)
         serializer = self.get_serializer(cart)
          
         # Get cart data
         cart_data = serializer.data
          
-        # Calculate shipping information
-        cart_total = cart.total_price
-         
         # Add shipping information
-        cart_data['shipping_info'] = {
-            'free_shipping_threshold': float(ShippingService.get_free_shipping_threshold()),
-            'remaining_for_free_shipping': float(ShippingService.get_remaining_for_free_shipping(cart_total)),
-            'default_shipping_cost': float(ShippingService.get_default_shipping_cost()),
-            'is_eligible_for_free_shipping': cart_total >= ShippingService.get_free_shipping_threshold()
-        }
+        cart_data['shipping_info'] = priced.shipping_info()
          
         # Add promo code information from the cart model
-        if cart.promo_code:
+        if priced.promo_code:
             cart_data['promo_code'] = {
-                'code': cart.promo_code.code,
-                'discount_amount': float(cart.discount_amount)
+                'code': priced.promo_code.code,
+                'discount_amount': float(priced.discount_amount)
             }
              
             # Recalculate total with discount
-            cart_data['discount_amount'] = float(cart.discount_amount)
-            cart_data['total_after_discount'] = float(cart_total) - float(cart.discount_amount)
+            cart_data['discount_amount'] = float(priced.discount_amount)
+            cart_data['total_after_discount'] = float(priced.subtotal - priced.discount_amount)
         # Fallback to session if no promo code in cart model
         elif 'promo_code' in request.session:
             promo_code_info = request.session.get('promo_code')
@@ -69,7 +66,7 @@ class CartViewSet(viewsets.GenericViewSet):
             # Recalculate total with discount
             discount_amount = promo_code_info['discount_amount']
             cart_data['discount_amount'] = discount_amount
-            cart_data['total_after_discount'] = float(cart_total) - discount_amount
+            cart_data['total_after_discount'] = float(priced.subtotal) - discount_amount
          
         return Response(cart_data)
     
@@ -312,11 +309,20 @@ class CartViewSet(viewsets.GenericViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class OrderPagination(CursorPaginationMixin, PageNumberPagination):
+    """Order pagination; ``?cursor=`` pages by (-created_at, -id)."""
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_ordering = ('-created_at', '-id')
+
+
 class OrderViewSet(viewsets.ModelViewSet):
     """ViewSet for managing orders."""
     
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = OrderPagination
     http_method_names = ['get', 'post', 'put', 'patch', 'delete', 'head', 'options']  # Explicitly allow POST
     
     def get_queryset(self):
@@ -384,6 +390,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         
         order.status = 'cancelled'
         order.save()
+        release_reservations(order, include_committed=True)
         
         # Send SMS notification for order cancellation
         SMSService.send_event_notification(
@@ -4,6 +4,8 @@ import json
 from typing import Dict, Any, Optional
 from django.conf import settings
 
+from backend.http_client import get_client
+
 
 class SSLCOMMERZ:
     """
@@ -36,7 +38,7 @@ class SSLCOMMERZ:
             # Make request to SSLCOMMERZ
             url = f"{self.base_url}/gwprocess/v4/api.php"
             
-            response = requests.post(url, data=data, timeout=30)
+            response = get_client('sslcommerz').post(url, data=data)
             
             if response.status_code == 200:
                 result = response.json()
@@ -98,7 +100,7 @@ class SSLCOMMERZ:
                 'format': 'json'
             }
             
-            response = requests.get(url, params=data, timeout=30)
+            response = get_client('sslcommerz').get(url, params=data)
             
             if response.status_code == 200:
                 result = response.json()
@@ -1,3 +1,117 @@
-from django.test import TestCase
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.test import SimpleTestCase
+
+from backend import http_client
+from backend.http_client import CircuitOpenError, HTTPClient
+from .sslcommerz import SSLCOMMERZ
+
+
+class StandInGateway(ThreadingHTTPServer):
+    """Local HTTP/1.1 server standing in for SSLCOMMERZ; counts connections and requests."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = []
+        self.fail_next = 0
+        self.lock = threading.Lock()
+        super().__init__(('127.0.0.1', 0), StandInGatewayHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class StandInGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def handle_request(self):
+        server = self.server
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        with server.lock:
+            server.requests.append((self.command, self.path.split('?')[0]))
+            failing = server.fail_next > 0
+            if failing:
+                server.fail_next -= 1
+        if failing:
+            body, status = b'{}', 503
+        elif 'validation' in self.path:
+            body, status = json.dumps({'status': 'VALID', 'val_id': 'v1'}).encode(), 200
+        else:
+            body, status = json.dumps({'status': 'SUCCESS', 'GatewayPageURL': 'https://pay', 'sessionkey': 'k'}).encode(), 200
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = handle_request
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SharedHTTPClientTest(SimpleTestCase):
+    """Payment calls reuse pooled connections, retry only what is safe and fail fast when the gateway is down."""
+
+    def setUp(self):
+        self.server = StandInGateway()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = HTTPClient('sslcommerz', retries=2, backoff=0, failure_threshold=3, reset_timeout=60)
+        patcher = mock.patch.dict(http_client._clients, {'sslcommerz': self.client})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.gateway = SSLCOMMERZ({'store_id': 'store', 'store_pass': 'pass'})
+        self.gateway.base_url = self.server.url
+
+    def test_reuses_connections(self):
+        for _ in range(5):
+            self.assertEqual(self.gateway.createSession({'tran_id': 'T1'})['status'], 'SUCCESS')
+            self.assertEqual(self.gateway.validate_transaction({'val_id': 'v1', 'store_id': 'store'})['status'], 'VALID')
+        self.assertEqual(len(self.server.requests), 10)
+        self.assertEqual(self.server.connections, 1)
+
+        stats = http_client.upstream_stats()['sslcommerz']
+        self.assertEqual((stats['count'], stats['errors'], stats['circuit']), (10, 0, 'closed'))
+        self.assertEqual(sum(bucket['count'] for bucket in stats['buckets']), 10)
+
+    def test_retries_idempotent_calls_only(self):
+        self.server.fail_next = 1
+        self.assertEqual(self.gateway.validate_transaction({'val_id': 'v1', 'store_id': 'store'})['status'], 'VALID')
+        self.assertEqual(len(self.server.requests), 2)
+
+        # Creating a session is not idempotent, so a 503 is returned rather than retried
+        self.server.fail_next = 1
+        result = self.gateway.createSession({'tran_id': 'T2'})
+        self.assertEqual(result['status'], 'FAILED')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        self.server.fail_next = 3
+        for _ in range(3):
+            self.assertEqual(self.client.post(f'{self.server.url}/gwprocess/v4/api.php').status_code, 503)
+        with self.assertRaises(CircuitOpenError):
+            self.client.post(f'{self.server.url}/gwprocess/v4/api.php')
+        self.assertIsInstance(CircuitOpenError(), requests.ConnectionError)
+        result = self.gateway.createSession({'tran_id': 'T3'})
+        self.assertEqual(result['status'], 'FAILED')
+        self.assertIn('Circuit open', result['failedreason'])
+        self.assertEqual(len(self.server.requests), 3)
+
+        # After the reset timeout one trial call is let through and closes the circuit again
+        self.client._breakers['sslcommerz'].opened_at -= 60
+        self.assertEqual(self.gateway.createSession({'tran_id': 'T4'})['status'], 'SUCCESS')
+        self.assertEqual(http_client.upstream_stats()['sslcommerz']['circuit'], 'closed')
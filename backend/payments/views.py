@@ -14,6 +14,7 @@ from django.conf import settings
 from django.urls import reverse
 from decimal import Decimal
 from orders.models import Order
+from orders.inventory import commit_reservations, release_reservations
 from emi.models import EMIPlan, EMIRecord, EMIInstallment, EMIApplication
 import json
 import uuid
@@ -410,8 +411,7 @@ def payment_success(request):
                                 payment_method='SSLCOMMERZ',
                                 transaction_id=payment.transaction_id
                             )
-                            # Update the EMI record status
-                            payment.installment.emi_record.update_payment_status()
+                            # mark_as_paid has already rolled up the EMI record
                             
                             # If this was the final installment, update order status
                             if payment.installment.emi_record.status == 'completed':
@@ -443,6 +443,10 @@ def payment_success(request):
                         order.payment_status = "paid"
                         order.save(update_fields=["status","payment_status"])
                     
+                    if payment.payment_type != 'EMI_INSTALLMENT':
+                        # Keep the stock reserved at checkout
+                        commit_reservations(payment.order)
+                    
                     # Redirect to the frontend thank you page
                     frontend_thank_you_url = f"{settings.FRONTEND_BASE_URL}/thank-you?order_id={payment.order.id}"
                     return HttpResponseRedirect(redirect_to=frontend_thank_you_url)
@@ -480,6 +484,8 @@ def payment_failed(request):
             payment.status = "FAILED"
             payment.payment_details = json.dumps(dict(payment_data))
             payment.save()
+            if payment.payment_type != 'EMI_INSTALLMENT':
+                release_reservations(payment.order)
             
             return JsonResponse({
                 'status': 'error',
@@ -509,6 +515,8 @@ def payment_canceled(request):
             payment.status = "CANCELED"
             payment.payment_details = json.dumps(dict(payment_data))
             payment.save()
+            if payment.payment_type != 'EMI_INSTALLMENT':
+                release_reservations(payment.order)
             
             # Redirect to frontend payment canceled page
             frontend_url = settings.FRONTEND_BASE_URL
@@ -576,6 +584,13 @@ def payment_ipn(request):
                 payment.payment_details = json.dumps(dict(payment_data))
                 payment.save()
                 
+                # Settle the stock reserved at checkout
+                if payment.payment_type != 'EMI_INSTALLMENT':
+                    if payment.status == "COMPLETED":
+                        commit_reservations(payment.order)
+                    elif payment.status == "FAILED":
+                        release_reservations(payment.order)
+                
                 return JsonResponse({
                     'status': 'success',
                     'message': 'IPN processed successfully'
@@ -5,7 +5,7 @@ from django.shortcuts import render, redirect
 from django.urls import path
 from django.http import HttpResponse
 from django.template.response import TemplateResponse
-from .models import Category, Brand, ProductField, Product, ProductImage, SKU, ProductVariation
+from .models import Category, Brand, ProductField, Product, ProductImage, SKU, ProductVariation, ImportJob, ImportRowError
 from reviews.models import Review
 from .utils.bulk_upload import generate_upload_template, process_upload_file
 
@@ -240,3 +240,21 @@ class SKUAdmin(admin.ModelAdmin):
     list_filter = ('is_active', 'product__category')
     search_fields = ('code', 'product__name')
     raw_id_fields = ('product',)
+
+
+class ImportRowErrorInline(admin.TabularInline):
+    model = ImportRowError
+    extra = 0
+    can_delete = False
+    readonly_fields = ('row', 'message', 'data')
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'category', 'status', 'processed_rows', 'total_rows', 'created_count',
+                    'error_count', 'created_by', 'created_at')
+    list_filter = ('status', 'category')
+    readonly_fields = ('total_rows', 'processed_rows', 'created_count', 'error_count', 'error_message',
+                       'started_at', 'finished_at')
+    raw_id_fields = ('vendor', 'created_by')
+    inlines = [ImportRowErrorInline]
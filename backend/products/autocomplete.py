@@ -0,0 +1,497 @@
+"""
+In-memory prefix index behind the autocomplete endpoint.
+
+Product, brand and category names are normalized and every word suffix
+("samsung galaxy s24", "galaxy s24", "s24") is stored in one sorted array, so
+a keystroke is a bisect for the matching key range. A segment tree over the
+entry weights (1 + analytics.SearchQuery counts) yields the best entries of
+that range without scanning it, and suggestion payloads are precomputed, so
+lookups never touch the database.
+
+Each process holds its own index. It is built in the background at startup
+(see backend/wsgi.py) and updated in place when products in this process are
+saved or deleted. Every change also bumps a shared version in the cache and
+records the changed product ids under that version, so other processes
+replay just those products in the background. Full rebuilds, also in the
+background, happen only when the log can't be replayed (a brand or category
+rename, a large import, an evicted or cleared log) and after
+AUTOCOMPLETE_INDEX_MAX_AGE seconds.
+"""
+import heapq
+import logging
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .deferred import defer_for_ids
+
+logger = logging.getLogger(__name__)
+
+VERSION_CACHE_KEY = 'products:autocomplete:version'
+CHANGE_CACHE_KEY = 'products:autocomplete:change:{}'
+
+# Change log record that can't be replayed product by product
+REBUILD = 'rebuild'
+
+# Sorts after every character a normalized key can contain
+_KEY_END = '\U0010ffff'
+
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def get_max_age():
+    """Seconds after which a process rebuilds its index regardless of changes."""
+    return getattr(settings, 'AUTOCOMPLETE_INDEX_MAX_AGE', 300)
+
+
+def get_check_interval():
+    """Minimum seconds between two checks of the shared version in the cache."""
+    return getattr(settings, 'AUTOCOMPLETE_INDEX_CHECK_INTERVAL', 5)
+
+
+def get_overlay_limit():
+    """Number of incremental updates kept beside the base index before a rebuild."""
+    return getattr(settings, 'AUTOCOMPLETE_INDEX_OVERLAY_LIMIT', 500)
+
+
+def get_change_log_timeout():
+    """Seconds a change log record stays in the cache for other processes to replay."""
+    return 2 * get_max_age()
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse punctuation/whitespace to single spaces."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+def suffix_keys(*texts):
+    """Every word suffix of each normalized text, de-duplicated."""
+    keys = set()
+    for text in texts:
+        words = normalize(text).split()
+        for start in range(len(words)):
+            keys.add(' '.join(words[start:]))
+    return keys
+
+
+class IndexEntry:
+    """A suggestion with its lookup keys and popularity weight."""
+
+    __slots__ = ('key', 'keys', 'weight', 'payload', 'seq')
+
+    def __init__(self, key, keys, weight, payload, seq=0):
+        self.key = key
+        self.keys = keys
+        self.weight = weight
+        self.payload = payload
+        self.seq = seq
+
+    def matches(self, prefix):
+        return any(key.startswith(prefix) for key in self.keys)
+
+
+def popularity_counts():
+    """Return ``(query_counts, click_counts, category_counts)`` from recent searches."""
+    from analytics.models import SearchQuery
+
+    since = timezone.now() - timedelta(days=getattr(settings, 'AUTOCOMPLETE_POPULARITY_DAYS', 90))
+    searches = SearchQuery.objects.filter(timestamp__gte=since).order_by()
+
+    query_counts = {}
+    for row in searches.values(text=Lower('query')).annotate(total=Count('id')):
+        normalized = normalize(row['text'])
+        query_counts[normalized] = query_counts.get(normalized, 0) + row['total']
+    click_counts = dict(
+        searches.filter(clicked_product__isnull=False).values_list('clicked_product')
+        .annotate(total=Count('id')).values_list('clicked_product', 'total')
+    )
+    category_counts = dict(
+        searches.filter(category_filter__isnull=False).values_list('category_filter')
+        .annotate(total=Count('id')).values_list('category_filter', 'total')
+    )
+    return query_counts, click_counts, category_counts
+
+
+def product_rows(product_ids=None):
+    """Approved products with the columns needed for a suggestion payload."""
+    from .models import Product
+
+    queryset = Product.objects.filter(is_approved=True).order_by()
+    if product_ids is not None:
+        queryset = queryset.filter(id__in=product_ids)
+    return queryset.values(
+        'id', 'name', 'slug', 'base_price', 'effective_price', 'primary_image_path',
+        'brand__name', 'category__name',
+    )
+
+
+def product_entry(row, query_counts, click_counts):
+    from .serializers import build_media_url
+
+    price = row['effective_price'] if row['effective_price'] is not None else row['base_price']
+    brand = row['brand__name'] or ''
+    weight = 1 + query_counts.get(normalize(row['name']), 0) + click_counts.get(row['id'], 0)
+    payload = {
+        'type': 'product',
+        'id': row['id'],
+        'name': row['name'],
+        'category': row['category__name'] or '',
+        'brand': brand,
+        'price': float(price or 0),
+        'image': build_media_url(row['primary_image_path']) if row['primary_image_path'] else None,
+        'url': f"/products/{row['slug']}" if row['slug'] else f"/products/{row['id']}",
+    }
+    return IndexEntry(f"product:{row['id']}", suffix_keys(row['name'], f"{brand} {row['name']}"),
+                      weight, payload)
+
+
+def build_entries():
+    """Load every suggestion from the database."""
+    from .models import Brand, Category
+
+    query_counts, click_counts, category_counts = popularity_counts()
+    entries = [product_entry(row, query_counts, click_counts) for row in product_rows().iterator()]
+
+    for brand in Brand.objects.order_by().values('id', 'name', 'slug'):
+        entries.append(IndexEntry(
+            f"brand:{brand['id']}", suffix_keys(brand['name']),
+            1 + query_counts.get(normalize(brand['name']), 0),
+            {'type': 'brand', 'id': brand['id'], 'name': brand['name'], 'slug': brand['slug'],
+             'url': f"/catalog?brand={brand['slug']}"},
+        ))
+    for category in Category.objects.filter(is_active=True).order_by().values('id', 'name', 'slug'):
+        entries.append(IndexEntry(
+            f"category:{category['id']}", suffix_keys(category['name']),
+            1 + query_counts.get(normalize(category['name']), 0) + category_counts.get(category['id'], 0),
+            {'type': 'category', 'id': category['id'], 'name': category['name'], 'slug': category['slug'],
+             'url': f"/catalog/{category['slug']}"},
+        ))
+    return entries
+
+
+class PrefixIndex:
+    """
+    Immutable sorted-array index of entries.
+
+    ``keys`` is sorted and ``positions[i]`` is the entry of ``keys[i]``.
+    ``tree`` is a segment tree holding, per node, the key position with the
+    highest weight below it, so the heaviest matches of a key range come out
+    in O(log n) each.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.by_key = {entry.key: entry for entry in entries}
+        pairs = sorted((key, number) for number, entry in enumerate(entries) for key in entry.keys)
+        self.keys = [key for key, _ in pairs]
+        self.positions = array('l', (number for _, number in pairs))
+        self.weights = array('d', (entries[number].weight for _, number in pairs))
+
+        size = 1
+        while size < len(self.keys):
+            size *= 2
+        self.size = size
+        tree = array('l', [-1]) * (2 * size)
+        for position in range(len(self.keys)):
+            tree[size + position] = position
+        weights = self.weights
+        for node in range(size - 1, 0, -1):
+            left, right = tree[2 * node], tree[2 * node + 1]
+            if right == -1 or (left != -1 and weights[left] >= weights[right]):
+                tree[node] = left
+            else:
+                tree[node] = right
+        self.tree = tree
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _heaviest(self, low, high):
+        """Yield key positions in ``[low, high)`` by descending weight."""
+        tree, weights, size = self.tree, self.weights, self.size
+        heap = []
+        low += size
+        high += size
+        while low < high:
+            if low & 1:
+                heap.append((-weights[tree[low]], tree[low], low))
+                low += 1
+            if high & 1:
+                high -= 1
+                heap.append((-weights[tree[high]], tree[high], high))
+            low >>= 1
+            high >>= 1
+        heapq.heapify(heap)
+
+        while heap:
+            _, position, node = heapq.heappop(heap)
+            if node >= size:
+                yield position
+                continue
+            for child in (2 * node, 2 * node + 1):
+                best = tree[child]
+                if best != -1:
+                    heapq.heappush(heap, (-weights[best], best, child))
+
+    def search(self, prefix, limit, skip=()):
+        """Return up to ``limit`` entries with a key starting with ``prefix``."""
+        low = bisect_left(self.keys, prefix)
+        high = bisect_right(self.keys, prefix + _KEY_END, low)
+        found = []
+        seen = set()
+        for position in self._heaviest(low, high):
+            number = self.positions[position]
+            if number in seen:
+                continue
+            seen.add(number)
+            entry = self.entries[number]
+            if entry.key in skip:
+                continue
+            found.append(entry)
+            if len(found) >= limit:
+                break
+        return found
+
+
+class AutocompleteIndex:
+    """
+    Process-wide autocomplete index with incremental updates.
+
+    Updates go to a small overlay (new or changed entries) plus a set of
+    entries hidden from the base index, both replaced copy-on-write so
+    lookups never take a lock. A rebuild folds them back into a new base.
+    """
+
+    def __init__(self):
+        self.base = None
+        self.overlay = {}
+        self.hidden = {}
+        self.built_at = 0.0
+        self.version = None
+        self.checked_at = 0.0
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    @property
+    def ready(self):
+        return self.base is not None
+
+    def _next_seq(self):
+        self._seq += 1
+        return self._seq
+
+    def rebuild(self):
+        """Reload every entry from the database and swap in a new base index."""
+        with self._lock:
+            started_seq = self._seq
+            version = cache.get(VERSION_CACHE_KEY, 0)
+        started = time.perf_counter()
+        base = PrefixIndex(build_entries())
+
+        with self._lock:
+            # Keep only the updates that happened while we were loading
+            self.overlay = {key: entry for key, entry in self.overlay.items() if entry.seq > started_seq}
+            self.hidden = {key: seq for key, seq in self.hidden.items() if seq > started_seq}
+            self.base = base
+            self.built_at = time.monotonic()
+            self.version = version
+            self.checked_at = self.built_at
+        logger.info(f"Built autocomplete index with {len(base)} entries in "
+                    f"{(time.perf_counter() - started) * 1000:.0f} ms")
+        return base
+
+    def sync(self):
+        """
+        Replay other processes' product changes from the cache change log.
+
+        Falls back to a rebuild when the log asks for one, when this index is
+        too far behind, or when the shared version went backwards (cache
+        cleared). A record that is missing (not written yet, or evicted) stops
+        the replay there until the next check; the max-age rebuild bounds how
+        long that can last.
+        """
+        version = cache.get(VERSION_CACHE_KEY, 0)
+        if not self.ready or self.version is None or version < self.version:
+            return self.rebuild()
+        if version - self.version > get_overlay_limit():
+            return self.rebuild()
+
+        versions = range(self.version + 1, version + 1)
+        records = cache.get_many([CHANGE_CACHE_KEY.format(number) for number in versions])
+        product_ids = set()
+        replayed = self.version
+        for number in versions:
+            record = records.get(CHANGE_CACHE_KEY.format(number))
+            if record is None:
+                break
+            if record == REBUILD:
+                return self.rebuild()
+            product_ids.update(record)
+            replayed = number
+
+        self.update_products(product_ids)
+        with self._lock:
+            if self.version is not None and self.version < replayed:
+                self.version = replayed
+
+    def _in_background(self, refresh, label):
+        """Run ``refresh`` on a daemon thread unless a refresh is already running."""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                refresh()
+            except Exception as e:
+                logger.error(f"Error {label} autocomplete index: {str(e)}")
+            finally:
+                self._refreshing = False
+                # The thread's connection would otherwise stay open until it is collected
+                connection.close()
+
+        threading.Thread(target=run, name='autocomplete-index', daemon=True).start()
+
+    def rebuild_in_background(self):
+        """Start a rebuild on a daemon thread unless a refresh is already running."""
+        self._in_background(self.rebuild, 'building')
+
+    def sync_in_background(self):
+        """Start replaying the change log on a daemon thread unless a refresh is already running."""
+        self._in_background(self.sync, 'syncing')
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if now - self.checked_at < get_check_interval():
+            return
+        self.checked_at = now
+        if now - self.built_at > get_max_age() or len(self.overlay) > get_overlay_limit():
+            self.rebuild_in_background()
+        elif cache.get(VERSION_CACHE_KEY, 0) != self.version:
+            self.sync_in_background()
+
+    def lookup(self, query, limit=5):
+        """
+        Return up to ``limit`` suggestion payloads for ``query``, best first.
+
+        Until the first build finishes (see warm_autocomplete_index) there are
+        no suggestions; the build runs in the background, never in the request.
+        """
+        prefix = normalize(query)
+        if not prefix or limit < 1:
+            return []
+        if not self.ready:
+            self.rebuild_in_background()
+            return []
+        self._maybe_refresh()
+
+        base, overlay, hidden = self.base, self.overlay, self.hidden
+        matches = base.search(prefix, limit, skip=hidden)
+        matches.extend(entry for entry in overlay.values() if entry.matches(prefix))
+        matches.sort(key=lambda entry: -entry.weight)
+        return [entry.payload for entry in matches[:limit]]
+
+    def update_products(self, product_ids):
+        """Reload the given products into the overlay, or hide them if gone or unapproved."""
+        product_ids = set(product_ids)
+        if not product_ids or not self.ready:
+            return
+        rows = {row['id']: row for row in product_rows(product_ids)}
+        with self._lock:
+            overlay = dict(self.overlay)
+            hidden = dict(self.hidden)
+            for product_id in product_ids:
+                key = f"product:{product_id}"
+                seq = self._next_seq()
+                hidden[key] = seq
+                previous = overlay.pop(key, None) or self.base.by_key.get(key)
+                if product_id in rows:
+                    # Keep the popularity weight computed at the last rebuild
+                    entry = product_entry(rows[product_id], {}, {})
+                    entry.weight = previous.weight if previous else entry.weight
+                    entry.seq = seq
+                    overlay[key] = entry
+            self.overlay = overlay
+            self.hidden = hidden
+
+    def acknowledge_version(self, version):
+        """Adopt a version bumped by this process's own update, avoiding a needless rebuild."""
+        with self._lock:
+            if version is not None and (self.version or 0) == version - 1:
+                self.version = version
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_autocomplete_index():
+    """Return the process-wide autocomplete index."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = AutocompleteIndex()
+    return _index
+
+
+def warm_autocomplete_index():
+    """Build the index in the background so the first keystroke doesn't pay for it."""
+    get_autocomplete_index().rebuild_in_background()
+
+
+def bump_autocomplete_version(product_ids=None):
+    """
+    Tell other processes their index is stale; returns the new version.
+
+    ``product_ids`` are logged under the new version for other processes to
+    replay. Without them, or with more than an overlay's worth, the change is
+    logged as needing a full rebuild.
+    """
+    product_ids = list(product_ids) if product_ids is not None else None
+    record = product_ids if product_ids is not None and len(product_ids) <= get_overlay_limit() else REBUILD
+    try:
+        cache.add(VERSION_CACHE_KEY, 0, None)
+        version = cache.incr(VERSION_CACHE_KEY)
+        cache.set(CHANGE_CACHE_KEY.format(version), record, get_change_log_timeout())
+        return version
+    except Exception as e:
+        logger.error(f"Error bumping autocomplete index version: {str(e)}")
+        return None
+
+
+def _update_index(product_ids):
+    index = get_autocomplete_index()
+    index.update_products(product_ids)
+    index.acknowledge_version(bump_autocomplete_version(product_ids))
+
+
+def schedule_autocomplete_update(product_id):
+    """Queue ``product_id`` to be reloaded into the autocomplete index on commit."""
+    defer_for_ids('autocomplete update', [product_id], _update_index)
+
+
+def schedule_autocomplete_rebuild():
+    """Rebuild every process's index on commit, e.g. after a brand or category rename."""
+    def rebuild():
+        bump_autocomplete_version()
+        index = get_autocomplete_index()
+        if index.ready:
+            index.rebuild_in_background()
+
+    transaction.on_commit(rebuild)
@@ -1,11 +1,16 @@
-from rest_framework import status, views, permissions
+from rest_framework import status, views, viewsets, permissions
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.http import FileResponse
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 
-from products.models import Category
-from products.utils.bulk_upload import generate_upload_template, process_upload_file
+from products.imports import create_import_job
+from products.models import Category, ImportJob
+from products.pagination import StandardResultsSetPagination
+from products.serializers import ImportJobSerializer, ImportRowErrorSerializer
+from products.utils.bulk_upload import generate_upload_template
 from users.permissions import IsVendorOwnerOrAdmin
 
 
@@ -60,13 +65,16 @@ class BulkUploadTemplateView(views.APIView):
 
 class BulkUploadProcessView(views.APIView):
     """
-    API view for processing bulk product uploads.
+    API view for starting bulk product uploads.
+    
+    The file is stored on an ImportJob and imported in the background; poll
+    the returned status URL (ImportJobViewSet) for progress and row errors.
     """
     permission_classes = [permissions.IsAuthenticated, IsVendorOwnerOrAdmin]
     parser_classes = [MultiPartParser, FormParser]
     
     def post(self, request, *args, **kwargs):
-        """Process a bulk product upload file."""
+        """Start importing a bulk product upload file."""
         category_id = request.data.get('category_id')
         file = request.data.get('file')
         
@@ -82,34 +90,53 @@ class BulkUploadProcessView(views.APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            # Verify category exists
-            category = get_object_or_404(Category, id=category_id)
-            
-            # Get vendor ID (for vendors) or None (for admins)
-            vendor_id = None
-            if hasattr(request.user, 'vendor_profile'):
-                vendor_id = request.user.vendor_profile.id
-            
-            # Process file
-            results = process_upload_file(file, category_id, vendor_id)
-            
-            # Summarize results
-            success_count = sum(1 for r in results if r['status'] == 'success')
-            error_count = len(results) - success_count
-            
-            return Response({
-                'message': f"Processed {len(results)} rows with {success_count} successes and {error_count} errors",
-                'summary': {
-                    'total': len(results),
-                    'success': success_count,
-                    'error': error_count
-                },
-                'results': results
-            })
+        category = get_object_or_404(Category, id=category_id)
         
+        # Vendors own the rows without a vendor_email; admins must name a vendor per row
+        vendor = request.user if getattr(request.user, 'role', None) == 'vendor' else None
+        
+        try:
+            job = create_import_job(file, category, vendor=vendor, created_by=request.user)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            ) 
\ No newline at end of file
+            )
+        
+        return import_job_response(request, job)
+
+
+def import_job_response(request, job):
+    """202 response pointing at the status endpoint of a new import job."""
+    job.refresh_from_db()
+    return Response({
+        'message': f"Import {job.id} started. Check its status for progress and row errors.",
+        'job_id': job.id,
+        'status_url': request.build_absolute_uri(reverse('products:import-job-detail', args=[job.id])),
+        'job': ImportJobSerializer(job).data,
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+class ImportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Status, progress, throughput and row errors of bulk product imports."""
+    
+    serializer_class = ImportJobSerializer
+    permission_classes = [permissions.IsAuthenticated, IsVendorOwnerOrAdmin]
+    
+    def get_queryset(self):
+        """Admins see every import, vendors their own."""
+        user = self.request.user
+        queryset = ImportJob.objects.all()
+        if not (user.is_staff or user.role == 'admin'):
+            queryset = queryset.filter(created_by=user)
+        return queryset
+    
+    @action(detail=True, methods=['get'])
+    def errors(self, request, pk=None):
+        """Every failed row of an import, paginated."""
+        job = self.get_object()
+        paginator = StandardResultsSetPagination()
+        page = paginator.paginate_queryset(job.row_errors.all(), request, view=self)
+        return paginator.get_paginated_response(ImportRowErrorSerializer(page, many=True).data)
@@ -0,0 +1,72 @@
+"""
+Product work deferred until the current transaction commits, batched by id.
+
+``defer_for_ids(name, ids, fn)`` adds ``ids`` to this thread's pending set
+for ``name``. The first call at each transaction or savepoint level
+registers one on_commit callback, which then runs ``fn(ids)`` once for
+every name with pending ids. Saving fifty variations of a product inside a transaction therefore
+costs one stats, search, autocomplete and facet refresh at commit. A
+product save adds a single callback, however many modules defer work
+for it.
+
+Batches run in the order their names were first deferred, except that
+``FIRST`` batches (the denormalized columns other work reads) run before
+the rest.
+
+Outside a transaction ``fn`` runs straight away, as on_commit would.
+"""
+import logging
+import threading
+
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+FIRST, NORMAL = 0, 1
+
+_pending = threading.local()
+
+
+def _registrations():
+    """This thread's ``{savepoint ids: (flush callback, batches)}``."""
+    if not hasattr(_pending, 'registrations'):
+        _pending.registrations = {}
+    return _pending.registrations
+
+
+def _make_flush(key, batches):
+    def flush():
+        if _registrations().get(key, (None,))[0] is flush:
+            del _registrations()[key]
+        for name, (_, fn, ids) in sorted(batches.items(), key=lambda item: item[1][0]):
+            try:
+                fn(list(ids))
+            except Exception:
+                logger.exception(f"Error running deferred {name} for {len(ids)} ids")
+    return flush
+
+
+def _current_batches(connection):
+    """The batches of the callback registered at the current savepoint, registering one if needed."""
+    key = tuple(connection.savepoint_ids)
+    registration = _registrations().get(key)
+    # run_on_commit holds (savepoint ids, callback, ...) entries; a rolled back
+    # savepoint takes its callback with it, and its pending ids are stale then
+    if registration is None or not any(entry[1] is registration[0] for entry in connection.run_on_commit):
+        batches = {}
+        registration = (_make_flush(key, batches), batches)
+        _registrations()[key] = registration
+        transaction.on_commit(registration[0])
+    return registration[1]
+
+
+def defer_for_ids(name, ids, fn, stage=NORMAL):
+    """Run ``fn(ids)`` for ``ids`` (merged with others deferred under ``name``) when the transaction commits."""
+    ids = {value for value in ids if value is not None}
+    if not ids:
+        return
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        fn(list(ids))
+        return
+    _current_batches(connection).setdefault(name, (stage, fn, set()))[2].update(ids)
@@ -0,0 +1,240 @@
+"""
+Facet index behind ProductViewSet.filter_options.
+
+``ProductFacetValue`` holds one row per (product, field, value) for approved,
+available products: the brand, the color and every specification backed by
+a filter ``ProductField``. ``ProductFacetCount`` aggregates those rows per
+(category, field, value) so unfiltered option lists are a single indexed
+read. Drill-down counts under the currently applied filters join the facet
+rows against the filtered products, one query per filtered facet field.
+
+Rows are refreshed on commit when a product changes; the Celery task
+``rebuild_product_facets_task`` rebuilds everything, e.g. after a
+``ProductField`` stops or starts being a filter.
+"""
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from backend.task_dispatch import dispatch_task
+
+from .deferred import defer_for_ids
+
+BRAND_FIELD = 'brand'
+COLOR_FIELD = 'color'
+
+# Query parameters that filter on a facet field; spec fields use specifications__<field>__in
+FACET_FILTER_PARAMS = {
+    BRAND_FIELD: ('brand', 'brand__slug', 'brand__slug__in'),
+}
+
+# Query parameters that scope or paginate rather than filter
+NON_FILTER_PARAMS = {'category', 'category_slug', 'page', 'page_size', 'cursor', 'count', 'ordering', 'format'}
+
+
+def get_facet_fields():
+    """Specification keys indexed as facets: color plus every filter ProductField."""
+    from .models import ProductField
+
+    fields = {COLOR_FIELD}
+    fields.update(name.lower() for name in ProductField.objects.filter(is_filter=True).values_list('name', flat=True))
+    return fields
+
+
+def indexed_products():
+    """Products that appear in filter options."""
+    from .models import Product
+
+    return Product.objects.filter(is_approved=True, is_available=True).order_by()
+
+
+def product_facets(product, spec_fields):
+    """Return the set of ``(field, value)`` pairs of a product values() row."""
+    pairs = set()
+    if product['brand_id']:
+        pairs.add((BRAND_FIELD, str(product['brand_id'])))
+
+    specifications = product['specifications']
+    if not isinstance(specifications, dict):
+        return pairs
+    for field in spec_fields:
+        value = specifications.get(field)
+        if not value:
+            continue
+        for item in value if isinstance(value, list) else [value]:
+            if item not in (None, '') and not isinstance(item, (dict, list)):
+                pairs.add((field, str(item)[:255]))
+    return pairs
+
+
+def _facet_rows(products, spec_fields):
+    from .models import ProductFacetValue
+
+    for product in products:
+        for field, value in product_facets(product, spec_fields):
+            yield ProductFacetValue(product_id=product['id'], category_id=product['category_id'],
+                                    field=field, value=value)
+
+
+def recount_facets(keys):
+    """Recompute ``ProductFacetCount`` for the given ``(category_id, field, value)`` keys."""
+    from .models import ProductFacetCount, ProductFacetValue
+
+    keys = set(keys)
+    if not keys:
+        return
+    counts = {
+        (category_id, field, value): total
+        for category_id, field, value, total in ProductFacetValue.objects.filter(
+            category_id__in={key[0] for key in keys},
+            field__in={key[1] for key in keys},
+            value__in={key[2] for key in keys},
+        ).order_by().values('category_id', 'field', 'value').annotate(total=Count('id')).values_list(
+            'category_id', 'field', 'value', 'total'
+        )
+    }
+
+    present = [
+        ProductFacetCount(category_id=key[0], field=key[1], value=key[2], count=counts[key])
+        for key in keys if counts.get(key)
+    ]
+    ProductFacetCount.objects.bulk_create(
+        present, update_conflicts=True, unique_fields=['category', 'field', 'value'], update_fields=['count'],
+    )
+
+    missing = [key for key in keys if not counts.get(key)]
+    if missing:
+        ProductFacetCount.objects.filter(reduce(
+            lambda left, right: left | right,
+            (Q(category_id=category_id, field=field, value=value) for category_id, field, value in missing),
+        )).delete()
+
+
+def refresh_product_facets(product_ids):
+    """Replace the facet rows of the given products and recount the values they touch."""
+    from .models import ProductFacetValue
+
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+
+    spec_fields = get_facet_fields()
+    with transaction.atomic():
+        existing = ProductFacetValue.objects.filter(product_id__in=product_ids)
+        affected = set(existing.values_list('category_id', 'field', 'value'))
+        existing.delete()
+
+        products = indexed_products().filter(id__in=product_ids).values(
+            'id', 'category_id', 'brand_id', 'specifications'
+        )
+        rows = list(_facet_rows(products, spec_fields))
+        ProductFacetValue.objects.bulk_create(rows, batch_size=1000)
+        affected.update((row.category_id, row.field, row.value) for row in rows)
+
+    # Counting after the rows are committed lets concurrent refreshes see each other's rows
+    recount_facets(affected)
+    return len(rows)
+
+
+def rebuild_product_facets(batch_size=2000):
+    """Rebuild every facet row and count from scratch; returns the number of facet rows."""
+    from .models import ProductFacetCount, ProductFacetValue
+
+    spec_fields = get_facet_fields()
+    created = 0
+    with transaction.atomic():
+        ProductFacetValue.objects.all().delete()
+        batch = []
+        products = indexed_products().values('id', 'category_id', 'brand_id', 'specifications')
+        for row in _facet_rows(products.iterator(chunk_size=batch_size), spec_fields):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                ProductFacetValue.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        ProductFacetValue.objects.bulk_create(batch)
+        created += len(batch)
+
+        ProductFacetCount.objects.all().delete()
+        totals = ProductFacetValue.objects.order_by().values('category_id', 'field', 'value').annotate(
+            total=Count('id')
+        )
+        ProductFacetCount.objects.bulk_create(
+            (ProductFacetCount(category_id=row['category_id'], field=row['field'], value=row['value'],
+                               count=row['total']) for row in totals.iterator(chunk_size=batch_size)),
+            batch_size=batch_size,
+        )
+    return created
+
+
+def facet_counts(category_ids=None, fields=None):
+    """Return ``{field: {value: count}}`` from the precomputed counts, summed over categories."""
+    from .models import ProductFacetCount
+
+    queryset = ProductFacetCount.objects.order_by()
+    if category_ids is not None:
+        queryset = queryset.filter(category_id__in=category_ids)
+    if fields is not None:
+        queryset = queryset.filter(field__in=fields)
+
+    counts = {}
+    for field, value, total in queryset.values('field', 'value').annotate(total=Sum('count')).values_list(
+        'field', 'value', 'total'
+    ):
+        counts.setdefault(field, {})[value] = total
+    return counts
+
+
+def active_filters(params):
+    """Applied product filters among request query parameters."""
+    return {
+        key: params.get(key) for key in params.keys()
+        if key not in NON_FILTER_PARAMS and params.get(key) not in (None, '')
+    }
+
+
+def drilldown_facet_counts(products, filters, fields):
+    """
+    Return ``{field: {value: count}}`` for ``products`` narrowed by ``filters``.
+
+    Each field is counted with its own filter left out, so the other values of
+    a field the shopper already picked from stay selectable with real counts.
+    Fields without an applied filter share one query.
+    """
+    from .filters import ProductFilter
+    from .models import ProductFacetValue
+
+    groups = {}
+    for field in fields:
+        own = tuple(param for param in FACET_FILTER_PARAMS.get(field, (f'specifications__{field}__in',))
+                    if param in filters)
+        groups.setdefault(own, []).append(field)
+
+    counts = {}
+    for own, group_fields in groups.items():
+        data = {key: value for key, value in filters.items() if key not in own}
+        filtered = ProductFilter(data, queryset=products).qs
+        rows = ProductFacetValue.objects.filter(
+            product__in=filtered.order_by().values('id'), field__in=group_fields,
+        ).order_by().values('field', 'value').annotate(total=Count('product_id', distinct=True))
+        for row in rows:
+            counts.setdefault(row['field'], {})[row['value']] = row['total']
+    return counts
+
+
+def schedule_facet_refresh(product_id):
+    """Queue a facet refresh for ``product_id`` when the current transaction commits."""
+    defer_for_ids('facet refresh', [product_id], refresh_product_facets)
+
+
+def schedule_facet_recount(keys):
+    """Queue a recount of ``(category_id, field, value)`` keys, e.g. of a product being deleted."""
+    defer_for_ids('facet recount', keys, recount_facets)
+
+
+def schedule_facet_rebuild():
+    """Rebuild the facet index after commit, on a Celery worker when a broker is configured."""
+    from .tasks import rebuild_product_facets_task
+
+    transaction.on_commit(lambda: dispatch_task(rebuild_product_facets_task, fallback=rebuild_product_facets))
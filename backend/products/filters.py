@@ -1,7 +1,6 @@
 import django_filters
 from django.db.models import Q, Count
 from .models import Product, Category, Brand
-from django.db import models
 
 class ProductFilter(django_filters.FilterSet):
     """Filter for Product model."""
@@ -173,9 +172,7 @@ class ProductFilter(django_filters.FilterSet):
             if hasattr(self, 'request') and self.request:
                 ordering = self.request.query_params.get('ordering', None)
                 if ordering == '-review_count':
-                    queryset = queryset.annotate(
-                        review_count=models.Count('product_reviews', filter=models.Q(product_reviews__status='approved'))
-                    ).order_by('-review_count')
+                    queryset = queryset.order_by('-approved_review_count')
                     # Return early since we've already applied ordering
                     return queryset
             
@@ -183,8 +180,12 @@ class ProductFilter(django_filters.FilterSet):
             if not hasattr(self, 'form') or not hasattr(self.form, 'cleaned_data'):
                 return queryset
                 
-            # Get all parameters
+            # Get all parameters; specification filters aren't declared on the
+            # form, so they only exist in the raw data
             data = self.form.cleaned_data.copy()
+            for key in self.data.keys():
+                if key.startswith('specifications__'):
+                    data[key] = self.data.get(key)
             
             # Log the cleaned form data
             print(f"Cleaned form data: {data}")
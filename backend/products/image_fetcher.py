@@ -0,0 +1,265 @@
+"""
+Concurrent download stage for product image URLs.
+
+``ImageFetcher.fetch_all`` takes the image paths of a batch, such as an
+import chunk, and fetches each distinct URL once. Downloads run on a
+bounded thread pool through the shared ``images`` HTTP client
+(backend/http_client.py), which keeps connections to image hosts alive
+and trips a circuit breaker per host. At most IMAGE_FETCH_PER_HOST requests go to any one host at a time. Connection
+errors, timeouts, 429s and 5xx responses are retried with exponential
+backoff and jitter.
+
+Bodies are streamed through a temporary file and hashed on the way.
+They are then stored under a content-addressed name
+(``product_images/content/<sha256>.<ext>``), so the same picture behind
+different URLs, or imported again later, is stored once. Local file paths
+are accepted too, as the bulk upload always allowed.
+
+Every path gets a ``FetchResult`` with its storage name or error, timing,
+attempts and size. These are logged so slow hosts are visible.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+from backend.http_client import get_client
+
+logger = logging.getLogger(__name__)
+
+CONTENT_DIR = 'product_images/content'
+CHUNK_SIZE = 64 * 1024
+
+IMAGE_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def is_url(path):
+    """Check if a path is an http(s) URL."""
+    try:
+        result = urlparse(path)
+        return result.scheme in ('http', 'https') and bool(result.netloc)
+    except ValueError:
+        return False
+
+
+def resolve_local_path(path):
+    """Find a local image path as given, under MEDIA_ROOT or the project's media directory."""
+    normalized = os.path.normpath(path)
+    base_dir = getattr(settings, 'BASE_DIR', '')
+    candidates = [
+        normalized,
+        os.path.join(getattr(settings, 'MEDIA_ROOT', ''), normalized.replace('\\', '/').lstrip('/')),
+        os.path.join(str(base_dir), normalized),
+        os.path.join(str(base_dir), 'media', normalized),
+        # Docker container media directory
+        os.path.join('/app/media', os.path.basename(normalized)),
+    ]
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+class FetchError(Exception):
+    """A download that failed; ``retry`` tells whether trying again may help."""
+
+    def __init__(self, message, retry=False):
+        super().__init__(message)
+        self.retry = retry
+
+
+class FetchResult:
+    """Outcome of fetching one image path."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = None
+        self.sha256 = None
+        self.size = 0
+        self.attempts = 0
+        self.elapsed = 0.0
+        self.error = None
+        self.reused = False
+
+    @property
+    def ok(self):
+        return self.name is not None
+
+    def as_dict(self):
+        return {
+            'path': self.path, 'name': self.name, 'sha256': self.sha256, 'size': self.size,
+            'attempts': self.attempts, 'elapsed_ms': round(self.elapsed * 1000, 1),
+            'error': self.error, 'reused': self.reused,
+        }
+
+
+class ImageFetcher:
+    """
+    Fetch many image paths concurrently into storage.
+
+    A fetcher may be reused for several batches; stored content is
+    remembered between them.
+    """
+
+    def __init__(self, max_workers=None, per_host=None, retries=None, timeout=None, backoff=None,
+                 max_bytes=None, storage=None):
+        self.max_workers = max_workers or _setting('IMAGE_FETCH_WORKERS', 16)
+        self.per_host = per_host or _setting('IMAGE_FETCH_PER_HOST', 4)
+        self.retries = retries if retries is not None else _setting('IMAGE_FETCH_RETRIES', 3)
+        self.timeout = timeout or _setting('IMAGE_FETCH_TIMEOUT', (5, 30))
+        self.backoff = backoff if backoff is not None else _setting('IMAGE_FETCH_BACKOFF', 0.5)
+        self.max_bytes = max_bytes or _setting('IMAGE_FETCH_MAX_BYTES', 20 * 1024 * 1024)
+        self.storage = storage or default_storage
+        self.client = get_client('images')
+
+        self._lock = threading.Lock()
+        self._host_slots = {}
+        self._stored = {}  # sha256 -> storage name
+        self._content_locks = {}
+
+    def fetch_all(self, paths):
+        """Fetch each distinct path once; returns ``{path: FetchResult}``."""
+        paths = list(dict.fromkeys(path for path in paths if path))
+        if not paths:
+            return {}
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(paths)),
+                                thread_name_prefix='image-fetch') as executor:
+            results = dict(zip(paths, executor.map(self.fetch, paths)))
+
+        failed = [result for result in results.values() if not result.ok]
+        timings = sorted(result.elapsed for result in results.values())
+        logger.info(
+            f"Fetched {len(paths) - len(failed)}/{len(paths)} images in "
+            f"{(time.perf_counter() - started) * 1000:.0f} ms "
+            f"(p50 {timings[len(timings) // 2] * 1000:.0f} ms, max {timings[-1] * 1000:.0f} ms)"
+        )
+        for result in failed:
+            logger.warning(f"Could not fetch image {result.path}: {result.error}")
+        return results
+
+    def fetch(self, path):
+        """Fetch one path into storage; never raises."""
+        result = FetchResult(path)
+        started = time.perf_counter()
+        try:
+            if is_url(path):
+                self._download(path, result)
+            else:
+                self._copy_local(path, result)
+        except Exception as e:
+            result.error = str(e)
+        result.elapsed = time.perf_counter() - started
+        logger.debug(f"Image {path}: {result.as_dict()}")
+        return result
+
+    def _host_slot(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+
+    def _download(self, url, result):
+        slot = self._host_slot(url)
+        for attempt in range(self.retries + 1):
+            result.attempts = attempt + 1
+            try:
+                with slot:
+                    return self._download_once(url, result)
+            except FetchError as e:
+                if not e.retry or attempt == self.retries:
+                    raise
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries:
+                    raise FetchError(f"{type(e).__name__}: {e}")
+            # Exponential backoff with full jitter, outside the host slot
+            time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def _download_once(self, url, result):
+        # Retries are handled by _download, inside the per-host limit
+        with self.client.get(url, stream=True, timeout=self.timeout, retries=0) as response:
+            if response.status_code == 429 or response.status_code >= 500:
+                raise FetchError(f"HTTP {response.status_code}", retry=True)
+            if response.status_code != 200:
+                raise FetchError(f"HTTP {response.status_code}")
+
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            extension = IMAGE_EXTENSIONS.get(content_type) or self._extension_from_path(urlparse(url).path)
+            if not extension:
+                raise FetchError(f"Not an image: {content_type or 'unknown content type'}")
+
+            with tempfile.TemporaryFile() as spool:
+                digest = hashlib.sha256()
+                size = 0
+                for block in response.iter_content(CHUNK_SIZE):
+                    size += len(block)
+                    if size > self.max_bytes:
+                        raise FetchError(f"Image larger than {self.max_bytes} bytes")
+                    digest.update(block)
+                    spool.write(block)
+                if not size:
+                    raise FetchError("Empty response", retry=True)
+                self._store(spool, digest.hexdigest(), extension, size, result)
+
+    def _copy_local(self, path, result):
+        result.attempts = 1
+        local_path = resolve_local_path(path)
+        if not local_path:
+            raise FetchError(f"File not found: {path}")
+        extension = self._extension_from_path(local_path)
+        if not extension:
+            raise FetchError(f"Not an image: {path}")
+
+        digest = hashlib.sha256()
+        with open(local_path, 'rb') as f:
+            for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(block)
+            size = f.tell()
+            self._store(f, digest.hexdigest(), extension, size, result)
+
+    @staticmethod
+    def _extension_from_path(path):
+        content_type, _ = mimetypes.guess_type(path)
+        return IMAGE_EXTENSIONS.get(content_type)
+
+    def _store(self, file, sha256, extension, size, result):
+        """Save under the content-addressed name unless that content is already stored."""
+        name = f"{CONTENT_DIR}/{sha256[:2]}/{sha256}.{extension}"
+        result.sha256 = sha256
+        result.size = size
+        # One writer per content hash, so concurrent duplicates wait and reuse its file
+        with self._lock:
+            content_lock = self._content_locks.setdefault(sha256, threading.Lock())
+        with content_lock:
+            stored = self._stored.get(sha256)
+            if stored is None and self.storage.exists(name):
+                stored = name
+            if stored is not None:
+                result.name = stored
+                result.reused = True
+                return
+            file.seek(0)
+            result.name = self.storage.save(name, File(file, name=os.path.basename(name)))
+            self._stored[sha256] = result.name
@@ -0,0 +1,624 @@
+"""
+Bulk product import pipeline behind ImportJob.
+
+An upload is stored on an ``ImportJob`` and imported by
+``run_import_job``, on a Celery worker when a broker is configured. The
+file is streamed in chunks of IMPORT_CHUNK_SIZE rows. For each chunk, slugs,
+brands, vendors, EMI plans and SKUs are resolved with a few set-based
+queries, and products, variations and EMI plan links are written with
+``bulk_create`` in one transaction. The chunk's image paths are then
+downloaded concurrently (see products.image_fetcher) and attached in one
+more ``bulk_create``. Denormalized columns, search vectors and facets are
+refreshed for the whole chunk at once. Rows that fail
+validation become ``ImportRowError`` records. Progress counters are updated
+after every chunk, so the status endpoint can report percentage and
+throughput while the job runs.
+
+Both upload layouts are accepted: the category template from
+``generate_upload_template`` (price, brand, vendor_email, variationN_*,
+imageN_*, category field columns) and the basic layout of
+``ProductViewSet.template`` (base_price, spec_* columns).
+"""
+import csv
+import io
+import logging
+import operator
+import os
+from decimal import Decimal, InvalidOperation
+from functools import reduce
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.text import slugify
+
+from backend.task_dispatch import dispatch_task
+
+from .image_fetcher import ImageFetcher
+from .models import Brand, ImportJob, ImportRowError, Product, ProductField, ProductVariation, generate_sku
+
+logger = logging.getLogger(__name__)
+
+# Variation and image column groups of the category template
+MAX_VARIATIONS = 3
+MAX_IMAGES = 3
+
+# Stored with each failed row, so the data of a huge row doesn't bloat the table
+MAX_ERROR_DATA_LENGTH = 1000
+
+
+def get_chunk_size():
+    """Rows imported per transaction."""
+    return getattr(settings, 'IMPORT_CHUNK_SIZE', 1000)
+
+
+def _parse_boolean(value, default=False):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    return str(value).strip().lower() in ('true', 'yes', '1', 'y')
+
+
+def _parse_decimal(value, column):
+    if value is None or value == '':
+        return None
+    try:
+        return Decimal(str(value).strip().replace(',', ''))
+    except InvalidOperation:
+        raise ValueError(f"Invalid {column}: {value}")
+
+
+def _parse_int(value, column, default=0):
+    if value is None or value == '':
+        return default
+    try:
+        return int(Decimal(str(value).strip()))
+    except InvalidOperation:
+        raise ValueError(f"Invalid {column}: {value}")
+
+
+def _text(value, max_length):
+    return str(value)[:max_length] if value is not None else None
+
+
+def _clean_column(name):
+    """Strip the required-field marker the template adds to column names."""
+    name = str(name or '').strip()
+    return name[:-2] if name.endswith(' *') else name
+
+
+def _clean_value(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    if isinstance(value, float) and value != value:  # NaN from pandas
+        return None
+    return value
+
+
+# ---------------------------------------------------------------------------
+# Reading files
+
+def file_extension(name):
+    return os.path.splitext(name or '')[1].lower().lstrip('.')
+
+
+def _open_rows(file):
+    """Yield the header then each row of a stored CSV or Excel upload as a list of values."""
+    extension = file_extension(file.name)
+    if extension not in ('csv', 'xlsx', 'xls'):
+        raise ValueError(f"Unsupported file format: {extension}")
+
+    handle = file.storage.open(file.name, 'rb')
+    try:
+        if extension == 'csv':
+            yield from csv.reader(io.TextIOWrapper(handle, encoding='utf-8-sig', newline=''))
+        elif extension == 'xlsx':
+            import openpyxl
+            workbook = openpyxl.load_workbook(handle, read_only=True, data_only=True)
+            try:
+                for row in workbook.active.iter_rows(values_only=True):
+                    yield list(row)
+            finally:
+                workbook.close()
+        else:
+            # Legacy .xls has no streaming reader, load it whole
+            import pandas as pd
+            for row in pd.read_excel(handle, header=None, dtype=object).itertuples(index=False):
+                yield list(row)
+    finally:
+        handle.close()
+
+
+def read_header(file):
+    """Return the cleaned column names of an upload."""
+    rows = _open_rows(file)
+    try:
+        return [_clean_column(column) for column in next(rows, [])]
+    finally:
+        rows.close()
+
+
+def count_rows(file):
+    """Number of non-blank data rows in an upload, for progress reporting."""
+    rows = _open_rows(file)
+    try:
+        next(rows, None)
+        return sum(1 for row in rows if any(_clean_value(value) is not None for value in row))
+    finally:
+        rows.close()
+
+
+def iter_chunks(file, chunk_size):
+    """Yield lists of ``(row_number, {column: value})``, skipping blank rows."""
+    rows = _open_rows(file)
+    try:
+        header = [_clean_column(column) for column in next(rows, [])]
+        chunk = []
+        for row_number, values in enumerate(rows, start=2):
+            data = {
+                column: _clean_value(value) for column, value in zip(header, values) if column
+            }
+            if not any(value is not None for value in data.values()):
+                continue
+            chunk.append((row_number, data))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        rows.close()
+
+
+# ---------------------------------------------------------------------------
+# Set-based lookups
+
+def _slug_stem(slug):
+    """``slug`` without a numeric ``-N`` suffix."""
+    stem, _, suffix = slug.rpartition('-')
+    return stem if stem and suffix.isdigit() else slug
+
+
+def allocate_slugs(model, names, max_length=255, fallback='product'):
+    """
+    Return a unique slug for each name, with a single query for existing slugs.
+
+    Clashes get ``-1``, ``-2``... suffixes like the row-at-a-time upload did.
+    """
+    bases = [(slugify(name)[:max_length - 8].strip('-') or fallback) for name in names]
+    if not bases:
+        return []
+    unique_bases = set(bases)
+    # Prefix matches are served by the slug column's pattern index; numeric suffixes are checked here
+    candidates = reduce(
+        operator.or_, (Q(slug__startswith=f"{base}-") for base in unique_bases), Q(slug__in=unique_bases),
+    )
+    taken = {
+        slug for slug in model.objects.filter(candidates).values_list('slug', flat=True)
+        if slug in unique_bases or _slug_stem(slug) in unique_bases
+    }
+
+    slugs = []
+    for base in bases:
+        slug, counter = base, 1
+        while slug in taken:
+            slug = f"{base}-{counter}"
+            counter += 1
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def allocate_skus(count, reserved=()):
+    """Return ``count`` generated SKUs unused by products and variations."""
+    skus = set()
+    reserved = set(reserved)
+    while len(skus) < count:
+        candidates = {generate_sku() for _ in range(count - len(skus))} - skus - reserved
+        clashes = set(Product.objects.filter(default_sku__in=candidates).values_list('default_sku', flat=True))
+        clashes.update(ProductVariation.objects.filter(sku__in=candidates).values_list('sku', flat=True))
+        skus.update(candidates - clashes)
+    return list(skus)
+
+
+def resolve_brands(names):
+    """Map brand names to ids, creating the brands that don't exist yet."""
+    names = {name for name in names if name}
+    brands = {}
+    for brand_id, name in Brand.objects.filter(name__in=names).order_by('id').values_list('id', 'name'):
+        brands.setdefault(name, brand_id)
+
+    missing = sorted(names - set(brands))
+    # New brands are rare, so they go through save() and its signals
+    for name, slug in zip(missing, allocate_slugs(Brand, missing, max_length=100, fallback='brand')):
+        brands[name] = Brand.objects.create(name=name, slug=slug).id
+    return brands
+
+
+def resolve_vendors(emails):
+    """Map vendor emails to user ids."""
+    User = get_user_model()
+    emails = {email for email in emails if email}
+    if not emails:
+        return {}
+    return dict(User.objects.filter(email__in=emails).values_list('email', 'id'))
+
+
+def resolve_emi_plans(plan_ids):
+    from emi.models import EMIPlan
+
+    plan_ids = set(plan_ids)
+    if not plan_ids:
+        return set()
+    return set(EMIPlan.objects.filter(id__in=plan_ids).values_list('id', flat=True))
+
+
+# ---------------------------------------------------------------------------
+# Rows
+
+class ImportContext:
+    """Job-wide settings and the category's fields, loaded once per job."""
+
+    def __init__(self, job):
+        self.job = job
+        self.category_id = job.category_id
+        self.brand_id = job.brand_id
+        self.vendor_id = job.vendor_id or job.created_by_id
+        self.auto_approve = job.auto_approve
+        self.fields = {field.name: field for field in ProductField.objects.filter(category_id=job.category_id)}
+        self.required_fields = [name for name, field in self.fields.items() if field.is_required]
+
+
+def _field_value(field, value):
+    if field.field_type == 'boolean':
+        return _parse_boolean(value)
+    if field.field_type == 'multi_select' and isinstance(value, str):
+        return [item.strip() for item in value.split(',') if item.strip()]
+    return value
+
+
+def parse_row(data, context):
+    """
+    Turn a row into a dict of product values, variations, images and EMI plans.
+
+    Raises ValueError with a message for the user if the row is invalid.
+    """
+    missing = [name for name in context.required_fields if data.get(name) is None]
+    if missing:
+        raise ValueError(f"Missing required fields: {', '.join(missing)}")
+
+    name = data.get('name')
+    if not name:
+        raise ValueError("Missing required fields: name")
+    base_price = _parse_decimal(data.get('base_price', data.get('price')), 'price')
+    if base_price is None:
+        raise ValueError("Missing required fields: price")
+
+    specifications = {}
+    for field_name, field in context.fields.items():
+        if data.get(field_name) is not None:
+            specifications[field_name] = _field_value(field, data[field_name])
+    for column, value in data.items():
+        if column.startswith('spec_') and value is not None:
+            specifications[column[5:]] = value
+
+    variations = []
+    for i in range(1, MAX_VARIATIONS + 1):
+        variation_name = data.get(f'variation{i}_name')
+        if not variation_name:
+            continue
+        variations.append({
+            'name': str(variation_name)[:255],
+            'price': _parse_decimal(data.get(f'variation{i}_price'), f'variation{i}_price') or Decimal('0'),
+            'stock_quantity': _parse_int(data.get(f'variation{i}_stock'), f'variation{i}_stock'),
+            'is_default': _parse_boolean(data.get(f'variation{i}_is_default')),
+            'is_active': _parse_boolean(data.get(f'variation{i}_is_active'), default=True),
+        })
+    if len({variation['name'] for variation in variations}) != len(variations):
+        raise ValueError("Duplicate variation names")
+    # Only the last default variation stays default, as saving them one by one did
+    defaults = [variation for variation in variations if variation['is_default']]
+    for variation in defaults[:-1]:
+        variation['is_default'] = False
+
+    images = []
+    for i in range(1, MAX_IMAGES + 1):
+        path = data.get(f'image{i}_path')
+        if path:
+            images.append({
+                'path': str(path),
+                'is_primary': _parse_boolean(data.get(f'image{i}_is_primary')),
+                'display_order': i,
+            })
+
+    emi_plan_ids = set()
+    for value in str(data.get('emi_plan_ids') or '').split(','):
+        value = value.strip()
+        if value.isdigit():
+            emi_plan_ids.add(int(value))
+
+    stock_quantity = _parse_int(data.get('stock_quantity'), 'stock_quantity')
+    if stock_quantity < 0:
+        raise ValueError(f"Invalid stock_quantity: {stock_quantity}")
+
+    return {
+        'product': {
+            'name': str(name)[:255],
+            'description': str(data.get('description') or ''),
+            'base_price': base_price,
+            'sale_price': _parse_decimal(data.get('sale_price'), 'sale_price'),
+            'stock_quantity': stock_quantity,
+            'category_id': context.category_id,
+            'is_available': _parse_boolean(data.get('is_available'), default=True),
+            'is_approved': _parse_boolean(data.get('is_approved'), default=context.auto_approve),
+            'emi_available': _parse_boolean(data.get('emi_available')),
+            'is_trending': _parse_boolean(data.get('is_trending')),
+            'is_special_offer': _parse_boolean(data.get('is_special_offer')),
+            'is_best_seller': _parse_boolean(data.get('is_best_seller')),
+            'is_todays_deal': _parse_boolean(data.get('is_todays_deal')),
+            'specifications': specifications,
+        },
+        'brand': _text(data.get('brand'), 100),
+        'vendor_email': _text(data.get('vendor_email'), 254),
+        'sku': _text(data.get('sku'), 20),
+        'variations': variations,
+        'images': images,
+        'emi_plan_ids': emi_plan_ids,
+    }
+
+
+def _error_data(data):
+    return {key: str(value)[:MAX_ERROR_DATA_LENGTH] for key, value in data.items() if value is not None}
+
+
+def import_chunk(rows, context):
+    """
+    Import one chunk of ``(row_number, data)`` rows.
+
+    Returns ``(created, errors)``: ``(row_number, product, images)`` for
+    each imported row and unsaved ``ImportRowError`` instances.
+    """
+    parsed, errors = [], []
+    for row_number, data in rows:
+        try:
+            parsed.append((row_number, data, parse_row(data, context)))
+        except ValueError as e:
+            errors.append(ImportRowError(job=context.job, row=row_number, message=str(e), data=_error_data(data)))
+
+    brands = {} if context.brand_id else resolve_brands(row['brand'] for _, _, row in parsed)
+    vendors = resolve_vendors(row['vendor_email'] for _, _, row in parsed)
+    emi_plans = resolve_emi_plans(plan_id for _, _, row in parsed for plan_id in row['emi_plan_ids'])
+
+    # SKUs given in the file must be new and unique within it
+    given_skus = [row['sku'] for _, _, row in parsed if row['sku']]
+    existing_skus = set(Product.objects.filter(default_sku__in=given_skus).values_list('default_sku', flat=True))
+    seen_skus = set()
+
+    valid = []
+    for row_number, data, row in parsed:
+        message = None
+        brand_id = context.brand_id or brands.get(row['brand'])
+        vendor_id = vendors.get(row['vendor_email']) or context.vendor_id
+        if not brand_id:
+            message = "Missing required fields: brand"
+        elif not vendor_id:
+            message = f"Unknown vendor: {row['vendor_email']}" if row['vendor_email'] else "Missing vendor"
+        elif row['sku'] and (row['sku'] in existing_skus or row['sku'] in seen_skus):
+            message = f"SKU already exists: {row['sku']}"
+        if message:
+            errors.append(ImportRowError(job=context.job, row=row_number, message=message, data=_error_data(data)))
+            continue
+        if row['sku']:
+            seen_skus.add(row['sku'])
+        row['product'].update(brand_id=brand_id, vendor_id=vendor_id)
+        valid.append((row_number, row))
+
+    created = _write_products(valid, emi_plans, seen_skus)
+    return created, errors
+
+
+def _write_products(valid, emi_plans, reserved_skus):
+    """Insert the products of a chunk with their variations and EMI plans."""
+    if not valid:
+        return []
+
+    slugs = allocate_slugs(Product, [row['product']['name'] for _, row in valid])
+    needed = sum(1 for _, row in valid if not row['sku']) + sum(len(row['variations']) for _, row in valid)
+    skus = iter(allocate_skus(needed, reserved_skus))
+
+    products = []
+    for (_, row), slug in zip(valid, slugs):
+        values = row['product']
+        # Product.save() would set these; a new product has no variations yet
+        products.append(Product(
+            slug=slug, default_sku=row['sku'] or next(skus), effective_price=values['base_price'],
+            min_price=values['base_price'], max_price=values['base_price'], **values
+        ))
+
+    with transaction.atomic():
+        Product.objects.bulk_create(products)
+        ProductVariation.objects.bulk_create([
+            ProductVariation(product=product, sku=next(skus), **variation)
+            for product, (_, row) in zip(products, valid) for variation in row['variations']
+        ])
+        Through = Product.emi_plans.through
+        Through.objects.bulk_create([
+            Through(product_id=product.id, emiplan_id=plan_id)
+            for product, (_, row) in zip(products, valid) for plan_id in row['emi_plan_ids'] if plan_id in emi_plans
+        ])
+    return [(row_number, product, row['images']) for product, (row_number, row) in zip(products, valid)]
+
+
+def attach_row_images(created, fetcher):
+    """
+    Download the images of created products concurrently and attach them.
+
+    Each distinct path is fetched once (see products.image_fetcher); paths
+    that fail are logged and skipped. Returns ``{path: FetchResult}``.
+    """
+    from .models import ProductImage, schedule_image_renditions
+
+    wanted = [(product, image) for _, product, images in created for image in images]
+    if not wanted:
+        return {}
+    results = fetcher.fetch_all(image['path'] for _, image in wanted)
+
+    rows, primary = [], {}
+    for product, image in wanted:
+        result = results[image['path']]
+        if not result.ok:
+            continue
+        row = ProductImage(product=product, image=result.name, is_primary=image['is_primary'],
+                           display_order=image['display_order'])
+        if row.is_primary:
+            # The last primary image of a product wins, as saving them one by one did
+            previous = primary.get(product.id)
+            if previous is not None:
+                previous.is_primary = False
+            primary[product.id] = row
+        rows.append(row)
+    ProductImage.objects.bulk_create(rows)
+
+    for name in {row.image.name for row in rows}:
+        transaction.on_commit(lambda name=name: schedule_image_renditions(name))
+    return results
+
+
+def refresh_imported_products(product_ids):
+    """Bring denormalized columns, search vectors, facets and caches up to date for new products."""
+    from .autocomplete import bump_autocomplete_version
+    from .facets import refresh_product_facets
+    from .rail_cache import bump_catalog_version
+    from .search import refresh_search_vectors
+    from .stats import refresh_product_stats
+
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    refresh_product_stats(product_ids)
+    refresh_search_vectors(product_ids=product_ids)
+    refresh_product_facets(product_ids)
+    bump_autocomplete_version(product_ids)
+    bump_catalog_version()
+
+
+# ---------------------------------------------------------------------------
+# Jobs
+
+REQUIRED_COLUMNS = ('name',)
+PRICE_COLUMNS = ('price', 'base_price')
+
+
+def missing_columns(header, required=REQUIRED_COLUMNS):
+    """Required columns absent from an upload's header; either price column will do."""
+    missing = [column for column in required if column not in header]
+    if not any(column in header for column in PRICE_COLUMNS):
+        missing.append('price')
+    return missing
+
+
+def run_import_job(job_id, chunk_size=None, collect_results=False):
+    """
+    Import an ImportJob's file; returns per-row results if ``collect_results``.
+
+    Jobs that are no longer pending are skipped, so a redelivered task
+    doesn't import the file twice.
+    """
+    updated = ImportJob.objects.filter(pk=job_id, status='pending').update(
+        status='running', started_at=timezone.now()
+    )
+    if not updated:
+        return None
+    job = ImportJob.objects.select_related('category').get(pk=job_id)
+    chunk_size = chunk_size or get_chunk_size()
+    results = [] if collect_results else None
+    fetcher = ImageFetcher()
+
+    try:
+        header = read_header(job.file)
+        missing = missing_columns(header)
+        if missing:
+            raise ValueError(f"Missing required columns: {', '.join(missing)}")
+        job.total_rows = count_rows(job.file)
+        job.save(update_fields=['total_rows'])
+
+        context = ImportContext(job)
+        for rows in iter_chunks(job.file, chunk_size):
+            created, errors = _import_chunk_with_retry(rows, context)
+            ImportRowError.objects.bulk_create(errors)
+            # Images first, so one stats refresh also picks up the primary images
+            attach_row_images(created, fetcher)
+            refresh_imported_products(product.id for _, product, _ in created)
+
+            ImportJob.objects.filter(pk=job.pk).update(
+                processed_rows=F('processed_rows') + len(rows),
+                created_count=F('created_count') + len(created),
+                error_count=F('error_count') + len(errors),
+            )
+            if results is not None:
+                results.extend({'row': row_number, 'status': 'success', 'product_id': product.id,
+                                'product_name': product.name} for row_number, product, _ in created)
+                results.extend({'row': error.row, 'status': 'error', 'errors': error.message,
+                                'data': error.data} for error in errors)
+
+        ImportJob.objects.filter(pk=job.pk).update(status='completed', finished_at=timezone.now())
+    except Exception as e:
+        logger.exception(f"Import job {job_id} failed")
+        ImportJob.objects.filter(pk=job.pk).update(status='failed', error_message=str(e),
+                                                    finished_at=timezone.now())
+
+    if results is not None:
+        results.sort(key=lambda result: result['row'])
+    return results
+
+
+def _import_chunk_with_retry(rows, context):
+    """Import a chunk, re-resolving slugs and SKUs once if a concurrent writer took one."""
+    try:
+        return import_chunk(rows, context)
+    except IntegrityError:
+        logger.warning(f"Import job {context.job.id}: conflict while writing a chunk, retrying")
+    try:
+        return import_chunk(rows, context)
+    except IntegrityError as e:
+        return [], [
+            ImportRowError(job=context.job, row=row_number, message=f"Could not save row: {str(e)}",
+                           data=_error_data(data))
+            for row_number, data in rows
+        ]
+
+
+def create_import_job(file, category, required_columns=REQUIRED_COLUMNS, schedule=True, **fields):
+    """
+    Store an upload as a pending ImportJob and schedule it.
+
+    The header is checked up front, so a file with missing columns is
+    rejected with a ValueError instead of producing a failed job.
+    """
+    job = ImportJob.objects.create(file=file, category=category, **fields)
+    try:
+        missing = missing_columns(read_header(job.file), required_columns)
+        if missing:
+            raise ValueError(f"Missing required columns: {', '.join(missing)}")
+    except Exception:
+        job.file.delete(save=False)
+        job.delete()
+        raise
+    if schedule:
+        schedule_import_job(job.id)
+    return job
+
+
+def schedule_import_job(job_id):
+    """Run the job after commit, on a Celery worker when a broker is configured."""
+    from .tasks import run_import_job_task
+
+    transaction.on_commit(lambda: dispatch_task(run_import_job_task, job_id, fallback=run_import_job))
@@ -0,0 +1,96 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+
+from products.autocomplete import AutocompleteIndex
+from products.models import Product
+from products.serializers import build_media_url
+
+
+def database_autocomplete(query, limit):
+    """The previous autocomplete implementation: an icontains query per keystroke."""
+    products = Product.objects.filter(
+        Q(name__icontains=query) | Q(name__istartswith=query)
+    ).filter(is_approved=True).select_related('brand', 'category')[:limit]
+
+    suggestions = []
+    for product in products:
+        price = product.effective_price if product.effective_price is not None else product.base_price
+        suggestions.append({
+            'type': 'product',
+            'id': product.id,
+            'name': product.name,
+            'category': product.category.name if product.category else '',
+            'brand': product.brand.name if product.brand else '',
+            'price': float(price or 0),
+            'image': build_media_url(product.primary_image_path) if product.primary_image_path else None,
+            'url': f'/products/{product.slug}' if product.slug else f'/products/{product.id}'
+        })
+    return suggestions
+
+
+class Command(BaseCommand):
+    help = 'Replay a keystroke stream against the database and in-memory autocomplete implementations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200,
+                            help='Number of search terms to type (sampled from product names)')
+        parser.add_argument('--limit', type=int, default=5, help='Suggestions per keystroke')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for sampling')
+        parser.add_argument('--skip-database', action='store_true',
+                            help='Only benchmark the in-memory index')
+
+    def handle(self, *args, **options):
+        keystrokes = self.keystroke_stream(options['queries'], options['seed'])
+        if not keystrokes:
+            self.stdout.write(self.style.WARNING('No approved products to build a keystroke stream from'))
+            return
+        self.stdout.write(f"Replaying {len(keystrokes)} keystrokes")
+
+        index = AutocompleteIndex()
+        started = time.perf_counter()
+        index.rebuild()
+        self.stdout.write(f"Built index of {len(index.base)} entries in "
+                          f"{(time.perf_counter() - started) * 1000:.0f} ms")
+
+        limit = options['limit']
+        self.report('index', keystrokes, lambda query: index.lookup(query, limit))
+        if not options['skip_database']:
+            self.report('database', keystrokes, lambda query: database_autocomplete(query, limit))
+
+    def keystroke_stream(self, count, seed):
+        """Type each sampled term one character at a time, starting at two characters."""
+        names = list(Product.objects.filter(is_approved=True).values_list('name', flat=True)[:10000])
+        if not names:
+            return []
+        rng = random.Random(seed)
+        keystrokes = []
+        for _ in range(count):
+            # Users usually type the first word or two of what they are looking for
+            term = ' '.join(rng.choice(names).split()[:2])
+            keystrokes.extend(term[:length] for length in range(2, len(term) + 1))
+        return keystrokes
+
+    def report(self, label, keystrokes, lookup):
+        timings = []
+        with CaptureQueriesContext(connection) as queries:
+            for query in keystrokes:
+                started = time.perf_counter()
+                lookup(query)
+                timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+
+        def percentile(p):
+            return timings[min(len(timings) - 1, int(len(timings) * p))]
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{label:>8}: mean {statistics.mean(timings):.3f} ms, p50 {percentile(0.50):.3f} ms, "
+            f"p95 {percentile(0.95):.3f} ms, p99 {percentile(0.99):.3f} ms, max {timings[-1]:.3f} ms, "
+            f"{len(queries.captured_queries) / len(keystrokes):.1f} queries/keystroke"
+        ))
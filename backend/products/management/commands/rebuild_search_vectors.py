@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Product
+from products.search import refresh_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Recompute the full-text search vector on products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int, action='append', dest='product_ids',
+                            help='Only rebuild this product id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of products updated per statement')
+
+    def handle(self, *args, **options):
+        product_ids = options['product_ids']
+        if product_ids is None:
+            product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+
+        batch_size = max(1, options['batch_size'])
+        updated = 0
+        for start in range(0, len(product_ids), batch_size):
+            updated += refresh_search_vectors(product_ids[start:start + batch_size])
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search vectors for {updated} products"))
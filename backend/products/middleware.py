@@ -1,83 +1,100 @@
+import logging
+import os
 import re
-from io import BytesIO
-from PIL import Image
-from django.http import HttpResponse
+from django.http import HttpResponse, FileResponse
 from django.conf import settings
 from django.core.files.storage import default_storage
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from urllib.parse import parse_qs
 
+from .renditions import get_rendition_store, get_max_width, get_rendition_max_age
+
+logger = logging.getLogger(__name__)
+
+
 class ImageResizingMiddleware:
     """
     Middleware to handle on-the-fly image resizing.
-    
+
     This middleware intercepts requests for images with size and width parameters
-    and returns resized versions of the images.
+    and returns resized versions of the images. Renditions are generated once,
+    persisted under MEDIA_ROOT and kept in a per-process LRU (see
+    products.renditions). Disk hits can be handed off to the front-end server
+    with X-Accel-Redirect or X-Sendfile via IMAGE_RENDITION_SERVE_MODE.
     """
-    
+
     def __init__(self, get_response):
         self.get_response = get_response
         # Regex pattern to match image file extensions
         self.image_pattern = re.compile(r'.*\.(jpg|jpeg|png|gif|webp)$', re.IGNORECASE)
-        
+        self.serve_mode = getattr(settings, 'IMAGE_RENDITION_SERVE_MODE', 'django')
+        self.accel_prefix = getattr(settings, 'IMAGE_RENDITION_ACCEL_PREFIX', '/protected-media/')
+
     def __call__(self, request):
         # Check if this is an image request
         path = request.path_info
         query_string = request.META.get('QUERY_STRING', '')
-        
+
         # Only process if it's a media URL and has query parameters
         if path.startswith('/media/') and query_string and self.image_pattern.match(path):
             # Parse query parameters
             query_params = parse_qs(query_string)
             size = query_params.get('size', [''])[0]
             width_str = query_params.get('width', [''])[0]
-            
+            image_format = query_params.get('format', [''])[0] or None
+
             # Only process if size and width parameters are present
             if size in ['small', 'medium'] and width_str.isdigit():
-                width = int(width_str)
-                
+                width = min(int(width_str), get_max_width())
+
                 # Remove /media/ prefix to get relative path
                 image_path = path[7:]  # Remove '/media/' prefix
-                
+
                 try:
-                    # Open the original image
-                    if default_storage.exists(image_path):
-                        with default_storage.open(image_path, 'rb') as f:
-                            img = Image.open(f)
-                            
-                            # Calculate new height maintaining aspect ratio
-                            ratio = img.height / img.width
-                            height = int(width * ratio)
-                            
-                            # Resize the image
-                            resized_img = img.resize((width, height), Image.LANCZOS)
-                            
-                            # Save to a BytesIO object
-                            output = BytesIO()
-                            
-                            # Determine format from original image
-                            format = img.format if img.format else 'JPEG'
-                            
-                            # Save with appropriate quality
-                            if format == 'JPEG':
-                                resized_img.save(output, format=format, quality=85, optimize=True)
-                            else:
-                                resized_img.save(output, format=format)
-                                
-                            output.seek(0)
-                            
-                            # Create response with appropriate content type
-                            content_type = f'image/{format.lower()}'
-                            if format.lower() == 'jpg':
-                                content_type = 'image/jpeg'
-                                
-                            response = HttpResponse(output.read(), content_type=content_type)
-                            
-                            # Add cache headers
-                            response['Cache-Control'] = 'public, max-age=31536000'  # Cache for a year
-                            
-                            return response
+                    if width > 0 and default_storage.exists(image_path):
+                        rendition, source = get_rendition_store().get(image_path, width, image_format)
+                        response = self._build_response(request, rendition)
+                        response['X-Rendition-Cache'] = source
+                        return response
                 except Exception as e:
-                    print(f"Error resizing image: {e}")
-        
+                    logger.error(f"Error resizing image {image_path}: {str(e)}")
+
         # If not an image request or any error occurred, continue with normal request
-        return self.get_response(request) 
\ No newline at end of file
+        return self.get_response(request)
+
+    def _build_response(self, request, rendition):
+        """Serve a rendition from memory, the front-end server or a file stream, or a 304."""
+        # Rendition names embed the original's mtime, so the ETag changes when the image is replaced
+        etag = quote_etag(os.path.basename(rendition.name))
+        last_modified = self._rendition_mtime(rendition.name)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            patch_cache_control(not_modified, public=True, max_age=get_rendition_max_age())
+            return not_modified
+
+        if rendition.data is not None:
+            response = HttpResponse(rendition.data, content_type=rendition.content_type)
+        elif self.serve_mode == 'x-accel-redirect':
+            response = HttpResponse(content_type=rendition.content_type)
+            response['X-Accel-Redirect'] = f"{self.accel_prefix.rstrip('/')}/{rendition.name}"
+        elif self.serve_mode == 'x-sendfile':
+            response = HttpResponse(content_type=rendition.content_type)
+            response['X-Sendfile'] = default_storage.path(rendition.name)
+        else:
+            # FileResponse uses wsgi.file_wrapper, i.e. sendfile() under gunicorn
+            response = FileResponse(default_storage.open(rendition.name, 'rb'), content_type=rendition.content_type)
+
+        # The public URL is the same for every version of the image, so it can't be immutable
+        patch_cache_control(response, public=True, max_age=get_rendition_max_age())
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def _rendition_mtime(self, name):
+        """Original mtime encoded in the rendition name (``<stem>.w<width>.<mtime>.<ext>``)."""
+        try:
+            return int(os.path.splitext(name)[0].rsplit('.', 1)[1])
+        except (IndexError, ValueError):
+            return None
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:20
+
+from django.db import migrations, models
+
+
+def populate_product_stats(apps, schema_editor):
+    from products.stats import product_stats_expressions
+    
+    Product = apps.get_model('products', 'Product')
+    ProductVariation = apps.get_model('products', 'ProductVariation')
+    ProductImage = apps.get_model('products', 'ProductImage')
+    Product.objects.update(**product_stats_expressions(ProductVariation, ProductImage))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_remove_productimage_thumbnail_medium_and_more'),
+        ('reviews', '0002_review_cons_review_pros_alter_review_rating_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='approved_review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='avg_rating',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, help_text='Default variation price, or base price without variations', max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='max_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='min_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='primary_image_path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_product_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:25
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+def populate_search_vectors(apps, schema_editor):
+    from products.search import product_search_vector
+
+    Product = apps.get_model('products', 'Product')
+    Brand = apps.get_model('products', 'Brand')
+    Category = apps.get_model('products', 'Category')
+    Product.objects.update(search_vector=product_search_vector(Brand, Category))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_denormalized_stats'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(populate_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='product_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_product_facets(apps, schema_editor):
+    from django.db.models import Count
+    from products.facets import COLOR_FIELD, product_facets
+    
+    Product = apps.get_model('products', 'Product')
+    ProductField = apps.get_model('products', 'ProductField')
+    ProductFacetValue = apps.get_model('products', 'ProductFacetValue')
+    ProductFacetCount = apps.get_model('products', 'ProductFacetCount')
+    
+    spec_fields = {COLOR_FIELD}
+    spec_fields.update(name.lower() for name in ProductField.objects.filter(is_filter=True).values_list('name', flat=True))
+    products = Product.objects.filter(is_approved=True, is_available=True).values(
+        'id', 'category_id', 'brand_id', 'specifications'
+    )
+    ProductFacetValue.objects.bulk_create(
+        (ProductFacetValue(product_id=product['id'], category_id=product['category_id'], field=field, value=value)
+         for product in products.iterator() for field, value in product_facets(product, spec_fields)),
+        batch_size=2000,
+    )
+    totals = ProductFacetValue.objects.values('category_id', 'field', 'value').annotate(total=Count('id'))
+    ProductFacetCount.objects.bulk_create(
+        (ProductFacetCount(category_id=row['category_id'], field=row['field'], value=row['value'], count=row['total'])
+         for row in totals.iterator()),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacetValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=100)),
+                ('value', models.CharField(max_length=255)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_values', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['category', 'field', 'value'], name='product_facet_value_idx')],
+                'unique_together': {('product', 'field', 'value')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=100)),
+                ('value', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='products.category')),
+            ],
+            options={
+                'unique_together': {('category', 'field', 'value')},
+            },
+        ),
+        migrations.RunPython(populate_product_facets, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
+import logging
 import uuid
 import os
 import json
@@ -12,6 +16,7 @@ from io import BytesIO
 from django.core.files.base import ContentFile
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 
 def product_image_path(instance, filename):
@@ -281,8 +286,26 @@ class Product(models.Model):
     is_best_seller = models.BooleanField(default=False)
     is_todays_deal = models.BooleanField(default=False)
     
+    # Denormalized listing data, maintained by products.signals (see products.stats)
+    effective_price = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True, editable=False,
+                                          help_text="Default variation price, or base price without variations")
+    min_price = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True, editable=False)
+    max_price = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True, editable=False)
+    primary_image_path = models.CharField(max_length=255, blank=True, default='', editable=False)
+    avg_rating = models.FloatField(default=0, editable=False)
+    approved_review_count = models.PositiveIntegerField(default=0, editable=False)
+    
+    # Weighted full-text document, maintained by products.signals (see products.search)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+            GinIndex(fields=['name'], name='product_name_trgm', opclasses=['gin_trgm_ops']),
+            # Keyset pagination order (see products.pagination)
+            models.Index(fields=['-created_at', '-id'], name='product_created_keyset'),
+        ]
     
     def __str__(self):
         return self.name
@@ -308,6 +331,10 @@ class Product(models.Model):
             while Product.objects.filter(default_sku=self.default_sku).exists():
                 self.default_sku = generate_sku()
         
+        # A new product has no variations yet, so all prices are the base price
+        if self.pk is None:
+            self.effective_price = self.min_price = self.max_price = self.base_price
+        
         super().save(*args, **kwargs)
     
     @property
@@ -328,26 +355,10 @@ class Product(models.Model):
         """Get all active variations."""
         return self.variations.filter(is_active=True)
     
-    @property
-    def min_price(self):
-        """Get the minimum price among all variations or base price."""
-        min_variation_price = self.variations.filter(is_active=True).order_by('price').values_list('price', flat=True).first()
-        return min_variation_price if min_variation_price else self.base_price
-    
-    @property
-    def max_price(self):
-        """Get the maximum price among all variations or base price."""
-        max_variation_price = self.variations.filter(is_active=True).order_by('-price').values_list('price', flat=True).first()
-        return max_variation_price if max_variation_price else self.base_price
-    
     @property
     def average_rating(self):
-        """Calculate the average rating for this product."""
-        from reviews.models import Review
-        reviews = Review.objects.filter(product=self, status='approved')
-        if reviews:
-            return sum(review.rating for review in reviews) / len(reviews)
-        return 0
+        """Average approved rating (maintained in avg_rating)."""
+        return self.avg_rating
     
     @average_rating.setter
     def average_rating(self, value):
@@ -358,9 +369,8 @@ class Product(models.Model):
     
     @property
     def total_reviews(self):
-        """Get the total number of reviews for this product."""
-        from reviews.models import Review
-        return Review.objects.filter(product=self, status='approved').count()
+        """Number of approved reviews (maintained in approved_review_count)."""
+        return self.approved_review_count
     
     @total_reviews.setter
     def total_reviews(self, value):
@@ -395,6 +405,20 @@ class Product(models.Model):
         return final_price
 
 
+def schedule_image_renditions(image_name):
+    """Generate standard renditions inline or, if configured, on a Celery worker."""
+    if getattr(settings, 'IMAGE_RENDITION_ASYNC', False):
+        from .tasks import generate_image_renditions_task
+        try:
+            generate_image_renditions_task.delay(image_name)
+            return
+        except Exception as e:
+            logger.error(f"Error queueing renditions for {image_name}: {str(e)}")
+
+    from .renditions import generate_image_renditions
+    generate_image_renditions(image_name)
+
+
 class ProductImage(models.Model):
     """Product image model."""
     
@@ -419,11 +443,132 @@ class ProductImage(models.Model):
         if self.is_primary:
             ProductImage.objects.filter(product=self.product, is_primary=True).update(is_primary=False)
         super().save(*args, **kwargs)
+        
+        # Pre-generate the standard thumbnail renditions once the row is committed
+        if self.image:
+            image_name = self.image.name
+            transaction.on_commit(lambda: schedule_image_renditions(image_name))
     
     def delete(self, *args, **kwargs):
-        # Delete the actual image file when the model instance is deleted
-        if self.image:
+        # Delete the actual image file when the model instance is deleted, unless
+        # other images share it (imported images are stored once per content hash)
+        shared = self.image and ProductImage.objects.filter(image=self.image.name).exclude(pk=self.pk).exists()
+        if self.image and not shared:
             storage = self.image.storage
             if storage.exists(self.image.name):
                 storage.delete(self.image.name)
+            
+            from .renditions import get_rendition_store
+            try:
+                get_rendition_store().delete_for(self.image.name)
+            except Exception as e:
+                logger.error(f"Error deleting renditions for {self.image.name}: {str(e)}")
         super().delete(*args, **kwargs)
+
+
+
+class ProductFacetValue(models.Model):
+    """One filterable (field, value) of an approved, available product, maintained by products.facets."""
+    
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='facet_values')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    field = models.CharField(max_length=100)
+    value = models.CharField(max_length=255)
+    
+    class Meta:
+        unique_together = ['product', 'field', 'value']
+        indexes = [
+            models.Index(fields=['category', 'field', 'value'], name='product_facet_value_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} {self.field}={self.value}"
+
+
+class ProductFacetCount(models.Model):
+    """Number of products per (category, field, value), aggregated from ProductFacetValue."""
+    
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='facet_counts')
+    field = models.CharField(max_length=100)
+    value = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['category', 'field', 'value']
+    
+    def __str__(self):
+        return f"{self.category_id} {self.field}={self.value}: {self.count}"
+
+
+class ImportJob(models.Model):
+    """A bulk product upload, imported in chunks by products.imports."""
+
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+
+    file = models.FileField(upload_to='product_imports/')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='import_jobs')
+    brand = models.ForeignKey(Brand, on_delete=models.SET_NULL, blank=True, null=True, related_name='+',
+                              help_text="Brand of every row; otherwise read from the brand column")
+    vendor = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='+',
+                               help_text="Vendor of rows without a known vendor_email")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True,
+                                   related_name='product_import_jobs')
+    auto_approve = models.BooleanField(default=False, help_text="Approve rows without an is_approved column")
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    error_message = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Import {self.id} ({self.get_status_display()})"
+
+    @property
+    def progress(self):
+        """Percentage of rows processed."""
+        if self.status == 'completed':
+            return 100.0
+        if not self.total_rows:
+            return 0.0
+        return round(min(self.processed_rows, self.total_rows) * 100.0 / self.total_rows, 1)
+
+    @property
+    def elapsed_seconds(self):
+        if not self.started_at:
+            return 0.0
+        return ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+
+    @property
+    def rows_per_second(self):
+        """Import throughput so far."""
+        elapsed = self.elapsed_seconds
+        return round(self.processed_rows / elapsed, 1) if elapsed > 0 else 0.0
+
+
+class ImportRowError(models.Model):
+    """A row of an ImportJob that could not be imported."""
+
+    job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, related_name='row_errors')
+    row = models.PositiveIntegerField(help_text="Spreadsheet row number, counting the header as row 1")
+    message = models.TextField()
+    data = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ['job', 'row']
+
+    def __str__(self):
+        return f"Import {self.job_id} row {self.row}: {self.message}"
@@ -1,8 +1,156 @@
-from rest_framework.pagination import PageNumberPagination
+"""
+Pagination shared by the product, order and analytics listings.
 
-class StandardResultsSetPagination(PageNumberPagination):
+Listings are page-number paginated by default. Passing ``?cursor=`` (empty
+for the first page) switches to keyset pagination over a composite index,
+e.g. ``(-created_at, -id)``: each page is an indexed range read, with no
+OFFSET scan and no COUNT(*). ``?count=`` picks how the total is reported:
+
+* ``exact`` - ``COUNT(*)``, the default in page-number mode;
+* ``approximate`` - the planner's estimate (``pg_class.reltuples`` for
+  unfiltered listings), falling back to ``COUNT(*)`` for small results;
+* ``none`` - no total, the default in cursor mode.
+"""
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+COUNT_EXACT = 'exact'
+COUNT_APPROXIMATE = 'approximate'
+COUNT_NONE = 'none'
+
+# Below this many estimated rows an exact COUNT(*) is cheap enough
+APPROXIMATE_COUNT_THRESHOLD = 10000
+
+
+def estimated_count(queryset):
+    """
+    Return PostgreSQL's row estimate for ``queryset``, or None if unavailable.
+
+    Unfiltered querysets read ``pg_class.reltuples`` (kept current by
+    autovacuum/ANALYZE); filtered ones use the planner's estimate from EXPLAIN.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    query = queryset.query
+    with connection.cursor() as cursor:
+        if not query.where and not query.distinct and not query.combinator:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)",
+                [connection.ops.quote_name(queryset.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+            # reltuples is -1 until the table has been vacuumed or analyzed
+            if row and row[0] is not None and row[0] >= 0:
+                return row[0]
+
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+def approximate_count(queryset):
+    """Estimated number of rows in ``queryset``, exact when the estimate is small."""
+    estimate = estimated_count(queryset)
+    if estimate is None or estimate < APPROXIMATE_COUNT_THRESHOLD:
+        return queryset.count()
+    return estimate
+
+
+class ApproximateCountPaginator(Paginator):
+    """Django paginator whose total comes from ``approximate_count``."""
+
+    @cached_property
+    def count(self):
+        return approximate_count(self.object_list)
+
+
+class KeysetCursorPagination(CursorPagination):
+    """CursorPagination that keeps its tie-breaking ordering unless ``?ordering=`` is given."""
+
+    def get_ordering(self, request, queryset, view):
+        if view is not None and request.query_params.get('ordering'):
+            return super().get_ordering(request, queryset, view)
+        return self.ordering
+
+
+class CursorPaginationMixin:
+    """
+    Opt-in keyset pagination for a PageNumberPagination subclass.
+
+    ``cursor_ordering`` must match a composite index on the model.
+    ``cursor_actions`` limits cursor mode to the given viewset actions, e.g.
+    to keep it off actions that order or cache their results differently.
+    """
+
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('-created_at', '-id')
+    cursor_actions = None
+    count_query_param = 'count'
+
+    def use_cursor(self, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            return False
+        return self.cursor_actions is None or getattr(view, 'action', None) in self.cursor_actions
+
+    def get_count_mode(self, request, default):
+        mode = request.query_params.get(self.count_query_param)
+        return mode if mode in (COUNT_EXACT, COUNT_APPROXIMATE, COUNT_NONE) else default
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if not self.use_cursor(request, view):
+            if self.get_count_mode(request, COUNT_EXACT) == COUNT_APPROXIMATE:
+                self.django_paginator_class = ApproximateCountPaginator
+            return super().paginate_queryset(queryset, request, view)
+
+        paginator = KeysetCursorPagination()
+        paginator.ordering = self.cursor_ordering
+        paginator.cursor_query_param = self.cursor_query_param
+        paginator.page_size = self.get_page_size(request)
+        self.cursor_paginator = paginator
+
+        count_mode = self.get_count_mode(request, COUNT_NONE)
+        if count_mode == COUNT_EXACT:
+            self.total_count = queryset.count()
+        elif count_mode == COUNT_APPROXIMATE:
+            self.total_count = approximate_count(queryset)
+        else:
+            self.total_count = None
+        return paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if getattr(self, 'cursor_paginator', None) is None:
+            return super().get_paginated_response(data)
+
+        payload = {}
+        if self.total_count is not None:
+            payload['count'] = self.total_count
+        payload['next'] = self.cursor_paginator.get_next_link()
+        payload['previous'] = self.cursor_paginator.get_previous_link()
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        if getattr(self, 'cursor_paginator', None) is None:
+            return super().get_paginated_response_schema(schema)
+        return self.cursor_paginator.get_paginated_response_schema(schema)
+
+
+class StandardResultsSetPagination(CursorPaginationMixin, PageNumberPagination):
     """Standard pagination for product listings."""
-    
+
     page_size = 10
     page_size_query_param = 'page_size'
-    max_page_size = 100 
\ No newline at end of file
+    max_page_size = 100
+    # Rails order by popularity or discount and are cached per page number
+    cursor_actions = ('list',)
@@ -0,0 +1,114 @@
+"""
+Versioned response cache for the homepage product rails.
+
+Rail payloads are cached in Django's cache under
+(catalog version, rail, page, page_size, category_slug). Catalog changes bump
+the version on commit (see products.signals), so every cached rail is
+invalidated at once without deleting keys; entries of old versions simply
+expire. Each entry carries a content ETag and the time it was built, so
+responses can be revalidated with 304s and shared by CDNs and browsers.
+
+With Redis (deployment/settings_aws.py) the version and the entries are
+shared by every worker. With the default LocMem cache each process has its
+own, and changes made in another process show up once entries expire after
+RAIL_CACHE_TIMEOUT.
+"""
+import hashlib
+import json
+import logging
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = 'products:catalog:version'
+
+
+def get_rail_timeout():
+    """Seconds a rail stays in the server-side cache."""
+    return getattr(settings, 'RAIL_CACHE_TIMEOUT', 600)
+
+
+def get_rail_max_age():
+    """Seconds browsers and CDNs may use a rail without revalidating."""
+    return getattr(settings, 'RAIL_CACHE_MAX_AGE', 60)
+
+
+def get_rail_stale_while_revalidate():
+    """Seconds a stale rail may still be served while it is revalidated in the background."""
+    return getattr(settings, 'RAIL_CACHE_STALE_WHILE_REVALIDATE', 300)
+
+
+def get_catalog_version():
+    """Return the current catalog version, initializing it if the cache is empty."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached rail."""
+    try:
+        cache.add(CATALOG_VERSION_KEY, 1, None)
+        return cache.incr(CATALOG_VERSION_KEY)
+    except Exception as e:
+        logger.error(f"Error bumping catalog version: {str(e)}")
+        return None
+
+
+def schedule_catalog_version_bump():
+    """Bump the catalog version once the current transaction commits."""
+    transaction.on_commit(bump_catalog_version)
+
+
+def rail_cache_key(rail, version, params):
+    query = urlencode(sorted((key, value) for key, value in params.items() if value not in (None, '')))
+    digest = hashlib.md5(query.encode()).hexdigest()
+    return f"products:rail:{version}:{rail}:{digest}"
+
+
+def get_rail(rail, params, build):
+    """
+    Return the cached entry for a rail, building it with ``build()`` on a miss.
+
+    The version is read before building, so data computed while a change
+    commits is stored under the old, already invalidated version.
+    """
+    key = rail_cache_key(rail, get_catalog_version(), params)
+    entry = cache.get(key)
+    if entry is None:
+        # Plain JSON types pickle compactly and hash deterministically
+        body = json.dumps(build(), cls=JSONEncoder, sort_keys=True)
+        entry = {
+            'data': json.loads(body),
+            'etag': quote_etag(hashlib.md5(body.encode()).hexdigest()),
+            'last_modified': int(time.time()),
+        }
+        cache.set(key, entry, get_rail_timeout())
+    return entry
+
+
+def rail_response(request, entry):
+    """Build a cacheable response for an entry, or a 304 if the client's copy is current."""
+    response = Response(entry['data'])
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    patch_cache_control(
+        response, public=True, max_age=get_rail_max_age(),
+        stale_while_revalidate=get_rail_stale_while_revalidate(),
+    )
+    # Staff and vendors get different rails, keep shared caches from mixing them up
+    patch_vary_headers(response, ['Authorization'])
+    return get_conditional_response(
+        request, etag=entry['etag'], last_modified=entry['last_modified'], response=response,
+    )
@@ -0,0 +1,308 @@
+"""
+Resized image renditions for product images.
+
+Renditions are keyed by (original path, width, format, original mtime) and are
+written once under ``MEDIA_ROOT/<IMAGE_RENDITION_DIR>/``. A bounded in-memory
+LRU keeps the hottest renditions in each worker so repeat hits never touch the
+disk, and per-process counters record hits, misses and generation time.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+# Formats we are willing to emit, mapped to their content types and extensions
+FORMATS = {
+    'JPEG': ('image/jpeg', 'jpg'),
+    'PNG': ('image/png', 'png'),
+    'WEBP': ('image/webp', 'webp'),
+    'GIF': ('image/gif', 'gif'),
+}
+
+EXTENSION_FORMATS = {
+    'jpg': 'JPEG',
+    'jpeg': 'JPEG',
+    'png': 'PNG',
+    'webp': 'WEBP',
+    'gif': 'GIF',
+}
+
+
+Rendition = namedtuple('Rendition', ['name', 'content_type', 'data'])
+
+
+def get_rendition_widths():
+    """Widths generated eagerly for every product image (thumbnail_small/medium)."""
+    return list(getattr(settings, 'IMAGE_RENDITION_WIDTHS', [300, 600]))
+
+
+def get_max_width():
+    """Largest width the middleware will render on request."""
+    return getattr(settings, 'IMAGE_RENDITION_MAX_WIDTH', 2000)
+
+
+def get_rendition_max_age():
+    """
+    Cache-Control max-age for served renditions.
+
+    Thumbnail URLs stay the same when an image is replaced, so clients
+    revalidate against the ETag after this many seconds.
+    """
+    return getattr(settings, 'IMAGE_RENDITION_MAX_AGE', 3600)
+
+
+def get_rendition_dir():
+    """Storage directory that holds generated renditions."""
+    return getattr(settings, 'IMAGE_RENDITION_DIR', 'renditions')
+
+
+def format_for_path(path, requested=None):
+    """Resolve the output format for a source path and an optional requested format."""
+    if requested:
+        requested = requested.upper()
+        if requested == 'JPG':
+            requested = 'JPEG'
+        if requested in FORMATS:
+            return requested
+    ext = os.path.splitext(path)[1].lstrip('.').lower()
+    return EXTENSION_FORMATS.get(ext, 'JPEG')
+
+
+def rendition_name(path, width, image_format, mtime):
+    """
+    Storage name of the rendition for a given key.
+
+    The original's mtime is part of the name, so replacing an image never
+    serves a stale rendition.
+    """
+    stem = os.path.splitext(path)[0]
+    ext = FORMATS[image_format][1]
+    return f"{get_rendition_dir()}/{stem}.w{int(width)}.{int(mtime)}.{ext}"
+
+
+def render(source, width, image_format):
+    """Resize an open image file to ``width`` and encode it as ``image_format``."""
+    img = Image.open(source)
+    img.load()
+
+    # Calculate new height maintaining aspect ratio
+    ratio = img.height / img.width
+    height = max(1, int(width * ratio))
+    resized_img = img.resize((width, height), Image.LANCZOS)
+
+    if image_format == 'JPEG' and resized_img.mode not in ('RGB', 'L'):
+        resized_img = resized_img.convert('RGB')
+
+    output = BytesIO()
+    if image_format == 'JPEG':
+        resized_img.save(output, format=image_format, quality=85, optimize=True)
+    elif image_format == 'WEBP':
+        resized_img.save(output, format=image_format, quality=85)
+    else:
+        resized_img.save(output, format=image_format)
+    return output.getvalue()
+
+
+class RenditionLRU:
+    """Thread-safe LRU of rendition bytes bounded by total size."""
+
+    def __init__(self, max_bytes, max_item_bytes):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.current_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = len(value.data)
+        if size > self.max_item_bytes or size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous.data)
+            self._items[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self.current_bytes -= len(evicted.data)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+
+class RenditionStore:
+    """Generates, persists and caches image renditions."""
+
+    def __init__(self, storage=None):
+        self.storage = storage or default_storage
+        self.memory = RenditionLRU(
+            max_bytes=getattr(settings, 'IMAGE_RENDITION_MEMORY_BYTES', 64 * 1024 * 1024),
+            max_item_bytes=getattr(settings, 'IMAGE_RENDITION_MEMORY_ITEM_BYTES', 512 * 1024),
+        )
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {
+                'memory_hits': 0,
+                'disk_hits': 0,
+                'misses': 0,
+                'errors': 0,
+                'generated': 0,
+                'generation_seconds': 0.0,
+            }
+
+    def _count(self, counter, amount=1):
+        with self._stats_lock:
+            self._stats[counter] += amount
+
+    def stats(self):
+        """Return a snapshot of this process's counters."""
+        with self._stats_lock:
+            data = dict(self._stats)
+        data['memory_items'] = len(self.memory)
+        data['memory_bytes'] = self.memory.current_bytes
+        generated = data['generated']
+        data['avg_generation_ms'] = (
+            round(data['generation_seconds'] * 1000 / generated, 2) if generated else 0.0
+        )
+        return data
+
+    def get(self, path, width, image_format=None):
+        """
+        Return ``(rendition, source)`` for an original image, generating it if needed.
+
+        ``source`` is one of ``'memory'``, ``'disk'`` or ``'generated'``. The
+        rendition's ``data`` is only populated when it came from (or was put in)
+        the in-memory LRU; otherwise callers should stream ``rendition.name``
+        from storage.
+        """
+        image_format = format_for_path(path, image_format)
+        mtime = self.storage.get_modified_time(path).timestamp()
+        name = rendition_name(path, width, image_format, mtime)
+        content_type = FORMATS[image_format][0]
+
+        cached = self.memory.get(name)
+        if cached is not None:
+            self._count('memory_hits')
+            return cached, 'memory'
+
+        if self.storage.exists(name):
+            self._count('disk_hits')
+            rendition = Rendition(name, content_type, None)
+            if self.storage.size(name) <= self.memory.max_item_bytes:
+                with self.storage.open(name, 'rb') as f:
+                    rendition = Rendition(name, content_type, f.read())
+                self.memory.set(name, rendition)
+            return rendition, 'disk'
+
+        self._count('misses')
+        rendition = self._generate(path, width, image_format, name, content_type)
+        self.memory.set(name, rendition)
+        return rendition, 'generated'
+
+    def _generate(self, path, width, image_format, name, content_type):
+        started = time.perf_counter()
+        try:
+            with self.storage.open(path, 'rb') as f:
+                data = render(f, width, image_format)
+        except Exception:
+            self._count('errors')
+            raise
+
+        # Another worker may have produced the same rendition meanwhile; the
+        # content is identical, so just keep whichever landed first.
+        if not self.storage.exists(name):
+            saved_name = self.storage.save(name, ContentFile(data))
+            if saved_name != name:
+                # Storage de-duplicated the name after a race, drop our copy
+                self.storage.delete(saved_name)
+
+        self._count('generated')
+        self._count('generation_seconds', time.perf_counter() - started)
+        return Rendition(name, content_type, data)
+
+    def generate_standard(self, path, widths=None, force=False):
+        """Eagerly create the standard renditions for an original; returns names created."""
+        created = []
+        image_format = format_for_path(path)
+        mtime = self.storage.get_modified_time(path).timestamp()
+        for width in widths or get_rendition_widths():
+            name = rendition_name(path, width, image_format, mtime)
+            if force and self.storage.exists(name):
+                self.storage.delete(name)
+            elif self.storage.exists(name):
+                continue
+            self._generate(path, width, image_format, name, FORMATS[image_format][0])
+            created.append(name)
+        return created
+
+    def delete_for(self, path):
+        """Remove every rendition (any width, format or mtime) of an original."""
+        directory, filename = os.path.split(path)
+        stem = os.path.splitext(filename)[0]
+        rendition_dir = f"{get_rendition_dir()}/{directory}" if directory else get_rendition_dir()
+        try:
+            _, files = self.storage.listdir(rendition_dir)
+        except (FileNotFoundError, NotImplementedError):
+            return 0
+
+        # Only <stem>.w<width>.<mtime>.<ext>, so "phone" leaves "phone.wide"'s renditions alone
+        pattern = re.compile(rf"{re.escape(stem)}\.w\d+\.\d+\.[^.]+")
+        deleted = 0
+        for rendition_file in files:
+            if pattern.fullmatch(rendition_file):
+                self.storage.delete(f"{rendition_dir}/{rendition_file}")
+                deleted += 1
+        return deleted
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_rendition_store():
+    """Return the process-wide rendition store."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RenditionStore()
+    return _store
+
+
+def generate_image_renditions(image_path):
+    """Generate the standard renditions for an image, logging rather than raising."""
+    try:
+        store = get_rendition_store()
+        if not store.storage.exists(image_path):
+            return []
+        return store.generate_standard(image_path)
+    except Exception as e:
+        logger.error(f"Error generating renditions for {image_path}: {str(e)}")
+        return []
@@ -0,0 +1,125 @@
+"""
+PostgreSQL full-text search over products.
+
+Every product carries a weighted ``search_vector`` (name and SKU > brand and
+category > specifications > description) backed by a GIN index, so matching
+and ranking happen in the database and only the requested page is loaded.
+A ``pg_trgm`` GIN index on ``name`` serves "did you mean" suggestions.
+"""
+import re
+from functools import reduce
+
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+)
+from django.db.models import (
+    Case, F, IntegerField, Min, OuterRef, Q, Subquery, TextField, Value, When, Window
+)
+from django.db.models.functions import Cast
+
+from .deferred import defer_for_ids
+
+# Text search configuration used for both documents and queries
+SEARCH_CONFIG = 'english'
+
+
+def product_search_vector(brand_model, category_model):
+    """
+    Build the weighted search vector expression for an UPDATE on products.
+
+    Models are passed in so data migrations can use historical models.
+    """
+    brand_name = Subquery(brand_model.objects.filter(pk=OuterRef('brand_id')).values('name')[:1])
+    category_name = Subquery(category_model.objects.filter(pk=OuterRef('category_id')).values('name')[:1])
+
+    return (
+        SearchVector('name', 'default_sku', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(brand_name, category_name, weight='B', config=SEARCH_CONFIG)
+        + SearchVector(Cast('specifications', TextField()), weight='C', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='D', config=SEARCH_CONFIG)
+    )
+
+
+def refresh_search_vectors(product_ids=None, **filters):
+    """
+    Recompute ``search_vector`` for the given products (all if None).
+
+    Extra keyword arguments filter the products instead, e.g. ``brand_id=3``
+    after a brand is renamed.
+    """
+    from .models import Brand, Category, Product
+
+    queryset = Product.objects.filter(**filters)
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        if not product_ids:
+            return 0
+        queryset = queryset.filter(id__in=product_ids)
+    return queryset.update(search_vector=product_search_vector(Brand, Category))
+
+
+def prefix_search_query(words):
+    """A query matching all ``words``, the last one as a prefix: ``galaxy & s2:*``."""
+    return SearchQuery(
+        ' & '.join(words[:-1] + [f'{words[-1]}:*']), search_type='raw', config=SEARCH_CONFIG,
+    )
+
+
+def search_products(queryset, term):
+    """
+    Filter ``queryset`` to products matching ``term`` and order them by relevance.
+
+    Exact name/SKU matches come first, then products by ``SearchRank``. All
+    keywords must match; if nothing does, the last keyword may be the start
+    of a word or SKU (for input typed so far, like "galax" or "PB-AB"), and
+    failing that any keyword is enough. The three levels are matched on the
+    search_vector index in one query, which keeps only the products of the
+    best level that matched. Returns the lazy queryset, annotated with
+    ``rank`` and ``exact_match``.
+    """
+    levels = [SearchQuery(term, search_type='websearch', config=SEARCH_CONFIG)]
+    words = re.findall(r'\w+', term)
+    if words:
+        levels.append(prefix_search_query(words))
+    keywords = term.split()
+    if len(keywords) > 1:
+        levels.append(reduce(
+            lambda left, right: left | right,
+            (SearchQuery(keyword, config=SEARCH_CONFIG) for keyword in keywords),
+        ))
+    query = reduce(lambda left, right: left | right, levels)
+
+    level = Case(
+        *(When(search_vector=level_query, then=Value(index)) for index, level_query in enumerate(levels[:-1])),
+        default=Value(len(levels) - 1), output_field=IntegerField(),
+    )
+    exact = Q(name__iexact=term) | Q(name__istartswith=term) | Q(default_sku__iexact=term)
+    return queryset.filter(search_vector=query).annotate(
+        match_level=level,
+        best_match_level=Window(Min(level)),
+    ).filter(match_level=F('best_match_level')).annotate(
+        rank=SearchRank(F('search_vector'), query),
+        exact_match=Case(When(exact, then=Value(1)), default=Value(0), output_field=IntegerField()),
+    ).order_by('-exact_match', '-rank', '-id')
+
+
+def did_you_mean(term, queryset):
+    """
+    Return the product name in ``queryset`` closest to ``term``, or None.
+
+    Both trigram lookups are served by the trigram index on ``name``; they
+    apply pg_trgm's ``similarity_threshold`` (0.3) and
+    ``word_similarity_threshold`` (0.6) respectively.
+    """
+    candidates = Q(name__trigram_similar=term) | Q(name__trigram_word_similar=term)
+    match = queryset.filter(candidates).annotate(
+        similarity=TrigramWordSimilarity(term, 'name')
+    ).order_by('-similarity', 'id').values_list('name', flat=True).first()
+    if match and match.lower() != term.lower():
+        return match
+    return None
+
+
+def schedule_search_vector_refresh(product_id):
+    """Queue a ``search_vector`` refresh for ``product_id`` when the transaction commits."""
+    defer_for_ids('search vector refresh', [product_id], refresh_search_vectors)
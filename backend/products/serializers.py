@@ -1,8 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Category, Brand, ProductField, Product, ProductImage, SKU, ProductVariation
+from .models import Category, Brand, ProductField, Product, ProductImage, SKU, ProductVariation, ImportJob, ImportRowError
 from users.serializers import UserSerializer
 from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.storage import default_storage
 import json
 from reviews.models import Review
 from reviews.serializers import ReviewSerializer
@@ -12,6 +14,17 @@ from emi.serializers import EMIPlanSerializer
 User = get_user_model()
 
 
+PRODUCT_PLACEHOLDER_IMAGE = '/static/images/product-placeholder.jpg'
+
+
+def build_media_url(path, request=None):
+    """Return the (absolute, when a request is available) URL of a stored media file."""
+    url = default_storage.url(path)
+    if request:
+        return request.build_absolute_uri(url)
+    return url
+
+
 class ProductMinimalSerializer(serializers.ModelSerializer):
     """Minimal serializer for Product model (used in analytics, reviews, etc.)."""
     
@@ -143,16 +156,15 @@ class ProductSerializer(serializers.ModelSerializer):
         return obj.vendor.email if obj.vendor else None
     
     def get_primary_image(self, obj):
-        primary_image = obj.images.filter(is_primary=True).first()
-        if primary_image:
+        if obj.primary_image_path:
             request = self.context.get('request')
             if request:
-                return request.build_absolute_uri(primary_image.image.url)
+                return build_media_url(obj.primary_image_path, request)
             
             # Fallback to constructing URL manually
             domain = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost:8000'
             protocol = 'https' if not settings.DEBUG else 'http'
-            return f"{protocol}://{domain}{primary_image.image.url}"
+            return f"{protocol}://{domain}{build_media_url(obj.primary_image_path)}"
         return None
 
 
@@ -162,8 +174,8 @@ class ProductListSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     brand_name = serializers.CharField(source='brand.name', read_only=True)
     primary_image = serializers.SerializerMethodField()
-    average_rating = serializers.FloatField(read_only=True, default=0)
-    review_count = serializers.IntegerField(read_only=True, default=0)
+    average_rating = serializers.FloatField(source='avg_rating', read_only=True, default=0)
+    review_count = serializers.IntegerField(source='approved_review_count', read_only=True, default=0)
     price = serializers.SerializerMethodField()
     
     # --- NEW: EMI fields so that checkout can calculate EMI details correctly ---
@@ -181,39 +193,19 @@ class ProductListSerializer(serializers.ModelSerializer):
     
     def get_price(self, obj):
         """Get the current price - either from default variation or base price."""
-        try:
-            # Check if product has variations
-            default_variation = obj.variations.filter(is_default=True, is_active=True).first()
-            if default_variation:
-                return float(default_variation.price)
-            return float(obj.base_price)
-        except Exception as e:
-            print(f"Error getting price for product {obj.id}: {str(e)}")
-            return float(obj.base_price)
+        # effective_price is kept in sync with the default variation by products.signals
+        if obj.effective_price is not None:
+            return float(obj.effective_price)
+        return float(obj.base_price)
     
     def get_primary_image(self, obj):
         """Get the primary image for a product."""
-        try:
-            primary_image = obj.images.filter(is_primary=True).first()
-            if primary_image:
-                request = self.context.get('request')
-                if request:
-                    return request.build_absolute_uri(primary_image.image.url)
-                return primary_image.image.url
-            
-            # If no primary image, try to get the first image
-            first_image = obj.images.first()
-            if first_image:
-                request = self.context.get('request')
-                if request:
-                    return request.build_absolute_uri(first_image.image.url)
-                return first_image.image.url
-            
-            # Default placeholder image
-            return '/static/images/product-placeholder.jpg'
-        except Exception as e:
-            print(f"Error getting primary image for product {obj.id}: {str(e)}")
-            return '/static/images/product-placeholder.jpg'
+        # primary_image_path is the primary image, or the first image if none is primary
+        if obj.primary_image_path:
+            return build_media_url(obj.primary_image_path, self.context.get('request'))
+        
+        # Default placeholder image
+        return PRODUCT_PLACEHOLDER_IMAGE
 
 
 class ProductVariationSerializer(serializers.ModelSerializer):
@@ -239,9 +231,10 @@ class ProductDetailSerializer(serializers.ModelSerializer):
     brand = BrandSerializer(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
     reviews = serializers.SerializerMethodField()
+    review_summary = serializers.SerializerMethodField()
     skus = SKUSerializer(many=True, read_only=True)
-    average_rating = serializers.FloatField(read_only=True, default=0)
-    total_reviews = serializers.IntegerField(read_only=True, default=0)
+    average_rating = serializers.FloatField(source='avg_rating', read_only=True, default=0)
+    total_reviews = serializers.IntegerField(source='approved_review_count', read_only=True, default=0)
     specifications_display = serializers.SerializerMethodField()
     variations = ProductVariationSerializer(many=True, read_only=True)
     price = serializers.SerializerMethodField()
@@ -253,22 +246,16 @@ class ProductDetailSerializer(serializers.ModelSerializer):
             'base_price', 'sale_price', 'price', 'default_sku', 'emi_available',
             'stock_quantity', 'is_available', 'specifications',
             'specifications_display', 'created_at', 'updated_at',
-            'images', 'reviews', 'skus', 'average_rating', 'total_reviews',
+            'images', 'reviews', 'review_summary', 'skus', 'average_rating', 'total_reviews',
             'is_trending', 'is_special_offer', 'is_best_seller', 'is_todays_deal',
             'variations'
         ]
     
     def get_price(self, obj):
         """Get the current price - either from default variation or base price."""
-        try:
-            # Check if product has variations
-            default_variation = obj.variations.filter(is_default=True, is_active=True).first()
-            if default_variation:
-                return float(default_variation.price)
-            return float(obj.base_price)
-        except Exception as e:
-            print(f"Error getting price for product {obj.id}: {str(e)}")
-            return float(obj.base_price)
+        if obj.effective_price is not None:
+            return float(obj.effective_price)
+        return float(obj.base_price)
     
     def get_specifications_display(self, obj):
         """Get specifications with labels and metadata."""
@@ -307,17 +294,36 @@ class ProductDetailSerializer(serializers.ModelSerializer):
             return {}
     
     def get_reviews(self, obj):
-        """Get approved reviews for the product."""
+        """Get the first page of approved reviews; later pages come from the reviews endpoint."""
         try:
             from reviews.models import Review
             from reviews.serializers import ReviewSerializer
+            from reviews.views import ReviewPagination
+            from reviews.votes import user_votes
             
-            reviews = Review.objects.filter(product=obj, status='approved')
-            serializer = ReviewSerializer(reviews, many=True, context=self.context)
+            reviews = list(Review.objects.filter(product=obj, status='approved').select_related(
+                'user', 'product'
+            ).prefetch_related('replies__user')[:ReviewPagination.page_size])
+            request = self.context.get('request')
+            context = {
+                **self.context,
+                'user_votes': user_votes(request.user if request else None, [review.id for review in reviews]),
+            }
+            serializer = ReviewSerializer(reviews, many=True, context=context)
             return serializer.data
         except Exception as e:
             print(f"Error getting reviews for product {obj.id}: {str(e)}")
             return []
+    
+    def get_review_summary(self, obj):
+        """Totals and rating histogram of approved reviews (see reviews.stats)."""
+        from reviews.stats import review_summary
+        
+        try:
+            stats = obj.review_stats
+        except ObjectDoesNotExist:
+            stats = None
+        return review_summary(stats)
 
 
 class ProductCreateUpdateSerializer(serializers.ModelSerializer):
@@ -614,4 +620,36 @@ class ProductCreateUpdateSerializer(serializers.ModelSerializer):
             for sku_data in skus_data:
                 SKU.objects.create(product=instance, **sku_data)
         
-        return instance 
\ No newline at end of file
+        return instance 
+
+
+class ImportRowErrorSerializer(serializers.ModelSerializer):
+    """Serializer for rows of a bulk import that failed."""
+    
+    class Meta:
+        model = ImportRowError
+        fields = ['row', 'message', 'data']
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    """Status of a bulk product import."""
+    
+    progress = serializers.FloatField(read_only=True)
+    rows_per_second = serializers.FloatField(read_only=True)
+    elapsed_seconds = serializers.FloatField(read_only=True)
+    errors = serializers.SerializerMethodField()
+    
+    # Failed rows included inline; the rest are listed by the errors action
+    ERROR_PREVIEW_LIMIT = 50
+    
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'status', 'category', 'brand', 'total_rows', 'processed_rows', 'created_count',
+            'error_count', 'progress', 'rows_per_second', 'elapsed_seconds', 'error_message',
+            'errors', 'created_at', 'started_at', 'finished_at',
+        ]
+        read_only_fields = fields
+    
+    def get_errors(self, obj):
+        return ImportRowErrorSerializer(obj.row_errors.all()[:self.ERROR_PREVIEW_LIMIT], many=True).data
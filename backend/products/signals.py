@@ -0,0 +1,112 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from reviews.models import Review
+from .models import Brand, Category, Product, ProductFacetValue, ProductField, ProductVariation, ProductImage
+from .autocomplete import schedule_autocomplete_rebuild, schedule_autocomplete_update
+from .facets import schedule_facet_rebuild, schedule_facet_recount, schedule_facet_refresh
+from .rail_cache import schedule_catalog_version_bump
+from .search import refresh_search_vectors, schedule_search_vector_refresh
+from .stats import schedule_product_stats_refresh
+
+
+@receiver(post_save, sender=Product)
+def refresh_stats_on_product_save(sender, instance, created, **kwargs):
+    """Base price changes feed effective/min/max price when there are no variations."""
+    if not created:
+        schedule_product_stats_refresh(instance.pk)
+
+
+@receiver(post_save, sender=ProductVariation)
+@receiver(post_delete, sender=ProductVariation)
+def refresh_stats_on_variation_change(sender, instance, **kwargs):
+    """Keep price columns in sync with variations."""
+    schedule_product_stats_refresh(instance.product_id)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def refresh_stats_on_image_change(sender, instance, **kwargs):
+    """Keep primary_image_path in sync with product images."""
+    schedule_product_stats_refresh(instance.product_id)
+
+
+@receiver(post_save, sender=Product)
+def refresh_search_vector_on_product_save(sender, instance, **kwargs):
+    """Keep search_vector in sync with name, SKU, specifications and description."""
+    schedule_search_vector_refresh(instance.pk)
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Category)
+def refresh_search_vectors_on_rename(sender, instance, created, **kwargs):
+    """Brand and category names are part of every product's search vector."""
+    if created:
+        return
+    field = 'brand_id' if sender is Brand else 'category_id'
+    transaction.on_commit(lambda: refresh_search_vectors(**{field: instance.pk}))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def update_autocomplete_on_product_change(sender, instance, **kwargs):
+    """Reload the product's suggestion in this process's autocomplete index."""
+    schedule_autocomplete_update(instance.pk)
+
+
+@receiver(post_save, sender=ProductVariation)
+@receiver(post_delete, sender=ProductVariation)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def update_autocomplete_on_listing_change(sender, instance, **kwargs):
+    """Suggestions show price and image; the stats refresh runs first at commit (see products.deferred)."""
+    schedule_autocomplete_update(instance.product_id)
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def rebuild_autocomplete_on_taxonomy_change(sender, instance, **kwargs):
+    """Brand and category names appear in many suggestions."""
+    schedule_autocomplete_rebuild()
+
+
+@receiver(post_save, sender=Product)
+def refresh_facets_on_product_save(sender, instance, **kwargs):
+    """Keep filter_options facets in sync with brand, category, specifications and visibility."""
+    schedule_facet_refresh(instance.pk)
+
+
+@receiver(pre_delete, sender=Product)
+def recount_facets_on_product_delete(sender, instance, **kwargs):
+    """Facet rows cascade away with the product, so remember which counts they fed."""
+    schedule_facet_recount(
+        ProductFacetValue.objects.filter(product_id=instance.pk).values_list('category_id', 'field', 'value')
+    )
+
+
+@receiver(post_save, sender=ProductField)
+@receiver(post_delete, sender=ProductField)
+def rebuild_facets_on_field_change(sender, instance, **kwargs):
+    """Filter fields decide which specifications are indexed."""
+    schedule_facet_rebuild()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductVariation)
+@receiver(post_delete, sender=ProductVariation)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(m2m_changed, sender=Product.emi_plans.through)
+def invalidate_rails_on_catalog_change(sender, **kwargs):
+    """Everything rendered in a homepage rail; connected last so denormalized columns refresh first."""
+    if kwargs.get('action', '').startswith('pre_'):
+        return
+    schedule_catalog_version_bump()
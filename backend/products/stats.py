@@ -0,0 +1,57 @@
+"""
+Denormalized listing columns on Product.
+
+``effective_price``, ``min_price``, ``max_price`` and ``primary_image_path``
+are derived from variations and images. They are recomputed set-based with
+a single UPDATE ... SET col = (subquery) so list serializers can read them
+without touching related tables. ``avg_rating`` and
+``approved_review_count`` are copied from the product's review stats row
+(see reviews/stats.py).
+"""
+from django.db.models import CharField, DecimalField, F, Max, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .deferred import FIRST, defer_for_ids
+
+
+def product_stats_expressions(variation_model, image_model):
+    """
+    Build the UPDATE expressions for the denormalized columns.
+
+    Models are passed in so data migrations can use historical models.
+    """
+    active_variations = variation_model.objects.filter(product=OuterRef('pk'), is_active=True)
+    price_field = DecimalField(max_digits=12, decimal_places=2)
+
+    default_price = active_variations.filter(is_default=True).order_by('-updated_at').values('price')[:1]
+    min_price = active_variations.order_by().values('product').annotate(value=Min('price')).values('value')[:1]
+    max_price = active_variations.order_by().values('product').annotate(value=Max('price')).values('value')[:1]
+    primary_image = image_model.objects.filter(product=OuterRef('pk')).order_by(
+        '-is_primary', 'display_order', 'id'
+    ).values('image')[:1]
+
+    return {
+        'effective_price': Coalesce(Subquery(default_price, output_field=price_field), F('base_price')),
+        'min_price': Coalesce(Subquery(min_price, output_field=price_field), F('base_price')),
+        'max_price': Coalesce(Subquery(max_price, output_field=price_field), F('base_price')),
+        'primary_image_path': Coalesce(Subquery(primary_image), Value(''), output_field=CharField()),
+    }
+
+
+def refresh_product_stats(product_ids=None):
+    """Recompute the denormalized columns for the given products (all if None)."""
+    from .models import Product, ProductVariation, ProductImage
+
+    queryset = Product.objects.all()
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        if not product_ids:
+            return 0
+        queryset = queryset.filter(id__in=product_ids)
+    return queryset.update(**product_stats_expressions(ProductVariation, ProductImage))
+
+
+def schedule_product_stats_refresh(product_id):
+    """Refresh ``product_id`` when the current transaction commits, batched with other saves (see products.deferred)."""
+    # First, since autocomplete and rails read these columns
+    defer_for_ids('product stats refresh', [product_id], refresh_product_stats, stage=FIRST)
@@ -72,4 +72,31 @@ def check_empty_brands():
     if empty_brands:
         logger.info(f"Empty brands found: {', '.join(empty_brands)}")
     
-    return f"Found {len(empty_brands)} empty brands" 
\ No newline at end of file
+    return f"Found {len(empty_brands)} empty brands" 
+
+
+@shared_task
+def generate_image_renditions_task(image_path):
+    """Generate the standard thumbnail renditions for a product image."""
+    from .renditions import generate_image_renditions
+    
+    created = generate_image_renditions(image_path)
+    return f"Generated {len(created)} renditions for {image_path}"
+
+
+@shared_task
+def rebuild_product_facets_task():
+    """Rebuild the filter_options facet index from scratch."""
+    from .facets import rebuild_product_facets
+    
+    created = rebuild_product_facets()
+    return f"Rebuilt {created} product facet values"
+
+
+@shared_task
+def run_import_job_task(job_id):
+    """Import a bulk product upload in chunks."""
+    from .imports import run_import_job
+    
+    run_import_job(job_id)
+    return f"Finished import job {job_id}"
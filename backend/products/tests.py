@@ -1,3 +1,745 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from analytics.models import SearchQuery
+from reviews.models import Review
+from . import autocomplete, facets
+from .pagination import estimated_count
+from .renditions import RenditionStore
+from .image_fetcher import ImageFetcher
+from .imports import allocate_slugs, create_import_job, run_import_job
+from .models import Category, Brand, ImportJob, Product, ProductField, ProductVariation, ProductImage
+
+User = get_user_model()
+
+
+class ProductListQueryCountTest(TestCase):
+    """List endpoints read denormalized columns, so query counts don't grow with page size."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user(email='vendor@example.com', password='pass')
+        cls.category = Category.objects.create(name='Phones', slug='phones')
+        cls.brand = Brand.objects.create(name='Acme', slug='acme')
+        reviewers = [
+            User.objects.create_user(email=f'reviewer{i}@example.com', password='pass')
+            for i in range(2)
+        ]
+
+        # Denormalized columns are refreshed in on_commit callbacks
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.create_catalog(reviewers)
+
+    @classmethod
+    def create_catalog(cls, reviewers):
+        for i in range(30):
+            product = Product.objects.create(
+                name=f'Phone {i}', slug=f'phone-{i}', category=cls.category, brand=cls.brand,
+                description='A phone', base_price=Decimal('1000.00'), vendor=cls.vendor,
+                is_approved=True, is_trending=True, is_special_offer=True,
+            )
+            ProductVariation.objects.create(product=product, name='4GB', price=Decimal('900.00'))
+            ProductVariation.objects.create(product=product, name='8GB', price=Decimal('1200.00'), is_default=True)
+            ProductImage.objects.create(product=product, image=f'product_images/{i}/a.jpg', display_order=1)
+            ProductImage.objects.create(product=product, image=f'product_images/{i}/b.jpg', is_primary=True)
+            for rating, reviewer in zip((4, 5), reviewers):
+                Review.objects.create(product=product, user=reviewer, rating=rating, title='t',
+                                      comment='c', status='approved')
+
+    def test_catalog_writes_share_one_commit_callback(self):
+        product = Product.objects.get(slug='phone-0')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            product.base_price = Decimal('800.00')
+            product.save()
+            for variation in ProductVariation.objects.filter(product=product):
+                variation.price = Decimal('700.00')
+                variation.save()
+        # one batched refresh; the rest are rail version bumps
+        self.assertEqual(len([callback for callback in callbacks if callback.__module__ == 'products.deferred']), 1)
+        product.refresh_from_db()
+        self.assertEqual((product.min_price, product.max_price), (Decimal('700.00'), Decimal('700.00')))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response
+
+    def test_denormalized_columns_are_maintained(self):
+        product = Product.objects.get(slug='phone-0')
+        self.assertEqual(product.effective_price, Decimal('1200.00'))
+        self.assertEqual(product.min_price, Decimal('900.00'))
+        self.assertEqual(product.max_price, Decimal('1200.00'))
+        self.assertEqual(product.primary_image_path, 'product_images/0/b.jpg')
+        self.assertEqual(product.approved_review_count, 2)
+        self.assertEqual(product.avg_rating, 4.5)
+
+    def test_list_serializer_uses_columns(self):
+        _, response = self.count_queries('/api/products/products/?page_size=1')
+        item = response.data['results'][0]
+        self.assertEqual(item['price'], 1200.0)
+        self.assertEqual(item['average_rating'], 4.5)
+        self.assertEqual(item['review_count'], 2)
+        self.assertTrue(item['primary_image'].endswith('/b.jpg'))
+
+    def test_list_endpoints_have_constant_query_count(self):
+        for endpoint in ['/api/products/products/', '/api/products/products/trending/',
+                         '/api/products/products/special_offers/']:
+            small, _ = self.count_queries(f'{endpoint}?page_size=5')
+            large, _ = self.count_queries(f'{endpoint}?page_size=30')
+            self.assertEqual(small, large, endpoint)
+
+
+class AdvancedSearchTest(TestCase):
+    """advanced_search ranks on the maintained search_vector and suggests via trigrams."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create_user(email='vendor@example.com', password='pass')
+        phones = Category.objects.create(name='Phones', slug='phones')
+        cases = Category.objects.create(name='Cases', slug='cases')
+        cls.brand = Brand.objects.create(name='Samsung', slug='samsung')
+
+        # search_vector is refreshed in on_commit callbacks
+        with cls.captureOnCommitCallbacks(execute=True):
+            for slug, name, category, description in [
+                ('galaxy-s24', 'Galaxy S24', phones, 'Flagship phone with a great camera'),
+                ('galaxy-a15', 'Galaxy A15', phones, 'Budget phone'),
+                ('s24-cover', 'Rugged Cover', cases, 'Protective case for the Galaxy S24'),
+            ]:
+                Product.objects.create(
+                    name=name, slug=slug, category=category, brand=cls.brand, description=description,
+                    base_price=Decimal('100.00'), vendor=vendor, is_approved=True,
+                    specifications={'chipset': 'Exynos 2400'} if slug == 'galaxy-s24' else {},
+                )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def search(self, **params):
+        response = self.client.get('/api/products/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ranks_name_matches_above_description_matches(self):
+        data = self.search(q='galaxy s24')
+        self.assertEqual([item['slug'] for item in data['results']], ['galaxy-s24', 's24-cover'])
+        self.assertEqual(data['count'], 2)
+        self.assertIsNone(data['did_you_mean'])
+
+    def test_matches_brand_category_and_specifications(self):
+        self.assertEqual(self.search(q='samsung')['count'], 3)
+        self.assertEqual(self.search(q='cases')['count'], 1)
+        self.assertEqual(self.search(q='exynos')['results'][0]['slug'], 'galaxy-s24')
+
+    def test_matches_partial_keywords(self):
+        self.assertEqual(self.search(q='galax')['count'], 3)
+        self.assertEqual([item['slug'] for item in self.search(q='galaxy s2')['results']], ['galaxy-s24', 's24-cover'])
+        self.assertEqual(self.search(q='exyn')['results'][0]['slug'], 'galaxy-s24')
+        sku = Product.objects.get(slug='galaxy-a15').default_sku
+        self.assertEqual([item['slug'] for item in self.search(q=sku[:-2])['results']], ['galaxy-a15'])
+
+    def test_paginates_in_sql(self):
+        data = self.search(q='samsung', page=2, page_size=2)
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(len(data['results']), 1)
+
+    def test_brand_rename_refreshes_vectors(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.brand.name = 'Samsung Electronics'
+            self.brand.save()
+        self.assertEqual(self.search(q='electronics')['count'], 3)
+
+    def test_did_you_mean(self):
+        data = self.search(q='galxy')
+        self.assertEqual(data['count'], 0)
+        self.assertIn(data['did_you_mean'], ['Galaxy S24', 'Galaxy A15'])
+
+
+class AutocompleteIndexTest(TestCase):
+    """Autocomplete is served from the in-memory prefix index without queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user(email='vendor@example.com', password='pass')
+        cls.category = Category.objects.create(name='Phones', slug='phones')
+        cls.brand = Brand.objects.create(name='Samsung', slug='samsung')
+        for slug, name in [('galaxy-s24', 'Galaxy S24'), ('galaxy-a15', 'Galaxy A15'),
+                           ('redmi-note', 'Redmi Note 13')]:
+            Product.objects.create(
+                name=name, slug=slug, category=cls.category, brand=cls.brand, description='A phone',
+                base_price=Decimal('100.00'), vendor=cls.vendor, is_approved=True,
+            )
+        for _ in range(3):
+            SearchQuery.objects.create(query='Galaxy A15', session_id='s')
+
+    def setUp(self):
+        autocomplete._index = None
+        self.client = APIClient()
+        autocomplete.get_autocomplete_index().rebuild()
+
+    def suggest(self, query, limit=5):
+        response = self.client.get('/api/products/autocomplete/', {'q': query, 'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        return response.data['suggestions']
+
+    def test_lookup_needs_no_queries(self):
+        with self.assertNumQueries(0):
+            autocomplete.get_autocomplete_index().lookup('gal')
+
+    def test_matches_word_prefixes_ranked_by_popularity(self):
+        names = [item['name'] for item in self.suggest('gal')]
+        self.assertEqual(names, ['Galaxy A15', 'Galaxy S24'])
+        self.assertEqual([item['name'] for item in self.suggest('note')], ['Redmi Note 13'])
+        self.assertEqual([item['name'] for item in self.suggest('samsung gal', limit=1)], ['Galaxy A15'])
+
+    def test_includes_brands_and_categories(self):
+        types = {item['type'] for item in self.suggest('sams')}
+        self.assertIn('brand', types)
+        self.assertEqual(self.suggest('phon')[0]['type'], 'category')
+
+    def test_product_changes_update_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                name='Pixel 9', slug='pixel-9', category=self.category, brand=self.brand,
+                description='A phone', base_price=Decimal('700.00'), vendor=self.vendor, is_approved=True,
+            )
+        self.assertEqual(self.suggest('pix')[0]['price'], 700.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'Pixel 9 Pro'
+            product.save()
+        self.assertEqual([item['name'] for item in self.suggest('pixel')], ['Pixel 9 Pro'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertEqual(self.suggest('pix'), [])
+
+    def test_other_processes_replay_product_changes(self):
+        other = autocomplete.AutocompleteIndex()
+        other.rebuild()
+        base = other.base
+        product = Product.objects.get(slug='redmi-note')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'Redmi Note 14'
+            product.save()
+
+        # Only the changed product is reloaded, the base index is kept
+        with self.assertNumQueries(1):
+            other.sync()
+        self.assertIs(other.base, base)
+        self.assertEqual(other.version, autocomplete.get_autocomplete_index().version)
+        self.assertEqual([item['name'] for item in other.lookup('redmi')], ['Redmi Note 14'])
+
+    def test_taxonomy_changes_rebuild_other_processes(self):
+        other = autocomplete.AutocompleteIndex()
+        other.rebuild()
+        base = other.base
+        with self.captureOnCommitCallbacks(execute=True), \
+                mock.patch.object(autocomplete.AutocompleteIndex, 'rebuild_in_background'):
+            self.brand.name = 'Samsung Mobile'
+            self.brand.save()
+
+        other.sync()
+        self.assertIsNot(other.base, base)
+        self.assertIn('Samsung Mobile', [item['name'] for item in other.lookup('samsung mob')])
+
+    def test_cold_lookup_builds_in_background(self):
+        index = autocomplete.AutocompleteIndex()
+        with mock.patch.object(index, 'rebuild_in_background') as rebuild, self.assertNumQueries(0):
+            self.assertEqual(index.lookup('gal'), [])
+        rebuild.assert_called_once_with()
+
+
+class FacetIndexTest(TestCase):
+    """filter_options reads the facet index and supports drill-down counts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user(email='vendor@example.com', password='pass')
+        cls.category = Category.objects.create(name='Phones', slug='phones')
+        cls.samsung = Brand.objects.create(name='Samsung', slug='samsung')
+        cls.apple = Brand.objects.create(name='Apple', slug='apple')
+
+        with cls.captureOnCommitCallbacks(execute=True):
+            ProductField.objects.create(category=cls.category, name='Storage', field_type='select', is_filter=True)
+            for i, (brand, color, storage) in enumerate([
+                (cls.samsung, 'Black', '128GB'), (cls.samsung, ['Black', 'Blue'], '256GB'),
+                (cls.apple, 'Black', '128GB'), (cls.apple, 'White', '256GB'),
+            ]):
+                Product.objects.create(
+                    name=f'Phone {i}', slug=f'phone-{i}', category=cls.category, brand=brand,
+                    description='A phone', base_price=Decimal('100.00') * (i + 1), vendor=cls.vendor,
+                    is_approved=True, specifications={'color': color, 'storage': storage},
+                )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def options(self, **params):
+        response = self.client.get('/api/products/filter-options/', {'category_slug': 'phones', **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_options_from_index(self):
+        data = self.options()
+        self.assertEqual(data['colors'], ['Black', 'Blue', 'White'])
+        self.assertEqual(data['custom_filters'], {'Storage': ['128GB', '256GB']})
+        self.assertEqual({brand['slug']: brand['count'] for brand in data['brands']}, {'samsung': 2, 'apple': 2})
+        self.assertEqual(data['facet_counts']['color'], {'Black': 3, 'Blue': 1, 'White': 1})
+
+    def test_drilldown_counts(self):
+        data = self.options(brand__slug='samsung', specifications__storage__in='256GB')
+        counts = data['facet_counts']
+        self.assertEqual(counts['color'], {'Black': 1, 'Blue': 1})
+        # A field's own filter is ignored for its counts, so siblings stay selectable
+        self.assertEqual(counts['storage'], {'128GB': 1, '256GB': 1})
+        self.assertEqual(counts['brand'], {str(self.samsung.id): 1, str(self.apple.id): 1})
+        # Option lists don't shrink under filters
+        self.assertEqual(data['colors'], ['Black', 'Blue', 'White'])
+
+    def test_query_count_does_not_grow_with_catalog(self):
+        with CaptureQueriesContext(connection) as small:
+            self.options(brand__slug='samsung')
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(20):
+                Product.objects.create(
+                    name=f'Extra {i}', slug=f'extra-{i}', category=self.category, brand=self.apple,
+                    description='A phone', base_price=Decimal('100.00'), vendor=self.vendor,
+                    is_approved=True, specifications={'color': f'Color {i}', 'storage': '64GB'},
+                )
+        with CaptureQueriesContext(connection) as large:
+            self.options(brand__slug='samsung')
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_incremental_updates_match_rebuild(self):
+        product = Product.objects.get(slug='phone-3')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.specifications = {'color': 'Green', 'storage': '512GB'}
+            product.save()
+            Product.objects.get(slug='phone-0').delete()
+        incremental = facets.facet_counts([self.category.id])
+        self.assertEqual(incremental['color'], {'Black': 2, 'Blue': 1, 'Green': 1})
+
+        facets.rebuild_product_facets()
+        self.assertEqual(facets.facet_counts([self.category.id]), incremental)
+
+
+class RailCacheTest(TestCase):
+    """Homepage rails are served from the versioned cache and support conditional requests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create_user(email='vendor@example.com', password='pass')
+        category = Category.objects.create(name='Phones', slug='phones')
+        brand = Brand.objects.create(name='Acme', slug='acme')
+        cls.product = Product.objects.create(
+            name='Phone', slug='phone', category=category, brand=brand, description='A phone',
+            base_price=Decimal('100.00'), vendor=vendor, is_approved=True, is_trending=True,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_repeat_requests_hit_the_cache(self):
+        first = self.client.get('/api/products/products/trending/?page_size=5')
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('public', first['Cache-Control'])
+        self.assertIn('max-age=', first['Cache-Control'])
+        self.assertIn('stale-while-revalidate=', first['Cache-Control'])
+        self.assertTrue(first.has_header('Last-Modified'))
+
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/products/products/trending/?page_size=5')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_conditional_request_returns_304(self):
+        first = self.client.get('/api/products/products/trending/')
+        response = self.client.get('/api/products/products/trending/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+
+        response = self.client.get('/api/products/products/trending/',
+                                   HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_rails_are_cached_per_origin_and_count_mode(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=self.product, image='product_images/phone.jpg', is_primary=True)
+        plain = self.client.get('/api/products/products/trending/')
+        secure = self.client.get('/api/products/products/trending/', secure=True, HTTP_HOST='shop.example.com')
+        self.assertTrue(plain.json()['results'][0]['primary_image'].startswith('http://testserver/'))
+        self.assertTrue(secure.json()['results'][0]['primary_image'].startswith('https://shop.example.com/'))
+
+        # The approximate count is not served from the exact count's entry
+        self.client.get('/api/products/products/trending/', {'count': 'exact'})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/products/products/trending/', {'count': 'approximate'})
+        self.assertTrue(queries.captured_queries)
+
+    def test_catalog_change_invalidates_rails(self):
+        first = self.client.get('/api/products/products/trending/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Renamed phone'
+            self.product.save()
+
+        response = self.client.get('/api/products/products/trending/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.data['results'][0]['name'], 'Renamed phone')
+
+
+class CursorPaginationTest(TestCase):
+    """``?cursor=`` pages product listings by (-created_at, -id) without counting."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create_user(email='vendor@example.com', password='pass')
+        category = Category.objects.create(name='Phones', slug='phones')
+        brand = Brand.objects.create(name='Acme', slug='acme')
+        for i in range(25):
+            Product.objects.create(
+                name=f'Phone {i}', slug=f'phone-{i}', category=category, brand=brand, description='A phone',
+                base_price=Decimal('100.00'), vendor=vendor, is_approved=True,
+            )
+        # Ties on created_at must be broken by id
+        Product.objects.filter(id__in=Product.objects.order_by('id').values('id')[:12]).update(
+            created_at=Product.objects.order_by('id').first().created_at
+        )
+        cls.expected = list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_walks_every_product_once(self):
+        seen = []
+        url = '/api/products/products/?cursor=&page_size=10'
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            self.assertFalse(any('COUNT(' in query['sql'] for query in context.captured_queries))
+            seen.extend(product['id'] for product in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, self.expected)
+
+    def test_count_modes(self):
+        response = self.client.get('/api/products/products/?cursor=&count=exact')
+        self.assertEqual(response.data['count'], 25)
+        # Small results fall back to an exact count
+        response = self.client.get('/api/products/products/?cursor=&count=approximate')
+        self.assertEqual(response.data['count'], 25)
+        response = self.client.get('/api/products/products/?page=2&count=approximate')
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_estimated_count(self):
+        self.assertIsInstance(estimated_count(Product.objects.all()), int)
+        self.assertIsInstance(estimated_count(Product.objects.filter(name__startswith='Phone 1')), int)
+
+
+class ImportJobTest(TestCase):
+    """Bulk uploads are imported in chunks with set-based lookups and report their progress."""
+
+    HEADER = ('name,description,price,stock_quantity,brand,vendor_email,is_approved,'
+              'variation1_name,variation1_price,variation1_is_default,Storage *\n')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create_user(email='vendor@example.com', password='pass', role='vendor')
+        cls.category = Category.objects.create(name='Phones', slug='phones')
+        cls.brand = Brand.objects.create(name='Acme', slug='acme')
+        ProductField.objects.create(category=cls.category, name='Storage', field_type='text', is_required=True)
+        Product.objects.create(name='Phone', slug='phone', category=cls.category, brand=cls.brand,
+                               description='Existing', base_price=Decimal('10.00'), vendor=cls.vendor)
+
+    def setUp(self):
+        # Uploaded files are stored under MEDIA_ROOT
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def csv_file(self, rows):
+        lines = [f'Phone,Imported,{100 + i},5,{brand},,true,Base,{200 + i},true,{i}GB\n'
+                 for i, brand in enumerate(rows)]
+        return SimpleUploadedFile('products.csv', (self.HEADER + ''.join(lines)).encode())
+
+    def test_upload_runs_job_and_reports_status(self):
+        client = APIClient()
+        client.force_authenticate(self.vendor)
+        content = self.HEADER + (
+            'Phone,Imported,100,5,Acme,,true,Base,250,true,64GB\n'
+            'Phone,Imported,120,5,Newco,,true,,,,128GB\n'
+            'No price,Imported,,5,Acme,,true,,,,64GB\n'
+            'No storage,Imported,100,5,Acme,,true,,,,\n'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/products/bulk-upload/process/', {
+                'category_id': self.category.id,
+                'file': SimpleUploadedFile('products.csv', content.encode()),
+            })
+        self.assertEqual(response.status_code, 202)
+
+        status = client.get(response.data['status_url']).data
+        self.assertEqual(status['status'], 'completed')
+        self.assertEqual((status['total_rows'], status['processed_rows']), (4, 4))
+        self.assertEqual((status['created_count'], status['error_count']), (2, 2))
+        self.assertEqual(status['progress'], 100.0)
+        self.assertEqual([error['row'] for error in status['errors']], [4, 5])
+        self.assertIn('price', status['errors'][0]['message'])
+        self.assertIn('Storage', status['errors'][1]['message'])
+
+        imported = Product.objects.filter(description='Imported').order_by('id')
+        self.assertEqual([product.slug for product in imported], ['phone-1', 'phone-2'])
+        self.assertEqual(imported[1].brand.name, 'Newco')
+        self.assertEqual(imported[0].vendor, self.vendor)
+        self.assertEqual(imported[0].specifications, {'Storage': '64GB'})
+        # Denormalized columns are refreshed for bulk-inserted rows
+        self.assertEqual(imported[0].effective_price, Decimal('250.00'))
+        self.assertTrue(imported[0].default_sku)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def run(rows):
+            job = create_import_job(self.csv_file(rows), self.category, schedule=False, vendor=self.vendor)
+            with CaptureQueriesContext(connection) as context:
+                run_import_job(job.id, chunk_size=100)
+            job.refresh_from_db()
+            self.assertEqual(job.created_count, len(rows))
+            return len(context.captured_queries)
+
+        self.assertEqual(run(['Acme'] * 5), run(['Acme'] * 50))
+
+    def test_allocate_slugs_skips_taken_suffixes(self):
+        for slug in ('phone-1', 'phone-case', 'phone-x-2'):
+            Product.objects.create(name=slug, slug=slug, category=self.category, brand=self.brand,
+                                   description='Existing', base_price=Decimal('10.00'), vendor=self.vendor)
+        with self.assertNumQueries(1):
+            slugs = allocate_slugs(Product, ['Phone', 'Phone', 'Phone Case', 'Phone X'])
+        self.assertEqual(slugs, ['phone-2', 'phone-3', 'phone-case-1', 'phone-x'])
+
+    def test_missing_columns_are_rejected_up_front(self):
+        client = APIClient()
+        client.force_authenticate(self.vendor)
+        response = client.post('/api/products/bulk-upload/process/', {
+            'category_id': self.category.id,
+            'file': SimpleUploadedFile('products.csv', b'description,stock_quantity\nA phone,5\n'),
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('name', response.data['error'])
+        self.assertFalse(ImportJob.objects.exists())
+
+
+class StandInImageServer(ThreadingHTTPServer):
+    """Local HTTP server standing in for image hosts; records requests and concurrency."""
+
+    daemon_threads = True
+
+    def __init__(self, delay=0):
+        buffer = io.BytesIO()
+        Image.new('RGB', (4, 4), 'red').save(buffer, format='PNG')
+        self.png = buffer.getvalue()
+        self.delay = delay
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        super().__init__(('127.0.0.1', 0), StandInImageHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server_address[1]}{path}'
+
+
+class StandInImageHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            attempt = server.requests.count(self.path)
+        try:
+            time.sleep(server.delay)
+            if self.path == '/missing.png' or (self.path == '/flaky.png' and attempt == 1):
+                self.send_response(404 if self.path == '/missing.png' else 503)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(server.png)))
+            self.end_headers()
+            self.wfile.write(server.png)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RenditionStoreTest(TestCase):
+    """Renditions are generated once, served from memory or disk after that, and removed with their original."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_RENDITION_WIDTHS=[100, 200])
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def original(self, name, image_format='JPEG'):
+        output = io.BytesIO()
+        Image.new('RGB', (400, 200), 'red').save(output, format=image_format)
+        return default_storage.save(f'product_images/1/{name}', ContentFile(output.getvalue()))
+
+    def renditions(self):
+        try:
+            return sorted(default_storage.listdir('renditions/product_images/1')[1])
+        except FileNotFoundError:
+            return []
+
+    def test_generates_then_serves_from_memory_and_disk(self):
+        path = self.original('phone.jpg')
+        store = RenditionStore()
+        rendition, source = store.get(path, 150)
+        self.assertEqual(source, 'generated')
+        self.assertEqual(Image.open(io.BytesIO(rendition.data)).size, (150, 75))
+        self.assertEqual(store.get(path, 150)[1], 'memory')
+        self.assertEqual(RenditionStore().get(path, 150)[1], 'disk')
+        self.assertEqual(store.get(path, 150, 'webp')[0].content_type, 'image/webp')
+        self.assertEqual((store.stats()['memory_hits'], store.stats()['generated']), (1, 2))
+
+    def test_delete_only_removes_renditions_of_that_original(self):
+        store = RenditionStore()
+        paths = [self.original('phone.jpg'), self.original('phone.wide.jpg'), self.original('phone.white.png', 'PNG')]
+        for path in paths:
+            store.generate_standard(path)
+        self.assertEqual(len(self.renditions()), 6)
+
+        self.assertEqual(store.delete_for(paths[0]), 2)
+        remaining = self.renditions()
+        self.assertEqual(len(remaining), 4)
+        self.assertTrue(all(name.startswith(('phone.wide.', 'phone.white.')) for name in remaining))
+
+    def test_backfill_command(self):
+        self.original('phone.jpg')
+        self.original('case.png', 'PNG')
+        output = io.StringIO()
+        call_command('generate_image_renditions', workers=2, stdout=output)
+        self.assertIn('Created 4 renditions for 2 images', output.getvalue())
+        self.assertEqual(len(self.renditions()), 4)
+
+        call_command('generate_image_renditions', widths='100', stdout=output)
+        self.assertIn('Created 0 renditions for 2 images', output.getvalue())
+
+    def test_middleware_revalidates_with_etag(self):
+        path = self.original('phone.jpg')
+        url = f'/media/{path}?size=small&width=100'
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertNotIn('immutable', first['Cache-Control'])
+        self.assertTrue(first.has_header('ETag'))
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        # Replacing the original keeps the URL but changes the ETag
+        source = default_storage.path(path)
+        os.utime(source, (time.time() + 60, time.time() + 60))
+        replaced = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(replaced.status_code, 200)
+        self.assertNotEqual(replaced['ETag'], first['ETag'])
+
+
+class ImageFetcherTest(TestCase):
+    """Image URLs are downloaded concurrently, once per URL and once per content."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def serve(self, delay=0):
+        server = StandInImageServer(delay)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_dedupes_retries_and_reports(self):
+        server = self.serve()
+        fetcher = ImageFetcher(backoff=0)
+        urls = [server.url(path) for path in ('/a.png', '/a.png', '/b.png', '/flaky.png', '/missing.png')]
+        results = fetcher.fetch_all(urls)
+
+        self.assertEqual(server.requests.count('/a.png'), 1)
+        a, b = results[server.url('/a.png')], results[server.url('/b.png')]
+        self.assertTrue(a.ok)
+        self.assertEqual(a.name, b.name)  # Same bytes, stored once
+        self.assertTrue(a.reused or b.reused)
+        self.assertEqual(results[server.url('/flaky.png')].attempts, 2)
+        self.assertTrue(results[server.url('/flaky.png')].ok)
+        missing = results[server.url('/missing.png')]
+        self.assertEqual((missing.ok, missing.attempts, missing.error), (False, 1, 'HTTP 404'))
+        self.assertGreater(a.elapsed, 0)
+
+    def test_limits_concurrency_per_host(self):
+        server = self.serve(delay=0.1)
+        fetcher = ImageFetcher(max_workers=8, per_host=2, backoff=0)
+        fetcher.fetch_all(server.url(f'/{i}.png') for i in range(8))
+        self.assertEqual(len(server.requests), 8)
+        self.assertEqual(server.max_in_flight, 2)
+
+    def test_import_attaches_images(self):
+        server = self.serve()
+        vendor = User.objects.create_user(email='vendor@example.com', password='pass', role='vendor')
+        category = Category.objects.create(name='Phones', slug='phones')
+        Brand.objects.create(name='Acme', slug='acme')
+        content = 'name,price,brand,image1_path,image1_is_primary,image2_path\n' + ''.join(
+            f'Phone {i},100,Acme,{server.url("/a.png")},true,{server.url("/missing.png")}\n' for i in range(3)
+        )
+        job = create_import_job(SimpleUploadedFile('products.csv', content.encode()), category,
+                                schedule=False, vendor=vendor)
+        run_import_job(job.id)
+
+        self.assertEqual(server.requests.count('/a.png'), 1)
+        images = ProductImage.objects.filter(product__category=category)
+        self.assertEqual(images.count(), 3)
+        self.assertEqual(len({image.image.name for image in images}), 1)
+        for product in Product.objects.filter(category=category):
+            self.assertEqual(product.primary_image_path, images[0].image.name)
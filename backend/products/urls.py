@@ -9,7 +9,7 @@ from .views import (
     ProductViewSet, SKUViewSet,
     advanced_search, autocomplete
 )
-from .bulk_upload import BulkUploadTemplateView, BulkUploadProcessView
+from .bulk_upload import BulkUploadTemplateView, BulkUploadProcessView, ImportJobViewSet
 
 app_name = 'products'
 
@@ -19,6 +19,7 @@ router.register('brands', BrandViewSet)
 router.register('fields', ProductFieldViewSet)
 router.register('products', ProductViewSet, basename='product')
 router.register('skus', SKUViewSet, basename='sku')
+router.register('import-jobs', ImportJobViewSet, basename='import-job')
 
 # Create a filter options view without custom permissions
 filter_options_view = ProductViewSet.as_view({'get': 'filter_options'})
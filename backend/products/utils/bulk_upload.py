@@ -1,20 +1,10 @@
 import csv
 import io
 import pandas as pd
-import numpy as np
 import openpyxl
-import requests
-import os
-import time
-from urllib.parse import urlparse
-from django.core.files import File
-from django.core.files.temp import NamedTemporaryFile
 from typing import Dict, List, Any, Tuple
-from django.db import transaction
-from django.contrib.auth import get_user_model
-from django.utils.text import slugify
 
-from products.models import Product, Category, Brand, ProductField, ProductVariation, ProductImage
+from products.models import Category, ProductField, ProductImage
 
 
 def _parse_boolean(value):
@@ -53,163 +43,36 @@ def validate_required_fields(data: Dict[str, Any], category: Category) -> Tuple[
 
 def is_url(path):
     """Check if a path is a URL."""
-    try:
-        result = urlparse(path)
-        return all([result.scheme, result.netloc])
-    except:
-        return False
+    from products.image_fetcher import is_url as _is_url
+    return _is_url(path)
 
 
 def save_image_from_path(product, image_path, is_primary=False, display_order=0):
-    """Save an image from a path or URL to a ProductImage instance."""
+    """
+    Save an image from a path or URL to a ProductImage instance.
+    
+    Uses products.image_fetcher, so downloads are retried with backoff and
+    identical content is stored once. Batches should call
+    ``ImageFetcher.fetch_all`` directly to download concurrently.
+    """
     if not image_path:
         print("No image path provided")
         return None
-        
-    try:
-        if is_url(image_path):
-            # Handle URL
-            print(f"Attempting to save image from URL: {image_path}")
-            
-            # Create a temporary file
-            img_temp = NamedTemporaryFile(delete=True)
-            
-            # Add retry logic for better reliability
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    # Increased timeout for slow servers
-                    response = requests.get(image_path, stream=True, timeout=30)
-                    
-                    if response.ok:
-                        break
-                    else:
-                        print(f"Attempt {attempt+1}/{max_retries}: Failed to download, status: {response.status_code}")
-                        if attempt == max_retries - 1:
-                            print(f"Failed to download image from URL after {max_retries} attempts: {image_path}")
-                            return None
-                        time.sleep(1)  # Wait before retrying
-                except Exception as e:
-                    print(f"Attempt {attempt+1}/{max_retries}: Download error: {str(e)}")
-                    if attempt == max_retries - 1:
-                        print(f"Failed to download image from URL after {max_retries} attempts: {str(e)}")
-                        return None
-                    time.sleep(1)  # Wait before retrying
-            
-            # Write the image to a temporary file
-            total_size = 0
-            try:
-                for block in response.iter_content(1024 * 8):
-                    if not block:
-                        break
-                    img_temp.write(block)
-                    total_size += len(block)
-                
-                img_temp.flush()
-                print(f"Downloaded image data: {total_size} bytes")
-                
-                if total_size == 0:
-                    print(f"Error: Downloaded image has zero bytes")
-                    return None
-            except Exception as e:
-                print(f"Error writing image data to temp file: {str(e)}")
-                return None
-            
-            # Create the product image
-            image = ProductImage.objects.create(
-                product=product,
-                is_primary=is_primary,
-                display_order=display_order
-            )
-            
-            # Get the filename from the URL or generate one
-            filename = os.path.basename(urlparse(image_path).path)
-            if not filename or len(filename) < 4:
-                # Get extension from content-type
-                content_type = response.headers.get('content-type', '')
-                ext = 'jpg'  # Default extension
-                if 'png' in content_type:
-                    ext = 'png'
-                elif 'gif' in content_type:
-                    ext = 'gif'
-                elif 'webp' in content_type:
-                    ext = 'webp'
-                    
-                filename = f"image_{product.id}_{display_order}.{ext}"
-            
-            # Save the image file
-            try:
-                image.image.save(filename, File(img_temp))
-                print(f"Successfully saved image from URL: {image_path}")
-                return image
-            except Exception as e:
-                print(f"Error saving image file: {str(e)}")
-                return None
-            finally:
-                img_temp.close()
-            
-        else:
-            # For local file paths, try to handle both Windows and Unix paths
-            # and convert to absolute paths if needed
-            
-            # Try to normalize the path
-            normalized_path = os.path.normpath(image_path)
-            
-            # Check if file exists directly
-            if os.path.exists(normalized_path):
-                file_path = normalized_path
-            else:
-                # Try common media locations
-                from django.conf import settings
-                media_root = getattr(settings, 'MEDIA_ROOT', '')
-                base_dir = os.path.dirname(os.path.dirname(os.path.abspath(settings.__file__)))
-                
-                # List of possible paths to try
-                possible_paths = [
-                    normalized_path,
-                    os.path.join(media_root, normalized_path),
-                    os.path.join(base_dir, normalized_path),
-                    os.path.join(base_dir, 'media', normalized_path),
-                    # For Docker container paths
-                    os.path.join('/app/media', os.path.basename(normalized_path)),
-                ]
-                
-                # Try each path
-                file_path = None
-                for path in possible_paths:
-                    if os.path.exists(path):
-                        file_path = path
-                        break
-                
-                if not file_path:
-                    print(f"Could not find image file: {image_path}")
-                    print(f"Tried paths: {possible_paths}")
-                    return None
-            
-            # Create the product image
-            image = ProductImage.objects.create(
-                product=product,
-                is_primary=is_primary,
-                display_order=display_order
-            )
-            
-            # Get the filename
-            filename = os.path.basename(file_path)
-            
-            # Open and save the file
-            try:
-                with open(file_path, 'rb') as f:
-                    image.image.save(filename, File(f))
-                    
-                print(f"Successfully saved image from file: {file_path}")
-                return image
-            except Exception as e:
-                print(f"Error saving image from file: {str(e)}")
-                return None
-            
-    except Exception as e:
-        print(f"Error in save_image_from_path: {str(e)}")
+    
+    from products.image_fetcher import ImageFetcher
+    
+    result = ImageFetcher(max_workers=1).fetch(image_path)
+    
+    if not result.ok:
+        print(f"Could not save image {image_path}: {result.error}")
         return None
+    
+    return ProductImage.objects.create(
+        product=product,
+        image=result.name,
+        is_primary=is_primary,
+        display_order=display_order
+    )
 
 
 def generate_upload_template(category_id: int, file_format: str = 'csv') -> io.BytesIO:
@@ -366,219 +229,20 @@ def generate_upload_template(category_id: int, file_format: str = 'csv') -> io.B
 
 
 def process_upload_file(file, category_id: int, vendor_id: int) -> List[Dict[str, Any]]:
-    """Process an uploaded file and create products."""
-    User = get_user_model()
-    category = Category.objects.get(id=category_id)
-    
-    # Read file based on extension
-    file_extension = file.name.split('.')[-1].lower()
-    
-    if file_extension == 'csv':
-        df = pd.read_csv(file, encoding='utf-8-sig')
-    elif file_extension in ['xlsx', 'xls']:
-        df = pd.read_excel(file)
-    else:
-        raise ValueError(f"Unsupported file format: {file_extension}")
-    
-    # Replace NaN values with None
-    df = df.replace({np.nan: None})
-    
-    # Get all field names for this category
-    product_fields = ProductField.objects.filter(category=category)
-    field_map = {field.name: field for field in product_fields}
+    """
+    Import an uploaded file synchronously and return per-row results.
     
-    # Clean column names (remove * from required fields)
-    df.columns = [col.split(' *')[0] if ' *' in col else col for col in df.columns]
+    Runs the chunked pipeline of products.imports in the calling thread and
+    keeps the ImportJob for reference. API uploads run it in the background
+    instead (see BulkUploadProcessView).
+    """
+    from products.imports import create_import_job, run_import_job
     
-    # Process each row
-    results = []
-    for index, row in df.iterrows():
-        row_data = row.to_dict()
-        
-        # Validate required fields
-        is_valid, missing_fields = validate_required_fields(row_data, category)
-        
-        if not is_valid:
-            results.append({
-                'row': index + 2,  # +2 for Excel row number (1-based + header)
-                'status': 'error',
-                'errors': f"Missing required fields: {', '.join(missing_fields)}",
-                'data': row_data
-            })
-            continue
-        
-        try:
-            # Use a transaction for each row
-            with transaction.atomic():
-                # Process basic product fields
-                brand_name = row_data.get('brand')
-                brand, _ = Brand.objects.get_or_create(name=brand_name) if brand_name else (None, False)
-                
-                # Handle vendor
-                vendor = None
-                vendor_email = row_data.get('vendor_email')
-                if vendor_email:
-                    try:
-                        user = User.objects.get(email=vendor_email)
-                        vendor_id = user.id  # Use the found user's ID
-                    except User.DoesNotExist:
-                        pass  # Keep using the provided vendor_id
-                
-                # Generate slug
-                product_name = row_data.get('name')
-                slug = slugify(product_name)
-                
-                # Ensure slug uniqueness
-                base_slug = slug
-                counter = 1
-                while Product.objects.filter(slug=slug).exists():
-                    slug = f"{base_slug}-{counter}"
-                    counter += 1
-                
-                # Extract basic product fields
-                basic_fields = {
-                    'name': product_name,
-                    'slug': slug,  # Add the generated slug
-                    'description': row_data.get('description', ''),
-                    'base_price': row_data.get('price'),
-                    'sale_price': row_data.get('sale_price'),
-                    'stock_quantity': row_data.get('stock_quantity', 0),
-                    'category': category,
-                    'brand': brand,
-                    'vendor_id': vendor_id,  # Use the vendor_id directly
-                    'is_available': _parse_boolean(row_data.get('is_available', 'True')),
-                    'is_approved': _parse_boolean(row_data.get('is_approved', 'False')),
-                    'emi_available': _parse_boolean(row_data.get('emi_available', 'False')),
-                    
-                    # Promotional fields
-                    'is_trending': _parse_boolean(row_data.get('is_trending', 'False')),
-                    'is_special_offer': _parse_boolean(row_data.get('is_special_offer', 'False')),
-                    'is_best_seller': _parse_boolean(row_data.get('is_best_seller', 'False')),
-                    'is_todays_deal': _parse_boolean(row_data.get('is_todays_deal', 'False')),
-                }
-                
-                # Create product
-                product = Product.objects.create(**basic_fields)
-                
-                # Add EMI plans if specified
-                emi_plan_ids = row_data.get('emi_plan_ids', '').strip()
-                if emi_plan_ids:
-                    try:
-                        plan_ids = [int(id.strip()) for id in emi_plan_ids.split(',')]
-                        product.emi_plans.set(plan_ids)
-                    except (ValueError, TypeError):
-                        pass  # Invalid EMI plan IDs, skip them
-                
-                # Process dynamic fields
-                specs = {}
-                for field_name, field in field_map.items():
-                    if field_name in row_data and row_data[field_name] is not None:
-                        value = row_data[field_name]
-                        
-                        # Convert types based on field type
-                        if field.field_type == 'boolean':
-                            value = _parse_boolean(value)
-                        elif field.field_type == 'multi_select' and isinstance(value, str):
-                            value = [item.strip() for item in value.split(',')]
-                        
-                        # Add to specifications
-                        specs[field.name] = value
-                
-                # Save specifications
-                product.specifications = specs
-                product.save()
-                
-                # Process product variations
-                for i in range(1, 4):  # Handle up to 3 variations
-                    var_name = row_data.get(f'variation{i}_name')
-                    if var_name:
-                        try:
-                            var_price = float(row_data.get(f'variation{i}_price', 0))
-                            var_stock = int(row_data.get(f'variation{i}_stock', 0))
-                            var_is_default = _parse_boolean(row_data.get(f'variation{i}_is_default', 'False'))
-                            var_is_active = _parse_boolean(row_data.get(f'variation{i}_is_active', 'True'))
-                            
-                            # Create variation
-                            ProductVariation.objects.create(
-                                product=product,
-                                name=var_name,
-                                price=var_price,
-                                stock_quantity=var_stock,
-                                is_default=var_is_default,
-                                is_active=var_is_active
-                            )
-                        except (ValueError, TypeError):
-                            # Skip invalid variations
-                            pass
-                
-                # Process product images
-                for i in range(1, 4):  # Handle up to 3 images
-                    img_path = row_data.get(f'image{i}_path')
-                    if img_path:
-                        try:
-                            img_is_primary = _parse_boolean(row_data.get(f'image{i}_is_primary', 'False'))
-                            
-                            # Try multiple approaches to save the image
-                            image = None
-                            
-                            # 1. Try direct URL or file path
-                            image = save_image_from_path(
-                                product=product,
-                                image_path=img_path,
-                                is_primary=img_is_primary,
-                                display_order=i
-                            )
-                            
-                            # 2. If that fails, try treating it as a relative path in the media directory
-                            if not image:
-                                from django.conf import settings
-                                media_root = getattr(settings, 'MEDIA_ROOT', '')
-                                relative_path = img_path.replace('\\', '/').lstrip('/')
-                                full_path = os.path.join(media_root, relative_path)
-                                
-                                if os.path.exists(full_path):
-                                    image = ProductImage.objects.create(
-                                        product=product,
-                                        is_primary=img_is_primary,
-                                        display_order=i
-                                    )
-                                    with open(full_path, 'rb') as f:
-                                        filename = os.path.basename(full_path)
-                                        image.image.save(filename, File(f))
-                            
-                            # 3. For Docker deployment, try container path
-                            if not image:
-                                docker_path = f"/app/media/{os.path.basename(img_path)}"
-                                if os.path.exists(docker_path):
-                                    image = ProductImage.objects.create(
-                                        product=product,
-                                        is_primary=img_is_primary,
-                                        display_order=i
-                                    )
-                                    with open(docker_path, 'rb') as f:
-                                        filename = os.path.basename(docker_path)
-                                        image.image.save(filename, File(f))
-                        except Exception as e:
-                            # Log image error but continue processing
-                            print(f"Error processing image {img_path}: {str(e)}")
-                            continue
-                
-                # Add success result
-                results.append({
-                    'row': index + 2,
-                    'status': 'success',
-                    'product_id': product.id,
-                    'product_name': product.name
-                })
-                
-        except Exception as e:
-            # Add error result
-            results.append({
-                'row': index + 2,
-                'status': 'error',
-                'errors': str(e),
-                'data': row_data
-            })
-            continue
+    category = Category.objects.get(id=category_id)
+    job = create_import_job(file, category, schedule=False, vendor_id=vendor_id)
+    results = run_import_job(job.id, collect_results=True)
     
-    return results 
\ No newline at end of file
+    job.refresh_from_db()
+    if job.status == 'failed':
+        raise ValueError(job.error_message)
+    return results
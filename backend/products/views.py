@@ -3,7 +3,7 @@ from rest_framework import viewsets, generics, permissions, status, filters
 from rest_framework.response import Response
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from django.db.models import Avg, Count, Q, ProtectedError, Case, When, Value, IntegerField, F
+from django.db.models import ProtectedError, Case, When, Value, IntegerField, F
 from django.shortcuts import get_object_or_404
 from django.utils.text import slugify
 import pandas as pd
@@ -12,11 +12,9 @@ from django.http import Http404
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db import models
 from django.http import HttpResponse
-from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
-from fuzzywuzzy import process
 from urllib.parse import quote
 
-from .models import Category, Brand, ProductField, Product, ProductImage, SKU, ProductVariation
+from .models import Category, Brand, ProductField, Product, ProductImage, SKU
 from .serializers import (
     CategorySerializer, BrandSerializer, ProductFieldSerializer,
     ProductListSerializer, ProductDetailSerializer, ProductCreateUpdateSerializer,
@@ -26,7 +24,13 @@ from users.permissions import IsVendorOwnerOrAdmin, IsUserOwnerOrAdmin, IsApprov
 from reviews.models import Review
 from reviews.serializers import ReviewSerializer
 from .filters import ProductFilter
+from .imports import create_import_job
 from .pagination import StandardResultsSetPagination
+from .autocomplete import get_autocomplete_index
+from .bulk_upload import import_job_response
+from .facets import BRAND_FIELD, COLOR_FIELD, active_filters, drilldown_facet_counts, facet_counts
+from .rail_cache import get_rail, rail_response
+from .search import search_products, did_you_mean as find_did_you_mean
 
 
 class CategoryViewSet(viewsets.ModelViewSet):
@@ -213,19 +217,16 @@ class ProductViewSet(viewsets.ModelViewSet):
         """Return appropriate queryset."""
         queryset = Product.objects.all()
         
-        # Always prefetch related fields for better performance
-        queryset = queryset.prefetch_related(
-            'images', 
-            'emi_plans',
-            'variations',  # Explicitly prefetch variations
-            'skus'
-        ).select_related('category', 'brand', 'vendor')
-        
-        # Annotate with review statistics
-        queryset = queryset.annotate(
-            avg_review_rating=Avg('product_reviews__rating'),
-            review_count=Count('product_reviews', filter=Q(product_reviews__status='approved'))
-        )
+        # Always prefetch related fields for better performance. Prices, primary
+        # image and review statistics are denormalized onto Product (see
+        # products.stats), so list actions don't need variations/images/reviews.
+        queryset = queryset.prefetch_related('emi_plans').select_related('category', 'brand', 'vendor')
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(
+                'images',
+                'variations',  # Explicitly prefetch variations
+                'skus'
+            ).select_related('review_stats')
         
         # Filter by category_slug (special case handling)
         category_slug = self.request.query_params.get('category_slug')
@@ -322,16 +323,16 @@ class ProductViewSet(viewsets.ModelViewSet):
         # Get the serialized data
         data = serializer.data
         
-        # Add variations data explicitly
-        variations = ProductVariation.objects.filter(product=instance, is_active=True)
+        # Add variations data explicitly (from the prefetched variations)
+        variations = [variation for variation in instance.variations.all() if variation.is_active]
         variations_serializer = ProductVariationSerializer(variations, many=True)
         data['variations'] = variations_serializer.data
-        data['has_variations'] = bool(variations.exists())
+        data['has_variations'] = bool(variations)
         
         # Add min and max prices if variations exist
-        if variations.exists():
-            data['min_price'] = variations.order_by('price').first().price
-            data['max_price'] = variations.order_by('-price').first().price
+        if variations:
+            data['min_price'] = instance.min_price
+            data['max_price'] = instance.max_price
         
         # Add EMI plans data if EMI is available for this product
         if instance.emi_available:
@@ -402,7 +403,7 @@ class ProductViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['post'], parser_classes=[MultiPartParser, FormParser])
     def bulk_upload(self, request):
-        """Bulk upload products via CSV or Excel file."""
+        """Start a background bulk upload of products from a CSV or Excel file."""
         try:
             # Check if file is provided
             if 'file' not in request.FILES:
@@ -430,92 +431,25 @@ class ProductViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Read file data
-            if filename.endswith('.csv'):
-                df = pd.read_csv(file)
-            else:  # Excel file
-                df = pd.read_excel(file)
-            
-            # Validate required columns
-            required_columns = ['name', 'description', 'base_price', 'stock_quantity']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            
-            if missing_columns:
-                return Response(
-                    {'error': f'Missing required columns: {", ".join(missing_columns)}'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
             # Verify category and brand exist
             category = get_object_or_404(Category, id=category_id)
             brand = get_object_or_404(Brand, id=brand_id)
             
-            # Process the data and create products
-            created_count = 0
-            errors = []
-            
-            for index, row in df.iterrows():
-                try:
-                    # Prepare product data
-                    product_data = {
-                        'name': row['name'],
-                        'description': row['description'],
-                        'base_price': float(row['base_price']),
-                        'stock_quantity': int(row['stock_quantity']),
-                        'category': category,
-                        'brand': brand,
-                        'vendor': request.user,
-                        'is_available': True,
-                        'is_approved': request.user.is_staff  # Auto-approve if admin
-                    }
-                    
-                    # Handle optional fields
-                    if 'sale_price' in df.columns and not pd.isna(row['sale_price']):
-                        product_data['sale_price'] = float(row['sale_price'])
-                    
-                    if 'emi_available' in df.columns and not pd.isna(row['emi_available']):
-                        product_data['emi_available'] = row['emi_available'].lower() in ['true', 'yes', '1']
-                    
-                    for promo_field in ['is_trending', 'is_special_offer', 'is_best_seller', 'is_todays_deal']:
-                        if promo_field in df.columns and not pd.isna(row[promo_field]):
-                            product_data[promo_field] = row[promo_field].lower() in ['true', 'yes', '1']
-                    
-                    # Generate slug if not provided
-                    slug = slugify(row['name'])
-                    base_slug = slug
-                    counter = 1
-                    
-                    # Ensure slug is unique
-                    while Product.objects.filter(slug=slug).exists():
-                        slug = f"{base_slug}-{counter}"
-                        counter += 1
-                    
-                    product_data['slug'] = slug
-                    
-                    # Get specifications
-                    specs = {}
-                    for col in df.columns:
-                        if col.startswith('spec_') and not pd.isna(row[col]):
-                            spec_key = col[5:]  # Remove 'spec_' prefix
-                            specs[spec_key] = row[col]
-                    
-                    if specs:
-                        product_data['specifications'] = specs
-                    
-                    # Create the product
-                    product = Product.objects.create(**product_data)
-                    created_count += 1
-                    
-                except Exception as e:
-                    errors.append(f"Row {index + 2}: {str(e)}")
+            # Rows are imported in chunks by products.imports; the header is checked now
+            try:
+                job = create_import_job(
+                    file, category,
+                    required_columns=['name', 'description', 'base_price', 'stock_quantity'],
+                    brand=brand, vendor=request.user, created_by=request.user,
+                    auto_approve=request.user.is_staff,  # Auto-approve if admin
+                )
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             
-            # Return response with results
-            return Response({
-                'message': f'Bulk upload completed. {created_count} products created.',
-                'created_count': created_count,
-                'errors': errors
-            }, status=status.HTTP_201_CREATED if created_count > 0 else status.HTTP_400_BAD_REQUEST)
+            return import_job_response(request, job)
             
+        except Http404:
+            raise
         except Exception as e:
             return Response(
                 {'error': f'An error occurred during bulk upload: {str(e)}'},
@@ -557,187 +491,80 @@ class ProductViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def trending(self, request):
         """Get trending products."""
-        try:
-            # Get base queryset - pass it through get_queryset to apply default filters
-            base_queryset = self.get_queryset()
-            
-            # Ensure we only get trending products that are approved and available
-            queryset = base_queryset.filter(
-                is_trending=True,
-                is_approved=True,
-                is_available=True
-            )
-            
-            print(f"Found {queryset.count()} trending products.")
-            
-            # Apply pagination
-            page = self.paginate_queryset(queryset)
-            if page is not None:
-                serializer = self.get_serializer(page, many=True)
-                response = self.get_paginated_response(serializer.data)
-                # Add cache control headers
-                response["Cache-Control"] = "no-cache, no-store, must-revalidate"
-                response["Pragma"] = "no-cache"
-                response["Expires"] = "0"
-                return response
-            
-            serializer = self.get_serializer(queryset, many=True)
-            response = Response(serializer.data)
-            # Add cache control headers
-            response["Cache-Control"] = "no-cache, no-store, must-revalidate"
-            response["Pragma"] = "no-cache"
-            response["Expires"] = "0"
-            return response
-        except Exception as e:
-            import traceback
-            print(f"Error in trending products: {str(e)}")
-            traceback.print_exc()
-            # Return empty array instead of 500 error
-            return Response({"results": [], "count": 0})
+        return self.cached_rail(request, 'trending', lambda queryset: queryset.filter(
+            is_trending=True,
+            is_approved=True,
+            is_available=True
+        ))
     
     @action(detail=False, methods=['get'])
     def special_offers(self, request):
         """Get special offer products."""
-        try:
-            # Get base queryset - pass it through get_queryset to apply default filters
-            base_queryset = self.get_queryset()
-            
-            # Ensure we only get special offer products that are approved and available
-            queryset = base_queryset.filter(
-                is_special_offer=True,
-                is_approved=True,
-                is_available=True
-            )
-            
-            print(f"Found {queryset.count()} special offer products.")
-            
-            # Debug: print all special offer product IDs and names
-            for product in queryset:
-                print(f"Special offer product: ID={product.id}, Name={product.name}, "
-                      f"Approved={product.is_approved}, Available={product.is_available}")
-            
-            # Apply pagination
-            page = self.paginate_queryset(queryset)
-            if page is not None:
-                serializer = self.get_serializer(page, many=True)
-                response = self.get_paginated_response(serializer.data)
-                # Add cache control headers
-                response["Cache-Control"] = "no-cache, no-store, must-revalidate"
-                response["Pragma"] = "no-cache"
-                response["Expires"] = "0"
-                return response
-            
-            serializer = self.get_serializer(queryset, many=True)
-            response = Response(serializer.data)
-            # Add cache control headers
-            response["Cache-Control"] = "no-cache, no-store, must-revalidate"
-            response["Pragma"] = "no-cache"
-            response["Expires"] = "0"
-            return response
-        except Exception as e:
-            import traceback
-            print(f"Error in special offers: {str(e)}")
-            traceback.print_exc()
-            # Return empty array instead of 500 error
-            return Response({"results": [], "count": 0})
+        return self.cached_rail(request, 'special_offers', lambda queryset: queryset.filter(
+            is_special_offer=True,
+            is_approved=True,
+            is_available=True
+        ))
     
     @action(detail=False, methods=['get'])
     def best_sellers(self, request):
         """Get best seller products."""
-        try:
-            # Get base queryset - pass it through get_queryset to apply default filters
-            base_queryset = self.get_queryset()
-            
-            # Ensure we only get best seller products that are approved and available
-            queryset = base_queryset.filter(
-                is_best_seller=True,
-                is_approved=True,
-                is_available=True
-            )
-            
-            print(f"Found {queryset.count()} best seller products.")
-            
-            # Apply pagination
-            page = self.paginate_queryset(queryset)
-            if page is not None:
-                serializer = self.get_serializer(page, many=True)
-                response = self.get_paginated_response(serializer.data)
-                # Add cache control headers
-                response["Cache-Control"] = "no-cache, no-store, must-revalidate"
-                response["Pragma"] = "no-cache"
-                response["Expires"] = "0"
-                return response
-            
-            serializer = self.get_serializer(queryset, many=True)
-            response = Response(serializer.data)
-            # Add cache control headers
-            response["Cache-Control"] = "no-cache, no-store, must-revalidate"
-            response["Pragma"] = "no-cache"
-            response["Expires"] = "0"
-            return response
-        except Exception as e:
-            import traceback
-            print(f"Error in best sellers: {str(e)}")
-            traceback.print_exc()
-            # Return empty array instead of 500 error
-            return Response({"results": [], "count": 0})
+        return self.cached_rail(request, 'best_sellers', lambda queryset: queryset.filter(
+            is_best_seller=True,
+            is_approved=True,
+            is_available=True
+        ))
     
     @action(detail=False, methods=['get'])
     def todays_deal(self, request):
         """Get today's deal products."""
-        try:
-            # Get base queryset - pass it through get_queryset to apply default filters
-            base_queryset = self.get_queryset()
-            
-            # Ensure we only get today's deal products that are approved and available
-            queryset = base_queryset.filter(
-                is_todays_deal=True,
-                is_approved=True,
-                is_available=True
-            )
-            
-            print(f"Found {queryset.count()} today's deal products.")
-            
-            # Apply pagination
-            page = self.paginate_queryset(queryset)
-            if page is not None:
-                serializer = self.get_serializer(page, many=True)
-                response = self.get_paginated_response(serializer.data)
-                # Add cache control headers
-                response["Cache-Control"] = "no-cache, no-store, must-revalidate"
-                response["Pragma"] = "no-cache"
-                response["Expires"] = "0"
-                return response
-            
-            serializer = self.get_serializer(queryset, many=True)
-            response = Response(serializer.data)
-            # Add cache control headers
-            response["Cache-Control"] = "no-cache, no-store, must-revalidate"
-            response["Pragma"] = "no-cache"
-            response["Expires"] = "0"
-            return response
-        except Exception as e:
-            import traceback
-            print(f"Error in today's deals: {str(e)}")
-            traceback.print_exc()
-            # Return empty array instead of 500 error
-            return Response({"results": [], "count": 0})
+        return self.cached_rail(request, 'todays_deal', lambda queryset: queryset.filter(
+            is_todays_deal=True,
+            is_approved=True,
+            is_available=True
+        ))
     
     @action(detail=False, methods=['get'])
     def new_arrivals(self, request):
         """Get new arrival products."""
+        return self.cached_rail(request, 'new_arrivals', lambda queryset: queryset.order_by('-created_at')[:10],
+                         paginate=False)
+    
+    def cached_rail(self, request, name, build_queryset, paginate=True):
+        """
+        Serve a homepage rail through the versioned rail cache (see products/rail_cache.py).
+        
+        Staff and vendors see unapproved or only their own products, so their
+        rails are computed per request and never cached.
+        """
         try:
-            queryset = self.get_queryset().order_by('-created_at')[:10]
-            serializer = self.get_serializer(queryset, many=True)
-            response = Response(serializer.data)
-            # Add cache control headers
-            response["Cache-Control"] = "no-cache, no-store, must-revalidate"
-            response["Pragma"] = "no-cache"
-            response["Expires"] = "0"
-            return response
+            def build():
+                queryset = build_queryset(self.get_queryset())
+                if paginate:
+                    page = self.paginate_queryset(queryset)
+                    if page is not None:
+                        serializer = self.get_serializer(page, many=True)
+                        return self.get_paginated_response(serializer.data).data
+                return self.get_serializer(queryset, many=True).data
+            
+            user = request.user
+            if user.is_authenticated and (user.is_staff or getattr(user, 'role', None) == 'vendor'):
+                response = Response(build())
+                response["Cache-Control"] = "private, no-cache, no-store, must-revalidate"
+                return response
+            
+            # Image URLs and page links are absolute, so the origin is part of the key
+            params = {
+                'origin': f"{request.scheme}://{request.get_host()}",
+                'page': request.query_params.get('page'),
+                'page_size': request.query_params.get('page_size'),
+                'count': request.query_params.get('count'),
+                'category_slug': request.query_params.get('category_slug'),
+            }
+            return rail_response(request, get_rail(name, params, build))
         except Exception as e:
             import traceback
-            print(f"Error in new arrivals: {str(e)}")
+            print(f"Error in {name} rail: {str(e)}")
             traceback.print_exc()
             # Return empty array instead of 500 error
             return Response({"results": [], "count": 0})
@@ -777,8 +604,8 @@ class ProductViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def emi_plans(self, request, pk=None):
         """Get available EMI plans for a product."""
-        from emi.models import EMIPlan
-        from emi.serializers import EMIPlanSerializer, EMICalculationSerializer
+        from emi.quote_matrix import product_plans, product_quotes
+        from emi.serializers import EMIPlanSerializer
         
         product = self.get_object()
         
@@ -789,54 +616,24 @@ class ProductViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Get EMI plans for this product
-        emi_plans = product.emi_plans.filter(is_active=True)
-        if not emi_plans.exists():
-            # If no specific plans are set, get all active EMI plans
-            emi_plans = EMIPlan.objects.filter(is_active=True)
-            
-            # Filter plans by price eligibility
-            product_price = product.price
-            emi_plans = emi_plans.filter(min_price__lte=product_price)
-            emi_plans = emi_plans.filter(
-                models.Q(max_price__isnull=True) | models.Q(max_price__gte=product_price)
-            )
-        
-        # Serialize EMI plans
-        serializer = EMIPlanSerializer(emi_plans, many=True)
-        
-        # Calculate example EMI for each plan
-        result = []
-        for plan_data in serializer.data:
-            plan = EMIPlan.objects.get(id=plan_data['id'])
-            
-            # Calculate EMI for 6, 12, and 24 months (or just the plan's duration if fixed)
-            tenures = [plan.duration_months]
-            if not tenures[0]:
-                tenures = [6, 12, 24]
-            
-            emi_calculations = []
-            for tenure in tenures:
-                try:
-                    calc = plan.calculate_monthly_payment(product.price, tenure)
-                    emi_calculations.append({
-                        'tenure_months': tenure,
-                        'monthly_payment': calc['monthly_payment'],
-                        'down_payment': calc['down_payment'],
-                        'processing_fee': calc['processing_fee'],
-                        'total_payment': calc['total_payment'],
-                        'total_interest': calc['total_interest']
-                    })
-                except Exception as e:
-                    # Skip invalid calculations
-                    continue
-            
-            result.append({
-                **plan_data,
-                'calculations': emi_calculations
+        quotes = product_quotes([product])[product.id]
+        calculations = {}
+        for row in quotes:
+            calculations.setdefault(row['plan_id'], []).append({
+                'tenure_months': row['tenure_months'],
+                'monthly_payment': row['monthly_payment'],
+                'down_payment': row['down_payment'],
+                'processing_fee': row['processing_fee'],
+                'total_payment': row['total_payment'],
+                'total_interest': row['total_interest']
             })
         
-        return Response(result)
+        # The product's own active plans, else every active plan its price is eligible for
+        serializer = EMIPlanSerializer(product_plans(product), many=True)
+        return Response([
+            {**plan_data, 'calculations': calculations.get(plan_data['id'], [])}
+            for plan_data in serializer.data
+        ])
 
     @action(detail=False, methods=['get'])
     def filter_options(self, request):
@@ -869,13 +666,15 @@ class ProductViewSet(viewsets.ModelViewSet):
                 'colors': [],
                 'brands': [],
                 'price_range': {'min': 0, 'max': 10000},
-                'custom_filters': {}
+                'custom_filters': {},
+                'facet_counts': {}
             }
             
             # Get product queryset
             products = Product.objects.filter(is_available=True, is_approved=True)
             
             # Filter by category if specified
+            category_ids = None
             if category:
                 # Get all subcategories too
                 category_ids = [category.id]
@@ -885,10 +684,10 @@ class ProductViewSet(viewsets.ModelViewSet):
                 products = products.filter(category_id__in=category_ids)
             
             # Get price range
-            if products.exists():
-                # Get min and max price
-                min_price = products.aggregate(models.Min('base_price'))['base_price__min'] or 0
-                max_price = products.aggregate(models.Max('base_price'))['base_price__max'] or 10000
+            prices = products.aggregate(min_price=models.Min('base_price'), max_price=models.Max('base_price'))
+            if prices['min_price'] is not None:
+                min_price = prices['min_price'] or 0
+                max_price = prices['max_price'] or 10000
                 
                 # If max_price is too close to min_price, add a buffer
                 if max_price - min_price < 100:
@@ -909,67 +708,51 @@ class ProductViewSet(viewsets.ModelViewSet):
             else:
                 print("No products found for price range calculation")
             
-            # Get available brands with counts
-            brands_data = []
-            brand_counts = products.values('brand').annotate(
-                count=models.Count('brand')
-            ).order_by('-count')
+            # Get custom filter fields for this category
+            filter_fields = []
+            if category:
+                # Get fields marked as filters
+                filter_fields = list(ProductField.objects.filter(
+                    models.Q(category=category) | models.Q(category__isnull=True),
+                    is_filter=True
+                ).order_by('display_order'))
             
-            for brand_data in brand_counts:
-                brand_id = brand_data['brand']
-                if brand_id is None:
-                    continue
-                brand = Brand.objects.filter(id=brand_id).first()
-                if brand:
-                    brands_data.append({
-                        'id': brand.id,
-                        'name': brand.name,
-                        'slug': brand.slug,
-                        'count': brand_data['count'],
-                        'logo': brand.logo.url if brand.logo else None
-                    })
+            # Option values come from the precomputed facet index (see products/facets.py)
+            facet_fields = [BRAND_FIELD, COLOR_FIELD] + [field.name.lower() for field in filter_fields]
+            options = facet_counts(category_ids, facet_fields)
             
-            response_data['brands'] = brands_data
+            # Drill-down counts under the currently applied filters
+            applied_filters = active_filters(request.query_params)
+            if applied_filters:
+                counts = drilldown_facet_counts(products, applied_filters, facet_fields)
+            else:
+                counts = options
+            response_data['facet_counts'] = counts
             
-            # Get available colors
-            colors = set()
-            for product in products:
-                if product.specifications and 'color' in product.specifications:
-                    product_color = product.specifications.get('color')
-                    if product_color:
-                        if isinstance(product_color, list):
-                            colors.update(product_color)
-                        else:
-                            colors.add(product_color)
+            # Get available brands with counts
+            brand_counts = counts.get(BRAND_FIELD, {})
+            brands = Brand.objects.filter(id__in=[int(brand_id) for brand_id in options.get(BRAND_FIELD, {})])
+            response_data['brands'] = sorted([
+                {
+                    'id': brand.id,
+                    'name': brand.name,
+                    'slug': brand.slug,
+                    'count': brand_counts.get(str(brand.id), 0),
+                    'logo': brand.logo.url if brand.logo else None
+                }
+                for brand in brands
+            ], key=lambda brand: -brand['count'])
             
-            response_data['colors'] = sorted(list(colors))
+            # Get available colors
+            response_data['colors'] = sorted(options.get(COLOR_FIELD, {}))
             
-            # Get custom filter fields for this category
             custom_filters = {}
-            if category:
-                # Get fields marked as filters
-                filter_fields = ProductField.objects.filter(
-                    models.Q(category=category) | models.Q(category__isnull=True),
-                    is_filter=True
-                ).order_by('display_order')
+            for field in filter_fields:
+                field_values = options.get(field.name.lower())
                 
-                for field in filter_fields:
-                    field_values = set()
-                    field_key = field.name.lower()
-                    
-                    # Collect unique values for this field from all products
-                    for product in products:
-                        if product.specifications and field_key in product.specifications:
-                            value = product.specifications.get(field_key)
-                            if value:
-                                if isinstance(value, list):
-                                    field_values.update(value)
-                                else:
-                                    field_values.add(value)
-                    
-                    # Add to custom filters if values exist
-                    if field_values:
-                        custom_filters[field.name] = sorted(list(field_values))
+                # Add to custom filters if values exist
+                if field_values:
+                    custom_filters[field.name] = sorted(field_values)
                 
             response_data['custom_filters'] = custom_filters
             
@@ -986,7 +769,8 @@ class ProductViewSet(viewsets.ModelViewSet):
                     'colors': [],
                     'brands': [],
                     'price_range': {'min': 0, 'max': 10000},
-                    'custom_filters': {}
+                    'custom_filters': {},
+                    'facet_counts': {}
                 },
                 status=status.HTTP_200_OK  # Return 200 with empty data instead of error
             )
@@ -1035,15 +819,15 @@ def advanced_search(request):
     """
     Advanced search endpoint with features like:
     - Exact match prioritization
-    - Fuzzy matching for typo correction
-    - Did you mean suggestions
+    - Ranked full-text search over a weighted, GIN-indexed search vector
+    - Did you mean suggestions from a trigram index
     - Search analytics tracking
-    - Keyword-based search across all fields
+    - Matching and pagination done in the database
     """
-    search_term = request.query_params.get('q', '')
+    search_term = request.query_params.get('q', '').strip()
     category = request.query_params.get('category', None)
-    page = int(request.query_params.get('page', 1))
-    page_size = int(request.query_params.get('page_size', 12))
+    page = max(1, int(request.query_params.get('page', 1)))
+    page_size = max(1, min(int(request.query_params.get('page_size', 12)), 100))
     
     if not search_term:
         return Response({
@@ -1054,82 +838,37 @@ def advanced_search(request):
         })
     
     # Start with base queryset
-    queryset = Product.objects.filter(is_approved=True)
+    base_queryset = Product.objects.filter(is_approved=True)
     
     # Apply category filter if provided
+    category_obj = None
     if category:
-        try:
-            category_obj = Category.objects.get(slug=category)
-            queryset = queryset.filter(category=category_obj)
-        except Category.DoesNotExist:
+        category_obj = Category.objects.filter(slug=category).first()
+        if category_obj:
+            base_queryset = base_queryset.filter(category=category_obj)
+        else:
             # Try to match by name if slug doesn't work
-            queryset = queryset.filter(category__name__icontains=category)
-    
-    # Enhanced keyword-based search
-    # Split search term into keywords for more comprehensive search
-    keywords = search_term.lower().split()
+            base_queryset = base_queryset.filter(category__name__icontains=category)
     
-    # Build a comprehensive search query using OR logic
-    search_query = Q()
+    # Ranked full-text search, exact name/SKU matches first
+    queryset = search_products(base_queryset, search_term).select_related(
+        'category', 'brand'
+    ).prefetch_related('emi_plans')
     
-    for keyword in keywords:
-        keyword_query = (
-            Q(name__icontains=keyword) |
-            Q(description__icontains=keyword) |
-            Q(specifications__icontains=keyword) |
-            Q(category__name__icontains=keyword) |
-            Q(brand__name__icontains=keyword) |
-            Q(sku__icontains=keyword) |
-            Q(model_number__icontains=keyword)
-        )
-        search_query |= keyword_query  # Use OR instead of AND
-    
-    # Also search for the complete search term
-    complete_term_query = (
-        Q(name__icontains=search_term) | 
-        Q(description__icontains=search_term) |
-        Q(specifications__icontains=search_term) |
-        Q(category__name__icontains=search_term) |
-        Q(brand__name__icontains=search_term) |
-        Q(sku__icontains=search_term) |
-        Q(model_number__icontains=search_term)
-    )
-    
-    # Combine keyword search with complete term search
-    final_search_query = search_query | complete_term_query
-    
-    # Apply the search filter
-    queryset = queryset.filter(final_search_query)
-    
-    # Prioritize exact matches over partial matches
-    exact_matches = queryset.filter(
-        Q(name__iexact=search_term) | 
-        Q(name__istartswith=search_term) |
-        Q(sku__iexact=search_term) |
-        Q(model_number__iexact=search_term)
-    )
-    
-    # Get partial matches (excluding exact matches)
-    partial_matches = queryset.exclude(id__in=exact_matches.values_list('id', flat=True))
-    
-    # Combine results, preserving the priority order
-    results = list(exact_matches) + list(partial_matches)
-    total_count = len(results)
-    
-    # Handle pagination
+    # Handle pagination in SQL, only the requested page is loaded
+    total_count = queryset.count()
     start = (page - 1) * page_size
-    end = start + page_size
-    paginated_results = results[start:end]
+    paginated_results = list(queryset[start:start + page_size])
     
     # Generate "Did you mean" suggestions if no exact matches were found
     did_you_mean = None
-    if not exact_matches and search_term:
-        # Get all product names for fuzzy matching
-        all_product_names = list(Product.objects.values_list('name', flat=True))
-        # Find the closest match using fuzzywuzzy
-        matches = process.extract(search_term, all_product_names, limit=1)
-        if matches and matches[0][1] > 70:  # Only suggest if similarity > 70%
-            did_you_mean = matches[0][0]
+    if page == 1:
+        # Exact matches sort first, so the top result tells us
+        has_exact_match = bool(paginated_results) and paginated_results[0].exact_match == 1
+    else:
+        has_exact_match = queryset.filter(exact_match=1).exists()
+    if not has_exact_match:
+        did_you_mean = find_did_you_mean(search_term, Product.objects.filter(is_approved=True))
     
     # Track search analytics
     try:
@@ -1146,7 +885,7 @@ def advanced_search(request):
             user=request.user if request.user.is_authenticated else None,
             session_id=session_id,
             results_count=total_count,
-            category_filter=Category.objects.get(slug=category) if category else None,
+            category_filter=category_obj,
         )
     except Exception as e:
         print(f"Error recording search analytics: {str(e)}")
@@ -1166,7 +905,8 @@ def advanced_search(request):
 @permission_classes([permissions.AllowAny])
 def autocomplete(request):
     """
-    Simplified endpoint for search autocomplete suggestions
+    Endpoint for search autocomplete suggestions, served from the in-memory
+    prefix index (see products/autocomplete.py) without database queries
     """
     try:
         query = request.query_params.get('q', '')
@@ -1175,40 +915,7 @@ def autocomplete(request):
         if not query or len(query) < 2:
             return Response({'suggestions': []})
         
-        suggestions = []
-        
-        # Simple product search - focus on name only to avoid complex queries
-        products = Product.objects.filter(
-            Q(name__icontains=query) | Q(name__istartswith=query)
-        ).filter(is_approved=True).select_related('brand', 'category')[:limit]
-        
-        # Add product suggestions with basic info
-        for product in products:
-            # Get price safely - use base_price only to avoid variations complexity
-            try:
-                product_price = float(product.base_price)
-            except:
-                product_price = 0.0
-            
-            # Get image safely
-            primary_image = None
-            try:
-                first_image = product.images.first()
-                if first_image and first_image.image:
-                    primary_image = first_image.image.url
-            except:
-                pass
-            
-            suggestions.append({
-                'type': 'product',
-                'id': product.id,
-                'name': product.name,
-                'category': product.category.name if product.category else '',
-                'brand': product.brand.name if product.brand else '',
-                'price': product_price,
-                'image': primary_image,
-                'url': f'/products/{product.slug}' if product.slug else f'/products/{product.id}'
-            })
+        suggestions = get_autocomplete_index().lookup(query, limit)
         
         return Response({'suggestions': suggestions})
         
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Review, ReviewVote, ReviewReply
+from .models import ProductReviewStats, Review, ReviewVote, ReviewReply
+from .stats import reconcile_review_stats
 
 
 class ReviewReplyInline(admin.TabularInline):
@@ -40,13 +41,19 @@ class ReviewAdmin(admin.ModelAdmin):
     
     def approve_reviews(self, request, queryset):
         """Approve selected reviews."""
+        product_ids = set(queryset.values_list('product_id', flat=True))
         queryset.update(status='approved')
+        # update() sends no signals
+        reconcile_review_stats(product_ids)
         self.message_user(request, f"{queryset.count()} reviews were approved.")
     approve_reviews.short_description = "Approve selected reviews"
     
     def reject_reviews(self, request, queryset):
         """Reject selected reviews."""
+        product_ids = set(queryset.values_list('product_id', flat=True))
         queryset.update(status='rejected')
+        # update() sends no signals
+        reconcile_review_stats(product_ids)
         self.message_user(request, f"{queryset.count()} reviews were rejected.")
     reject_reviews.short_description = "Reject selected reviews"
 
@@ -81,3 +88,15 @@ class ReviewVoteAdmin(admin.ModelAdmin):
     search_fields = ['user__email', 'review__title']
     readonly_fields = ['created_at']
     raw_id_fields = ['review', 'user']
+
+
+@admin.register(ProductReviewStats)
+class ProductReviewStatsAdmin(admin.ModelAdmin):
+    """Admin interface for product review stats (maintained automatically)."""
+    list_display = ['product', 'review_count', 'rating_sum', 'verified_count', 'updated_at']
+    search_fields = ['product__name']
+    raw_id_fields = ['product']
+    readonly_fields = [
+        'review_count', 'rating_sum', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5',
+        'verified_count', 'updated_at'
+    ]
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from reviews.models import Review
+from reviews.votes import recount_votes
+
+
+class Command(BaseCommand):
+    help = 'Recount helpful and unhelpful votes on reviews from the vote rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--review', type=int, action='append', dest='review_ids',
+                            help='Only recount this review id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of reviews checked per statement')
+
+    def handle(self, *args, **options):
+        review_ids = options['review_ids']
+        if review_ids is None:
+            review_ids = list(Review.objects.order_by('id').values_list('id', flat=True))
+
+        batch_size = max(1, options['batch_size'])
+        updated = 0
+        for start in range(0, len(review_ids), batch_size):
+            updated += recount_votes(review_ids[start:start + batch_size])
+
+        self.stdout.write(self.style.SUCCESS(f"Recounted votes on {updated} reviews"))
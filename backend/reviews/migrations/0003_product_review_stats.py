@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_review_stats(apps, schema_editor):
+    from reviews.stats import reconcile_review_stats
+
+    reconcile_review_stats(
+        review_model=apps.get_model('reviews', 'Review'),
+        stats_model=apps.get_model('reviews', 'ProductReviewStats'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_import_jobs'),
+        ('reviews', '0002_review_cons_review_pros_alter_review_rating_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductReviewStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='review_stats', serialize=False, to='products.product')),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('rating_1', models.PositiveIntegerField(default=0)),
+                ('rating_2', models.PositiveIntegerField(default=0)),
+                ('rating_3', models.PositiveIntegerField(default=0)),
+                ('rating_4', models.PositiveIntegerField(default=0)),
+                ('rating_5', models.PositiveIntegerField(default=0)),
+                ('verified_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Product review stats',
+            },
+        ),
+        migrations.RunPython(fill_review_stats, migrations.RunPython.noop),
+    ]
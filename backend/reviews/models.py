@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db.models import Avg
@@ -83,16 +83,25 @@ class Review(models.Model):
         return (self.helpful_votes / total_votes) * 100
     
     def save(self, *args, **kwargs):
-        """Override save to store previous status for signal handling."""
-        if hasattr(self, 'id'):
-            # Store the previous status for signal handling
+        """Flag verified purchases on creation and store the previous state for signal handling."""
+        from .stats import review_contribution
+        
+        self._previous_status = None
+        self._previous_stats = None
+        if self.pk is None and not self.is_verified_purchase:
+            from orders.purchases import has_purchased
+            self.is_verified_purchase = has_purchased(self.user_id, self.product_id)
+        if self.pk:
+            # Store the previous state for signal handling
             try:
-                old_instance = Review.objects.get(id=self.id)
+                old_instance = Review.objects.only(
+                    'product_id', 'status', 'rating', 'is_verified_purchase'
+                ).get(pk=self.pk)
                 self._previous_status = old_instance.status
+                self._previous_stats = (old_instance.product_id, review_contribution(old_instance))
             except Review.DoesNotExist:
-                self._previous_status = None
+                pass
         super().save(*args, **kwargs)
-        # No need to update product rating since we use average_rating property
 
 
 class ReviewVote(models.Model):
@@ -113,53 +122,27 @@ class ReviewVote(models.Model):
         unique_together = ('review', 'user')
     
     def save(self, *args, **kwargs):
-        """Override save to update review vote counts."""
-        # Check if this is an update or new vote
-        is_new = self.pk is None
-        
-        # If updating an existing vote, get the old vote
-        old_vote = None
-        if not is_new:
-            old_vote = ReviewVote.objects.get(pk=self.pk).vote
-        
-        # Save the vote
-        super().save(*args, **kwargs)
-        
-        # Update review vote counts
-        review = self.review
-        
-        if is_new:
-            # New vote
-            if self.vote == 'helpful':
-                review.helpful_votes += 1
-            else:
-                review.unhelpful_votes += 1
-        elif old_vote != self.vote:
-            # Changed vote
-            if self.vote == 'helpful':
-                review.helpful_votes += 1
-                review.unhelpful_votes -= 1
-            else:
-                review.helpful_votes -= 1
-                review.unhelpful_votes += 1
+        """Save the vote and move the review's counts with it (see reviews.votes)."""
+        from .votes import apply_vote_change
         
-        review.save(update_fields=['helpful_votes', 'unhelpful_votes'])
+        with transaction.atomic():
+            previous = None
+            if self.pk is not None:
+                previous = ReviewVote.objects.select_for_update().filter(pk=self.pk).values_list(
+                    'vote', flat=True
+                ).first()
+            super().save(*args, **kwargs)
+            apply_vote_change(self.review_id, previous, self.vote)
     
     def delete(self, *args, **kwargs):
-        """Override delete to update review vote counts."""
-        review = self.review
+        """Delete the vote and take it off the review's counts."""
+        from .votes import apply_vote_change
         
-        # Update vote counts
-        if self.vote == 'helpful':
-            review.helpful_votes = max(0, review.helpful_votes - 1)
-        else:
-            review.unhelpful_votes = max(0, review.unhelpful_votes - 1)
-        
-        # Delete the vote
-        super().delete(*args, **kwargs)
-        
-        # Save the review
-        review.save(update_fields=['helpful_votes', 'unhelpful_votes'])
+        with transaction.atomic():
+            deleted, per_model = super().delete(*args, **kwargs)
+            if deleted:
+                apply_vote_change(self.review_id, self.vote, None)
+        return deleted, per_model
 
 
 class ReviewReply(models.Model):
@@ -179,3 +162,38 @@ class ReviewReply(models.Model):
     
     def __str__(self):
         return f"Reply to review {self.review.id} by {self.user.email}"
+
+
+class ProductReviewStats(models.Model):
+    """Approved review totals of a product, maintained by reviews.signals (see reviews.stats)."""
+    
+    product = models.OneToOneField(
+        'products.Product',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='review_stats'
+    )
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    # Histogram of approved ratings
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    verified_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'Product review stats'
+    
+    def __str__(self):
+        return f"Review stats for product {self.product_id}"
+    
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.review_count if self.review_count else 0
+    
+    @property
+    def rating_distribution(self):
+        return {str(star): getattr(self, f'rating_{star}') for star in range(5, 0, -1)}
@@ -1,7 +1,7 @@
 from rest_framework import serializers
-from django.db import transaction
 from django.utils.text import Truncator
 from .models import Review, ReviewVote, ReviewReply
+from .votes import cast_vote
 from users.serializers import UserMinimalSerializer
 
 
@@ -68,6 +68,11 @@ class ReviewSerializer(serializers.ModelSerializer):
     
     def get_user_vote(self, obj):
         """Get the current user's vote on this review."""
+        # Views serializing a page of reviews look up the votes at once (see reviews.votes.user_votes)
+        user_votes = self.context.get('user_votes')
+        if user_votes is not None:
+            return user_votes.get(obj.pk)
+        
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             try:
@@ -92,30 +97,9 @@ class ReviewSerializer(serializers.ModelSerializer):
         return attrs
     
     def create(self, validated_data):
-        """Create a new review."""
+        """Create a new review; Review.save flags verified purchases."""
         user = self.context['request'].user
-        
-        # Check if the user has purchased the product
-        product = validated_data.get('product')
-        is_verified = False
-        
-        # Check order history to verify purchase
-        if hasattr(user, 'orders'):
-            from orders.models import OrderItem
-            is_verified = OrderItem.objects.filter(
-                order__user=user,
-                product=product,
-                order__status__in=['delivered', 'completed']
-            ).exists()
-        
-        # Create the review
-        review = Review.objects.create(
-            user=user,
-            is_verified_purchase=is_verified,
-            **validated_data
-        )
-        
-        return review
+        return Review.objects.create(user=user, **validated_data)
 
 
 class ReviewVoteSerializer(serializers.ModelSerializer):
@@ -130,19 +114,9 @@ class ReviewVoteSerializer(serializers.ModelSerializer):
         """Create or update a vote."""
         user = self.context['request'].user
         review = validated_data.get('review')
-        vote = validated_data.get('vote')
         
-        # Check if the user has already voted on this review
-        try:
-            # Update existing vote
-            with transaction.atomic():
-                existing_vote = ReviewVote.objects.get(review=review, user=user)
-                existing_vote.vote = vote
-                existing_vote.save()
-                return existing_vote
-        except ReviewVote.DoesNotExist:
-            # Create new vote
-            return ReviewVote.objects.create(user=user, **validated_data)
+        cast_vote(review.id, user.id, validated_data.get('vote'))
+        return ReviewVote.objects.get(review=review, user=user)
 
 
 class ReviewCreateSerializer(serializers.ModelSerializer):
@@ -3,6 +3,7 @@ from django.dispatch import receiver
 from django.db.models import Avg
 
 from .models import Review, ReviewVote
+from .stats import apply_review_change, review_contribution
 from notifications.notification_service import NotificationService
 
 
@@ -78,17 +79,15 @@ def notify_vendor_on_new_review(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=Review)
-def update_product_rating(sender, instance, **kwargs):
-    """Update product rating when a review is saved/updated."""
-    # No need to update rating field since we use the average_rating property
-    # that calculates in real-time from reviews
-    pass  # The average_rating property will calculate automatically when needed
+def update_review_stats(sender, instance, **kwargs):
+    """Move the review's contribution to its product's ProductReviewStats (see reviews.stats)."""
+    apply_review_change(
+        before=getattr(instance, '_previous_stats', None),
+        after=(instance.product_id, review_contribution(instance))
+    )
 
 
 @receiver(post_delete, sender=Review)
-def update_product_rating_on_delete(sender, instance, **kwargs):
-    """Update product rating when a review is deleted."""
-    if instance.product:
-        # No need to update rating field since we use the average_rating property
-        # that calculates in real-time from reviews
-        pass  # The average_rating property will calculate automatically when needed 
\ No newline at end of file
+def update_review_stats_on_delete(sender, instance, **kwargs):
+    """Take the deleted review's contribution off its product's stats."""
+    apply_review_change(before=(instance.product_id, review_contribution(instance)))
@@ -0,0 +1,190 @@
+"""
+Per-product review statistics.
+
+ProductReviewStats holds the count, rating sum, per-star histogram and
+verified purchase count of a product's approved reviews. Review.save
+remembers what the review counted for before the save. reviews.signals
+then applies the difference as one relative UPDATE (col = col + delta)
+in the same transaction, whether the review was created, moderated,
+re-rated or deleted. Concurrent reviews of one product therefore never
+overwrite each other's counts.
+
+The product's ``approved_review_count`` and ``avg_rating`` listing
+columns are copies of its row, set from it by one UPDATE right after the
+row changes, so the two never disagree.
+
+Queryset ``update()`` and ``delete()`` calls and raw SQL bypass the
+signals. ``reconcile_review_stats`` recomputes the rows from the reviews
+with one grouped query and rewrites only those that drifted, along with
+their product columns. The ``reconcile_review_stats`` task runs it
+nightly.
+"""
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Exists, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Greatest
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+STARS = range(1, 6)
+STAT_FIELDS = ['review_count', 'rating_sum'] + [f'rating_{star}' for star in STARS] + ['verified_count']
+
+
+def contribution(status, rating, is_verified_purchase):
+    """What one review adds to its product's stats."""
+    if status != 'approved' or rating not in STARS:
+        return {}
+    return {
+        'review_count': 1,
+        'rating_sum': rating,
+        f'rating_{rating}': 1,
+        'verified_count': 1 if is_verified_purchase else 0,
+    }
+
+
+def review_contribution(review):
+    return contribution(review.status, review.rating, review.is_verified_purchase)
+
+
+def apply_review_change(before=None, after=None):
+    """
+    Move a review's contribution from ``before`` to ``after``.
+
+    Both are (product_id, contribution) or None. A stats row is only
+    created for the product gaining a contribution.
+    """
+    from .models import ProductReviewStats
+
+    deltas = defaultdict(lambda: defaultdict(int))
+    if before:
+        for field, value in before[1].items():
+            deltas[before[0]][field] -= value
+    if after:
+        for field, value in after[1].items():
+            deltas[after[0]][field] += value
+
+    with transaction.atomic():
+        changed = []
+        for product_id, changes in deltas.items():
+            changes = {field: value for field, value in changes.items() if value}
+            if not changes:
+                continue
+            changed.append(product_id)
+            if after and product_id == after[0]:
+                ProductReviewStats.objects.bulk_create(
+                    [ProductReviewStats(product_id=product_id)], ignore_conflicts=True
+                )
+            # Greatest keeps a drifted row valid until the reconcile job fixes it
+            ProductReviewStats.objects.filter(product_id=product_id).update(
+                updated_at=timezone.now(),
+                **{field: Greatest(F(field) + value, Value(0)) for field, value in changes.items()}
+            )
+        if changed:
+            sync_product_ratings(changed, ProductReviewStats)
+
+
+def product_rating_expressions(stats_model):
+    """
+    Build the UPDATE expressions copying a product's stats row into its rating columns.
+
+    Models are passed in so data migrations can use historical models.
+    """
+    stats = stats_model.objects.filter(product_id=OuterRef('pk'), review_count__gt=0)
+    average = stats.annotate(
+        value=Cast('rating_sum', FloatField()) / Cast('review_count', FloatField()),
+    ).values('value')[:1]
+    return {
+        'approved_review_count': Coalesce(Subquery(stats.values('review_count')[:1], output_field=IntegerField()), 0),
+        'avg_rating': Coalesce(Subquery(average, output_field=FloatField()), Value(0.0)),
+    }
+
+
+def sync_product_ratings(product_ids=None, stats_model=None):
+    """Set the rating columns of the products (all if None) that differ from their stats row; returns how many."""
+    if stats_model is None:
+        from .models import ProductReviewStats as stats_model
+    product_model = stats_model._meta.get_field('product').related_model
+    products = product_model.objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=list(product_ids))
+    expected = product_rating_expressions(stats_model)
+    drifted = products.annotate(**{f'expected_{field}': value for field, value in expected.items()}).filter(
+        ~Q(approved_review_count=F('expected_approved_review_count')) | ~Q(avg_rating=F('expected_avg_rating'))
+    )
+    return drifted.update(**expected)
+
+
+def aggregate_review_stats(review_model, product_ids=None):
+    """Stats of every product with approved reviews, from one grouped query."""
+    reviews = review_model.objects.filter(status='approved', rating__in=STARS)
+    if product_ids is not None:
+        reviews = reviews.filter(product_id__in=product_ids)
+    stars = {f'rating_{star}': Count('id', filter=Q(rating=star)) for star in STARS}
+    rows = reviews.order_by().values('product_id').annotate(
+        review_count=Count('id'),
+        rating_sum=Sum('rating'),
+        verified_count=Count('id', filter=Q(is_verified_purchase=True)),
+        **stars
+    )
+    return {row.pop('product_id'): row for row in rows}
+
+
+def reconcile_review_stats(product_ids=None, review_model=None, stats_model=None):
+    """
+    Rewrite the stats rows that drifted from the reviews; returns how many.
+
+    Models can be passed in so data migrations can use historical models.
+    """
+    if review_model is None or stats_model is None:
+        from .models import ProductReviewStats, Review
+        review_model, stats_model = Review, ProductReviewStats
+    if product_ids is not None:
+        product_ids = list(product_ids)
+
+    expected = aggregate_review_stats(review_model, product_ids)
+    stored = stats_model.objects.all()
+    if product_ids is not None:
+        stored = stored.filter(product_id__in=product_ids)
+    current = {row.pop('product_id'): row for row in stored.values('product_id', *STAT_FIELDS)}
+
+    drifted = [
+        stats_model(product_id=product_id, **values)
+        for product_id, values in expected.items()
+        if current.get(product_id) != values
+    ]
+    # Rows of products that no longer have approved reviews
+    emptied = stored.exclude(review_count=0).filter(
+        ~Exists(review_model.objects.filter(product_id=OuterRef('product_id'), status='approved', rating__in=STARS))
+    )
+    with transaction.atomic():
+        stats_model.objects.bulk_create(
+            drifted, batch_size=1000, update_conflicts=True,
+            unique_fields=['product'], update_fields=STAT_FIELDS + ['updated_at'],
+        )
+        emptied_count = emptied.update(updated_at=timezone.now(), **{field: 0 for field in STAT_FIELDS})
+        resynced = sync_product_ratings(product_ids, stats_model)
+    if drifted or emptied_count:
+        logger.warning(f"Reconciled review stats of {len(drifted) + emptied_count} products")
+    if resynced:
+        logger.warning(f"Resynced rating columns of {resynced} products")
+    return len(drifted) + emptied_count
+
+
+def review_summary(stats):
+    """The review summary payload of a ProductReviewStats row (or None for no reviews)."""
+    if stats is None:
+        return {
+            'total_reviews': 0,
+            'average_rating': 0,
+            'rating_distribution': {str(star): 0 for star in reversed(STARS)},
+            'verified_purchases': 0,
+        }
+    return {
+        'total_reviews': stats.review_count,
+        'average_rating': stats.average_rating,
+        'rating_distribution': stats.rating_distribution,
+        'verified_purchases': stats.verified_count,
+    }
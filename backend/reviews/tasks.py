@@ -0,0 +1,14 @@
+import logging
+
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def reconcile_review_stats():
+    """Rewrite product review stats that drifted from the reviews (see reviews/stats.py)."""
+    from .stats import reconcile_review_stats as reconcile
+
+    fixed = reconcile()
+    return f"Reconciled review stats of {fixed} products"
@@ -1,3 +1,226 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from orders.models import Order, OrderItem
+from products.models import Brand, Category, Product
+from .models import ProductReviewStats, Review, ReviewVote
+from .stats import aggregate_review_stats, reconcile_review_stats
+from .votes import cast_vote, recount_votes, retract_vote
+
+User = get_user_model()
+
+
+class ProductReviewStatsTest(TestCase):
+    """Review totals and histograms are kept per product as reviews are written, moderated and deleted."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create_user(email='vendor@example.com', password='pass')
+        brand = Brand.objects.create(name='Acme', slug='acme')
+        category = Category.objects.create(name='Phones', slug='phones')
+        cls.product = Product.objects.create(name='Phone', slug='phone', category=category, brand=brand,
+                                             vendor=vendor, description='A phone', base_price=Decimal('100'),
+                                             is_approved=True)
+        cls.users = [User.objects.create_user(email=f'user{n}@example.com', password='pass') for n in range(12)]
+
+    def review(self, user, rating, status='approved', verified=False):
+        return Review.objects.create(product=self.product, user=user, rating=rating, title='Title',
+                                     comment='Comment', status=status, is_verified_purchase=verified)
+
+    def assert_in_sync(self):
+        stats = ProductReviewStats.objects.get(product=self.product)
+        expected = aggregate_review_stats(Review).get(self.product.id, {})
+        for field in ['review_count', 'rating_sum', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5',
+                      'verified_count']:
+            self.assertEqual(getattr(stats, field), expected.get(field, 0), field)
+        # The product's listing columns are copies of the row
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.approved_review_count, product.avg_rating), (stats.review_count, stats.average_rating))
+        return stats
+
+    def test_stats_follow_review_lifecycle(self):
+        first = self.review(self.users[0], 5, verified=True)
+        second = self.review(self.users[1], 3)
+        pending = self.review(self.users[2], 1, status='pending')
+        stats = self.assert_in_sync()
+        self.assertEqual((stats.review_count, stats.average_rating, stats.verified_count), (2, 4, 1))
+
+        pending.status = 'approved'
+        pending.save()
+        second.rating = 4
+        second.save()
+        first.status = 'rejected'
+        first.save()
+        stats = self.assert_in_sync()
+        self.assertEqual(stats.rating_distribution, {'5': 0, '4': 1, '3': 0, '2': 0, '1': 1})
+
+        second.delete()
+        self.assertEqual(self.assert_in_sync().review_count, 1)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/reviews/reviews/summary/?product={self.product.id}')
+        self.assertEqual(response.data['total_reviews'], 1)
+        self.assertEqual(response.data['rating_distribution']['1'], 1)
+
+    def test_reconcile_repairs_bulk_updates(self):
+        for user in self.users[:3]:
+            self.review(user, 4)
+        self.assertEqual(reconcile_review_stats(), 0)
+
+        # update() sends no signals
+        Review.objects.filter(user=self.users[0]).update(status='rejected')
+        Review.objects.filter(user=self.users[1]).update(rating=2)
+        self.assertEqual(reconcile_review_stats([self.product.id]), 1)
+        self.assertEqual(self.assert_in_sync().rating_sum, 6)
+
+        Review.objects.all().update(status='pending')
+        self.assertEqual(reconcile_review_stats(), 1)
+        self.assertEqual(self.assert_in_sync().review_count, 0)
+
+    def test_product_detail_embeds_first_page_and_histogram(self):
+        for user in self.users:
+            self.review(user, 5)
+        response = self.client.get(f'/api/products/products/id-{self.product.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['reviews']), 10)
+        self.assertEqual(response.data['review_summary']['total_reviews'], 12)
+        self.assertEqual(response.data['review_summary']['rating_distribution']['5'], 12)
+
+
+class ReviewVoteTest(TestCase):
+    """Votes move the review counters with relative updates and are read a page at a time."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create_user(email='vendor@example.com', password='pass')
+        brand = Brand.objects.create(name='Acme', slug='acme')
+        category = Category.objects.create(name='Phones', slug='phones')
+        cls.product = Product.objects.create(name='Phone', slug='phone', category=category, brand=brand,
+                                             vendor=vendor, description='A phone', base_price=Decimal('100'),
+                                             is_approved=True)
+        cls.users = [User.objects.create_user(email=f'voter{n}@example.com', password='pass') for n in range(3)]
+        cls.reviews = [
+            Review.objects.create(product=cls.product, user=user, rating=4, title='Title', comment='Comment',
+                                  status='approved')
+            for user in cls.users
+        ]
+
+    def counts(self, review):
+        review.refresh_from_db()
+        return review.helpful_votes, review.unhelpful_votes
+
+    def test_cast_change_and_retract(self):
+        review = self.reviews[0]
+        # The upsert and the counter update, inside a savepoint
+        with self.assertNumQueries(4):
+            self.assertIsNone(cast_vote(review.id, self.users[1].id, 'helpful'))
+        cast_vote(review.id, self.users[2].id, 'helpful')
+        self.assertEqual(self.counts(review), (2, 0))
+
+        # Same vote again changes nothing
+        self.assertEqual(cast_vote(review.id, self.users[1].id, 'helpful'), 'helpful')
+        self.assertEqual(cast_vote(review.id, self.users[1].id, 'unhelpful'), 'helpful')
+        self.assertEqual(self.counts(review), (1, 1))
+
+        self.assertEqual(retract_vote(review.id, self.users[1].id), 'unhelpful')
+        self.assertIsNone(retract_vote(review.id, self.users[1].id))
+        self.assertEqual(self.counts(review), (1, 0))
+        self.assertEqual(ReviewVote.objects.filter(review=review).count(), 1)
+
+        # Model saves and deletes keep the counters too
+        vote = ReviewVote.objects.get(review=review)
+        vote.vote = 'unhelpful'
+        vote.save()
+        self.assertEqual(self.counts(review), (0, 1))
+        vote.delete()
+        self.assertEqual(self.counts(review), (0, 0))
+
+    def test_recount_repairs_drift(self):
+        cast_vote(self.reviews[0].id, self.users[1].id, 'helpful')
+        cast_vote(self.reviews[1].id, self.users[0].id, 'unhelpful')
+        self.assertEqual(recount_votes(), 0)
+
+        Review.objects.filter(pk=self.reviews[0].id).update(helpful_votes=7)
+        ReviewVote.objects.filter(review=self.reviews[1]).delete()
+        self.assertEqual(recount_votes([self.reviews[0].id]), 1)
+        self.assertEqual(self.counts(self.reviews[0]), (1, 0))
+        call_command('recount_review_votes', stdout=StringIO())
+        self.assertEqual(self.counts(self.reviews[1]), (0, 0))
+
+    def test_vote_endpoints(self):
+        review = self.reviews[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[1])
+        response = self.client.post(f'/api/reviews/reviews/{review.id}/vote/', {'vote': 'helpful'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['helpful_votes'], response.data['previous_vote']), (1, None))
+        self.client.post(f'/api/reviews/reviews/{self.reviews[2].id}/vote/', {'vote': 'unhelpful'}, format='json')
+
+        ids = ','.join(str(review.id) for review in self.reviews)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/reviews/reviews/my_votes/?reviews={ids}')
+        self.assertEqual(response.data, {review.id: 'helpful', self.reviews[2].id: 'unhelpful'})
+
+        response = self.client.get(f'/api/reviews/reviews/?product={self.product.id}')
+        votes = {row['id']: row['user_vote'] for row in response.data['results']}
+        self.assertEqual(votes, {review.id: 'helpful', self.reviews[1].id: None, self.reviews[2].id: 'unhelpful'})
+
+        response = self.client.delete(f'/api/reviews/reviews/{review.id}/vote/')
+        self.assertEqual((response.data['helpful_votes'], response.data['previous_vote']), (0, 'helpful'))
+
+
+class CanReviewTest(TestCase):
+    """Can-review answers and verified purchase flags come from the purchased products set."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create_user(email='vendor@example.com', password='pass')
+        brand = Brand.objects.create(name='Acme', slug='acme')
+        category = Category.objects.create(name='Phones', slug='phones')
+        cls.products = [
+            Product.objects.create(name=f'Phone {n}', slug=f'phone-{n}', category=category, brand=brand,
+                                   vendor=vendor, description='A phone', base_price=Decimal('100'),
+                                   is_approved=True)
+            for n in range(3)
+        ]
+        cls.user = User.objects.create_user(email='buyer@example.com', password='pass')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        order = Order.objects.create(
+            user=self.user, payment_method='card', shipping_address='House 1', shipping_city='Dhaka',
+            shipping_state='Dhaka', shipping_postal_code='1200', shipping_phone='01700000000', subtotal=0, total=0,
+        )
+        for product in self.products[:2]:
+            OrderItem.objects.create(order=order, product=product, price=product.base_price)
+        order.status = 'delivered'
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+
+    def test_single_and_batch_answers(self):
+        bought, reviewed, other = self.products
+        review = Review.objects.create(product=reviewed, user=self.user, rating=5, title='Title', comment='Comment')
+        self.assertTrue(review.is_verified_purchase)
+
+        response = self.client.get(f'/api/reviews/reviews/can_review/?product={bought.id}')
+        self.assertEqual(response.data, {'can_review': True})
+        response = self.client.get(f'/api/reviews/can-review/?product={other.id}')
+        self.assertEqual(response.data['reason'], 'You need to purchase this product before leaving a review')
+        response = self.client.get('/api/reviews/reviews/can_review/?product=999999')
+        self.assertEqual(response.status_code, 404)
 
-# Create your tests here.
+        ids = ','.join(str(product.id) for product in self.products)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/reviews/reviews/can_review_batch/?products={ids}')
+        self.assertEqual(
+            {product_id: (answer['can_review'], answer['purchased']) for product_id, answer in response.data.items()},
+            {bought.id: (True, True), reviewed.id: (False, True), other.id: (False, False)},
+        )
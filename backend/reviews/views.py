@@ -1,14 +1,17 @@
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Count, Avg, Q
+from django.db.models import Count, Q
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action, api_view, permission_classes, authentication_classes
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
-from .models import Review, ReviewVote, ReviewReply
+from .models import ProductReviewStats, Review, ReviewReply
+from .stats import review_summary
+from .votes import VOTES, cast_vote, retract_vote, user_votes
+from orders.purchases import purchased_product_ids
 from .serializers import (
-    ReviewSerializer, ReviewVoteSerializer, ReviewReplySerializer,
+    ReviewSerializer, ReviewReplySerializer,
     ReviewCreateSerializer, ReviewSummarySerializer
 )
 from .permissions import IsReviewOwnerOrReadOnly, IsReplyOwnerOrReadOnly
@@ -22,6 +25,55 @@ class ReviewPagination(PageNumberPagination):
     max_page_size = 100
 
 
+ALREADY_REVIEWED = 'You have already reviewed this product'
+NOT_PURCHASED = 'You need to purchase this product before leaving a review'
+
+
+def review_eligibility(user, product_ids):
+    """
+    Whether ``user`` can review each of ``product_ids``, as {product_id: answer}.
+
+    Purchases come from the cached purchased products set (see
+    orders.purchases); the user's own reviews take one query.
+    """
+    purchased = purchased_product_ids(user.id)
+    reviewed = set(Review.objects.filter(user=user, product_id__in=product_ids).values_list('product_id', flat=True))
+    answers = {}
+    for product_id in product_ids:
+        answer = {'can_review': False, 'purchased': product_id in purchased}
+        if product_id in reviewed:
+            answer['reason'] = ALREADY_REVIEWED
+        elif not answer['purchased']:
+            answer['reason'] = NOT_PURCHASED
+        else:
+            answer['can_review'] = True
+        answers[product_id] = answer
+    return answers
+
+
+def can_review_response(user, product_id):
+    """The can-review answer of one product; the product is only looked up when neither bought nor reviewed."""
+    if not product_id:
+        return Response(
+            {'error': 'Product ID is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        product_id = int(product_id)
+    except (TypeError, ValueError):
+        product_id = None
+    
+    answer = review_eligibility(user, [product_id])[product_id] if product_id else None
+    if answer is None or (answer.get('reason') == NOT_PURCHASED and not Product.objects.filter(id=product_id).exists()):
+        return Response(
+            {'error': 'Product not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    answer.pop('purchased')
+    return Response(answer, status=status.HTTP_200_OK)
+
+
 class ReviewViewSet(viewsets.ModelViewSet):
     """API endpoint for reviews."""
     serializer_class = ReviewSerializer
@@ -78,34 +130,66 @@ class ReviewViewSet(viewsets.ModelViewSet):
         """Set user when creating a review."""
         serializer.save(user=self.request.user)
     
-    @action(detail=True, methods=['post'])
+    def get_serializer(self, *args, **kwargs):
+        """Look up the current user's votes on a page of reviews with one query."""
+        if kwargs.get('many') and args and self.get_serializer_class() is ReviewSerializer:
+            reviews = args[0]
+            kwargs['context'] = {
+                **self.get_serializer_context(),
+                'user_votes': user_votes(self.request.user, [review.pk for review in reviews]),
+            }
+        return super().get_serializer(*args, **kwargs)
+    
+    @action(detail=True, methods=['post', 'delete'], permission_classes=[permissions.IsAuthenticated])
     def vote(self, request, pk=None):
-        """Vote on a review (helpful/unhelpful)."""
+        """Vote on a review (helpful/unhelpful), or take the vote back with DELETE."""
         review = self.get_object()
         
-        # Get vote type from request data
-        vote_type = request.data.get('vote')
-        if vote_type not in ['helpful', 'unhelpful']:
+        if request.method == 'DELETE':
+            previous = retract_vote(review.id, request.user.id)
+            vote_type = None
+        else:
+            # Get vote type from request data
+            vote_type = request.data.get('vote')
+            if vote_type not in VOTES:
+                return Response(
+                    {'error': 'Invalid vote type. Use "helpful" or "unhelpful".'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            # One upsert plus one relative counter update (see reviews.votes)
+            previous = cast_vote(review.id, request.user.id, vote_type)
+        
+        counts = Review.objects.filter(pk=review.id).values('helpful_votes', 'unhelpful_votes').first()
+        return Response({
+            'review': review.id,
+            'vote': vote_type,
+            'previous_vote': previous,
+            **counts,
+        })
+    
+    @action(detail=False, methods=['get'])
+    def my_votes(self, request):
+        """Get the current user's votes on a page of reviews (?reviews=1,2,3) as {review_id: vote}."""
+        if not request.user.is_authenticated:
             return Response(
-                {'error': 'Invalid vote type. Use "helpful" or "unhelpful".'},
-                status=status.HTTP_400_BAD_REQUEST
+                {'error': 'Authentication required'},
+                status=status.HTTP_401_UNAUTHORIZED
             )
         
-        # Create or update vote
         try:
-            vote, created = ReviewVote.objects.update_or_create(
-                review=review,
-                user=request.user,
-                defaults={'vote': vote_type}
+            review_ids = [int(value) for value in request.query_params.get('reviews', '').split(',') if value.strip()]
+        except ValueError:
+            return Response(
+                {'error': 'reviews must be a comma separated list of review IDs'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            
-            serializer = ReviewVoteSerializer(vote)
-            return Response(serializer.data)
-        except Exception as e:
+        if len(review_ids) > ReviewPagination.max_page_size:
             return Response(
-                {'error': str(e)},
+                {'error': f'At most {ReviewPagination.max_page_size} reviews per request'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        
+        return Response(user_votes(request.user, review_ids))
     
     @action(detail=True, methods=['post'])
     def reply(self, request, pk=None):
@@ -132,25 +216,12 @@ class ReviewViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Get product
-        product = get_object_or_404(Product, id=product_id)
-        
-        # Get approved reviews for this product
-        reviews = Review.objects.filter(product=product, status='approved')
-        
-        # Calculate statistics
-        stats = {
-            'total_reviews': reviews.count(),
-            'average_rating': reviews.aggregate(avg=Avg('rating'))['avg'] or 0,
-            'rating_distribution': {
-                '5': reviews.filter(rating=5).count(),
-                '4': reviews.filter(rating=4).count(),
-                '3': reviews.filter(rating=3).count(),
-                '2': reviews.filter(rating=2).count(),
-                '1': reviews.filter(rating=1).count(),
-            },
-            'verified_purchases': reviews.filter(is_verified_purchase=True).count(),
-        }
+        # Precomputed totals and histogram (see reviews.stats)
+        stats = ProductReviewStats.objects.filter(product_id=product_id).first()
+        if stats is None:
+            # No approved review yet, or no such product
+            get_object_or_404(Product, id=product_id)
+        stats = review_summary(stats)
         
         return Response(stats)
     
@@ -203,53 +274,31 @@ class ReviewViewSet(viewsets.ModelViewSet):
                 {'can_review': False, 'reason': 'Authentication required'},
                 status=status.HTTP_200_OK
             )
-            
-        product_id = request.query_params.get('product')
-        if not product_id:
-            return Response(
-                {'error': 'Product ID is required'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-            
-        # Get product
+        
+        return can_review_response(request.user, request.query_params.get('product'))
+    
+    @action(detail=False, methods=['get'])
+    def can_review_batch(self, request):
+        """Check a page of products at once (?products=1,2,3): {product_id: {can_review, purchased, reason}}."""
         try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
+            product_ids = [int(value) for value in request.query_params.get('products', '').split(',') if value.strip()]
+        except ValueError:
             return Response(
-                {'error': 'Product not found'},
-                status=status.HTTP_404_NOT_FOUND
+                {'error': 'products must be a comma separated list of product IDs'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            
-        # Check if user has already reviewed this product
-        has_reviewed = Review.objects.filter(
-            product=product, 
-            user=request.user
-        ).exists()
-        
-        if has_reviewed:
+        if len(product_ids) > ReviewPagination.max_page_size:
             return Response(
-                {'can_review': False, 'reason': 'You have already reviewed this product'},
-                status=status.HTTP_200_OK
+                {'error': f'At most {ReviewPagination.max_page_size} products per request'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            
-        # Check if user has purchased the product
-        from orders.models import OrderItem
-        has_purchased = OrderItem.objects.filter(
-            order__user=request.user,
-            product=product,
-            order__status__in=['delivered', 'completed']
-        ).exists()
         
-        if not has_purchased:
-            return Response(
-                {'can_review': False, 'reason': 'You need to purchase this product before leaving a review'},
-                status=status.HTTP_200_OK
-            )
-            
-        return Response(
-            {'can_review': True},
-            status=status.HTTP_200_OK
-        )
+        if not request.user.is_authenticated:
+            return Response({
+                product_id: {'can_review': False, 'purchased': False, 'reason': 'Authentication required'}
+                for product_id in product_ids
+            })
+        return Response(review_eligibility(request.user, product_ids))
 
 
 class ReviewReplyViewSet(viewsets.ModelViewSet):
@@ -329,50 +378,4 @@ def check_can_review(request):
             status=status.HTTP_200_OK
         )
     
-    # Get product ID from query parameters
-    product_id = request.query_params.get('product')
-    if not product_id:
-        return Response(
-            {'error': 'Product ID is required'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    # Get product
-    try:
-        product = Product.objects.get(id=product_id)
-    except Product.DoesNotExist:
-        return Response(
-            {'error': 'Product not found'},
-            status=status.HTTP_404_NOT_FOUND
-        )
-    
-    # Check if user has already reviewed this product
-    has_reviewed = Review.objects.filter(
-        product=product, 
-        user=request.user
-    ).exists()
-    
-    if has_reviewed:
-        return Response(
-            {'can_review': False, 'reason': 'You have already reviewed this product'},
-            status=status.HTTP_200_OK
-        )
-    
-    # Check if user has purchased the product
-    from orders.models import OrderItem
-    has_purchased = OrderItem.objects.filter(
-        order__user=request.user,
-        product=product,
-        order__status__in=['delivered', 'completed']
-    ).exists()
-    
-    if not has_purchased:
-        return Response(
-            {'can_review': False, 'reason': 'You need to purchase this product before leaving a review'},
-            status=status.HTTP_200_OK
-        )
-    
-    return Response(
-        {'can_review': True},
-        status=status.HTTP_200_OK
-    )
+    return can_review_response(request.user, request.query_params.get('product'))
@@ -0,0 +1,166 @@
+"""
+Review votes.
+
+Each review and user has at most one ReviewVote row. The review keeps the
+counts in ``helpful_votes`` and ``unhelpful_votes``. ``cast_vote`` and
+``retract_vote`` change the row. In the same transaction they move the
+counts with one relative UPDATE (col = col + delta), so concurrent votes
+on a popular review never overwrite each other's counts.
+
+On PostgreSQL, casting a vote is a single INSERT ... ON CONFLICT DO UPDATE
+that only touches the row when the vote changes. A vote is either helpful
+or unhelpful, so the statement's result says how the counts move:
+
+* a new row adds one to the vote cast;
+* a changed row moves one over from the other kind;
+* no row means the same vote was already cast.
+
+Retracting is a DELETE ... RETURNING. Other databases lock and read the
+row first.
+
+Queryset ``delete()`` calls (for example when a user is deleted) bypass
+this. ``recount_votes`` rebuilds the counts from the vote rows with one
+UPDATE, and the ``recount_review_votes`` command runs it.
+"""
+import logging
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+HELPFUL = 'helpful'
+UNHELPFUL = 'unhelpful'
+VOTES = (HELPFUL, UNHELPFUL)
+COUNT_FIELDS = {HELPFUL: 'helpful_votes', UNHELPFUL: 'unhelpful_votes'}
+
+
+def _other(vote):
+    return UNHELPFUL if vote == HELPFUL else HELPFUL
+
+
+def apply_vote_change(review_id, before=None, after=None):
+    """Move one count of the review from the ``before`` vote to the ``after`` vote; either may be None."""
+    from .models import Review
+
+    if before == after:
+        return
+    changes = {}
+    if before:
+        field = COUNT_FIELDS[before]
+        # Greatest keeps a drifted count valid until it is recounted
+        changes[field] = Greatest(F(field) - 1, Value(0))
+    if after:
+        field = COUNT_FIELDS[after]
+        changes[field] = F(field) + 1
+    Review.objects.filter(pk=review_id).update(**changes)
+
+
+def _upsert(review_id, user_id, vote):
+    """Store the vote; returns the vote it replaced (the same vote if unchanged) or None."""
+    from .models import ReviewVote
+
+    if connection.vendor != 'postgresql':
+        for _ in range(2):
+            previous = ReviewVote.objects.select_for_update().filter(
+                review_id=review_id, user_id=user_id,
+            ).values_list('vote', flat=True).first()
+            if previous is not None:
+                if previous != vote:
+                    ReviewVote.objects.filter(review_id=review_id, user_id=user_id).update(vote=vote)
+                return previous
+            try:
+                with transaction.atomic():
+                    ReviewVote.objects.bulk_create([ReviewVote(review_id=review_id, user_id=user_id, vote=vote)])
+                return None
+            except IntegrityError:
+                # A concurrent request inserted it first; lock and read that row
+                continue
+        raise IntegrityError(f"Could not store vote of user {user_id} on review {review_id}")
+
+    table = connection.ops.quote_name(ReviewVote._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} AS v (review_id, user_id, vote, created_at) VALUES (%s, %s, %s, %s)
+            ON CONFLICT (review_id, user_id) DO UPDATE SET vote = EXCLUDED.vote
+            WHERE v.vote <> EXCLUDED.vote
+            RETURNING (v.xmax = 0)
+            """,
+            [review_id, user_id, vote, timezone.now()],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return vote
+    # xmax is 0 on a freshly inserted row
+    return None if row[0] else _other(vote)
+
+
+def cast_vote(review_id, user_id, vote):
+    """Record ``user_id``'s vote on the review and update its counts; returns the previous vote or None."""
+    if vote not in VOTES:
+        raise ValueError(f"Invalid vote {vote!r}")
+    with transaction.atomic():
+        previous = _upsert(review_id, user_id, vote)
+        apply_vote_change(review_id, previous, vote)
+    return previous
+
+
+def retract_vote(review_id, user_id):
+    """Remove ``user_id``'s vote on the review and update its counts; returns the removed vote or None."""
+    from .models import ReviewVote
+
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            table = connection.ops.quote_name(ReviewVote._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE review_id = %s AND user_id = %s RETURNING vote",
+                    [review_id, user_id],
+                )
+                row = cursor.fetchone()
+            removed = row[0] if row else None
+        else:
+            votes = ReviewVote.objects.select_for_update().filter(review_id=review_id, user_id=user_id)
+            removed = votes.values_list('vote', flat=True).first()
+            if removed is not None:
+                votes.delete()
+        apply_vote_change(review_id, removed, None)
+    return removed
+
+
+def user_votes(user, review_ids):
+    """``{review_id: vote}`` of ``user`` on ``review_ids``, from one query."""
+    from .models import ReviewVote
+
+    review_ids = list(review_ids)
+    if user is None or not user.is_authenticated or not review_ids:
+        return {}
+    return dict(ReviewVote.objects.filter(user=user, review_id__in=review_ids).values_list('review_id', 'vote'))
+
+
+def recount_votes(review_ids=None):
+    """Rewrite the vote counts that drifted from the vote rows; returns how many reviews changed."""
+    from .models import Review, ReviewVote
+
+    expected = {
+        f'expected_{field}': Coalesce(Subquery(
+            ReviewVote.objects.filter(review_id=OuterRef('pk'), vote=vote).order_by().values('review_id').annotate(
+                count=Count('id'),
+            ).values('count'),
+            output_field=IntegerField(),
+        ), 0)
+        for vote, field in COUNT_FIELDS.items()
+    }
+    reviews = Review.objects.all()
+    if review_ids is not None:
+        reviews = reviews.filter(pk__in=list(review_ids))
+    drifted = reviews.annotate(**expected).filter(
+        ~Q(helpful_votes=F('expected_helpful_votes')) | ~Q(unhelpful_votes=F('expected_unhelpful_votes'))
+    )
+    updated = drifted.update(**{field: expected[f'expected_{field}'] for field in COUNT_FIELDS.values()})
+    if updated:
+        logger.warning(f"Recounted votes of {updated} reviews")
+    return updated
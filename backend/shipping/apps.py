@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ShippingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shipping'
+
+    def ready(self):
+        """Import signals when the app is ready."""
+        import shipping.signals
@@ -191,33 +191,7 @@ class ShippingRate(models.Model):
         return f"{self.zone.name} - {self.method.name} ({self.get_rate_type_display()})"
     
     def calculate_shipping_cost(self, order_total, weight=None, items_count=None, dimensions=None):
-        """Calculate shipping cost based on various factors."""
-        cost = self.base_rate
+        """Calculate shipping cost based on various factors (see shipping/quotes.py)."""
+        from .quotes import rate_cost
         
-        if self.rate_type == 'flat':
-            return cost
-        
-        if self.rate_type == 'weight' and weight:
-            cost += self.per_kg_rate * weight
-        
-        if self.rate_type == 'item' and items_count:
-            cost += self.per_item_rate * items_count
-        
-        if self.rate_type == 'price':
-            # Apply any price-based rules from conditions
-            price_rules = self.conditions.get('price_rules', [])
-            for rule in price_rules:
-                if rule['min'] <= order_total <= rule['max']:
-                    cost = rule['rate']
-                    break
-        
-        if self.rate_type == 'dimension' and dimensions:
-            # Calculate dimensional weight and apply rate
-            dim_weight = (dimensions['length'] * dimensions['width'] * dimensions['height']) / 5000
-            cost += self.per_kg_rate * dim_weight
-        
-        # Check for free shipping threshold
-        if self.free_shipping_threshold and order_total >= self.free_shipping_threshold:
-            return 0
-        
-        return cost
+        return rate_cost(self, order_total, weight, items_count, dimensions)
@@ -0,0 +1,154 @@
+"""
+Shipping quotes.
+
+``rate_cost`` is the one pricing rule for a ShippingRate. The rate type
+picks the factors:
+
+* ``flat``: the base rate.
+* ``weight``, ``item``, ``dimension``: the base rate plus ``per_kg_rate``
+  x weight, ``per_item_rate`` x items, or ``per_kg_rate`` x dimensional
+  weight (L x W x H / 5000, in cm).
+* ``price``: the first ``conditions['price_rules']`` tier holding the
+  order total ({'min', 'max', 'rate'}), else the base rate plus
+  ``conditions['percentage']`` of the total.
+* ``combined``: the base rate plus every factor the parcel has.
+
+A rate's own free shipping threshold makes it free.
+
+``quote_parcel`` prices every method that reaches a destination for one
+parcel. It reads the compiled zones (see shipping/zones.py) and makes no
+queries. A parcel is a dict with ``order_total`` and optional ``weight``
+(kg), ``items_count`` and ``dimensions``. Methods the parcel is too heavy
+for are left out. When several zones offer a method, the cheapest rate is
+used. Quotes are ranked by cost, then by the longest delivery time.
+``quote_many`` does the same for many (destination, parcel) pairs and
+resolves each distinct destination once.
+"""
+from decimal import Decimal, InvalidOperation
+
+from .zones import get_zones, normalize
+
+CENTS = Decimal('0.01')
+ZERO = Decimal('0.00')
+# cm³ per kg of dimensional weight
+DIMENSIONAL_DIVISOR = Decimal('5000')
+DESTINATION_FIELDS = ('country', 'state', 'city', 'postal_code')
+
+
+def _decimal(value):
+    if value is None or value == '':
+        return None
+    try:
+        value = Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    # NaN and infinities would poison costs and their ranking
+    return value if value.is_finite() else None
+
+
+def dimensional_weight(dimensions):
+    """Dimensional weight in kg of {'length', 'width', 'height'} in cm, or None."""
+    if not dimensions:
+        return None
+    sides = [_decimal(dimensions.get(side)) for side in ('length', 'width', 'height')]
+    if None in sides:
+        return None
+    return sides[0] * sides[1] * sides[2] / DIMENSIONAL_DIVISOR
+
+
+def _price_tier(rate, order_total):
+    for rule in (rate.conditions or {}).get('price_rules', []):
+        low, high, amount = _decimal(rule.get('min')), _decimal(rule.get('max')), _decimal(rule.get('rate'))
+        if amount is not None and (low is None or low <= order_total) and (high is None or order_total <= high):
+            return amount
+    return None
+
+
+def rate_cost(rate, order_total, weight=None, items_count=None, dimensions=None):
+    """Cost of shipping a parcel with ``rate``."""
+    order_total = _decimal(order_total) or ZERO
+    if rate.free_shipping_threshold and order_total >= rate.free_shipping_threshold:
+        return ZERO
+
+    weight = _decimal(weight)
+    dim_weight = dimensional_weight(dimensions)
+    cost = rate.base_rate
+    rate_type = rate.rate_type
+    combined = rate_type == 'combined'
+
+    if rate_type == 'price':
+        tier = _price_tier(rate, order_total)
+        if tier is not None:
+            return tier.quantize(CENTS)
+        percentage = _decimal((rate.conditions or {}).get('percentage')) or ZERO
+        cost += order_total * percentage / 100
+    if (rate_type == 'weight' or combined) and weight:
+        cost += rate.per_kg_rate * weight
+    if (rate_type == 'item' or combined) and items_count:
+        cost += rate.per_item_rate * items_count
+    if (rate_type == 'dimension' or combined) and dim_weight:
+        cost += rate.per_kg_rate * dim_weight
+    return cost.quantize(CENTS)
+
+
+def method_fits(method, weight=None):
+    """Whether ``method`` takes a parcel of ``weight`` kg."""
+    weight = _decimal(weight)
+    return not (method.max_weight and weight and weight > method.max_weight)
+
+
+def _quote(rate, parcel, free_shipping_threshold):
+    order_total = _decimal(parcel.get('order_total')) or ZERO
+    if free_shipping_threshold is not None and order_total >= free_shipping_threshold:
+        cost = ZERO
+    else:
+        cost = rate_cost(rate, order_total, parcel.get('weight'), parcel.get('items_count'),
+                         parcel.get('dimensions'))
+    method = rate.method
+    return {
+        'method_id': method.id,
+        'method_name': method.name,
+        'method_type': method.method_type,
+        'zone_id': rate.zone_id,
+        'rate_id': rate.id,
+        'rate_type': rate.rate_type,
+        'cost': cost,
+        'is_free': cost == ZERO,
+        'min_delivery_time': method.min_delivery_time,
+        'max_delivery_time': method.max_delivery_time,
+    }
+
+
+def _rank(rates, parcel, free_shipping_threshold):
+    cheapest = {}
+    for rate in rates:
+        if not method_fits(rate.method, parcel.get('weight')):
+            continue
+        quote = _quote(rate, parcel, free_shipping_threshold)
+        current = cheapest.get(quote['method_id'])
+        if current is None or quote['cost'] < current['cost']:
+            cheapest[quote['method_id']] = quote
+    return sorted(cheapest.values(), key=lambda quote: (
+        quote['cost'], quote['max_delivery_time'], quote['method_name'], quote['method_id'],
+    ))
+
+
+def quote_parcel(destination, parcel, free_shipping_threshold=None):
+    """Ranked quotes of every method reaching ``destination`` for ``parcel``."""
+    zones = get_zones()
+    zone_ids = zones.resolve(**{field: destination.get(field) for field in DESTINATION_FIELDS})
+    return _rank(zones.rates_for(zone_ids), parcel, free_shipping_threshold)
+
+
+def quote_many(pairs, free_shipping_threshold=None):
+    """Ranked quotes for each (destination, parcel) pair, in order."""
+    zones = get_zones()
+    rates_by_destination = {}
+    results = []
+    for destination, parcel in pairs:
+        key = tuple(normalize(destination.get(field)) for field in DESTINATION_FIELDS)
+        if key not in rates_by_destination:
+            zone_ids = zones.resolve(**{field: destination.get(field) for field in DESTINATION_FIELDS})
+            rates_by_destination[key] = zones.rates_for(zone_ids)
+        results.append(_rank(rates_by_destination[key], parcel, free_shipping_threshold))
+    return results
@@ -1,5 +1,8 @@
+from decimal import Decimal
+
 from rest_framework import serializers
 from .models import ShippingZone, ShippingMethod, ShippingRate
+from .zones import get_zones
 
 
 class ShippingZoneSerializer(serializers.ModelSerializer):
@@ -60,6 +63,14 @@ class ShippingRateSerializer(serializers.ModelSerializer):
         return data
 
 
+class ShippingDimensionsSerializer(serializers.Serializer):
+    """Parcel dimensions in cm."""
+    
+    length = serializers.DecimalField(max_digits=8, decimal_places=2, min_value=Decimal('0.01'))
+    width = serializers.DecimalField(max_digits=8, decimal_places=2, min_value=Decimal('0.01'))
+    height = serializers.DecimalField(max_digits=8, decimal_places=2, min_value=Decimal('0.01'))
+
+
 class ShippingCalculatorSerializer(serializers.Serializer):
     """Serializer for calculating shipping costs."""
     
@@ -68,31 +79,26 @@ class ShippingCalculatorSerializer(serializers.Serializer):
     order_total = serializers.DecimalField(max_digits=10, decimal_places=2)
     weight = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
     items_count = serializers.IntegerField(required=False)
-    dimensions = serializers.DictField(required=False)
+    dimensions = ShippingDimensionsSerializer(required=False)
     
     def validate(self, data):
         """Validate shipping calculator data."""
-        try:
-            zone = ShippingZone.objects.get(id=data['zone_id'], is_active=True)
-            method = ShippingMethod.objects.get(id=data['method_id'], is_active=True)
-            
-            # Get the shipping rate
-            rate = ShippingRate.objects.get(
-                zone=zone,
-                method=method,
-                is_active=True
-            )
-            
-            # Add validated objects to the data
-            data['zone'] = zone
-            data['method'] = method
-            data['rate'] = rate
-            
-        except (ShippingZone.DoesNotExist, ShippingMethod.DoesNotExist):
+        zones = get_zones()
+        zone = zones.zones.get(data['zone_id'])
+        rate = zones.rate(data['zone_id'], data['method_id'])
+        if zone is None:
             raise serializers.ValidationError('Invalid shipping zone or method.')
-        except ShippingRate.DoesNotExist:
+        if rate is None:
+            # Only the error path queries, to tell a bad method from a missing rate
+            if not ShippingMethod.objects.filter(id=data['method_id'], is_active=True).exists():
+                raise serializers.ValidationError('Invalid shipping zone or method.')
             raise serializers.ValidationError('No active shipping rate found for this zone and method.')
         
+        # Add validated objects to the data
+        data['zone'] = zone
+        data['method'] = rate.method
+        data['rate'] = rate
+        
         return data
     
     def calculate(self):
@@ -105,4 +111,28 @@ class ShippingCalculatorSerializer(serializers.Serializer):
             weight=data.get('weight'),
             items_count=data.get('items_count'),
             dimensions=data.get('dimensions')
-        ) 
\ No newline at end of file
+        ) 
+
+class ShippingDestinationSerializer(serializers.Serializer):
+    """Where a parcel is shipped."""
+    
+    country = serializers.CharField()
+    state = serializers.CharField(required=False, allow_blank=True)
+    city = serializers.CharField(required=False, allow_blank=True)
+    postal_code = serializers.CharField(required=False, allow_blank=True)
+
+
+class ShippingParcelSerializer(serializers.Serializer):
+    """What is shipped: the order total and optionally weight (kg), item count and dimensions (cm)."""
+    
+    order_total = serializers.DecimalField(max_digits=12, decimal_places=2)
+    weight = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    items_count = serializers.IntegerField(required=False, min_value=0)
+    dimensions = ShippingDimensionsSerializer(required=False)
+
+
+class ShippingQuoteSerializer(serializers.Serializer):
+    """One destination and parcel to quote every shipping method for."""
+    
+    destination = ShippingDestinationSerializer()
+    parcel = ShippingParcelSerializer()
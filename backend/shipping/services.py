@@ -1,6 +1,6 @@
 from decimal import Decimal
-from django.db.models import Q
-from .models import ShippingRate, ShippingZone, ShippingMethod
+from . import quotes
+from .zones import get_zones, normalize
 
 
 class ShippingService:
@@ -20,32 +20,23 @@ class ShippingService:
         if not shipping_zone or not shipping_method:
             return cls.get_default_shipping_cost()
         
-        # Try to find a specific shipping rate
-        try:
-            rate = ShippingRate.objects.get(
-                zone=shipping_zone,
-                method=shipping_method,
-                is_active=True
-            )
-            
-            # Check if this rate has its own free shipping threshold
-            if rate.free_shipping_threshold and cart_total >= rate.free_shipping_threshold:
-                return Decimal('0.00')
-            
-            # Calculate shipping cost based on rate type
-            if rate.rate_type == 'flat':
-                return rate.base_rate
-            elif rate.rate_type == 'price':
-                # Price-based shipping (percentage of cart total)
-                percentage = rate.conditions.get('percentage', 0)
-                return (cart_total * Decimal(percentage) / 100) + rate.base_rate
-            else:
-                # Default to base rate for other rate types
-                return rate.base_rate
-            
-        except ShippingRate.DoesNotExist:
+        # Find the rate in the compiled zones, without a query
+        rate = get_zones().rate(shipping_zone.id, shipping_method.id)
+        if rate is None:
             # Fall back to default shipping cost
             return cls.get_default_shipping_cost()
+        
+        return quotes.rate_cost(rate, cart_total)
+    
+    @classmethod
+    def quote(cls, destination, parcel):
+        """Ranked quotes of every method reaching ``destination`` for ``parcel`` (see shipping/quotes.py)."""
+        return quotes.quote_parcel(destination, parcel, cls.get_free_shipping_threshold())
+    
+    @classmethod
+    def quote_many(cls, pairs):
+        """Ranked quotes for each (destination, parcel) pair, in order."""
+        return quotes.quote_many(pairs, cls.get_free_shipping_threshold())
     
     @classmethod
     def get_free_shipping_threshold(cls):
@@ -78,138 +69,40 @@ def debug_city_matching(city):
     
     # Normalize the city name (lowercase)
     city_lower = city.lower().strip()
+    zones = get_zones()
+    all_zones = sorted(zones.zones.values(), key=lambda zone: (zone.name, zone.id))
     
-    # Find zones that match this city
-    direct_match_zones = ShippingZone.objects.filter(
-        Q(cities__contains=[city]) & Q(is_active=True)
-    )
-    
-    lowercase_match_zones = ShippingZone.objects.filter(
-        Q(cities__contains=[city_lower]) & Q(is_active=True)
-    )
-    
-    # Get all zones to check manual matching
-    all_zones = ShippingZone.objects.filter(is_active=True)
-    manual_matches = []
+    def describe(zone):
+        return {'id': zone.id, 'name': zone.name, 'cities': zone.cities}
     
-    for zone in all_zones:
-        cities = zone.cities
-        if not cities:
-            continue
-        
-        for zone_city in cities:
-            if zone_city.lower() == city_lower:
-                manual_matches.append({
-                    'id': zone.id,
-                    'name': zone.name,
-                    'city_in_zone': zone_city
-                })
+    manual_matches = [
+        {'id': zone.id, 'name': zone.name, 'city_in_zone': zone_city}
+        for zone in all_zones
+        for zone_city in zone.cities or []
+        if normalize(zone_city) == normalize(city)
+    ]
     
     # Create debug response
-    response = {
+    return {
         'city_queried': city,
         'city_normalized': city_lower,
-        'direct_matches': [
-            {'id': zone.id, 'name': zone.name, 'cities': zone.cities}
-            for zone in direct_match_zones
-        ],
-        'lowercase_matches': [
-            {'id': zone.id, 'name': zone.name, 'cities': zone.cities}
-            for zone in lowercase_match_zones
-        ],
+        'direct_matches': [describe(zone) for zone in all_zones if city in (zone.cities or [])],
+        'lowercase_matches': [describe(zone) for zone in all_zones if city_lower in (zone.cities or [])],
         'manual_matches': manual_matches,
-        'all_zones': [
-            {'id': zone.id, 'name': zone.name, 'cities': zone.cities}
-            for zone in all_zones
-        ]
+        'resolved_zone_ids': sorted(zones.resolve(city=city)),
+        'all_zones': [describe(zone) for zone in all_zones]
     }
-    
-    return response
 
 def get_available_shipping_methods(country=None, state=None, city=None, postal_code=None):
     """
-    Get available shipping methods for a location.
+    Get available shipping methods for a location, from the compiled zones.
     """
-    # Find matching zones
-    zones_query = Q(is_active=True)
-    
-    if country:
-        zones_query &= Q(countries__contains=[country])
-    
-    if state:
-        zones_query &= (Q(states__contains=[state]) | Q(states=[]))
-    
-    if city:
-        # Try both exact match and lowercase match
-        city_lower = city.lower().strip()
-        cities_query = Q()
-        
-        # Check for city in the cities array
-        for zone in ShippingZone.objects.filter(zones_query):
-            if zone.cities:
-                for zone_city in zone.cities:
-                    if zone_city.lower() == city_lower:
-                        cities_query |= Q(id=zone.id)
-        
-        # If we found matches using manual comparison
-        if cities_query:
-            zones_query &= cities_query
-        else:
-            # Fall back to contains lookup
-            zones_query &= (Q(cities__contains=[city]) | Q(cities__contains=[city_lower]) | Q(cities=[]))
-    
-    if postal_code:
-        zones_query &= (Q(postal_codes__contains=[postal_code]) | Q(postal_codes=[]))
-    
-    zones = ShippingZone.objects.filter(zones_query)
-    
-    # Get unique methods from rates for matching zones
-    rates = ShippingRate.objects.filter(zone__in=zones, is_active=True)
-    method_ids = rates.values_list('method_id', flat=True).distinct()
-    
-    # Get the methods
-    methods = ShippingMethod.objects.filter(id__in=method_ids, is_active=True)
-    
-    return methods
+    zones = get_zones()
+    return zones.methods_for(zones.resolve(country, state, city, postal_code))
 
 def get_available_shipping_rates(country=None, state=None, city=None, postal_code=None):
     """
-    Get available shipping rates for a location.
+    Get available shipping rates for a location, from the compiled zones.
     """
-    # Find matching zones using the same logic as get_available_shipping_methods
-    zones_query = Q(is_active=True)
-    
-    if country:
-        zones_query &= Q(countries__contains=[country])
-    
-    if state:
-        zones_query &= (Q(states__contains=[state]) | Q(states=[]))
-    
-    if city:
-        # Try both exact match and lowercase match
-        city_lower = city.lower().strip()
-        cities_query = Q()
-        
-        # Check for city in the cities array
-        for zone in ShippingZone.objects.filter(zones_query):
-            if zone.cities:
-                for zone_city in zone.cities:
-                    if zone_city.lower() == city_lower:
-                        cities_query |= Q(id=zone.id)
-        
-        # If we found matches using manual comparison
-        if cities_query:
-            zones_query &= cities_query
-        else:
-            # Fall back to contains lookup
-            zones_query &= (Q(cities__contains=[city]) | Q(cities__contains=[city_lower]) | Q(cities=[]))
-    
-    if postal_code:
-        zones_query &= (Q(postal_codes__contains=[postal_code]) | Q(postal_codes=[]))
-    
-    zones = ShippingZone.objects.filter(zones_query)
-    
-    # Get rates for matching zones
-    rates = ShippingRate.objects.filter(zone__in=zones, is_active=True)
-    
-    return rates 
\ No newline at end of file
+    zones = get_zones()
+    return zones.rates_for(zones.resolve(country, state, city, postal_code))
@@ -0,0 +1,17 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ShippingMethod, ShippingRate, ShippingZone
+from .zones import bump_zones_version
+
+
+@receiver(post_save, sender=ShippingZone)
+@receiver(post_delete, sender=ShippingZone)
+@receiver(post_save, sender=ShippingMethod)
+@receiver(post_delete, sender=ShippingMethod)
+@receiver(post_save, sender=ShippingRate)
+@receiver(post_delete, sender=ShippingRate)
+def invalidate_compiled_zones(sender, instance, **kwargs):
+    """Compiled zones hold every active zone, method and rate; bumped after commit so nobody compiles the old rows under the new version."""
+    transaction.on_commit(bump_zones_version)
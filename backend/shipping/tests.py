@@ -1,3 +1,169 @@
+from decimal import Decimal
+
 from django.test import TestCase
 
-# Create your tests here.
+from .models import ShippingMethod, ShippingRate, ShippingZone
+from . import quotes
+from .services import ShippingService, get_available_shipping_methods, get_available_shipping_rates
+from .zones import bump_zones_version, get_zones
+
+
+class ZoneResolverTest(TestCase):
+    """Addresses resolve against compiled zones, which recompile when zones or rates change."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.standard = ShippingMethod.objects.create(name='Standard Delivery', method_type='standard')
+        cls.express = ShippingMethod.objects.create(name='Express Delivery', method_type='express')
+        cls.dhaka = ShippingZone.objects.create(name='Dhaka Zone', countries=['BD'], cities=['dhaka', 'Dhaka'],
+                                                postal_codes=['1000', '12*'])
+        cls.sylhet = ShippingZone.objects.create(name='Sylhet Zone', countries=['BD'], cities=['Sylhet'],
+                                                 states=['Sylhet'])
+        cls.rest = ShippingZone.objects.create(name='Rest of Bangladesh', countries=['BD'])
+        ShippingZone.objects.create(name='Closed Zone', countries=['BD'], cities=['Dhaka'], is_active=False)
+        cls.dhaka_standard = ShippingRate.objects.create(zone=cls.dhaka, method=cls.standard, rate_type='flat',
+                                                         base_rate=Decimal('120'))
+        ShippingRate.objects.create(zone=cls.dhaka, method=cls.express, rate_type='flat', base_rate=Decimal('200'))
+        ShippingRate.objects.create(zone=cls.sylhet, method=cls.standard, rate_type='flat', base_rate=Decimal('150'))
+        ShippingRate.objects.create(zone=cls.rest, method=cls.standard, rate_type='flat', base_rate=Decimal('200'))
+
+    def setUp(self):
+        # Rolling back a test sends no signals, so compiled zones could outlive its rows
+        bump_zones_version()
+
+    def test_resolves_city_state_and_postal_code(self):
+        zones = get_zones()
+        self.assertEqual(zones.resolve('BD', city=' DHAKA '), {self.dhaka.id})
+        self.assertEqual(zones.resolve('BD', city='Dhaka', postal_code='1207'), {self.dhaka.id})
+        self.assertEqual(zones.resolve('BD', city='Dhaka', postal_code='4000'), set())
+        self.assertEqual(zones.resolve('BD', state='sylhet', city='sylhet'), {self.sylhet.id})
+        # No zone lists the city, so zones without cities apply
+        self.assertEqual(zones.resolve('BD', city='Khulna'), {self.rest.id})
+        self.assertEqual(zones.resolve('IN', city='Dhaka'), set())
+
+    def test_lookups_make_no_queries_until_a_rate_changes(self):
+        get_zones()
+        with self.assertNumQueries(0):
+            methods = get_available_shipping_methods(country='BD', city='dhaka')
+            rates = get_available_shipping_rates(country='BD', city='dhaka')
+            cost = ShippingService.calculate_shipping_cost(Decimal('1000'), self.dhaka, self.standard)
+        self.assertEqual([method.name for method in methods], ['Express Delivery', 'Standard Delivery'])
+        self.assertEqual([rate.base_rate for rate in rates], [Decimal('200'), Decimal('120')])
+        self.assertEqual(cost, Decimal('120'))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.dhaka_standard.base_rate = Decimal('100')
+            self.dhaka_standard.save()
+            # The version moves only once the change is committed
+            self.assertEqual(ShippingService.calculate_shipping_cost(Decimal('1000'), self.dhaka, self.standard),
+                             Decimal('120'))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(ShippingService.calculate_shipping_cost(Decimal('1000'), self.dhaka, self.standard),
+                         Decimal('100'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.express.is_active = False
+            self.express.save()
+        self.assertEqual([method.name for method in get_available_shipping_methods(country='BD', city='Dhaka')],
+                         ['Standard Delivery'])
+
+    def test_calculate_endpoint(self):
+        response = self.client.post('/api/shipping/rates/calculate/', {
+            'zone_id': self.sylhet.id, 'method_id': self.standard.id, 'order_total': '1000',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.data['shipping_cost']), Decimal('150'))
+
+        response = self.client.post('/api/shipping/rates/calculate/', {
+            'zone_id': self.sylhet.id, 'method_id': self.express.id, 'order_total': '1000',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('No active shipping rate', str(response.data))
+
+
+class ShippingQuoteTest(TestCase):
+    """Every rate type is priced by one rule, and quotes are ranked per destination."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.standard = ShippingMethod.objects.create(name='Standard Delivery', method_type='standard')
+        cls.express = ShippingMethod.objects.create(name='Express Delivery', method_type='express',
+                                                    max_weight=Decimal('5'))
+        cls.freight = ShippingMethod.objects.create(name='Freight', method_type='freight')
+        cls.dhaka = ShippingZone.objects.create(name='Dhaka Zone', countries=['BD'], cities=['Dhaka'])
+        cls.rest = ShippingZone.objects.create(name='Rest of Bangladesh', countries=['BD'])
+        ShippingRate.objects.create(zone=cls.dhaka, method=cls.standard, rate_type='item',
+                                    base_rate=Decimal('60'), per_item_rate=Decimal('10'))
+        ShippingRate.objects.create(zone=cls.dhaka, method=cls.express, rate_type='weight',
+                                    base_rate=Decimal('100'), per_kg_rate=Decimal('20'))
+        ShippingRate.objects.create(zone=cls.dhaka, method=cls.freight, rate_type='price', base_rate=Decimal('500'),
+                                    conditions={'price_rules': [{'min': 0, 'max': 999, 'rate': 300}]})
+        ShippingRate.objects.create(zone=cls.rest, method=cls.standard, rate_type='combined',
+                                    base_rate=Decimal('100'), per_kg_rate=Decimal('10'),
+                                    per_item_rate=Decimal('5'), free_shipping_threshold=Decimal('3000'))
+
+    def setUp(self):
+        # Rolling back a test sends no signals, so compiled zones could outlive its rows
+        bump_zones_version()
+
+    def test_rate_types_share_one_rule(self):
+        rate = ShippingRate(rate_type='dimension', base_rate=Decimal('50'), per_kg_rate=Decimal('10'))
+        self.assertEqual(rate.calculate_shipping_cost(Decimal('100'), dimensions={'length': 50, 'width': 20,
+                                                                                  'height': 10}),
+                         Decimal('70.00'))
+        rate = ShippingRate(rate_type='price', base_rate=Decimal('100'), conditions={'percentage': 2})
+        self.assertEqual(rate.calculate_shipping_cost(Decimal('1000')), Decimal('120.00'))
+        rate = ShippingRate(rate_type='combined', base_rate=Decimal('100'), per_kg_rate=Decimal('10'),
+                            per_item_rate=Decimal('5'), free_shipping_threshold=Decimal('3000'))
+        self.assertEqual(rate.calculate_shipping_cost(Decimal('1000'), weight=Decimal('2'), items_count=3),
+                         Decimal('135.00'))
+        self.assertEqual(rate.calculate_shipping_cost(Decimal('3000'), weight=Decimal('2')), Decimal('0.00'))
+
+    def test_quotes_are_ranked_and_batched_without_queries(self):
+        get_zones()
+        parcel = {'order_total': Decimal('1500'), 'weight': Decimal('2'), 'items_count': 2}
+        with self.assertNumQueries(0):
+            dhaka, heavy, elsewhere = ShippingService.quote_many([
+                ({'country': 'BD', 'city': 'dhaka'}, parcel),
+                ({'country': 'BD', 'city': 'Dhaka'}, dict(parcel, weight=Decimal('8'))),
+                ({'country': 'BD', 'city': 'Khulna'}, parcel),
+            ])
+        self.assertEqual([(quote['method_name'], quote['cost']) for quote in dhaka],
+                         [('Standard Delivery', Decimal('80.00')), ('Express Delivery', Decimal('140.00')),
+                          ('Freight', Decimal('500.00'))])
+        # Too heavy for express
+        self.assertEqual([quote['method_name'] for quote in heavy], ['Standard Delivery', 'Freight'])
+        self.assertEqual([(quote['method_name'], quote['cost']) for quote in elsewhere],
+                         [('Standard Delivery', Decimal('130.00'))])
+        # Over the store-wide free shipping threshold
+        self.assertTrue(all(quote['is_free'] for quote in ShippingService.quote(
+            {'country': 'BD', 'city': 'Dhaka'}, {'order_total': Decimal('6000')})))
+
+    def test_quote_endpoint(self):
+        response = self.client.post('/api/shipping/rates/quote/', {
+            'destination': {'country': 'BD', 'city': 'Dhaka'}, 'parcel': {'order_total': '800', 'items_count': 1},
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([quote['method_name'] for quote in response.data['quotes']],
+                         ['Standard Delivery', 'Express Delivery', 'Freight'])
+        self.assertEqual(response.data['quotes'][2]['cost'], Decimal('300.00'))
+
+        response = self.client.post('/api/shipping/rates/quote/', {'requests': [
+            {'destination': {'country': 'BD', 'city': 'Sylhet'}, 'parcel': {'order_total': '100'}},
+            {'destination': {'country': 'IN'}, 'parcel': {'order_total': '100'}},
+        ]}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([len(result['quotes']) for result in response.data['results']], [1, 0])
+
+        response = self.client.post('/api/shipping/rates/quote/', {'requests': [{'parcel': {}}]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_quote_endpoint_rejects_non_finite_dimensions(self):
+        for value in ('Infinity', 'NaN', '-5'):
+            response = self.client.post('/api/shipping/rates/quote/', {
+                'destination': {'country': 'BD', 'city': 'Dhaka'},
+                'parcel': {'order_total': '800', 'dimensions': {'length': value, 'width': '10', 'height': '10'}},
+            }, content_type='application/json')
+            self.assertEqual(response.status_code, 400, value)
+        self.assertIsNone(quotes.dimensional_weight({'length': 'NaN', 'width': 10, 'height': 10}))
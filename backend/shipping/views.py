@@ -3,13 +3,15 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
-from django.db.models import Q
 from .models import ShippingZone, ShippingMethod, ShippingRate
 from .serializers import (
     ShippingZoneSerializer, ShippingMethodSerializer,
-    ShippingRateSerializer, ShippingCalculatorSerializer
+    ShippingRateSerializer, ShippingCalculatorSerializer, ShippingQuoteSerializer
 )
-from .services import debug_city_matching
+from .services import ShippingService, debug_city_matching, get_available_shipping_rates
+
+# Most (destination, parcel) pairs one quote request may carry
+MAX_QUOTE_REQUESTS = 500
 
 
 class ShippingZoneViewSet(viewsets.ModelViewSet):
@@ -107,7 +109,7 @@ class ShippingRateViewSet(viewsets.ModelViewSet):
     
     def get_permissions(self):
         """Return appropriate permissions."""
-        if self.action in ['list', 'retrieve', 'calculate', 'available_rates']:
+        if self.action in ['list', 'retrieve', 'calculate', 'available_rates', 'quote']:
             return [AllowAny()]  # Public access for viewing rates and calculations
         elif self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [IsAdminUser()]  # Admin only for modifications
@@ -146,6 +148,35 @@ class ShippingRateViewSet(viewsets.ModelViewSet):
             })
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=False, methods=['post'])
+    def quote(self, request):
+        """
+        Quote every shipping method for a destination and parcel, cheapest first.
+        
+        Send ``{"destination": {...}, "parcel": {...}}`` for one quote, or
+        ``{"requests": [{"destination": ..., "parcel": ...}, ...]}`` for many.
+        """
+        batch = 'requests' in request.data
+        items = request.data.get('requests') if batch else [request.data]
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'requests must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > MAX_QUOTE_REQUESTS:
+            return Response(
+                {'error': f'At most {MAX_QUOTE_REQUESTS} requests can be quoted at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        serializer = ShippingQuoteSerializer(data=items, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors if batch else serializer.errors[0], status=status.HTTP_400_BAD_REQUEST)
+        
+        results = ShippingService.quote_many(
+            (item['destination'], item['parcel']) for item in serializer.validated_data
+        )
+        if batch:
+            return Response({'results': [{'quotes': quotes} for quotes in results], 'currency': 'BDT'})
+        return Response({'quotes': results[0], 'currency': 'BDT'})
+    
     @action(detail=False, methods=['get'])
     def available_rates(self, request):
         """Get available shipping rates for a location."""
@@ -160,23 +191,20 @@ class ShippingRateViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Find matching zones
-        zones = ShippingZone.objects.filter(
-            Q(countries__contains=[country]) &
-            Q(is_active=True)
-        )
-        
-        if state:
-            zones = zones.filter(Q(states__contains=[state]) | Q(states=[]))
-        
-        if city:
-            zones = zones.filter(Q(cities__contains=[city]) | Q(cities=[]))
+        # Rates of the matching zones, from the compiled zones
+        rates = get_available_shipping_rates(country, state, city, postal_code)
         
-        if postal_code:
-            zones = zones.filter(Q(postal_codes__contains=[postal_code]) | Q(postal_codes=[]))
+        # Narrow down like get_queryset
+        zone_id = request.query_params.get('zone')
+        if zone_id:
+            rates = [rate for rate in rates if str(rate.zone_id) == zone_id]
+        method_id = request.query_params.get('method')
+        if method_id:
+            rates = [rate for rate in rates if str(rate.method_id) == method_id]
+        rate_type = request.query_params.get('type')
+        if rate_type:
+            rates = [rate for rate in rates if rate.rate_type == rate_type]
         
-        # Get rates for matching zones
-        rates = self.get_queryset().filter(zone__in=zones)
         serializer = self.get_serializer(rates, many=True)
         
         return Response(serializer.data)
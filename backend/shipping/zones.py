@@ -0,0 +1,169 @@
+"""
+Compiled shipping zone resolver.
+
+Every active zone and rate is read once into hash maps keyed by
+normalized (casefolded, stripped) country, state, city and postal code,
+with the active rates of each zone. The maps are kept per process.
+Resolving an address, or finding the rate of a zone and method, takes a
+few dict lookups and makes no query.
+
+The compiled copy is tagged with a version stamp held in the cache.
+Saving or deleting a zone, method or rate bumps it (see
+shipping/signals.py), and the next lookup in each process recompiles.
+Bulk ``update()`` calls send no signals, so call ``bump_zones_version()``
+after them. A compiled copy is also rebuilt after SHIPPING_ZONES_TTL
+seconds, which bounds staleness when processes do not share a cache
+(LocMem).
+
+Matching follows the zone fields:
+
+* ``countries``: the zone must list the country.
+* ``states`` and ``postal_codes``: the zone must list the value, or list
+  none at all. A postal code entry ending in ``*`` is a prefix, so
+  ``12*`` covers ``1207``.
+* ``cities``: zones listing the city win. When none of the candidate
+  zones lists it, zones without cities match.
+
+The compiled rates and methods are shared between requests. Treat them
+as read-only.
+"""
+import logging
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import ShippingRate, ShippingZone
+
+logger = logging.getLogger(__name__)
+
+VERSION_CACHE_KEY = 'shipping:zones:version'
+POSTAL_WILDCARD = '*'
+
+_compiled = None
+
+
+def get_ttl():
+    """Seconds a process keeps its compiled zones without a version change."""
+    return getattr(settings, 'SHIPPING_ZONES_TTL', 300)
+
+
+def get_zones_version():
+    return cache.get(VERSION_CACHE_KEY, 0)
+
+
+def bump_zones_version():
+    """Make every process recompile its zones; returns the new version."""
+    try:
+        cache.add(VERSION_CACHE_KEY, 0, None)
+        return cache.incr(VERSION_CACHE_KEY)
+    except Exception as e:
+        logger.error(f"Error bumping shipping zones version: {str(e)}")
+        return None
+
+
+def normalize(value):
+    return str(value).strip().casefold() if value is not None else ''
+
+
+class CompiledZones:
+    """Active zones and rates indexed for lookups by address."""
+
+    def __init__(self, zones, rates, version):
+        self.version = version
+        self.compiled_at = time.monotonic()
+        self.zones = {zone.id: zone for zone in zones}
+
+        self.by_country = defaultdict(set)
+        self.by_state = defaultdict(set)
+        self.by_city = defaultdict(set)
+        self.by_postal_code = defaultdict(set)
+        self.by_postal_prefix = defaultdict(set)
+        self.any_state, self.any_city, self.any_postal_code = set(), set(), set()
+        # Longest postal prefix any zone uses, to bound the prefixes tried
+        self.max_prefix = 0
+
+        for zone in zones:
+            for country in zone.countries or []:
+                self.by_country[normalize(country)].add(zone.id)
+            self._index(zone.id, zone.states, self.by_state, self.any_state)
+            self._index(zone.id, zone.cities, self.by_city, self.any_city)
+            if not zone.postal_codes:
+                self.any_postal_code.add(zone.id)
+            for code in zone.postal_codes or []:
+                code = normalize(code)
+                if code.endswith(POSTAL_WILDCARD):
+                    prefix = code.rstrip(POSTAL_WILDCARD)
+                    self.by_postal_prefix[prefix].add(zone.id)
+                    self.max_prefix = max(self.max_prefix, len(prefix))
+                else:
+                    self.by_postal_code[code].add(zone.id)
+
+        self.rates = defaultdict(list)
+        self.rate_by_method = {}
+        for rate in rates:
+            self.rates[rate.zone_id].append(rate)
+            # Rates are ordered newest first; the first per zone and method wins, as get() would have
+            self.rate_by_method.setdefault((rate.zone_id, rate.method_id), rate)
+
+    @staticmethod
+    def _index(zone_id, values, index, unrestricted):
+        if not values:
+            unrestricted.add(zone_id)
+        for value in values or []:
+            index[normalize(value)].add(zone_id)
+
+    def _postal_matches(self, postal_code):
+        matches = set(self.by_postal_code.get(postal_code, ()))
+        for length in range(min(len(postal_code), self.max_prefix) + 1):
+            matches |= self.by_postal_prefix.get(postal_code[:length], set())
+        return matches | self.any_postal_code
+
+    def resolve(self, country=None, state=None, city=None, postal_code=None):
+        """Ids of the active zones covering an address; every argument is optional."""
+        candidates = set(self.zones)
+        if country:
+            candidates &= self.by_country.get(normalize(country), set())
+        if state:
+            candidates &= self.by_state.get(normalize(state), set()) | self.any_state
+        if city:
+            listed = candidates & self.by_city.get(normalize(city), set())
+            candidates = listed or (candidates & self.any_city)
+        if postal_code:
+            candidates &= self._postal_matches(normalize(postal_code))
+        return candidates
+
+    def rates_for(self, zone_ids):
+        """Active rates of active methods in ``zone_ids``, ordered like ShippingRate."""
+        rates = [rate for zone_id in zone_ids for rate in self.rates.get(zone_id, ())]
+        return sorted(rates, key=lambda rate: (self.zones[rate.zone_id].name, rate.zone_id,
+                                              rate.method.name, rate.method_id, -rate.created_at.timestamp()))
+
+    def methods_for(self, zone_ids):
+        """Active methods with a rate in ``zone_ids``, ordered by name."""
+        methods = {rate.method_id: rate.method for zone_id in zone_ids for rate in self.rates.get(zone_id, ())}
+        return sorted(methods.values(), key=lambda method: (method.name, method.id))
+
+    def rate(self, zone_id, method_id):
+        """The active rate of a zone and method, or None."""
+        return self.rate_by_method.get((zone_id, method_id))
+
+
+def compile_zones(version=None):
+    """Read active zones and rates into a CompiledZones; two queries."""
+    zones = list(ShippingZone.objects.filter(is_active=True))
+    rates = list(ShippingRate.objects.filter(
+        is_active=True, zone__is_active=True, method__is_active=True,
+    ).select_related('zone', 'method').order_by('-created_at', '-id'))
+    return CompiledZones(zones, rates, get_zones_version() if version is None else version)
+
+
+def get_zones():
+    """This process's compiled zones, recompiled when the version changed or the TTL ran out."""
+    global _compiled
+    version = get_zones_version()
+    compiled = _compiled
+    if compiled is None or compiled.version != version or time.monotonic() - compiled.compiled_at > get_ttl():
+        compiled = _compiled = compile_zones(version)
+    return compiled
@@ -11,16 +11,16 @@ class SMSTemplateAdmin(admin.ModelAdmin):
 
 @admin.register(SMSLog)
 class SMSLogAdmin(admin.ModelAdmin):
-    list_display = ('phone_number', 'status', 'template', 'sent_at', 'delivered_at')
+    list_display = ('phone_number', 'status', 'template', 'attempts', 'sent_at', 'delivered_at')
     list_filter = ('status', 'created_at')
-    search_fields = ('phone_number', 'message', 'transaction_id')
-    readonly_fields = ('created_at', 'sent_at', 'delivered_at')
+    search_fields = ('phone_number', 'message', 'transaction_id', 'dedupe_key')
+    readonly_fields = ('created_at', 'sent_at', 'delivered_at', 'attempts', 'next_attempt_at', 'dedupe_key')
     fieldsets = (
         (None, {
             'fields': ('phone_number', 'message', 'template', 'status')
         }),
         ('Transaction Details', {
-            'fields': ('transaction_id', 'error_message')
+            'fields': ('transaction_id', 'error_message', 'attempts', 'next_attempt_at', 'dedupe_key')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'sent_at', 'delivered_at')
@@ -0,0 +1,288 @@
+"""
+Outbox for SMS messages.
+
+``enqueue_sms`` stores the message as a ``pending`` SMSLog due now and
+returns it straight away; nothing talks to the gateway inside the caller's
+request or transaction. After commit a drain is scheduled: the
+``dispatch_sms_outbox`` task on a Celery worker when a broker is configured,
+inline otherwise. The same task also runs from beat to pick up retries.
+
+``SMSDispatcher.drain`` claims due rows in batches (``FOR UPDATE SKIP
+LOCKED``, so several workers never claim the same row) and sends each
+batch with one call to SSL Wireless' dynamic bulk API through the shared
+``sms`` HTTP client (backend/http_client.py). Sends are rate limited to SMS_DISPATCH_RATE messages
+per second. A claimed row is ``sending`` under a lease; if the worker dies
+the lease runs out and the row is claimed again.
+
+Connection errors, timeouts, 429s and 5xx responses put the batch back
+with exponential backoff until SMS_DISPATCH_MAX_ATTEMPTS is reached.
+The gateway rejects a csms_id it has already seen, so a retried message
+cannot be delivered twice.
+"""
+import logging
+import random
+import time
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from backend.http_client import get_client
+from backend.task_dispatch import dispatch_task
+from .models import SMSLog
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class SMSGatewayError(Exception):
+    """A batch the gateway did not accept; ``retry`` tells whether trying again may help."""
+
+    def __init__(self, message, retry=False):
+        super().__init__(message)
+        self.retry = retry
+
+
+class RateLimiter:
+    """Token bucket allowing ``rate`` messages per second, in bursts of up to ``burst``."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def acquire(self, count=1):
+        # A batch larger than the bucket waits for a full bucket and runs it into debt
+        needed = min(count, self.capacity)
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= needed:
+                self.tokens -= count
+                return
+            time.sleep((needed - self.tokens) / self.rate)
+
+
+class SSLWirelessGateway:
+    """Client for SSL Wireless' dynamic bulk API; one request carries many messages."""
+
+    def __init__(self, api_url=None, api_token=None, sid=None, timeout=None):
+        self.api_url = (api_url or _setting('SMS_API_URL', 'https://smsplus.sslwireless.com')).rstrip('/')
+        self.api_token = api_token or _setting('SMS_API_TOKEN', '')
+        self.sid = sid or _setting('SMS_API_SID', '')
+        self.timeout = timeout or _setting('SMS_DISPATCH_TIMEOUT', (5, 30))
+        self.client = get_client('sms')
+
+    def send_batch(self, messages):
+        """
+        Send ``messages`` of (csms_id, msisdn, text).
+
+        Returns ``{csms_id: (ok, reference_or_error)}`` for the messages the
+        gateway reported on; raises SMSGatewayError if it took none of them.
+        """
+        payload = {
+            'api_token': self.api_token,
+            'sid': self.sid,
+            'sms': [{'msisdn': msisdn, 'text': text, 'csms_id': csms_id} for csms_id, msisdn, text in messages],
+        }
+        try:
+            # The dispatcher reschedules failed batches itself
+            response = self.client.post(f"{self.api_url}/api/v3/send-sms/dynamic", json=payload,
+                                        timeout=self.timeout, retries=0)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise SMSGatewayError(f"{type(e).__name__}: {e}", retry=True)
+
+        if response.status_code == 429 or response.status_code >= 500:
+            raise SMSGatewayError(f"HTTP error {response.status_code}", retry=True)
+        if response.status_code != 200:
+            raise SMSGatewayError(f"HTTP error {response.status_code}")
+        try:
+            data = response.json()
+        except ValueError:
+            raise SMSGatewayError("Invalid response from SMS gateway", retry=True)
+
+        results = {}
+        for info in data.get('smsinfo') or []:
+            if info.get('sms_status') == 'SUCCESS':
+                results[str(info.get('csms_id'))] = (True, info.get('reference_id') or info.get('sms_id'))
+            else:
+                results[str(info.get('csms_id'))] = (False, info.get('status_message') or 'Rejected by gateway')
+        if not results and data.get('status') != 'SUCCESS':
+            raise SMSGatewayError(data.get('error_message') or 'Unknown error')
+        return results
+
+
+class SMSDispatcher:
+    """Drain the SMS outbox in rate-limited batches."""
+
+    def __init__(self, gateway=None, batch_size=None, rate=None, max_attempts=None, backoff=None, lease=None):
+        self.gateway = gateway or SSLWirelessGateway()
+        self.batch_size = batch_size or _setting('SMS_DISPATCH_BATCH_SIZE', 100)
+        self.limiter = RateLimiter(rate or _setting('SMS_DISPATCH_RATE', 50))
+        self.max_attempts = max_attempts or _setting('SMS_DISPATCH_MAX_ATTEMPTS', 5)
+        self.backoff = backoff if backoff is not None else _setting('SMS_DISPATCH_BACKOFF', 30)
+        self.lease = lease or _setting('SMS_DISPATCH_LEASE', 300)
+
+    def drain(self, limit=None):
+        """Send due messages until none are left (or ``limit`` were claimed); returns counts."""
+        counts = {'sent': 0, 'failed': 0, 'retried': 0}
+        claimed_total = 0
+        # Messages put back for a retry during this drain wait for the next one
+        due = timezone.now()
+        while limit is None or claimed_total < limit:
+            size = self.batch_size if limit is None else min(self.batch_size, limit - claimed_total)
+            batch = self.claim(size, due)
+            if not batch:
+                break
+            claimed_total += len(batch)
+            for outcome, count in self.send(batch).items():
+                counts[outcome] += count
+        if claimed_total:
+            logger.info(f"SMS outbox: sent {counts['sent']}, failed {counts['failed']}, "
+                        f"retrying {counts['retried']}")
+        return counts
+
+    def claim(self, size, due=None):
+        """Mark up to ``size`` messages due by ``due`` as ``sending`` under a lease and return them."""
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                SMSLog.objects.select_for_update(skip_locked=True)
+                .filter(status__in=['pending', 'sending'], next_attempt_at__lte=due or now)
+                .order_by('next_attempt_at', 'id')[:size]
+            )
+            if batch:
+                SMSLog.objects.filter(pk__in=[log.pk for log in batch]).update(
+                    status='sending', attempts=F('attempts') + 1,
+                    next_attempt_at=now + timedelta(seconds=self.lease),
+                )
+        for log in batch:
+            log.status = 'sending'
+            log.attempts += 1
+        return batch
+
+    def send(self, batch):
+        """Send one claimed batch and record the outcome of every message."""
+        now = timezone.now()
+        if _setting('SMS_TEST_MODE', False):
+            for log in batch:
+                self._sent(log, f"TEST-{log.id}", now)
+                logger.info(f"[TEST MODE] SMS to {log.phone_number}: {log.message}")
+            return self._save(batch)
+
+        self.limiter.acquire(len(batch))
+        try:
+            results = self.gateway.send_batch([(str(log.id), log.phone_number, log.message) for log in batch])
+        except SMSGatewayError as e:
+            logger.error(f"SMS gateway error for a batch of {len(batch)}: {e}")
+            for log in batch:
+                self._failed(log, str(e), e.retry, now)
+            return self._save(batch)
+
+        for log in batch:
+            ok, detail = results.get(str(log.id), (False, None))
+            if ok:
+                self._sent(log, detail, now)
+            else:
+                # Not reported on at all: the gateway may not have seen it, so try again
+                self._failed(log, detail or 'No status from gateway', detail is None, now)
+        return self._save(batch)
+
+    def _sent(self, log, transaction_id, now):
+        log.status = 'sent'
+        log.sent_at = now
+        log.transaction_id = transaction_id
+        log.error_message = None
+        log.next_attempt_at = None
+
+    def _failed(self, log, error, retry, now):
+        log.error_message = error
+        if retry and log.attempts < self.max_attempts:
+            # Exponential backoff with jitter
+            delay = self.backoff * (2 ** (log.attempts - 1))
+            log.status = 'pending'
+            log.next_attempt_at = now + timedelta(seconds=random.uniform(delay / 2, delay))
+        else:
+            log.status = 'failed'
+            log.next_attempt_at = None
+
+    @staticmethod
+    def _save(batch):
+        SMSLog.objects.bulk_update(
+            batch, ['status', 'sent_at', 'transaction_id', 'error_message', 'next_attempt_at'],
+        )
+        counts = {'sent': 0, 'failed': 0, 'retried': 0}
+        for log in batch:
+            counts['retried' if log.status == 'pending' else log.status] += 1
+        return counts
+
+
+def dispatch_outbox(limit=None):
+    """Drain the outbox once with a fresh dispatcher."""
+    return SMSDispatcher().drain(limit=limit)
+
+
+def schedule_dispatch():
+    """Drain the outbox after commit, on a Celery worker when a broker is configured."""
+    from .tasks import dispatch_sms_outbox
+
+    transaction.on_commit(lambda: dispatch_task(dispatch_sms_outbox, fallback=dispatch_outbox))
+
+
+def enqueue_sms(phone_number, message, template=None, send_at=None):
+    """
+    Queue an SMS and return its SMSLog, still ``pending``.
+
+    The log is the handle: its status moves to ``sent`` or ``failed`` once
+    a dispatcher has handled it.
+    """
+    sms_log = SMSLog.objects.create(
+        phone_number=phone_number,
+        message=message,
+        template=template,
+        status='pending',
+        next_attempt_at=send_at or timezone.now(),
+    )
+    schedule_dispatch()
+    return sms_log
+
+
+def enqueue_batch(messages):
+    """
+    Queue many SMS in one insert; returns the dedupe keys that were queued.
+
+    ``messages`` are dicts with phone_number, message, dedupe_key and
+    optionally template. Messages whose key was queued before, by this run
+    or an earlier one, are skipped.
+    """
+    messages = {message['dedupe_key']: message for message in messages}
+    if not messages:
+        return []
+    queued_before = set(
+        SMSLog.objects.filter(dedupe_key__in=list(messages)).values_list('dedupe_key', flat=True)
+    )
+    now = timezone.now()
+    logs = [
+        SMSLog(
+            phone_number=message['phone_number'],
+            message=message['message'],
+            template=message.get('template'),
+            status='pending',
+            next_attempt_at=now,
+            dedupe_key=key,
+        )
+        for key, message in messages.items() if key not in queued_before
+    ]
+    # A concurrent run may have queued some of them since; the unique key drops those
+    SMSLog.objects.bulk_create(logs, ignore_conflicts=True)
+    if logs:
+        schedule_dispatch()
+    return [log.dedupe_key for log in logs]
@@ -0,0 +1,103 @@
+"""
+Local stand-in for the SSL Wireless SMS API.
+
+Point SMS_API_URL at it (``manage.py fake_sms_gateway``) to run the outbox
+without sending real messages. It accepts the single and dynamic bulk send
+endpoints, records every message, and can be told to fail requests or
+reject numbers, so retries can be exercised offline.
+"""
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class FakeSMSGateway(ThreadingHTTPServer):
+    """
+    Records messages in ``messages`` and requests in ``requests``.
+
+    ``fail_next`` answers that many requests with ``fail_status``;
+    ``rejected`` numbers get a failed status of their own.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0):
+        self.delay = delay
+        self.messages = []
+        self.requests = []
+        self.fail_next = 0
+        self.fail_status = 503
+        self.rejected = set()
+        self.seen_ids = set()
+        self.lock = threading.Lock()
+        super().__init__((host, port), FakeSMSGatewayHandler)
+
+    @property
+    def url(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeSMSGatewayHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            data = json.loads(body or b'{}')
+        else:
+            data = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+        with server.lock:
+            server.requests.append(self.path)
+            failing = server.fail_next > 0
+            if failing:
+                server.fail_next -= 1
+        time.sleep(server.delay)
+        if failing:
+            return self._respond(server.fail_status, {'status': 'FAILED', 'error_message': 'Unavailable'})
+
+        if self.path.rstrip('/') == '/api/v3/send-sms/dynamic':
+            messages = [(item.get('csms_id'), item.get('msisdn'), item.get('text')) for item in data.get('sms', [])]
+        elif self.path.rstrip('/') == '/api/v3/send-sms':
+            messages = [(data.get('csms_id'), data.get('msisdn'), data.get('sms'))]
+        else:
+            return self._respond(404, {'status': 'FAILED', 'error_message': 'Not found'})
+
+        smsinfo = []
+        with server.lock:
+            for csms_id, msisdn, text in messages:
+                info = {'msisdn': msisdn, 'csms_id': csms_id, 'sms_body': text}
+                if msisdn in server.rejected:
+                    info.update(sms_status='FAILED', status_message='Invalid Mobile Number')
+                elif csms_id in server.seen_ids:
+                    info.update(sms_status='FAILED', status_message='Duplicate CSMS ID')
+                else:
+                    server.seen_ids.add(csms_id)
+                    server.messages.append({'csms_id': csms_id, 'msisdn': msisdn, 'text': text})
+                    info.update(sms_status='SUCCESS', status_message='Success',
+                                reference_id=uuid.uuid4().hex[:16])
+                    info['sms_id'] = info['reference_id']
+                smsinfo.append(info)
+        self._respond(200, {'status': 'SUCCESS', 'status_code': 200, 'error_message': '', 'smsinfo': smsinfo})
+
+    def _respond(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
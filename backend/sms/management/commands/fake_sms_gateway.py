@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from sms.fake_gateway import FakeSMSGateway
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in for the SMS API that prints messages instead of sending them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8025)
+        parser.add_argument('--delay', type=float, default=0, help='Seconds to wait before each response')
+        parser.add_argument('--reject', nargs='*', default=[], help='Numbers to answer with a failed status')
+
+    def handle(self, *args, **options):
+        gateway = FakeSMSGateway(options['host'], options['port'], delay=options['delay']).start()
+        gateway.rejected.update(options['reject'])
+        self.stdout.write(self.style.SUCCESS(f"Fake SMS gateway listening; set SMS_API_URL={gateway.url}"))
+        printed = 0
+        try:
+            while True:
+                with gateway.lock:
+                    new = gateway.messages[printed:]
+                for message in new:
+                    self.stdout.write(f"SMS {message['csms_id']} to {message['msisdn']}: {message['text']}")
+                printed += len(new)
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            gateway.stop()
+        self.stdout.write(f"Received {printed} messages")
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms', '0004_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='smslog',
+            name='dedupe_key',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
@@ -34,6 +34,7 @@ class SMSLog(models.Model):
     
     STATUS_CHOICES = (
         ('pending', 'Pending'),
+        ('sending', 'Sending'),
         ('sent', 'Sent'),
         ('delivered', 'Delivered'),
         ('failed', 'Failed'),
@@ -48,6 +49,16 @@ class SMSLog(models.Model):
     sent_at = models.DateTimeField(null=True, blank=True)
     delivered_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Outbox bookkeeping (see sms/dispatch.py); messages sent directly leave next_attempt_at empty
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    # Set by batch senders so a retried run never queues the same message twice
+    dedupe_key = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='smslog_outbox'),
+        ]
     
     def __str__(self):
         return f"SMS to {self.phone_number} ({self.status})"
@@ -1,11 +1,12 @@
 import random
 import string
-import requests
 import logging
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 from .models import SMSTemplate, SMSLog, PhoneVerification
+from .dispatch import enqueue_batch, enqueue_sms
+from backend.http_client import get_client
 
 logger = logging.getLogger(__name__)
 
@@ -168,7 +169,7 @@ class SMSService:
             
             # Make the API request
             logger.info(f"Sending SMS to {phone_number}: {message}")
-            response = requests.post(f"{self.api_url}/api/v3/send-sms", data=payload)
+            response = get_client('sms').post(f"{self.api_url}/api/v3/send-sms", data=payload)
             
             if response.status_code == 200:
                 response_data = response.json()
@@ -191,6 +192,35 @@ class SMSService:
         
         return sms_log
     
+    def queue_sms(self, phone_number, message, template=None):
+        """
+        Queue an SMS for the outbox instead of sending it in this request
+        
+        Args:
+            phone_number (str): Recipient phone number
+            message (str): Message content
+            template (SMSTemplate, optional): Template used for this message
+        
+        Returns:
+            SMSLog: The pending log entry; its status changes once it is dispatched
+        """
+        return enqueue_sms(self._clean_phone_number(phone_number), message, template)
+    
+    def queue_many(self, messages):
+        """
+        Queue many SMS for the outbox in one insert
+        
+        Args:
+            messages (list): Dicts with phone_number, message, dedupe_key and optionally template
+        
+        Returns:
+            list: Dedupe keys of the messages queued; ones queued before are skipped
+        """
+        return enqueue_batch([
+            {**message, 'phone_number': self._clean_phone_number(message['phone_number'])}
+            for message in messages
+        ])
+    
     def _clean_phone_number(self, phone_number):
         """
         Ensure phone number is in the correct format for Bangladesh (880XXXXXXXXX)
@@ -367,7 +397,7 @@ class SMSService:
             return None
     
     def send_order_confirmation(self, order):
-        """Send order confirmation message"""
+        """Queue order confirmation message"""
         if not order.shipping_phone:
             logger.warning(f"Cannot send order confirmation SMS for order {order.id}: No phone number")
             return None
@@ -380,13 +410,13 @@ class SMSService:
                 total=order.total,
                 brand=self.brand_name
             )
-            return self.send_sms(order.shipping_phone, message, template)
+            return self.queue_sms(order.shipping_phone, message, template)
         except SMSTemplate.DoesNotExist:
             logger.warning("Order confirmation SMS template not found")
             return None
     
     def send_payment_confirmation(self, order):
-        """Send payment confirmation message"""
+        """Queue payment confirmation message"""
         if not order.shipping_phone:
             logger.warning(f"Cannot send payment confirmation SMS for order {order.id}: No phone number")
             return None
@@ -399,13 +429,13 @@ class SMSService:
                 total=order.total,
                 brand=self.brand_name
             )
-            return self.send_sms(order.shipping_phone, message, template)
+            return self.queue_sms(order.shipping_phone, message, template)
         except SMSTemplate.DoesNotExist:
             logger.warning("Payment confirmation SMS template not found")
             return None
     
     def send_order_status_update(self, order):
-        """Send order status update message"""
+        """Queue order status update message"""
         if not order.shipping_phone:
             logger.warning(f"Cannot send order status SMS for order {order.id}: No phone number")
             return None
@@ -418,7 +448,7 @@ class SMSService:
                 status=order.get_status_display(),
                 brand=self.brand_name
             )
-            return self.send_sms(order.shipping_phone, message, template)
+            return self.queue_sms(order.shipping_phone, message, template)
         except SMSTemplate.DoesNotExist:
             logger.warning("Order status SMS template not found")
             return None
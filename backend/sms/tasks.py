@@ -0,0 +1,10 @@
+from celery import shared_task
+
+from .dispatch import dispatch_outbox
+
+
+@shared_task
+def dispatch_sms_outbox():
+    """Send queued SMS messages, including retries that have come due."""
+    counts = dispatch_outbox()
+    return f"Sent {counts['sent']} SMS, {counts['failed']} failed, {counts['retried']} to retry"
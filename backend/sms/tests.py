@@ -1,3 +1,121 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from notifications.models import SMSProvider
+from orders.models import Order
+from .dispatch import SMSDispatcher, SSLWirelessGateway, enqueue_sms
+from .fake_gateway import FakeSMSGateway
+from .models import SMSLog, SMSTemplate
+from .services import SMSService
+
+User = get_user_model()
+
+
+@override_settings(SMS_TEST_MODE=False, CELERY_BROKER_URL=None)
+class SMSOutboxTest(TestCase):
+    """Messages are queued as pending logs and sent in batches after commit."""
+
+    def setUp(self):
+        self.gateway = FakeSMSGateway().start()
+        self.addCleanup(self.gateway.stop)
+        settings_override = override_settings(SMS_API_URL=self.gateway.url, SMS_DISPATCH_BACKOFF=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def dispatcher(self, **options):
+        return SMSDispatcher(gateway=SSLWirelessGateway(timeout=2), **options)
+
+    def test_enqueue_returns_pending_handle_and_sends_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            logs = [enqueue_sms(f'88017000000{i:02d}', f'Message {i}') for i in range(5)]
+            self.assertEqual(self.gateway.requests, [])
+        self.assertTrue(all(log.status == 'pending' for log in logs))
+
+        callbacks[0]()
+        # One bulk request carried every queued message
+        self.assertEqual(self.gateway.requests, ['/api/v3/send-sms/dynamic'])
+        self.assertEqual(len(self.gateway.messages), 5)
+        for log in logs:
+            log.refresh_from_db()
+            self.assertEqual((log.status, log.attempts), ('sent', 1))
+            self.assertTrue(log.transaction_id)
+            self.assertIsNone(log.next_attempt_at)
+
+    def test_retries_with_backoff_and_fails_rejected_numbers(self):
+        good = enqueue_sms('8801700000001', 'Hello')
+        rejected = enqueue_sms('8801700000002', 'Hello')
+        self.gateway.rejected.add('8801700000002')
+        self.gateway.fail_next = 1
+
+        dispatcher = self.dispatcher(batch_size=10, max_attempts=3)
+        self.assertEqual(dispatcher.drain(), {'sent': 0, 'failed': 0, 'retried': 2})
+        good.refresh_from_db()
+        self.assertEqual((good.status, good.attempts, good.error_message), ('pending', 1, 'HTTP error 503'))
+
+        self.assertEqual(dispatcher.drain(), {'sent': 1, 'failed': 1, 'retried': 0})
+        good.refresh_from_db()
+        rejected.refresh_from_db()
+        self.assertEqual((good.status, good.attempts), ('sent', 2))
+        self.assertEqual((rejected.status, rejected.error_message), ('failed', 'Invalid Mobile Number'))
+        self.assertEqual(len(self.gateway.messages), 1)
+
+    def test_gives_up_after_max_attempts_and_reclaims_expired_leases(self):
+        log = enqueue_sms('8801700000001', 'Hello')
+        self.gateway.fail_next = 5
+        dispatcher = self.dispatcher(max_attempts=2)
+        dispatcher.drain()
+        dispatcher.drain()
+        log.refresh_from_db()
+        self.assertEqual((log.status, log.attempts), ('failed', 2))
+
+        # A worker died holding this one; it is sent once its lease runs out
+        stuck = enqueue_sms('8801700000003', 'Hello')
+        SMSLog.objects.filter(pk=stuck.pk).update(status='sending', next_attempt_at=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(dispatcher.drain()['sent'], 0)
+        self.gateway.fail_next = 0
+        SMSLog.objects.filter(pk=stuck.pk).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(dispatcher.drain()['sent'], 1)
+
+    def test_order_messages_are_queued_instead_of_sent(self):
+        SMSTemplate.objects.update_or_create(type='order_confirmation', defaults={
+            'name': 'Order Confirmation', 'is_active': True,
+            'template_text': 'Order #{order_id} received, {name}. Total: {total}',
+        })
+        user = User.objects.create_user(email='buyer@example.com', password='pass')
+        order = Order.objects.create(
+            user=user, payment_method='cod', shipping_address='House 1', shipping_city='Dhaka',
+            shipping_state='Dhaka', shipping_postal_code='1200', shipping_phone='01700000000',
+            subtotal=100, total=100,
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            log = SMSService().send_order_confirmation(order)
+            self.assertEqual((log.status, log.phone_number), ('pending', '8801700000000'))
+            self.assertEqual(self.gateway.requests, [])
+
+        log.refresh_from_db()
+        self.assertEqual(log.status, 'sent')
+        self.assertIn(order.order_id, self.gateway.messages[0]['text'])
+
+    def test_order_notifications_are_queued_instead_of_sent(self):
+        SMSProvider.objects.create(name='SSL', provider_type='ssl_wireless', api_url=self.gateway.url)
+        user = User.objects.create_user(email='buyer@example.com', password='pass', phone='01711111111')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Order.objects.create(
+                user=user, payment_method='cod', shipping_address='House 1', shipping_city='Dhaka',
+                shipping_state='Dhaka', shipping_postal_code='1200', shipping_phone='01700000000',
+                subtotal=100, total=100,
+            )
+        # Run the order's callbacks, but not the outbox drain they schedule
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.gateway.requests, [])
+        log = SMSLog.objects.get()
+        self.assertEqual((log.status, log.phone_number), ('pending', '8801711111111'))
+        self.assertIn('Thank you for your order', log.message)
+
+        self.assertEqual(self.dispatcher().drain()['sent'], 1)